@@ -1,10 +1,13 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, BackgroundTasks, UploadFile, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, Request
 from fastapi import File as FastAPIFile
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
@@ -12,28 +15,36 @@ import sentry_sdk
 import os
 import logging
 import asyncio
+import gzip
+import html
+import json
+import math
+import random
 import re
+import socket
+import time
 from better_profanity import profanity
 from pathlib import Path
 import cloudinary
 import cloudinary.uploader
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 import uuid
 import secrets
 from datetime import datetime, timedelta
+from functools import lru_cache
+from string import Template
 import jwt
 from passlib.context import CryptContext
 import httpx
 
-# Optional import for resend (email service)
+# Optional import for h2 (HTTP/2 for the Expo push client)
 try:
-    import resend
-    RESEND_AVAILABLE = True
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
 except ImportError:
-    RESEND_AVAILABLE = False
-    logging.warning("resend package not installed - password reset emails will be disabled")
+    HTTP2_AVAILABLE = False
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -74,6 +85,10 @@ mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME', 'pathgro_db')]
 
+def duplicate_key_indexes(e: BulkWriteError) -> set:
+    """Op indexes in an unordered bulk write that failed on a duplicate key."""
+    return {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") == 11000}
+
 # JWT Settings
 SECRET_KEY = os.environ.get('JWT_SECRET', 'pathgro-secret-key-change-in-production')
 ALGORITHM = "HS256"
@@ -89,10 +104,6 @@ ADMIN_ALERT_EMAIL = os.environ.get('ADMIN_ALERT_EMAIL', '').strip()
 APP_NAME = "FRIKT"
 RESET_TOKEN_EXPIRE_HOURS = 1  # Password reset tokens expire after 1 hour
 
-# Initialize Resend if API key is present and package is available
-if RESEND_API_KEY and RESEND_AVAILABLE:
-    resend.api_key = RESEND_API_KEY
-
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -278,6 +289,8 @@ class UserStats(BaseModel):
     last_visit_date: Optional[str] = None
     streak_miss_count: int = 0
     posts_per_category: dict = {}
+    relates_given_per_category: dict = {}
+    comments_per_category: dict = {}
     max_relates_on_single_post: int = 0
 
 # User Achievement Model
@@ -485,6 +498,7 @@ class NotificationSettings(BaseModel):
     follows: bool = True
     trending: bool = True
     local_new_frikts: bool = True  # Notify when new frikt posted in my Local
+    weekly_digest: bool = True  # Weekly top-Frikts push and email
 
 class NotificationSettingsUpdate(BaseModel):
     push_notifications: Optional[bool] = None  # Global toggle
@@ -494,6 +508,7 @@ class NotificationSettingsUpdate(BaseModel):
     follows: Optional[bool] = None
     trending: Optional[bool] = None
     local_new_frikts: Optional[bool] = None
+    weekly_digest: Optional[bool] = None
 
 # Report Model (for posts and comments)
 REPORT_REASONS = ["spam", "harassment", "hate", "sexual", "other", "abuse", "off-topic", "duplicate"]
@@ -565,7 +580,12 @@ class PendingNotificationBatch(BaseModel):
     user_names: List[str] = []  # List of user names for the notification
     first_action_at: datetime = Field(default_factory=datetime.utcnow)
     last_action_at: datetime = Field(default_factory=datetime.utcnow)
-    notification_sent: bool = False
+    notification_sent: bool = False  # False while user_ids hold actors waiting to be sent
+    due_at: Optional[datetime] = None  # When the pending actors are flushed
+    window_until: Optional[datetime] = None  # Actions before this are batched, not sent immediately
+    expires_at: Optional[datetime] = None  # TTL
+    claimed_by: Optional[str] = None  # Worker lease while sending
+    claimed_until: Optional[datetime] = None
 
 # Batching constants
 RELATE_BATCH_WINDOW_MINUTES = 5
@@ -707,7 +727,186 @@ async def log_admin_action(admin: dict, action: str, target_type: str, target_id
     await db.admin_audit_logs.insert_one(log_entry.dict())
     logger.info(f"Admin action: {admin['email']} performed {action} on {target_type}/{target_id}")
 
+# ===================== NOTIFICATION SETTINGS =====================
+# Per-user notification settings with NotificationSettings defaults applied, cached for
+# a minute so write paths don't re-read them on every action. update_push_settings
+# drops this process's entry; other workers pick the change up when theirs expires.
+
+NOTIFICATION_SETTINGS_CACHE_SECONDS = 60
+NOTIFICATION_SETTINGS_CACHE_MAX = 50000
+_notification_settings_cache: Dict[str, tuple] = {}  # user_id -> (expires, settings)
+
+async def get_notification_settings_bulk(user_ids: List[str]) -> Dict[str, dict]:
+    """Settings per user (defaults for users who never saved any). Treat as read-only."""
+    now = time.time()
+    result, missing = {}, []
+    for user_id in set(user_ids):
+        cached = _notification_settings_cache.get(user_id)
+        if cached and cached[0] > now:
+            result[user_id] = cached[1]
+        else:
+            missing.append(user_id)
+    if not missing:
+        return result
+    
+    stored = {
+        s["user_id"]: s async for s in db.notification_settings.find({"user_id": {"$in": missing}}, {"_id": 0})
+    }
+    if len(_notification_settings_cache) + len(missing) > NOTIFICATION_SETTINGS_CACHE_MAX:
+        _notification_settings_cache.clear()
+    for user_id in missing:
+        settings = NotificationSettings(user_id=user_id).dict()
+        del settings["user_id"]
+        settings.update({k: v for k, v in stored.get(user_id, {}).items() if k in settings and v is not None})
+        _notification_settings_cache[user_id] = (now + NOTIFICATION_SETTINGS_CACHE_SECONDS, settings)
+        result[user_id] = settings
+    return result
+
+async def get_notification_settings(user_id: str) -> dict:
+    return (await get_notification_settings_bulk([user_id]))[user_id]
+
+def wants_push(settings: dict, toggle: str) -> bool:
+    """Global push toggle and the given per-type toggle are both on."""
+    return settings["push_notifications"] and settings[toggle]
+
+def invalidate_notification_settings(user_id: str):
+    _notification_settings_cache.pop(user_id, None)
+
+# ===================== NOTIFICATION COUNTERS =====================
+# One notification_counters document per user: {"user_id", "unread", "total",
+# "last_read_at"}, where total is the size of the user's hot inbox (see NOTIFICATION
+# RETENTION). Every in-app notification is inserted through insert_notifications, which
+# $incs the recipients' counters, so the bell and push badges read a single document.
+# "Mark all read" moves the last_read_at watermark instead of rewriting notifications:
+# anything created at or before it is read, whatever its is_read flag says. Users
+# without a counter yet get one from a one-off count the first time they're touched;
+# the counter reconciler repairs any drift.
+
+async def init_unread_counters(user_ids: List[str]):
+    """Create missing counters from a count of the users' notifications."""
+    existing = set(await db.notification_counters.distinct("user_id", {"user_id": {"$in": user_ids}}))
+    counts = {uid: {"unread": 0, "total": 0} for uid in user_ids if uid not in existing}
+    if not counts:
+        return
+    async for row in db.notifications.aggregate([
+        {"$match": {"user_id": {"$in": list(counts)}}},
+        {"$group": {
+            "_id": "$user_id",
+            "total": {"$sum": 1},
+            "unread": {"$sum": {"$cond": [{"$eq": ["$is_read", False]}, 1, 0]}},
+        }},
+    ]):
+        counts[row["_id"]] = {"unread": row["unread"], "total": row["total"]}
+    try:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": uid}, {"$setOnInsert": c}, upsert=True)
+            for uid, c in counts.items()
+        ], ordered=False)
+    except BulkWriteError:
+        pass  # Created concurrently; that counter wins
+
+async def insert_notifications(notifications: List[dict], pushes: Optional[List[dict]] = None):
+    """Insert in-app notifications and bump each recipient's unread counter.
+    
+    `pushes` are queued in the push outbox in the same step (see enqueue_pushes).
+    """
+    if not notifications:
+        await enqueue_pushes(pushes or [])
+        return
+    await db.notifications.insert_many(notifications)
+    await enqueue_pushes(pushes or [])
+    per_user = {}
+    for n in notifications:
+        per_user[n["user_id"]] = per_user.get(n["user_id"], 0) + 1
+    result = await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": uid}, {"$inc": {"unread": count, "total": count}}) for uid, count in per_user.items()
+    ], ordered=False)
+    if result.matched_count < len(per_user):
+        # No counter yet: the initial count includes the notifications just inserted
+        await init_unread_counters(list(per_user))
+
+async def insert_notification(notification: dict):
+    await insert_notifications([notification])
+
+async def notification_exists(user_id: str, notification_id: str) -> bool:
+    return await db.notifications.find_one({"user_id": user_id, "id": notification_id}, {"_id": 1}) is not None
+
+async def get_notification_counter(user_id: str) -> dict:
+    counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0})
+    if not counter:
+        await init_unread_counters([user_id])
+        counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0})
+    return counter
+
+async def get_unread_counts(user_ids: List[str]) -> Dict[str, int]:
+    """Unread notification count per user."""
+    await init_unread_counters(user_ids)
+    counts = {
+        c["user_id"]: max(c.get("unread", 0), 0)
+        async for c in db.notification_counters.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "unread": 1})
+    }
+    return {uid: counts.get(uid, 0) for uid in user_ids}
+
+async def get_unread_count(user_id: str) -> int:
+    return max((await get_notification_counter(user_id)).get("unread", 0), 0)
+
+def apply_read_watermark(notifications: List[dict], last_read_at: Optional[datetime]) -> List[dict]:
+    """Flag notifications at or before the user's last_read_at as read."""
+    if last_read_at:
+        for n in notifications:
+            if n.get("created_at") and n["created_at"] <= last_read_at:
+                n["is_read"] = True
+    return notifications
+
+async def mark_all_notifications_read(user_id: str):
+    await db.notification_counters.update_one(
+        {"user_id": user_id},
+        {"$set": {"unread": 0}, "$max": {"last_read_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def mark_notification_ids_read(user_id: str, notification_ids: List[str]) -> int:
+    """Mark specific notifications read. Returns how many were unread."""
+    counter = await get_notification_counter(user_id)
+    query = {"user_id": user_id, "id": {"$in": notification_ids}, "is_read": False}
+    if counter.get("last_read_at"):
+        # Already read through the watermark, so not counted as unread
+        query["created_at"] = {"$gt": counter["last_read_at"]}
+    result = await db.notifications.update_many(query, {"$set": {"is_read": True}})
+    read = result.modified_count
+    if read:
+        decremented = await db.notification_counters.update_one(
+            {"user_id": user_id, "unread": {"$gte": read}}, {"$inc": {"unread": -read}}
+        )
+        if not decremented.modified_count:
+            await db.notification_counters.update_one({"user_id": user_id}, {"$set": {"unread": 0}})
+    return read
+
 # ===================== NOTIFICATION BATCHING HELPERS =====================
+# One pending_notification_batches document per (recipient, batch_type, target), unique.
+# The first action opens a window and is notified immediately; actions inside the window
+# are added to the document and flushed together at due_at (rounded up to a bucket so the
+# poller picks them up in groups). Workers claim due documents with a short lease, so
+# any number of them can drain the queue without double sends.
+
+NOTIFICATION_BATCH_POLL_SECONDS = float(os.environ.get("NOTIFICATION_BATCH_POLL_SECONDS", "15"))
+NOTIFICATION_BATCH_BUCKET_SECONDS = 15
+NOTIFICATION_BATCH_PAGE_SIZE = 100
+NOTIFICATION_BATCH_CLAIM_SECONDS = 120
+NOTIFICATION_BATCH_SEND_CONCURRENCY = 10
+# Batch documents expire (TTL index on expires_at) this long after their window closes
+NOTIFICATION_BATCH_RETENTION = timedelta(hours=24)
+
+def notification_batch_window(batch_type: str) -> timedelta:
+    minutes = RELATE_BATCH_WINDOW_MINUTES if batch_type == "relate_batch" else COMMENT_BATCH_WINDOW_MINUTES
+    return timedelta(minutes=minutes)
+
+def notification_batch_due_at(t: datetime) -> datetime:
+    """Round up to the next scheduling bucket."""
+    bucket = NOTIFICATION_BATCH_BUCKET_SECONDS
+    epoch = datetime(1970, 1, 1)
+    seconds = (t - epoch).total_seconds()
+    return epoch + timedelta(seconds=-(-seconds // bucket) * bucket)
 
 async def add_to_notification_batch(
     recipient_user_id: str,
@@ -722,73 +921,131 @@ async def add_to_notification_batch(
     (immediate notification should be sent), False if batched.
     """
     now = datetime.utcnow()
+    key = {"recipient_user_id": recipient_user_id, "batch_type": batch_type, "target_id": target_id}
+    due_at = notification_batch_due_at(now + notification_batch_window(batch_type))
     
-    # Check if there's an existing pending batch for this recipient + target
-    existing_batch = await db.pending_notification_batches.find_one({
-        "recipient_user_id": recipient_user_id,
-        "batch_type": batch_type,
-        "target_id": target_id,
-        "notification_sent": False
-    })
-    
-    if existing_batch:
-        # Add to existing batch
-        if actor_user_id not in existing_batch.get("user_ids", []):
+    for _ in range(3):
+        # Window still open, or a batch is waiting to be sent: add this actor to it
+        result = await db.pending_notification_batches.update_one(
+            {
+                **key,
+                "user_ids": {"$ne": actor_user_id},
+                "$or": [{"window_until": {"$gt": now}}, {"notification_sent": False}],
+            },
+            {
+                "$push": {"user_ids": actor_user_id, "user_names": actor_user_name},
+                "$set": {
+                    "target_title": target_title,
+                    "last_action_at": now,
+                    "notification_sent": False,
+                    "due_at": due_at,
+                    "window_until": due_at,
+                    "expires_at": due_at + NOTIFICATION_BATCH_RETENTION,
+                },
+            }
+        )
+        if result.matched_count:
+            return False  # Batched, don't send immediate notification
+        
+        # No recent notification, this is the first action - send immediately
+        # and open a window for the ones that follow
+        try:
             await db.pending_notification_batches.update_one(
-                {"id": existing_batch["id"]},
+                {**key, "notification_sent": True, "$or": [{"window_until": {"$lte": now}}, {"window_until": None}]},
                 {
-                    "$push": {
-                        "user_ids": actor_user_id,
-                        "user_names": actor_user_name
+                    "$set": {
+                        "target_title": target_title,
+                        "user_ids": [],
+                        "user_names": [],
+                        "first_action_at": now,
+                        "last_action_at": now,
+                        "due_at": None,
+                        "window_until": due_at,
+                        "expires_at": due_at + NOTIFICATION_BATCH_RETENTION,
                     },
-                    "$set": {"last_action_at": now}
-                }
+                    "$setOnInsert": {"id": str(uuid.uuid4())},
+                },
+                upsert=True
             )
-        return False  # Batched, don't send immediate notification
-    
-    # Check if we recently sent a notification for this target
-    window_minutes = RELATE_BATCH_WINDOW_MINUTES if batch_type == "relate_batch" else COMMENT_BATCH_WINDOW_MINUTES
-    cutoff_time = now - timedelta(minutes=window_minutes)
-    
-    recent_sent = await db.pending_notification_batches.find_one({
-        "recipient_user_id": recipient_user_id,
-        "batch_type": batch_type,
-        "target_id": target_id,
-        "notification_sent": True,
-        "last_action_at": {"$gte": cutoff_time}
-    })
-    
-    if recent_sent:
-        # Create new pending batch (notification was recently sent)
-        batch = PendingNotificationBatch(
-            recipient_user_id=recipient_user_id,
-            batch_type=batch_type,
-            target_id=target_id,
-            target_title=target_title,
-            user_ids=[actor_user_id],
-            user_names=[actor_user_name],
-            first_action_at=now,
-            last_action_at=now,
-            notification_sent=False
-        )
-        await db.pending_notification_batches.insert_one(batch.dict())
-        return False  # Batched, don't send immediate
-    
-    # No recent notification, this is the first action - send immediately
-    # But also create a batch record to track the window
-    batch = PendingNotificationBatch(
-        recipient_user_id=recipient_user_id,
-        batch_type=batch_type,
-        target_id=target_id,
-        target_title=target_title,
-        user_ids=[actor_user_id],
-        user_names=[actor_user_name],
-        first_action_at=now,
-        last_action_at=now,
-        notification_sent=True  # Mark as sent since we're sending immediately
+            return True  # Send immediate notification
+        except DuplicateKeyError:
+            # The window is open: another request just opened it (retry batching),
+            # or this actor is already in the pending batch
+            if await db.pending_notification_batches.find_one({**key, "user_ids": actor_user_id}, {"_id": 1}):
+                return False
+    return False
+
+async def add_to_notification_batches(
+    recipient_user_ids: List[str],
+    batch_type: str,
+    target_id: str,
+    target_title: str,
+    actor_user_id: str,
+    actor_user_name: str
+) -> set:
+    """add_to_notification_batch for many recipients of the same action, in a few bulk
+    writes. Returns the recipients who should be notified immediately."""
+    if not recipient_user_ids:
+        return set()
+    now = datetime.utcnow()
+    key = {"recipient_user_id": {"$in": recipient_user_ids}, "batch_type": batch_type, "target_id": target_id}
+    due_at = notification_batch_due_at(now + notification_batch_window(batch_type))
+
+    await db.pending_notification_batches.update_many(
+        {
+            **key,
+            "user_ids": {"$ne": actor_user_id},
+            "$or": [{"window_until": {"$gt": now}}, {"notification_sent": False}],
+        },
+        {
+            "$push": {"user_ids": actor_user_id, "user_names": actor_user_name},
+            "$set": {
+                "target_title": target_title,
+                "last_action_at": now,
+                "notification_sent": False,
+                "due_at": due_at,
+                "window_until": due_at,
+                "expires_at": due_at + NOTIFICATION_BATCH_RETENTION,
+            },
+        }
     )
-    await db.pending_notification_batches.insert_one(batch.dict())
-    return True  # Send immediate notification
+    batched = set(await db.pending_notification_batches.distinct("recipient_user_id", {**key, "user_ids": actor_user_id}))
+    first = [uid for uid in recipient_user_ids if uid not in batched]
+    if not first:
+        return set()
+
+    ops = [
+        UpdateOne(
+            {"recipient_user_id": uid, "batch_type": batch_type, "target_id": target_id,
+             "notification_sent": True, "$or": [{"window_until": {"$lte": now}}, {"window_until": None}]},
+            {
+                "$set": {
+                    "target_title": target_title,
+                    "user_ids": [],
+                    "user_names": [],
+                    "first_action_at": now,
+                    "last_action_at": now,
+                    "due_at": None,
+                    "window_until": due_at,
+                    "expires_at": due_at + NOTIFICATION_BATCH_RETENTION,
+                },
+                "$setOnInsert": {"id": str(uuid.uuid4())},
+            },
+            upsert=True
+        )
+        for uid in first
+    ]
+    try:
+        await db.pending_notification_batches.bulk_write(ops, ordered=False)
+        return set(first)
+    except BulkWriteError as e:
+        # A concurrent action opened some of these windows: settle those one at a time
+        raced = duplicate_key_indexes(e)
+        immediate = {uid for i, uid in enumerate(first) if i not in raced}
+        for i in raced:
+            if await add_to_notification_batch(first[i], batch_type, target_id, target_title, actor_user_id, actor_user_name):
+                immediate.add(first[i])
+        return immediate
 
 def format_batch_notification_message(user_names: List[str], action_type: str) -> str:
     """Format a batched notification message."""
@@ -802,83 +1059,128 @@ def format_batch_notification_message(user_names: List[str], action_type: str) -
         others_count = len(user_names) - 2
         return f"{user_names[0]}, {user_names[1]}, and {others_count} others {action_type}"
 
-async def process_pending_notification_batches():
-    """Process and send pending notification batches that have expired their window."""
-    now = datetime.utcnow()
-    
-    # Find relate batches older than 5 minutes
-    relate_cutoff = now - timedelta(minutes=RELATE_BATCH_WINDOW_MINUTES)
-    relate_batches = await db.pending_notification_batches.find({
-        "batch_type": "relate_batch",
+async def claim_due_notification_batches(now: datetime) -> List[dict]:
+    """Lease a page of due batches to this worker."""
+    unclaimed = {
         "notification_sent": False,
-        "last_action_at": {"$lte": relate_cutoff}
-    }).to_list(100)
+        "due_at": {"$lte": now},
+        "$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}],
+    }
+    due = await db.pending_notification_batches.find(unclaimed, {"_id": 0, "id": 1}).sort("due_at", 1).limit(NOTIFICATION_BATCH_PAGE_SIZE).to_list(NOTIFICATION_BATCH_PAGE_SIZE)
+    if not due:
+        return []
     
-    # Find comment batches older than 3 minutes
-    comment_cutoff = now - timedelta(minutes=COMMENT_BATCH_WINDOW_MINUTES)
-    comment_batches = await db.pending_notification_batches.find({
-        "batch_type": "comment_batch",
-        "notification_sent": False,
-        "last_action_at": {"$lte": comment_cutoff}
-    }).to_list(100)
+    claim = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    await db.pending_notification_batches.update_many(
+        {**unclaimed, "id": {"$in": [b["id"] for b in due]}},
+        {"$set": {"claimed_by": claim, "claimed_until": now + timedelta(seconds=NOTIFICATION_BATCH_CLAIM_SECONDS)}}
+    )
+    return await db.pending_notification_batches.find({"claimed_by": claim}, {"_id": 0}).to_list(NOTIFICATION_BATCH_PAGE_SIZE)
+
+async def complete_notification_batch(batch: dict):
+    """Remove the sent actors from the batch; actors added while it was being sent stay pending."""
+    sent = set(batch.get("user_ids", []))
+    doc = batch
+    for _ in range(5):
+        remaining = [(uid, name) for uid, name in zip(doc.get("user_ids", []), doc.get("user_names", [])) if uid not in sent]
+        update = {
+            "user_ids": [uid for uid, _ in remaining],
+            "user_names": [name for _, name in remaining],
+            "notification_sent": not remaining,
+            "claimed_by": None,
+            "claimed_until": None,
+        }
+        if not remaining:
+            update["due_at"] = None
+        result = await db.pending_notification_batches.update_one(
+            {"id": doc["id"], "last_action_at": doc["last_action_at"]},
+            {"$set": update}
+        )
+        if result.matched_count:
+            return
+        doc = await db.pending_notification_batches.find_one({"id": batch["id"]}, {"_id": 0})
+        if not doc:
+            return
+
+async def send_notification_batch(batch: dict):
+    user_names = batch.get("user_names", [])
+    target_title = batch.get("target_title", "your Frikt")[:40]
+    target_id = batch.get("target_id")
+    recipient_id = batch.get("recipient_user_id")
     
-    all_batches = relate_batches + comment_batches
+    if batch["batch_type"] == "relate_batch":
+        action_text = "related to your Frikt"
+        title = "New relates!"
+    else:
+        action_text = "commented on your Frikt"
+        title = "New comments!"
     
-    for batch in all_batches:
-        try:
-            user_names = batch.get("user_names", [])
-            target_title = batch.get("target_title", "your Frikt")[:40]
-            target_id = batch.get("target_id")
-            recipient_id = batch.get("recipient_user_id")
-            
-            if batch["batch_type"] == "relate_batch":
-                action_text = "related to your Frikt"
-                title = "New relates!"
-            else:
-                action_text = "commented on your Frikt"
-                title = "New comments!"
-            
-            message = format_batch_notification_message(user_names, action_text)
-            
-            if message:
-                # Create in-app notification
-                notification = Notification(
-                    user_id=recipient_id,
-                    type="batched_" + batch["batch_type"],
-                    problem_id=target_id,
-                    message=message
-                )
-                await db.notifications.insert_one(notification.dict())
-                
-                # Send push notification
-                await send_notification_to_user(
-                    recipient_id,
-                    title,
-                    message,
-                    {"type": batch["batch_type"], "problemId": target_id}
-                )
-            
-            # Mark batch as sent
-            await db.pending_notification_batches.update_one(
-                {"id": batch["id"]},
-                {"$set": {"notification_sent": True}}
-            )
-            
-        except Exception as e:
-            logger.error(f"Error processing notification batch {batch.get('id')}: {e}")
+    message = format_batch_notification_message(user_names, action_text)
     
-    # Cleanup old batches (older than 24 hours)
-    cleanup_cutoff = now - timedelta(hours=24)
-    await db.pending_notification_batches.delete_many({
-        "notification_sent": True,
-        "last_action_at": {"$lte": cleanup_cutoff}
-    })
+    if message:
+        # Create in-app notification
+        notification = Notification(
+            user_id=recipient_id,
+            type="batched_" + batch["batch_type"],
+            problem_id=target_id,
+            message=message
+        )
+        await insert_notification(notification.dict())
+        
+        # Send push notification
+        await send_notification_to_user(
+            recipient_id,
+            title,
+            message,
+            {"type": batch["batch_type"], "problemId": target_id}
+        )
+    
+    await complete_notification_batch(batch)
+
+async def process_pending_notification_batches() -> int:
+    """Send due notification batches a claimed page at a time until none are left. Returns batches sent."""
+    semaphore = asyncio.Semaphore(NOTIFICATION_BATCH_SEND_CONCURRENCY)
+    
+    async def send(batch: dict) -> bool:
+        async with semaphore:
+            try:
+                await send_notification_batch(batch)
+                return True
+            except Exception as e:
+                # Claim expires and the batch is retried on a later pass
+                logger.error(f"Error processing notification batch {batch.get('id')}: {e}")
+                return False
+    
+    sent = 0
+    while True:
+        batches = await claim_due_notification_batches(datetime.utcnow())
+        if not batches:
+            return sent
+        results = await asyncio.gather(*(send(b) for b in batches))
+        sent += sum(results)
+
+async def migrate_legacy_notification_batches():
+    """Move documents from the old one-per-window layout to one per key."""
+    # Sent documents only tracked an open window (at most a few minutes)
+    await db.pending_notification_batches.delete_many({"window_until": {"$exists": False}, "notification_sent": True})
+    legacy = await db.pending_notification_batches.find(
+        {"window_until": {"$exists": False}}, {"_id": 0, "id": 1, "batch_type": 1, "last_action_at": 1}
+    ).to_list(None)
+    ops = []
+    for batch in legacy:
+        due_at = notification_batch_due_at(batch["last_action_at"] + notification_batch_window(batch["batch_type"]))
+        ops.append(UpdateOne({"id": batch["id"]}, {"$set": {
+            "due_at": due_at, "window_until": due_at, "expires_at": due_at + NOTIFICATION_BATCH_RETENTION,
+        }}))
+    if ops:
+        await db.pending_notification_batches.bulk_write(ops, ordered=False)
+        logger.info(f"Migrated {len(ops)} pending notification batches")
 
 # Background task to process batches
 notification_batch_task_running = False
 
 async def notification_batch_processor():
-    """Background task that runs every minute to process pending batches."""
+    """Background task that polls for due batches (every worker; claims prevent double sends)."""
     global notification_batch_task_running
     if notification_batch_task_running:
         return
@@ -886,7 +1188,7 @@ async def notification_batch_processor():
     notification_batch_task_running = True
     try:
         while True:
-            await asyncio.sleep(60)  # Check every minute
+            await asyncio.sleep(NOTIFICATION_BATCH_POLL_SECONDS)
             try:
                 await process_pending_notification_batches()
             except Exception as e:
@@ -894,35 +1196,336 @@ async def notification_batch_processor():
     finally:
         notification_batch_task_running = False
 
+# ===================== DOMAIN EVENTS =====================
+# Write endpoints commit their core write, emit an event and return. Side effects
+# (author gamification, notifications, push) run in a bounded worker pool.
+#
+# Events are persisted in db.domain_events before they are queued, so events still
+# in a process's queue when it stops are picked up by the recovery job. Each handler
+# gets a run document in db.event_handler_runs per (event id, handler), claimed before
+# it runs and marked done only once it returns. A handler that raises is retried with
+# backoff, as is one whose run was claimed by a process that died mid-handler, up to
+# EVENT_HANDLER_MAX_ATTEMPTS; after that the run is dead-lettered with its error. An
+# event is done once every handler is done or dead.
+#
+# Handlers can therefore run more than once for an event. They receive the event id
+# (payload["event_id"]) and key what they write on it (see event_key), so a retry
+# repeats nothing that already happened.
+
+EVENT_QUEUE_MAXSIZE = int(os.environ.get("EVENT_QUEUE_MAXSIZE", "10000"))
+EVENT_WORKER_COUNT = int(os.environ.get("EVENT_WORKER_COUNT", "4"))
+EVENT_RECOVERY_JOB = "domain_event_recovery"
+EVENT_RECOVERY_INTERVAL_SECONDS = 60
+# Events still pending after this long are assumed lost with their process's queue
+EVENT_RECOVERY_AFTER_SECONDS = 300
+EVENT_RECOVERY_BATCH_SIZE = 500
+# A run still marked running after this long is assumed lost with its process
+EVENT_HANDLER_CLAIM_SECONDS = 300
+EVENT_HANDLER_MAX_ATTEMPTS = 5
+EVENT_HANDLER_BACKOFF_BASE_SECONDS = 30
+EVENT_HANDLER_BACKOFF_MAX_SECONDS = 1800
+# Event and handler-run documents expire (TTL index on expires_at) after this
+EVENT_RETENTION = timedelta(days=2)
+
+_event_handlers: Dict[str, List[Callable]] = {}
+_event_queue: Optional[asyncio.Queue] = None
+_event_workers: List[asyncio.Task] = []
+
+def on_domain_event(event_name: str):
+    """Register an async handler for a domain event. Handlers for one event run in
+    registration order and are retried when they fail, so keep them small and
+    idempotent (see event_key)."""
+    def decorator(func):
+        _event_handlers.setdefault(event_name, []).append(func)
+        return func
+    return decorator
+
+def event_key(event: dict, name: str) -> str:
+    """Id for something a handler writes for this event, the same on every retry."""
+    return f"{event['event_id']}:{name}"
+
+def get_event_queue() -> asyncio.Queue:
+    global _event_queue
+    if _event_queue is None:
+        _event_queue = asyncio.Queue(maxsize=EVENT_QUEUE_MAXSIZE)
+    return _event_queue
+
+async def emit_event(event_name: str, payload: dict):
+    """Persist a domain event and queue it for the worker pool. Blocks (backpressure)
+    when the queue is full."""
+    if event_name not in _event_handlers:
+        return
+    now = datetime.utcnow()
+    event_id = str(uuid.uuid4())
+    await db.domain_events.insert_one({
+        "_id": event_id,
+        "name": event_name,
+        "payload": payload,
+        "status": "pending",
+        "created_at": now,
+        "expires_at": now + EVENT_RETENTION,
+    })
+    await get_event_queue().put((event_name, payload, event_id))
+
+async def claim_handler_run(run_id: str, event_name: str) -> bool:
+    """Claim a handler's run for this worker: its first attempt, a failed attempt whose
+    backoff has passed, or a running one whose claim expired. False if the run is done,
+    dead, waiting for its backoff or running elsewhere."""
+    now = datetime.utcnow()
+    claimed_until = now + timedelta(seconds=EVENT_HANDLER_CLAIM_SECONDS)
+    try:
+        await db.event_handler_runs.insert_one({
+            "_id": run_id, "event": event_name, "status": "running", "attempts": 1,
+            "claimed_until": claimed_until, "started_at": now, "expires_at": now + EVENT_RETENTION,
+        })
+        return True
+    except DuplicateKeyError:
+        pass
+    run = await db.event_handler_runs.find_one_and_update(
+        {"_id": run_id, "$or": [
+            {"status": "failed", "next_attempt_at": {"$lte": now}},
+            {"status": "running", "claimed_until": {"$lt": now}},
+        ]},
+        {"$inc": {"attempts": 1}, "$set": {"status": "running", "claimed_until": claimed_until, "started_at": now}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not run:
+        return False
+    if run["attempts"] > EVENT_HANDLER_MAX_ATTEMPTS:
+        # Its last attempt was lost with its process
+        logger.error(f"Event handler run {run_id} dead after {run['attempts'] - 1} attempts")
+        await db.event_handler_runs.update_one({"_id": run_id}, {"$set": {"status": "dead", "claimed_until": None}})
+        return False
+    return True
+
+async def finish_handler_run(run_id: str, error: Optional[Exception] = None):
+    """Mark a claimed run done, or failed (retried after a backoff) / dead."""
+    if error is None:
+        await db.event_handler_runs.update_one(
+            {"_id": run_id}, {"$set": {"status": "done", "claimed_until": None, "finished_at": datetime.utcnow()}}
+        )
+        return
+    run = await db.event_handler_runs.find_one({"_id": run_id}, {"attempts": 1})
+    attempts = run["attempts"] if run else EVENT_HANDLER_MAX_ATTEMPTS
+    update = {"status": "failed", "claimed_until": None, "error": str(error)[:500]}
+    if attempts >= EVENT_HANDLER_MAX_ATTEMPTS:
+        update["status"] = "dead"
+    else:
+        update["next_attempt_at"] = datetime.utcnow() + retry_backoff(
+            attempts, EVENT_HANDLER_BACKOFF_BASE_SECONDS, EVENT_HANDLER_BACKOFF_MAX_SECONDS
+        )
+    await db.event_handler_runs.update_one({"_id": run_id}, {"$set": update})
+
+async def run_event_handlers(event_name: str, payload: dict, event_id: str):
+    """Run every handler for an event that is due to run, then mark the event done if
+    they all are, or schedule its next attempt."""
+    event = {**payload, "event_id": event_id}
+    run_ids = []
+    for handler in _event_handlers.get(event_name, []):
+        run_id = f"{event_id}:{handler.__name__}"
+        run_ids.append(run_id)
+        if not await claim_handler_run(run_id, event_name):
+            continue
+        try:
+            await handler(event)
+        except Exception as e:
+            logger.error(f"Event handler {handler.__name__} failed for {event_name} ({event_id}): {e}")
+            await finish_handler_run(run_id, e)
+        else:
+            await finish_handler_run(run_id)
+
+    # Runs written before runs had a status count as finished
+    unfinished = await db.event_handler_runs.find(
+        {"_id": {"$in": run_ids}, "status": {"$in": ["running", "failed"]}},
+        {"next_attempt_at": 1, "claimed_until": 1}
+    ).to_list(None)
+    if unfinished:
+        next_attempt_at = min(run.get("next_attempt_at") or run.get("claimed_until") or datetime.utcnow() for run in unfinished)
+        await db.domain_events.update_one(
+            {"_id": event_id, "status": "pending"}, {"$set": {"next_attempt_at": next_attempt_at}}
+        )
+        return
+    await db.domain_events.update_one(
+        {"_id": event_id},
+        {"$set": {"status": "done", "processed_at": datetime.utcnow()}}
+    )
+
+async def domain_event_worker():
+    queue = get_event_queue()
+    while True:
+        event_name, payload, event_id = await queue.get()
+        try:
+            await run_event_handlers(event_name, payload, event_id)
+        except Exception as e:
+            logger.error(f"Error processing event {event_name}: {e}")
+        finally:
+            queue.task_done()
+
+async def recover_domain_events():
+    """Run events whose handler retries are due, and events that stayed pending past
+    EVENT_RECOVERY_AFTER_SECONDS without a first run (their process stopped before
+    draining its queue). Handlers that are done are skipped."""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=EVENT_RECOVERY_AFTER_SECONDS)
+    recovered = 0
+    async for event in db.domain_events.find({"status": "pending", "$or": [
+        {"next_attempt_at": {"$lte": now}},
+        {"next_attempt_at": None, "created_at": {"$lt": cutoff}},
+    ]}).sort("created_at", 1).limit(EVENT_RECOVERY_BATCH_SIZE):
+        await run_event_handlers(event["name"], event["payload"], event["_id"])
+        recovered += 1
+    if recovered:
+        logger.warning(f"Recovered {recovered} pending domain events")
+
+def start_event_workers():
+    if _event_workers:
+        return
+    for _ in range(EVENT_WORKER_COUNT):
+        _event_workers.append(asyncio.create_task(domain_event_worker()))
+
+async def stop_event_workers(timeout: float = 10.0):
+    """Give queued events a chance to finish, then cancel the workers."""
+    if _event_queue is not None and _event_workers:
+        try:
+            await asyncio.wait_for(_event_queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Shutting down with {_event_queue.qsize()} unprocessed domain events (left for recovery)")
+    for task in _event_workers:
+        task.cancel()
+    _event_workers.clear()
+
+# ===================== BACKGROUND JOBS =====================
+# Periodic jobs that must run on one instance at a time hold a lease in db.job_leases.
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+async def acquire_lease(name: str, ttl_seconds: int) -> bool:
+    """Take or renew the named lease for this worker. False if another worker holds it."""
+    now = datetime.utcnow()
+    try:
+        await db.job_leases.update_one(
+            {"_id": name, "$or": [{"owner": WORKER_ID}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # Lease exists, is held by someone else and hasn't expired
+        return False
+
+async def release_lease(name: str):
+    await db.job_leases.update_one(
+        {"_id": name, "owner": WORKER_ID},
+        {"$set": {"expires_at": datetime.utcnow()}}
+    )
+
+def retry_backoff(attempts: int, base_seconds: float, max_seconds: float) -> timedelta:
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(base_seconds * 2 ** (attempts - 1), max_seconds)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+async def run_periodic_job(name: str, interval_seconds: float, job: Callable, leased: bool = True):
+    """Run `job` every interval. With leased=True only the lease holder runs it."""
+    lease_ttl = max(30, int(interval_seconds * 3))
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            if leased and not await acquire_lease(name, lease_ttl):
+                continue
+            await job()
+        except Exception as e:
+            logger.error(f"Error in background job {name}: {e}")
+
+# ===================== EXPIRY POLICIES =====================
+# Every collection holding short-lived documents, declared in one place. Startup creates
+# a TTL index for each and Mongo's TTL monitor evicts expired documents in the background
+# (roughly once a minute), so no request or job has to delete them. Reads that must not
+# see a just-expired document still filter on expires_at.
+
+# collection -> (date field, seconds after that date before the document is removed)
+EXPIRY_POLICIES = {
+    # expires_at is set per document from the retention constants next to each writer
+    "pending_notification_batches": ("expires_at", 0),
+    "push_tickets": ("expires_at", 0),
+    "push_outbox": ("expires_at", 0),
+    "email_outbox": ("expires_at", 0),
+    "fanout_jobs": ("expires_at", 0),
+    "domain_events": ("expires_at", 0),
+    "event_handler_runs": ("expires_at", 0),
+    "problem_trends": ("expires_at", 0),
+    "trend_actors": ("expires_at", 0),
+    "community_join_requests": ("expires_at", 0),
+    "community_requests": ("expires_at", 0),
+    # Kept a day past expiry so forgot-password rate limiting still sees them
+    "password_reset_tokens": ("expires_at", int(timedelta(days=1).total_seconds())),
+    # Badges queued for a user who never came back to see them
+    "pending_badge_notifications": ("created_at", int(timedelta(days=30).total_seconds())),
+}
+
+async def ensure_expiry_indexes():
+    for collection, (field, seconds) in EXPIRY_POLICIES.items():
+        try:
+            try:
+                await db[collection].create_index(field, expireAfterSeconds=seconds)
+            except OperationFailure:
+                # An index on the field already exists with other options: change it in place
+                await db.command("collMod", collection, index={"keyPattern": {field: 1}, "expireAfterSeconds": seconds})
+        except Exception as e:
+            logger.warning(f"TTL index warning for {collection}.{field}: {e}")
+
 # ===================== GAMIFICATION HELPERS =====================
 
+def build_user_stats_update(user_id: str, inc: Optional[dict] = None, set_fields: Optional[dict] = None,
+                            max_fields: Optional[dict] = None) -> dict:
+    """Update document for user_stats that also fills UserStats defaults on upsert."""
+    update = {}
+    if inc:
+        update["$inc"] = inc
+    if set_fields:
+        update["$set"] = set_fields
+    if max_fields:
+        update["$max"] = max_fields
+    
+    # Defaults for fields not touched by the other operators (a path and its
+    # parent can't appear in the same update)
+    touched = {key.split(".")[0] for op in update.values() for key in op}
+    defaults = {
+        k: v for k, v in UserStats(user_id=user_id).dict().items()
+        if k != "user_id" and k not in touched
+    }
+    if defaults:
+        update["$setOnInsert"] = defaults
+    return update
+
+async def bump_user_stats(user_id: str, inc: Optional[dict] = None, set_fields: Optional[dict] = None,
+                          max_fields: Optional[dict] = None) -> dict:
+    """
+    Apply $inc / $set / $max to a user's stats in one round trip, creating the
+    document with UserStats defaults if it doesn't exist. Returns the updated stats.
+    Keys may be dotted paths, e.g. {"posts_per_category.work": 1}.
+    """
+    update = build_user_stats_update(user_id, inc, set_fields, max_fields)
+    for attempt in range(2):
+        try:
+            return await db.user_stats.find_one_and_update(
+                {"user_id": user_id},
+                update,
+                projection={"_id": 0, "activity_seq": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race on the unique user_id index; the doc exists now
+            if attempt:
+                raise
+
 async def get_or_create_user_stats(user_id: str) -> dict:
     """Get user stats, creating default if not exists"""
-    stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
-    if not stats:
-        stats = UserStats(user_id=user_id).dict()
-        await db.user_stats.insert_one(stats)
-        # Re-fetch without _id to ensure clean dict
-        stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
-    return stats
+    return await bump_user_stats(user_id)
 
 async def update_user_stats(user_id: str, updates: dict) -> dict:
     """Update user stats and return the updated document"""
-    await db.user_stats.update_one(
-        {"user_id": user_id},
-        {"$set": updates},
-        upsert=True
-    )
-    return await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
-
-async def increment_user_stat(user_id: str, field: str, amount: int = 1) -> dict:
-    """Increment a numeric stat field"""
-    await get_or_create_user_stats(user_id)  # Ensure stats exist
-    await db.user_stats.update_one(
-        {"user_id": user_id},
-        {"$inc": {field: amount}}
-    )
-    return await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
+    return await bump_user_stats(user_id, set_fields=updates)
 
 async def sync_user_stats_from_db(user_id: str) -> dict:
     """
@@ -949,12 +1552,19 @@ async def sync_user_stats_from_db(user_id: str) -> dict:
     for cat in category_counts:
         if cat["_id"]:
             posts_per_category[cat["_id"]] = cat["count"]
+    relates_given_per_category, comments_per_category = {}, {}
+    for collection, per_category in [(db.relates, relates_given_per_category), (db.comments, comments_per_category)]:
+        async for row in collection.aggregate(group_by_problem_category({"user_id": user_id})):
+            if row["_id"].get("category_id"):
+                per_category[row["_id"]["category_id"]] = row["score"]
     
     # Count frikts opened (views) - this might not be tracked per user, keep existing
-    existing_stats = await get_or_create_user_stats(user_id)
-    total_frikts_opened = existing_stats.get("total_frikts_opened", 0)
+    # (plus activity events the aggregator hasn't folded in yet)
+    existing_stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0}) or {}
+    pending_inc, _, latest_event_id = await pending_activity_changes(user_id, existing_stats.get("activity_seq"))
+    total_frikts_opened = existing_stats.get("total_frikts_opened", 0) + pending_inc.get("total_frikts_opened", 0)
     current_visit_streak = existing_stats.get("current_visit_streak", 0)
-    users_followed = existing_stats.get("users_followed", 0)
+    users_followed = existing_stats.get("users_followed", 0) + pending_inc.get("users_followed", 0)
     
     # Update user_stats with correct values
     updated_stats = {
@@ -963,205 +1573,178 @@ async def sync_user_stats_from_db(user_id: str) -> dict:
         "total_relates_given": total_relates_given,
         "total_relates_received": total_relates_received,
         "posts_per_category": posts_per_category,
+        "relates_given_per_category": relates_given_per_category,
+        "comments_per_category": comments_per_category,
         "total_frikts_opened": total_frikts_opened,
         "current_visit_streak": current_visit_streak,
         "users_followed": users_followed,
     }
+    # Everything logged so far is reflected in these counts
+    if latest_event_id:
+        updated_stats["activity_seq"] = latest_event_id
     
-    await db.user_stats.update_one(
-        {"user_id": user_id},
-        {"$set": updated_stats},
-        upsert=True
-    )
+    stats = await bump_user_stats(user_id, set_fields=updated_stats)
     
     logger.info(f"Synced stats for user {user_id}: posts={total_posts}, comments={total_comments}, relates_given={total_relates_given}")
     
-    return await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
+    return stats
 
-async def increment_category_posts(user_id: str, category_id: str) -> dict:
-    """Increment posts count for a specific category"""
-    await get_or_create_user_stats(user_id)
-    await db.user_stats.update_one(
-        {"user_id": user_id},
-        {"$inc": {f"posts_per_category.{category_id}": 1}}
-    )
-    return await db.user_stats.find_one({"user_id": user_id}, {"_id": 0})
+# Badge rules: (badge_id, triggers that evaluate it, predicate(stats, user) -> bool).
+# trigger "all" evaluates every rule.
+
+def _stat_at_least(field: str, threshold: int):
+    return lambda stats, user: stats.get(field, 0) >= threshold
+
+def _category_posts_at_least(cat_id: str, threshold: int):
+    return lambda stats, user: (stats.get("posts_per_category") or {}).get(cat_id, 0) >= threshold
+
+def _joined_before(date_before: datetime):
+    def predicate(stats, user):
+        # Test accounts are excluded from OG/Early badges
+        if user.get("name", "").lower() in TEST_ACCOUNTS:
+            return False
+        created_at = user.get("created_at")
+        if not created_at:
+            return False
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+        return created_at.replace(tzinfo=None) < date_before
+    return predicate
+
+BADGE_RULES = [
+    # Streak badges
+    *[(badge_id, ("visit",), _stat_at_least("current_visit_streak", threshold))
+      for badge_id, threshold in [("streak_2", 2), ("streak_7", 7), ("streak_14", 14), ("streak_30", 30), ("streak_100", 100)]],
+    # Explorer badges
+    *[(badge_id, ("explore",), _stat_at_least("total_frikts_opened", threshold))
+      for badge_id, threshold in [("explorer_3", 3), ("explorer_25", 25), ("explorer_100", 100)]],
+    # Relater badges (giving relates)
+    *[(badge_id, ("relate",), _stat_at_least("total_relates_given", threshold))
+      for badge_id, threshold in [("relater_1", 1), ("relater_10", 10), ("relater_50", 50), ("relater_200", 200), ("relater_500", 500)]],
+    # Creator badges
+    *[(badge_id, ("create",), _stat_at_least("total_posts", threshold))
+      for badge_id, threshold in [("creator_1", 1), ("creator_5", 5), ("creator_10", 10)]],
+    # Commenter badges
+    *[(badge_id, ("comment",), _stat_at_least("total_comments", threshold))
+      for badge_id, threshold in [("commenter_1", 1), ("commenter_10", 10), ("commenter_25", 25)]],
+    # Social Impact badges (relates received)
+    *[(badge_id, ("impact",), _stat_at_least("total_relates_received", threshold))
+      for badge_id, threshold in [("impact_5", 5), ("impact_25", 25), ("impact_100", 100)]],
+    # Viral badges (Drama Influencer, Universal Problem)
+    ("drama_influencer", ("viral",), _stat_at_least("max_relates_on_single_post", 20)),
+    ("universal_problem", ("viral",), _stat_at_least("max_relates_on_single_post", 50)),
+    # Follow badge
+    ("follow_5", ("follow",), _stat_at_least("users_followed", 5)),
+    # Category badges
+    *[(f"category_{cat_id}_{level}", ("create", "category"), _category_posts_at_least(cat_id, threshold))
+      for cat_id in CATEGORY_IDS for level, threshold in [("apprentice", 1), ("master", 5)]],
+    # Special date-based badges: OG Member before March 15, 2026, Early Frikter before June 1, 2026
+    ("og_member", ("special",), _joined_before(datetime(2026, 3, 15))),
+    ("early_frikter", ("special",), _joined_before(datetime(2026, 6, 1))),
+]
 
-async def has_badge(user_id: str, badge_id: str) -> bool:
-    """Check if user already has a badge"""
-    existing = await db.user_achievements.find_one({"user_id": user_id, "badge_id": badge_id})
-    return existing is not None
+def evaluate_badge_rules(user: dict, stats: dict, triggers) -> List[str]:
+    """Badge IDs whose rule is satisfied for the given trigger(s). Pure, no I/O."""
+    if isinstance(triggers, str):
+        triggers = [triggers]
+    check_all = "all" in triggers
+    return [
+        badge_id for badge_id, rule_triggers, predicate in BADGE_RULES
+        if (check_all or any(t in rule_triggers for t in triggers)) and predicate(stats, user)
+    ]
 
-async def award_badge(user_id: str, badge_id: str) -> Optional[dict]:
-    """Award a badge to user if not already earned. Returns badge info if newly awarded."""
-    if await has_badge(user_id, badge_id):
-        return None
-    
-    badge_info = BADGES.get(badge_id)
-    if not badge_info:
-        return None
-    
-    achievement = UserAchievement(user_id=user_id, badge_id=badge_id)
-    await db.user_achievements.insert_one(achievement.dict())
-    
-    logger.info(f"Badge awarded: {badge_id} to user {user_id}")
+def badge_award_payload(badge_id: str, unlocked_at: datetime) -> dict:
+    badge_info = BADGES[badge_id]
     return {
         "badge_id": badge_id,
         "name": badge_info["name"],
         "icon": badge_info["icon"],
         "description": badge_info["description"],
-        "unlocked_at": achievement.unlocked_at.isoformat()
+        "unlocked_at": unlocked_at.isoformat()
     }
 
-async def check_and_award_badges(user_id: str, user: dict, stats: dict, trigger: str) -> List[dict]:
+async def check_and_award_badges(user_id: str, user: dict, stats: dict, trigger) -> List[dict]:
     """
-    Check and award badges based on trigger event.
+    Check and award badges based on trigger event (a trigger name or a list of them).
     Returns list of newly awarded badges.
+
+    Rules are evaluated in memory; the user's achievements are read once (only if some
+    rule is satisfied) and new ones are written with a single insert_many. The unique
+    (user_id, badge_id) index makes concurrent awards safe.
     """
-    newly_awarded = []
-    
-    # Streak badges
-    if trigger in ["visit", "all"]:
-        streak = stats.get("current_visit_streak", 0)
-        streak_thresholds = [
-            ("streak_2", 2), ("streak_7", 7), ("streak_14", 14),
-            ("streak_30", 30), ("streak_100", 100)
-        ]
-        for badge_id, threshold in streak_thresholds:
-            if streak >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
-    
-    # Explorer badges
-    if trigger in ["explore", "all"]:
-        opened = stats.get("total_frikts_opened", 0)
-        explorer_thresholds = [("explorer_3", 3), ("explorer_25", 25), ("explorer_100", 100)]
-        for badge_id, threshold in explorer_thresholds:
-            if opened >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
-    
-    # Relater badges (giving relates)
-    if trigger in ["relate", "all"]:
-        relates_given = stats.get("total_relates_given", 0)
-        relater_thresholds = [
-            ("relater_1", 1), ("relater_10", 10), ("relater_50", 50),
-            ("relater_200", 200), ("relater_500", 500)
-        ]
-        for badge_id, threshold in relater_thresholds:
-            if relates_given >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
-    
-    # Creator badges
-    if trigger in ["create", "all"]:
-        total_posts = stats.get("total_posts", 0)
-        creator_thresholds = [("creator_1", 1), ("creator_5", 5), ("creator_10", 10)]
-        for badge_id, threshold in creator_thresholds:
-            if total_posts >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
-    
-    # Commenter badges
-    if trigger in ["comment", "all"]:
-        total_comments = stats.get("total_comments", 0)
-        commenter_thresholds = [("commenter_1", 1), ("commenter_10", 10), ("commenter_25", 25)]
-        for badge_id, threshold in commenter_thresholds:
-            if total_comments >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
+    satisfied = [b for b in evaluate_badge_rules(user, stats, trigger) if b in BADGES]
+    if not satisfied:
+        return []
     
-    # Social Impact badges (relates received)
-    if trigger in ["impact", "all"]:
-        relates_received = stats.get("total_relates_received", 0)
-        impact_thresholds = [("impact_5", 5), ("impact_25", 25), ("impact_100", 100)]
-        for badge_id, threshold in impact_thresholds:
-            if relates_received >= threshold:
-                badge = await award_badge(user_id, badge_id)
-                if badge:
-                    newly_awarded.append(badge)
+    unlocked = set(await db.user_achievements.distinct(
+        "badge_id", {"user_id": user_id, "badge_id": {"$in": satisfied}}
+    ))
+    achievements = [UserAchievement(user_id=user_id, badge_id=b) for b in satisfied if b not in unlocked]
+    if not achievements:
+        return []
     
-    # Viral badges (Drama Influencer, Universal Problem)
-    if trigger in ["viral", "all"]:
-        max_relates = stats.get("max_relates_on_single_post", 0)
-        if max_relates >= 20:
-            badge = await award_badge(user_id, "drama_influencer")
-            if badge:
-                newly_awarded.append(badge)
-        if max_relates >= 50:
-            badge = await award_badge(user_id, "universal_problem")
-            if badge:
-                newly_awarded.append(badge)
+    try:
+        await db.user_achievements.insert_many([a.dict() for a in achievements], ordered=False)
+    except BulkWriteError as e:
+        # Another request awarded some of these first
+        duplicates = duplicate_key_indexes(e)
+        achievements = [a for i, a in enumerate(achievements) if i not in duplicates]
     
-    # Follow badge
-    if trigger in ["follow", "all"]:
-        users_followed = stats.get("users_followed", 0)
-        if users_followed >= 5:
-            badge = await award_badge(user_id, "follow_5")
-            if badge:
-                newly_awarded.append(badge)
+    for a in achievements:
+        logger.info(f"Badge awarded: {a.badge_id} to user {user_id}")
+    return [badge_award_payload(a.badge_id, a.unlocked_at) for a in achievements]
+
+async def check_and_award_badges_bulk(entries: List[tuple]) -> Dict[str, List[dict]]:
+    """
+    Bulk form of check_and_award_badges for many users at once.
+    entries: (user, stats, trigger) tuples. One achievements read and one insert_many
+    for the whole set. Returns newly awarded badges per user_id.
+    """
+    satisfied = {}
+    for user, stats, trigger in entries:
+        badge_ids = [b for b in evaluate_badge_rules(user, stats, trigger) if b in BADGES]
+        if badge_ids:
+            satisfied[user["id"]] = badge_ids
+    if not satisfied:
+        return {}
+    
+    unlocked = set()
+    async for a in db.user_achievements.find(
+        {"user_id": {"$in": list(satisfied)}, "badge_id": {"$in": list({b for ids in satisfied.values() for b in ids})}},
+        {"_id": 0, "user_id": 1, "badge_id": 1}
+    ):
+        unlocked.add((a["user_id"], a["badge_id"]))
+    achievements = [
+        UserAchievement(user_id=user_id, badge_id=b)
+        for user_id, badge_ids in satisfied.items() for b in badge_ids if (user_id, b) not in unlocked
+    ]
+    if not achievements:
+        return {}
     
-    # Category badges
-    if trigger in ["create", "category", "all"]:
-        posts_per_cat = stats.get("posts_per_category", {})
-        for cat_id in CATEGORY_IDS:
-            cat_posts = posts_per_cat.get(cat_id, 0)
-            if cat_posts >= 1:
-                badge = await award_badge(user_id, f"category_{cat_id}_apprentice")
-                if badge:
-                    newly_awarded.append(badge)
-            if cat_posts >= 5:
-                badge = await award_badge(user_id, f"category_{cat_id}_master")
-                if badge:
-                    newly_awarded.append(badge)
-    
-    # Special date-based badges (check user creation date)
-    if trigger in ["special", "all"]:
-        # Check if user is a test account
-        username = user.get("name", "").lower()
-        if username not in TEST_ACCOUNTS:
-            created_at = user.get("created_at")
-            if created_at:
-                if isinstance(created_at, str):
-                    created_at = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-                
-                # OG Member - before March 15, 2026
-                og_date = datetime(2026, 3, 15)
-                if created_at < og_date:
-                    badge = await award_badge(user_id, "og_member")
-                    if badge:
-                        newly_awarded.append(badge)
-                
-                # Early Frikter - before June 1, 2026
-                early_date = datetime(2026, 6, 1)
-                if created_at < early_date:
-                    badge = await award_badge(user_id, "early_frikter")
-                    if badge:
-                        newly_awarded.append(badge)
+    try:
+        await db.user_achievements.insert_many([a.dict() for a in achievements], ordered=False)
+    except BulkWriteError as e:
+        duplicates = duplicate_key_indexes(e)
+        achievements = [a for i, a in enumerate(achievements) if i not in duplicates]
     
-    return newly_awarded
+    awarded: Dict[str, List[dict]] = {}
+    for a in achievements:
+        awarded.setdefault(a.user_id, []).append(badge_award_payload(a.badge_id, a.unlocked_at))
+    return awarded
 
-async def update_visit_streak(user_id: str) -> tuple[dict, bool]:
+def advance_visit_streak(stats: dict, today: str) -> Optional[dict]:
     """
-    Update visit streak logic with grace window.
-    Returns (updated_stats, is_qualifying_visit)
+    Apply a visit on `today` (YYYY-MM-DD) to the streak fields, with grace window.
+    Returns the new streak fields, or None if the user already visited today.
+    Pure, so the activity log can replay visits when rebuilding stats.
     """
-    stats = await get_or_create_user_stats(user_id)
-    today = datetime.utcnow().strftime("%Y-%m-%d")
     last_visit = stats.get("last_visit_date")
     current_streak = stats.get("current_visit_streak", 0)
     streak_miss_count = stats.get("streak_miss_count", 0)
     
     # If already visited today, no change
     if last_visit == today:
-        return stats, False
-    
-    is_qualifying = True
+        return None
     
     if last_visit:
         last_date = datetime.strptime(last_visit, "%Y-%m-%d")
@@ -1190,14 +1773,29 @@ async def update_visit_streak(user_id: str) -> tuple[dict, bool]:
         current_streak = 1
         streak_miss_count = 0
     
-    # Update stats
-    updated_stats = await update_user_stats(user_id, {
+    return {
         "last_visit_date": today,
         "current_visit_streak": current_streak,
         "streak_miss_count": streak_miss_count
-    })
+    }
+
+async def update_visit_streak(user_id: str) -> tuple[dict, bool]:
+    """
+    Update visit streak logic with grace window.
+    Returns (updated_stats, is_qualifying_visit)
+    """
+    stats = await get_or_create_user_stats(user_id)
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    streak_fields = advance_visit_streak(stats, today)
+    if not streak_fields:
+        return stats, False
     
-    return updated_stats, is_qualifying
+    updated_stats = await update_user_stats(user_id, streak_fields)
+    # Logged so a rebuild from the activity log can replay the streak
+    await append_activity_events([{
+        "user_id": user_id, "type": "visit", "date": today, "created_at": datetime.utcnow()
+    }])
+    return updated_stats, True
 
 async def get_user_badges_status(user_id: str, user: dict) -> dict:
     """Get complete badge status for a user"""
@@ -1315,30 +1913,349 @@ def get_badge_requirement(badge_id: str) -> str:
     
     return ""
 
-# ===================== SIGNAL SCORE =====================
+# ===================== ACTIVITY LOG =====================
+# Gamification stats are derived from an append-only log (db.activity_events).
+# Request handlers append one event; the aggregator folds new events into
+# user_stats in batches and records its checkpoint, so user_stats can always be
+# rebuilt from the log. Visit streaks are order-dependent and still computed on
+# request (the visit event is logged so rebuilds can replay it).
+#
+# The checkpoint is an event _id, so event ids are assigned by the database
+# (append_activity_events) and the aggregator's lag is measured on the database
+# clock. Ids made by each app server would follow that server's clock, and one
+# running behind would insert events the checkpoint has already passed.
+
+ACTIVITY_AGGREGATOR_INTERVAL_SECONDS = float(os.environ.get("ACTIVITY_AGGREGATOR_INTERVAL_SECONDS", "5"))
+ACTIVITY_AGGREGATOR_BATCH_SIZE = int(os.environ.get("ACTIVITY_AGGREGATOR_BATCH_SIZE", "2000"))
+# Events younger than this (by the database clock) are left for the next pass so
+# inserts still in flight (with slightly older ObjectIds) are not skipped past
+ACTIVITY_AGGREGATOR_LAG_SECONDS = 2
+ACTIVITY_AGGREGATOR_JOB = "activity_aggregator"
+
+# event type -> stat field incremented by the event's amount
+ACTIVITY_STAT_FIELDS = {
+    "post_created": "total_posts",
+    "relate_given": "total_relates_given",
+    "relate_received": "total_relates_received",
+    "comment_created": "total_comments",
+    "user_followed": "users_followed",
+    "frikt_opened": "total_frikts_opened",
+}
 
-# Signal Score Weights (transparent and configurable)
-SIGNAL_WEIGHTS = {
-    "relate": 3.0,      # 1 relate = 3 points (most valuable - shows resonance)
-    "comment": 2.0,     # 1 comment = 2 points (engagement but easier to game)
-    "unique_commenter": 1.0,  # Bonus per unique person commenting
-    "follow": 1.0,      # 1 follow = 1 point
-    "pain_base": 0.5,   # Pain level multiplier (1-5 scale)
-    "frequency_daily": 1.0,    # Daily friction bonus
-    "frequency_weekly": 0.5,   # Weekly friction bonus
-    "frequency_monthly": 0.25, # Monthly friction bonus
-    "recency_max_boost": 2.0,  # Max recency boost for brand new posts
-    "recency_decay_hours": 72, # Hours until recency boost = 0
+# event type -> per-category map incremented with the total, for events carrying a
+# category_id (or {category_id: amount} in categories, for batched events)
+ACTIVITY_CATEGORY_FIELDS = {
+    "post_created": "posts_per_category",
+    "relate_given": "relates_given_per_category",
+    "comment_created": "comments_per_category",
 }
 
-def calculate_signal_score(problem: dict, include_breakdown: bool = False) -> float | dict:
-    """
-    Calculate SignalScore based on engagement metrics.
-    
-    Formula: 
-    base_score = (relates × 3) + (comments × 2) + (unique_commenters × 1) + (pain × freq_modifier)
-    recency_boost = linear decay from 2.0 to 0 over 72 hours
-    final_score = base_score + recency_boost
+# event type -> badge triggers to re-check once the event is folded
+ACTIVITY_BADGE_TRIGGERS = {
+    "post_created": ["create"],
+    "relate_given": ["relate"],
+    "relate_received": ["impact", "viral"],
+    "comment_created": ["comment"],
+    "user_followed": ["follow"],
+    "frikt_opened": ["explore"],
+}
+
+# Counters carried by a stats_baseline event (snapshot of user_stats when the log started)
+ACTIVITY_BASELINE_FIELDS = [
+    "total_posts", "total_relates_given", "total_relates_received", "total_comments",
+    "total_frikts_opened", "users_followed", "current_visit_streak", "last_visit_date",
+    "streak_miss_count", "posts_per_category", "relates_given_per_category", "comments_per_category",
+    "max_relates_on_single_post",
+]
+
+def fold_activity_event(event: dict, inc: dict, maxes: dict):
+    """Accumulate one event's $inc / $max contributions into the given dicts."""
+    event_type = event["type"]
+    amount = event.get("amount", 1)
+    sign = 1
+    if event_type == "comment_deleted":
+        event_type, sign = "comment_created", -1
+    field = ACTIVITY_STAT_FIELDS.get(event_type)
+    if not field:
+        return  # visit / stats_baseline don't fold incrementally
+    inc[field] = inc.get(field, 0) + sign * amount
+    per_category = ACTIVITY_CATEGORY_FIELDS.get(event_type)
+    categories = event.get("categories") or ({event["category_id"]: amount} if event.get("category_id") else {})
+    if per_category:
+        for cat_id, count in categories.items():
+            path = f"{per_category}.{cat_id}"
+            inc[path] = inc.get(path, 0) + sign * count
+    if event_type == "relate_received" and event.get("relates_count"):
+        maxes["max_relates_on_single_post"] = max(
+            maxes.get("max_relates_on_single_post", 0), event["relates_count"]
+        )
+
+def apply_stat_changes(stats: dict, inc: dict, maxes: dict) -> dict:
+    """In-memory equivalent of a user_stats $inc / $max update."""
+    stats = {**stats, **{f: dict(stats.get(f) or {}) for f in ACTIVITY_CATEGORY_FIELDS.values()}}
+    for path, amount in inc.items():
+        if "." in path:
+            field, cat_id = path.split(".", 1)
+            stats[field][cat_id] = stats[field].get(cat_id, 0) + amount
+        else:
+            stats[path] = stats.get(path, 0) + amount
+    for field, value in maxes.items():
+        stats[field] = max(stats.get(field, 0), value)
+    return stats
+
+async def database_now() -> datetime:
+    """The database server's clock."""
+    return (await db.command("hello"))["localTime"]
+
+async def append_activity_events(events: List[dict]):
+    """Insert activity events, leaving their _ids to the database. Events whose
+    source_id is already recorded are skipped."""
+    result = await db.command({"insert": "activity_events", "documents": events, "ordered": False})
+    errors = [e for e in result.get("writeErrors", []) if e.get("code") != 11000]
+    if errors:
+        raise OperationFailure(errors[0].get("errmsg"), errors[0].get("code"), result)
+
+async def record_activity(user_id: str, event_type: str, source_id: Optional[str] = None, **fields) -> dict:
+    """
+    Append an activity event and return the user's stored stats with this event
+    applied, so the caller can award badges immediately. Other events still
+    waiting for the aggregator (a few seconds' worth) aren't included; the
+    aggregator's own badge check picks up anything this estimate misses.
+    
+    With `source_id` (unique), recording the same event again appends nothing.
+    """
+    event = {"user_id": user_id, "type": event_type, "created_at": datetime.utcnow(), **fields}
+    if source_id:
+        event["source_id"] = source_id
+    _, stats = await asyncio.gather(
+        append_activity_events([event]),
+        db.user_stats.find_one({"user_id": user_id}, {"_id": 0, "activity_seq": 0}),
+    )
+    inc, maxes = {}, {}
+    fold_activity_event(event, inc, maxes)
+    return apply_stat_changes(stats or UserStats(user_id=user_id).dict(), inc, maxes)
+
+async def pending_activity_changes(user_id: str, folded_up_to: Optional[ObjectId],
+                                   up_to: Optional[ObjectId] = None) -> tuple[dict, dict, Optional[ObjectId]]:
+    """$inc / $max of the user's events after `folded_up_to` (through `up_to` if given), plus the latest event id."""
+    query = {"user_id": user_id}
+    if folded_up_to:
+        query["_id"] = {"$gt": folded_up_to}
+    if up_to:
+        query.setdefault("_id", {})["$lte"] = up_to
+    inc, maxes = {}, {}
+    last_id = folded_up_to
+    async for event in db.activity_events.find(query, {"type": 1, "amount": 1, "category_id": 1, "categories": 1, "relates_count": 1}).sort("_id", 1):
+        fold_activity_event(event, inc, maxes)
+        last_id = event["_id"]
+    return inc, maxes, last_id
+
+async def fold_pending_activity(user_id: str, up_to: ObjectId):
+    """Fold a user's events between their activity_seq and `up_to` into user_stats,
+    re-reading the seq whenever someone else moves it first."""
+    while True:
+        stats = await db.user_stats.find_one({"user_id": user_id}, {"_id": 0, "activity_seq": 1}) or {}
+        seq = stats.get("activity_seq")
+        if seq and seq >= up_to:
+            return
+        inc, maxes, last_id = await pending_activity_changes(user_id, seq, up_to)
+        if last_id == seq:
+            return
+        try:
+            await db.user_stats.update_one(
+                {"user_id": user_id, "activity_seq": seq},
+                build_user_stats_update(user_id, inc, {"activity_seq": last_id}, maxes),
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            continue
+
+async def aggregate_activity_batch() -> int:
+    """Fold the next batch of activity events into user_stats. Returns events processed."""
+    state = await db.job_state.find_one({"_id": ACTIVITY_AGGREGATOR_JOB}) or {}
+    query = {"_id": {"$lt": ObjectId.from_datetime(await database_now() - timedelta(seconds=ACTIVITY_AGGREGATOR_LAG_SECONDS))}}
+    if state.get("checkpoint"):
+        query["_id"]["$gt"] = state["checkpoint"]
+    
+    started = time.monotonic()
+    events = await db.activity_events.find(query).sort("_id", 1).limit(ACTIVITY_AGGREGATOR_BATCH_SIZE).to_list(ACTIVITY_AGGREGATOR_BATCH_SIZE)
+    if not events:
+        return 0
+    
+    # Each user's activity_seq records the last event folded into it. A sync, rebuild
+    # or re-run of this batch (crash before the checkpoint write) may already cover
+    # part of it, so only events past the seq are folded, and the write matches the
+    # seq that was read: if it moved in the meantime the upsert hits the unique
+    # user_id index and that user's slice is folded again from the new seq.
+    user_ids = list({event["user_id"] for event in events})
+    seqs = {
+        s["user_id"]: s.get("activity_seq")
+        async for s in db.user_stats.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "activity_seq": 1})
+    }
+    per_user: Dict[str, dict] = {}
+    for event in events:
+        seq = seqs.get(event["user_id"])
+        if seq and event["_id"] <= seq:
+            continue
+        acc = per_user.setdefault(event["user_id"], {"inc": {}, "max": {}, "seq": seq, "last": event["_id"], "triggers": set()})
+        fold_activity_event(event, acc["inc"], acc["max"])
+        acc["last"] = event["_id"]
+        acc["triggers"].update(ACTIVITY_BADGE_TRIGGERS.get(event["type"], []))
+    
+    ops, op_users = [], []
+    for user_id, acc in per_user.items():
+        update = build_user_stats_update(user_id, acc["inc"], {"activity_seq": acc["last"]}, acc["max"])
+        ops.append(UpdateOne({"user_id": user_id, "activity_seq": acc["seq"]}, update, upsert=True))
+        op_users.append(user_id)
+    conflicts = set()
+    if ops:
+        try:
+            await db.user_stats.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            conflicts = duplicate_key_indexes(e)
+            if len(conflicts) != len(e.details.get("writeErrors", [])):
+                raise
+    for index in conflicts:
+        await fold_pending_activity(op_users[index], per_user[op_users[index]]["last"])
+    
+    elapsed = time.monotonic() - started
+    await db.job_state.update_one(
+        {"_id": ACTIVITY_AGGREGATOR_JOB},
+        {
+            "$set": {
+                "checkpoint": events[-1]["_id"],
+                "last_batch_size": len(events),
+                "last_batch_seconds": round(elapsed, 4),
+                "last_batch_events_per_second": round(len(events) / elapsed, 1) if elapsed else None,
+                "updated_at": datetime.utcnow(),
+            },
+            "$inc": {"events_processed": len(events)},
+        },
+        upsert=True
+    )
+    
+    await award_badges_after_aggregation({uid: acc["triggers"] for uid, acc in per_user.items() if acc["triggers"]})
+    return len(events)
+
+async def award_badges_after_aggregation(triggers_by_user: Dict[str, set]):
+    """Badge check for users whose stats just changed; new badges are queued for their next visit."""
+    if not triggers_by_user:
+        return
+    user_ids = list(triggers_by_user)
+    users = {u["id"]: u async for u in db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1, "created_at": 1})}
+    entries = [
+        (users[stats["user_id"]], stats, list(triggers_by_user[stats["user_id"]]))
+        async for stats in db.user_stats.find({"user_id": {"$in": user_ids}}, {"_id": 0})
+        if stats["user_id"] in users
+    ]
+    awarded = await check_and_award_badges_bulk(entries)
+    pending = [
+        {"user_id": user_id, "badge": badge, "created_at": datetime.utcnow()}
+        for user_id, badges in awarded.items() for badge in badges
+    ]
+    if pending:
+        await db.pending_badge_notifications.insert_many(pending)
+
+async def run_activity_aggregator():
+    """Drain the activity log (one lease-holder at a time)."""
+    while await aggregate_activity_batch() == ACTIVITY_AGGREGATOR_BATCH_SIZE:
+        # Full batch: more is waiting, keep the lease alive and continue (unless
+        # it expired and another worker has taken over)
+        if not await acquire_lease(ACTIVITY_AGGREGATOR_JOB, max(30, int(ACTIVITY_AGGREGATOR_INTERVAL_SECONDS * 3))):
+            return
+
+async def seed_activity_baseline():
+    """One-off: snapshot existing user_stats as stats_baseline events so the log
+    alone can rebuild every user's stats."""
+    if await db.job_state.find_one({"_id": "activity_baseline", "seeded": True}):
+        return
+    if not await acquire_lease("activity_baseline", 600):
+        return
+    seeded = 0
+    batch = []
+    async for stats in db.user_stats.find({}, {"_id": 0}):
+        batch.append({
+            "user_id": stats["user_id"],
+            "type": "stats_baseline",
+            "stats": {k: stats[k] for k in ACTIVITY_BASELINE_FIELDS if k in stats},
+            # Events up to here are already included in the snapshot
+            "folded_up_to": stats.get("activity_seq"),
+            "created_at": datetime.utcnow(),
+        })
+        if len(batch) >= 500:
+            await append_activity_events(batch)
+            seeded += len(batch)
+            batch = []
+    if batch:
+        await append_activity_events(batch)
+        seeded += len(batch)
+    await db.job_state.update_one(
+        {"_id": "activity_baseline"},
+        {"$set": {"seeded": True, "users": seeded, "seeded_at": datetime.utcnow()}},
+        upsert=True
+    )
+    await release_lease("activity_baseline")
+    logger.info(f"Seeded activity baseline for {seeded} users")
+
+async def start_activity_aggregator():
+    try:
+        await seed_activity_baseline()
+    except Exception as e:
+        logger.error(f"Activity baseline seeding failed: {e}")
+    await run_periodic_job(ACTIVITY_AGGREGATOR_JOB, ACTIVITY_AGGREGATOR_INTERVAL_SECONDS, run_activity_aggregator)
+
+async def rebuild_user_stats_from_activity(user_id: str) -> dict:
+    """Recompute a user's stats purely from the activity log and store them."""
+    stats = UserStats(user_id=user_id).dict()
+    query = {"user_id": user_id, "type": {"$ne": "stats_baseline"}}
+    baseline = await db.activity_events.find_one({"user_id": user_id, "type": "stats_baseline"}, sort=[("_id", -1)])
+    if baseline:
+        stats.update(baseline.get("stats", {}))
+        if baseline.get("folded_up_to"):
+            query["_id"] = {"$gt": baseline["folded_up_to"]}
+    
+    inc, maxes = {}, {}
+    last_id = None
+    async for event in db.activity_events.find(query).sort("_id", 1):
+        last_id = event["_id"]
+        if event["type"] == "visit" and event.get("date"):
+            streak_fields = advance_visit_streak(stats, event["date"])
+            if streak_fields:
+                stats.update(streak_fields)
+        else:
+            fold_activity_event(event, inc, maxes)
+    stats = apply_stat_changes(stats, inc, maxes)
+    
+    set_fields = {k: v for k, v in stats.items() if k != "user_id"}
+    if last_id:
+        set_fields["activity_seq"] = last_id
+    return await bump_user_stats(user_id, set_fields=set_fields)
+
+# ===================== SIGNAL SCORE =====================
+
+# Signal Score Weights (transparent and configurable)
+SIGNAL_WEIGHTS = {
+    "relate": 3.0,      # 1 relate = 3 points (most valuable - shows resonance)
+    "comment": 2.0,     # 1 comment = 2 points (engagement but easier to game)
+    "unique_commenter": 1.0,  # Bonus per unique person commenting
+    "follow": 1.0,      # 1 follow = 1 point
+    "pain_base": 0.5,   # Pain level multiplier (1-5 scale)
+    "frequency_daily": 1.0,    # Daily friction bonus
+    "frequency_weekly": 0.5,   # Weekly friction bonus
+    "frequency_monthly": 0.25, # Monthly friction bonus
+    "recency_max_boost": 2.0,  # Max recency boost for brand new posts
+    "recency_decay_hours": 72, # Hours until recency boost = 0
+}
+
+def calculate_signal_score(problem: dict, include_breakdown: bool = False) -> float | dict:
+    """
+    Calculate SignalScore based on engagement metrics.
+    
+    Formula: 
+    base_score = (relates × 3) + (comments × 2) + (unique_commenters × 1) + (pain × freq_modifier)
+    recency_boost = linear decay from 2.0 to 0 over 72 hours
+    final_score = base_score + recency_boost
     
     Key principle: Posts with interaction ALWAYS beat posts without (except for very new posts)
     """
@@ -1392,9 +2309,276 @@ def calculate_signal_score(problem: dict, include_breakdown: bool = False) -> fl
             },
             "formula": "Signal = (relates×3) + (comments×2) + (unique_commenters×1) + pain_bonus + recency_boost"
         }
-    
+
     return final_score
 
+async def refresh_signal_score(problem: dict) -> float:
+    """
+    Store the signal score for a problem document returned by an atomic $inc.
+
+    The write is guarded on the counters the score was computed from, so a slower
+    concurrent request can never overwrite a newer score with a stale one.
+    """
+    new_score = calculate_signal_score(problem)
+    await db.problems.update_one(
+        {
+            "id": problem["id"],
+            "relates_count": problem.get("relates_count", 0),
+            "comments_count": problem.get("comments_count", 0),
+            "unique_commenters": problem.get("unique_commenters", 0),
+        },
+        {"$set": {"signal_score": new_score}}
+    )
+    return new_score
+
+async def refresh_signal_scores(problems: List[dict]):
+    """Bulk version of refresh_signal_score for documents re-read after a batch of $inc writes."""
+    ops = [
+        UpdateOne(
+            {
+                "id": p["id"],
+                "relates_count": p.get("relates_count", 0),
+                "comments_count": p.get("comments_count", 0),
+                "unique_commenters": p.get("unique_commenters", 0),
+            },
+            {"$set": {"signal_score": calculate_signal_score(p)}}
+        )
+        for p in problems
+    ]
+    if ops:
+        await db.problems.bulk_write(ops, ordered=False)
+
+# ===================== COUNTER RECONCILER =====================
+# Low-priority background pass (lease holder only) that walks problems, comments,
+# user_stats and notification_counters with resumable cursors, recounts a small batch against the source
+# collections and repairs drift. A mismatch is only confirmed once the writes in flight
+# at the check have landed: after ACTIVITY_AGGREGATOR_LAG_SECONDS (activity inserts in
+# flight, counter $incs next to their write) and once every domain event emitted by then
+# has been handled, since handlers append the activity events user_stats is checked
+# against. If the event queue doesn't drain within RECONCILER_SETTLE_TIMEOUT_SECONDS the
+# batch is left for the next pass rather than "repaired" mid-write. Divergence per
+# field is recorded in job_state to show which write path leaks.
+
+RECONCILER_JOB = "counter_reconciler"
+RECONCILER_INTERVAL_SECONDS = float(os.environ.get("RECONCILER_INTERVAL_SECONDS", "30"))
+RECONCILER_BATCH_SIZE = int(os.environ.get("RECONCILER_BATCH_SIZE", "200"))
+RECONCILER_CONFIRM_DELAY_SECONDS = ACTIVITY_AGGREGATOR_LAG_SECONDS
+RECONCILER_SETTLE_TIMEOUT_SECONDS = 30
+RECONCILER_SAMPLE_LIMIT = 50
+
+PROBLEM_COUNTER_FIELDS = ["relates_count", "comments_count", "unique_commenters"]
+USER_STATS_COUNTER_FIELDS = ["total_posts", "total_comments", "total_relates_given", "total_relates_received"]
+
+def relate_counts_pipeline(match: dict) -> list:
+    """Relates per problem."""
+    return [{"$match": match}, {"$group": {"_id": "$problem_id", "count": {"$sum": 1}}}]
+
+def comment_counts_pipeline(match: dict) -> list:
+    """Non-removed/hidden comments and unique commenters per problem."""
+    return [
+        {"$match": {**match, "status": {"$nin": UNCOUNTED_COMMENT_STATUSES}}},
+        {"$group": {"_id": {"problem_id": "$problem_id", "user_id": "$user_id"}, "count": {"$sum": 1}}},
+        {"$group": {"_id": "$_id.problem_id", "count": {"$sum": "$count"}, "unique": {"$sum": 1}}},
+    ]
+
+async def find_problem_drift(problem_ids: List[str]) -> Dict[str, tuple[dict, dict]]:
+    """(stored, actual) counters for the given problems whose stored counters are wrong."""
+    stored = {
+        p["id"]: {f: p.get(f, 0) for f in PROBLEM_COUNTER_FIELDS}
+        async for p in db.problems.find({"id": {"$in": problem_ids}}, {"_id": 0, "id": 1, **{f: 1 for f in PROBLEM_COUNTER_FIELDS}})
+    }
+    actual = {pid: {f: 0 for f in PROBLEM_COUNTER_FIELDS} for pid in stored}
+    match = {"problem_id": {"$in": list(stored)}}
+    async for row in db.relates.aggregate(relate_counts_pipeline(match)):
+        actual[row["_id"]]["relates_count"] = row["count"]
+    async for row in db.comments.aggregate(comment_counts_pipeline(match)):
+        actual[row["_id"]]["comments_count"] = row["count"]
+        actual[row["_id"]]["unique_commenters"] = row["unique"]
+    return {pid: (stored[pid], actual[pid]) for pid in stored if stored[pid] != actual[pid]}
+
+async def repair_problem_drift(drift: Dict[str, tuple[dict, dict]]):
+    # Guarded on the stored values we compared against; a concurrent $inc wins and the
+    # next pass re-checks the problem
+    await db.problems.bulk_write([
+        UpdateOne({"id": pid, **stored}, {"$set": actual}) for pid, (stored, actual) in drift.items()
+    ], ordered=False)
+    await refresh_signal_scores([{"id": pid, **actual} for pid, (_, actual) in drift.items()])
+
+async def find_comment_drift(comment_ids: List[str]) -> Dict[str, tuple[dict, dict]]:
+    """(stored, actual) helpful_count for the given comments where it is wrong."""
+    stored = {
+        c["id"]: {"helpful_count": c.get("helpful_count", 0)}
+        async for c in db.comments.find({"id": {"$in": comment_ids}}, {"_id": 0, "id": 1, "helpful_count": 1})
+    }
+    actual = {cid: {"helpful_count": 0} for cid in stored}
+    async for row in db.helpfuls.aggregate([
+        {"$match": {"comment_id": {"$in": list(stored)}}},
+        {"$group": {"_id": "$comment_id", "count": {"$sum": 1}}},
+    ]):
+        actual[row["_id"]]["helpful_count"] = row["count"]
+    return {cid: (stored[cid], actual[cid]) for cid in stored if stored[cid] != actual[cid]}
+
+async def repair_comment_drift(drift: Dict[str, tuple[dict, dict]]):
+    await db.comments.bulk_write([
+        UpdateOne({"id": cid, **stored}, {"$set": actual}) for cid, (stored, actual) in drift.items()
+    ], ordered=False)
+
+async def find_user_stats_drift(user_ids: List[str]) -> Dict[str, tuple[dict, dict]]:
+    """
+    (stored, expected) counters for the given users' stats that are wrong. Expected is the
+    recount minus activity events not folded yet, since the aggregator will still add those.
+    Stored includes activity_seq so the repair only applies to the state that was checked.
+    """
+    existing = {s["user_id"]: s async for s in db.user_stats.find({"user_id": {"$in": user_ids}}, {"_id": 0})}
+    user_ids = list(existing)
+    counters = await compute_user_counters(user_ids)
+    pending, _ = await pending_activity_by_user(user_ids, existing)
+    
+    drift = {}
+    for user_id, stats in existing.items():
+        counts = counters.get(user_id) or empty_user_counters()
+        pending_inc = pending.get(user_id, {})
+        stored, expected = {}, {}
+        for field in USER_STATS_COUNTER_FIELDS:
+            stored[field] = stats.get(field, 0)
+            expected[field] = counts[field] - pending_inc.get(field, 0)
+        categories = set(counts["posts_per_category"]) | set(stats.get("posts_per_category") or {})
+        for cat_id in categories:
+            path = f"posts_per_category.{cat_id}"
+            stored[path] = (stats.get("posts_per_category") or {}).get(cat_id, 0)
+            expected[path] = counts["posts_per_category"].get(cat_id, 0) - pending_inc.get(path, 0)
+        if stored != expected:
+            drift[user_id] = ({**stored, "activity_seq": stats.get("activity_seq")}, expected)
+    return drift
+
+async def repair_user_stats_drift(drift: Dict[str, tuple[dict, dict]]):
+    ops = []
+    for user_id, (stored, expected) in drift.items():
+        # $inc by the difference keeps events folded in the meantime; the activity_seq
+        # guard skips users the aggregator touched since the check
+        inc = {f: expected[f] - stored[f] for f in expected if expected[f] != stored[f]}
+        ops.append(UpdateOne({"user_id": user_id, "activity_seq": stored["activity_seq"]}, {"$inc": inc}))
+    await db.user_stats.bulk_write(ops, ordered=False)
+
+async def find_unread_drift(user_ids: List[str]) -> Dict[str, tuple[dict, dict]]:
+    """(stored, actual) unread/total counters for the given users where they are wrong."""
+    stored = {
+        c["user_id"]: {"unread": c.get("unread", 0), "total": c.get("total"), "last_read_at": c.get("last_read_at")}
+        async for c in db.notification_counters.find({"user_id": {"$in": user_ids}}, {"_id": 0})
+    }
+    if not stored:
+        return {}
+    actual = {uid: {"unread": 0, "total": 0} for uid in stored}
+    async for row in db.notifications.aggregate([
+        {"$match": {"user_id": {"$in": list(stored)}}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+    ]):
+        actual[row["_id"]]["total"] = row["count"]
+    unread_since_watermark = [
+        {"user_id": uid, "created_at": {"$gt": c["last_read_at"]}} if c["last_read_at"] else {"user_id": uid}
+        for uid, c in stored.items()
+    ]
+    async for row in db.notifications.aggregate([
+        {"$match": {"is_read": False, "$or": unread_since_watermark}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+    ]):
+        actual[row["_id"]]["unread"] = row["count"]
+    return {
+        uid: (stored[uid], actual[uid]) for uid in stored
+        if (stored[uid]["unread"], stored[uid]["total"]) != (actual[uid]["unread"], actual[uid]["total"])
+    }
+
+async def repair_unread_drift(drift: Dict[str, tuple[dict, dict]]):
+    # Guarded on the counters and the watermark, so a read or insert since the check wins
+    await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": uid, **stored}, {"$set": actual}) for uid, (stored, actual) in drift.items()
+    ], ordered=False)
+
+# collection -> (id field, drift finder, repairer)
+RECONCILER_TARGETS = {
+    "problems": ("id", find_problem_drift, repair_problem_drift),
+    "comments": ("id", find_comment_drift, repair_comment_drift),
+    "user_stats": ("user_id", find_user_stats_drift, repair_user_stats_drift),
+    "notification_counters": ("user_id", find_unread_drift, repair_unread_drift),
+}
+
+async def wait_for_domain_events(cutoff: datetime, timeout: float) -> bool:
+    """Wait until the domain events created before cutoff have been handled. False on
+    timeout. Events older than EVENT_RECOVERY_AFTER_SECONDS are left to the recovery job."""
+    deadline = time.monotonic() + timeout
+    in_flight = {"status": "pending", "created_at": {
+        "$gte": cutoff - timedelta(seconds=EVENT_RECOVERY_AFTER_SECONDS), "$lt": cutoff,
+    }}
+    while await db.domain_events.find_one(in_flight, {"_id": 1}):
+        if time.monotonic() >= deadline:
+            return False
+        await asyncio.sleep(1)
+    return True
+
+async def reconcile_batch(collection: str, after: Optional[str]) -> tuple[Optional[str], int, Dict[str, tuple[dict, dict]]]:
+    """Check the next batch after the cursor. Returns (next cursor or None at the end, checked, repaired drift)."""
+    id_field, find_drift, repair = RECONCILER_TARGETS[collection]
+    query = {id_field: {"$gt": after}} if after else {id_field: {"$type": "string"}}
+    ids = [
+        doc[id_field] async for doc in db[collection].find(query, {"_id": 0, id_field: 1}).sort(id_field, 1).limit(RECONCILER_BATCH_SIZE)
+    ]
+    next_cursor = ids[-1] if len(ids) == RECONCILER_BATCH_SIZE else None
+    if not ids:
+        return None, 0, {}
+    
+    drift = await find_drift(ids)
+    if drift:
+        await asyncio.sleep(RECONCILER_CONFIRM_DELAY_SECONDS)
+        if not await wait_for_domain_events(datetime.utcnow(), RECONCILER_SETTLE_TIMEOUT_SECONDS):
+            logger.info(f"Counter reconciler deferred {len(drift)} {collection} docs: domain events still pending")
+            return next_cursor, len(ids), {}
+        drift = await find_drift(list(drift))
+    if drift:
+        await repair(drift)
+    return next_cursor, len(ids), drift
+
+def divergence_metrics(collection: str, drift: Dict[str, tuple[dict, dict]]) -> tuple[dict, list]:
+    """$inc counters per drifted field, plus samples of what was repaired."""
+    inc, samples = {}, []
+    for doc_id, (stored, actual) in drift.items():
+        for field, value in actual.items():
+            stored_value = stored.get(field) or 0
+            if stored_value == value:
+                continue
+            key = f"divergence.{collection}.{field.replace('.', '_')}"
+            inc[f"{key}.drifted"] = inc.get(f"{key}.drifted", 0) + 1
+            inc[f"{key}.delta"] = inc.get(f"{key}.delta", 0) + (value - stored_value)
+            samples.append({
+                "collection": collection, "id": doc_id, "field": field,
+                "stored": stored_value, "actual": value, "at": datetime.utcnow(),
+            })
+    return inc, samples
+
+async def run_counter_reconciler():
+    """One reconciler tick: a batch of each collection, resuming from the stored cursors."""
+    state = await db.job_state.find_one({"_id": RECONCILER_JOB}) or {}
+    cursors = state.get("cursors", {})
+    
+    for collection in RECONCILER_TARGETS:
+        try:
+            next_cursor, checked, drift = await reconcile_batch(collection, cursors.get(collection))
+        except Exception as e:
+            logger.error(f"Counter reconciler error on {collection}: {e}")
+            continue
+        inc, samples = divergence_metrics(collection, drift)
+        inc[f"checked.{collection}"] = checked
+        inc[f"repaired.{collection}"] = len(drift)
+        if next_cursor is None:
+            inc[f"passes.{collection}"] = 1
+        update = {
+            "$set": {f"cursors.{collection}": next_cursor, "updated_at": datetime.utcnow()},
+            "$inc": inc,
+        }
+        if samples:
+            update["$push"] = {"recent_drift": {"$each": samples, "$slice": -RECONCILER_SAMPLE_LIMIT}}
+            logger.info(f"Counter reconciler repaired {len(drift)} {collection} docs")
+        await db.job_state.update_one({"_id": RECONCILER_JOB}, update, upsert=True)
+
 # ===================== AUTH ROUTES =====================
 
 # Email validation regex pattern
@@ -1475,22 +2659,38 @@ async def login(request: Request, credentials: UserLogin):
 async def get_me(user: dict = Depends(require_auth)):
     return UserResponse(**user)
 
-# ===================== PASSWORD RESET ROUTES =====================
-
-async def send_password_reset_email(email: str, token: str, user_name: str):
-    """Send password reset email using Resend"""
-    if not RESEND_AVAILABLE:
-        logger.warning("resend package not installed - cannot send password reset email")
-        return False
-        
-    if not RESEND_API_KEY:
-        logger.warning("RESEND_API_KEY not configured - cannot send password reset email")
-        return False
-    
-    # Generate reset link - this would be a deep link or web page in production
-    reset_link = f"frikt://reset-password?token={token}"
-    
-    html_content = f"""
+# ===================== EMAIL OUTBOX =====================
+# Outgoing mail is queued in email_outbox and sent by outbox workers through Resend's
+# REST API on a pooled client, at most EMAIL_MAX_IN_FLIGHT requests at a time, so no
+# request handler or thread waits on the provider. A worker claims only as many entries
+# as it can have in flight, so each claim is done within one request timeout, well
+# before EMAIL_OUTBOX_CLAIM_SECONDS lets another worker take it. Bulk mail (the
+# EMAIL_BATCH_KINDS) goes through Resend's batch endpoint, EMAIL_BATCH_SIZE messages
+# per request, and every request is paced to EMAIL_REQUESTS_PER_SECOND so a large run
+# isn't answered with 429s. Failed sends (timeouts, 429, 5xx) are retried with backoff
+# and dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS. Admin alerts are coalesced per
+# recipient: alerts arriving within EMAIL_DIGEST_WINDOW_SECONDS of the first are sent
+# as one digest.
+
+RESEND_API_URL = os.environ.get("RESEND_API_URL", "https://api.resend.com").rstrip("/")
+EMAIL_OUTBOX_WORKERS = int(os.environ.get("EMAIL_OUTBOX_WORKERS", "1"))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", "5"))
+EMAIL_MAX_IN_FLIGHT = int(os.environ.get("EMAIL_MAX_IN_FLIGHT", "4"))
+# Resend's default rate limit is 2 requests per second per team
+EMAIL_REQUESTS_PER_SECOND = float(os.environ.get("EMAIL_REQUESTS_PER_SECOND", "2"))
+EMAIL_BATCH_KINDS = {"weekly_digest"}
+EMAIL_BATCH_SIZE = 100  # Resend's limit per batch request
+EMAIL_OUTBOX_CLAIM_SECONDS = 120
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+EMAIL_OUTBOX_BACKOFF_BASE_SECONDS = 30
+EMAIL_OUTBOX_BACKOFF_MAX_SECONDS = 3600
+EMAIL_DIGEST_WINDOW_SECONDS = int(os.environ.get("EMAIL_DIGEST_WINDOW_SECONDS", "120"))
+EMAIL_DIGEST_MAX_ITEMS = 50
+# Sent entries expire (TTL index on expires_at) after this; dead letters are kept
+EMAIL_OUTBOX_RETENTION = timedelta(days=7)
+
+EMAIL_TEMPLATES = {
+    "password_reset": """
     <!DOCTYPE html>
     <html>
     <head>
@@ -1503,10 +2703,10 @@ async def send_password_reset_email(email: str, token: str, user_name: str):
         </div>
         <div style="background-color: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
             <h2 style="color: #2B2F36; margin-top: 0;">Reset Your Password</h2>
-            <p style="color: #666; line-height: 1.6;">Hi {user_name},</p>
+            <p style="color: #666; line-height: 1.6;">Hi $user_name,</p>
             <p style="color: #666; line-height: 1.6;">We received a request to reset your password. Use the code below to reset it:</p>
             <div style="background-color: #F6F3EE; padding: 20px; text-align: center; border-radius: 8px; margin: 20px 0;">
-                <span style="font-size: 32px; font-weight: bold; color: #E4572E; letter-spacing: 4px;">{token}</span>
+                <span style="font-size: 32px; font-weight: bold; color: #E4572E; letter-spacing: 4px;">$token</span>
             </div>
             <p style="color: #666; line-height: 1.6;">This code expires in <strong>1 hour</strong>.</p>
             <p style="color: #666; line-height: 1.6;">If you didn't request this reset, you can safely ignore this email.</p>
@@ -1515,26 +2715,279 @@ async def send_password_reset_email(email: str, token: str, user_name: str):
         </div>
     </body>
     </html>
-    """
-    
-    params = {
-        "from": SENDER_EMAIL,
-        "to": [email],
-        "subject": f"Reset your {APP_NAME} password",
-        "html": html_content
+    """,
+    "admin_report_item": """
+                <h3>New report received</h3>
+                <p><strong>Reporter:</strong> $reporter_name</p>
+                <p><strong>Target type:</strong> $target_type</p>
+                <p><strong>Target ID:</strong> $target_id</p>
+                <p><strong>Reason:</strong> $reason</p>
+    """,
+    "admin_report_digest": """
+                $items
+                <p>Review them in the FRIKT admin panel.</p>
+    """,
+    "weekly_digest_item": """
+            <div style="border-bottom: 1px solid #eee; padding: 12px 0;">
+                <p style="color: #2B2F36; font-weight: bold; margin: 0 0 4px 0;">$title</p>
+                <p style="color: #999; font-size: 13px; margin: 0;">$context · $relates_count relates · $comments_count comments</p>
+            </div>
+    """,
+    "weekly_digest": """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <meta charset="utf-8">
+        <title>Your week on FRIKT</title>
+    </head>
+    <body style="font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; background-color: #F6F3EE;">
+        <div style="background-color: #2B2F36; padding: 20px; text-align: center; border-radius: 8px 8px 0 0;">
+            <h1 style="color: #E4572E; margin: 0; font-size: 28px;">FRIKT</h1>
+        </div>
+        <div style="background-color: white; padding: 30px; border-radius: 0 0 8px 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+            <h2 style="color: #2B2F36; margin-top: 0;">Your week on FRIKT</h2>
+            <p style="color: #666; line-height: 1.6;">Hi $user_name, here are the top Frikts this week in the places you follow:</p>
+            $items
+            <p style="color: #666; line-height: 1.6;">Open the app to relate and join the conversation.</p>
+            <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
+            <p style="color: #999; font-size: 12px;">You can turn off the weekly digest in your notification settings.</p>
+        </div>
+    </body>
+    </html>
+    """,
+}
+
+_email_client: Optional[httpx.AsyncClient] = None
+_email_semaphore: Optional[asyncio.Semaphore] = None
+_email_outbox_wakeup = asyncio.Event()
+_email_next_request_at = 0.0
+
+@lru_cache(maxsize=None)
+def email_template(name: str) -> Template:
+    """Parsed EMAIL_TEMPLATES entry, built once per template."""
+    return Template(EMAIL_TEMPLATES[name])
+
+def render_email(template: str, **fields) -> str:
+    """Render an EMAIL_TEMPLATES entry with HTML-escaped field values."""
+    return email_template(template).substitute({k: html.escape(str(v)) for k, v in fields.items()})
+
+def get_email_client() -> httpx.AsyncClient:
+    global _email_client, _email_semaphore
+    if _email_client is None or _email_client.is_closed:
+        _email_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=EMAIL_MAX_IN_FLIGHT, max_keepalive_connections=EMAIL_MAX_IN_FLIGHT),
+        )
+        _email_semaphore = asyncio.Semaphore(EMAIL_MAX_IN_FLIGHT)
+    return _email_client
+
+async def close_email_client():
+    global _email_client
+    if _email_client is not None:
+        await _email_client.aclose()
+        _email_client = None
+
+def email_configured() -> bool:
+    if not RESEND_API_KEY:
+        logger.warning("RESEND_API_KEY not configured - email not sent")
+        return False
+    return True
+
+def new_email_entry(kind: str, to: str, **fields) -> dict:
+    now = datetime.utcnow()
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "to": to,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "claimed_by": None,
+        "claimed_until": None,
+        "created_at": now,
+        "expires_at": None,
+        **fields,
     }
-    
-    try:
-        email_result = await asyncio.to_thread(resend.Emails.send, params)
-        logger.info(f"Password reset email sent to {email}, id: {email_result.get('id')}")
-        return True
-    except Exception as e:
-        logger.error(f"Failed to send password reset email: {str(e)}")
+
+async def enqueue_email(to: str, subject: str, html_content: str, kind: str = "email") -> bool:
+    """Queue a single email for the outbox workers."""
+    return await enqueue_emails([{"to": to, "subject": subject, "html": html_content}], kind) > 0
+
+async def enqueue_emails(messages: List[dict], kind: str = "email") -> int:
+    """Queue emails ({"to", "subject", "html"}) in one write. Returns the number queued."""
+    if not messages or not email_configured():
+        return 0
+    await db.email_outbox.insert_many([
+        new_email_entry(kind, m["to"], subject=m["subject"], html=m["html"]) for m in messages
+    ])
+    _email_outbox_wakeup.set()
+    return len(messages)
+
+async def enqueue_admin_alert_email(to: str, item: dict) -> bool:
+    """Add an alert to the recipient's open digest, opening one (sent after the digest window) if needed."""
+    if not email_configured():
         return False
+    open_digest = {"kind": "admin_alert_digest", "to": to, "status": "pending", "claimed_by": None,
+                   f"items.{EMAIL_DIGEST_MAX_ITEMS - 1}": {"$exists": False}}
+    result = await db.email_outbox.update_one(open_digest, {"$push": {"items": item}})
+    if not result.matched_count:
+        entry = new_email_entry("admin_alert_digest", to, items=[item])
+        entry["next_attempt_at"] += timedelta(seconds=EMAIL_DIGEST_WINDOW_SECONDS)
+        await db.email_outbox.insert_one(entry)
+    return True
+
+def build_email(entry: dict) -> dict:
+    """Resend message for an outbox entry."""
+    if entry["kind"] == "admin_alert_digest":
+        items = entry["items"]
+        rendered = "".join(render_email("admin_report_item", **i) for i in items)
+        subject = f"[FRIKT] New {items[0]['target_type']} report" if len(items) == 1 else f"[FRIKT] {len(items)} new reports"
+        body = email_template("admin_report_digest").substitute(items=rendered)
+    else:
+        subject, body = entry["subject"], entry["html"]
+    return {"from": SENDER_EMAIL, "to": [entry["to"]], "subject": subject, "html": body}
+
+async def wait_for_email_slot():
+    """Space Resend requests from this process at least 1 / EMAIL_REQUESTS_PER_SECOND apart."""
+    global _email_next_request_at
+    now = time.monotonic()
+    slot = max(now, _email_next_request_at)
+    _email_next_request_at = slot + 1 / EMAIL_REQUESTS_PER_SECOND
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+async def post_email(payload, path: str = "/emails") -> Optional[str]:
+    """Send through Resend. Returns None on success, else an error; errors starting with "retry:" are transient."""
+    client = get_email_client()
+    async with _email_semaphore:
+        await wait_for_email_slot()
+        try:
+            response = await client.post(
+                f"{RESEND_API_URL}{path}", json=payload,
+                headers={"Authorization": f"Bearer {RESEND_API_KEY}"},
+            )
+        except httpx.HTTPError as e:
+            return f"retry:{type(e).__name__}"
+    if response.status_code == 429 or response.status_code >= 500:
+        return f"retry:HTTP {response.status_code}"
+    if response.status_code >= 400:
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+    return None
+
+async def claim_email_outbox(now: datetime, batch: bool = False) -> List[dict]:
+    """Lease due outbox entries to this worker: up to EMAIL_MAX_IN_FLIGHT single sends,
+    or with batch=True up to EMAIL_BATCH_SIZE entries of the EMAIL_BATCH_KINDS."""
+    limit = EMAIL_BATCH_SIZE if batch else EMAIL_MAX_IN_FLIGHT
+    unclaimed = {
+        "status": "pending",
+        "kind": {"$in" if batch else "$nin": list(EMAIL_BATCH_KINDS)},
+        "next_attempt_at": {"$lte": now},
+        "$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}],
+    }
+    due = await db.email_outbox.find(unclaimed, {"_id": 0, "id": 1}).sort("next_attempt_at", 1).limit(limit).to_list(limit)
+    if not due:
+        return []
+    
+    claim = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    await db.email_outbox.update_many(
+        {**unclaimed, "id": {"$in": [e["id"] for e in due]}},
+        {"$set": {"claimed_by": claim, "claimed_until": now + timedelta(seconds=EMAIL_OUTBOX_CLAIM_SECONDS)}}
+    )
+    return await db.email_outbox.find({"claimed_by": claim}, {"_id": 0}).to_list(limit)
+
+def email_result_update(entry: dict, error: Optional[str], now: datetime) -> dict:
+    """Outbox fields to set after a send attempt: sent, retried with backoff, or dead-lettered."""
+    update = {"claimed_by": None, "claimed_until": None, "attempts": entry["attempts"] + 1}
+    if error is None:
+        update.update(status="sent", sent_at=now, expires_at=now + EMAIL_OUTBOX_RETENTION)
+    else:
+        update["last_error"] = error
+        if not error.startswith("retry:") or update["attempts"] >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            update["status"] = "dead"
+            logger.error(f"Email {entry['id']} ({entry['kind']}) to {entry['to']} dead-lettered: {error}")
+        else:
+            update["next_attempt_at"] = now + retry_backoff(update["attempts"], EMAIL_OUTBOX_BACKOFF_BASE_SECONDS, EMAIL_OUTBOX_BACKOFF_MAX_SECONDS)
+    return update
+
+async def deliver_email_entry(entry: dict) -> bool:
+    error = await post_email(build_email(entry))
+    update = email_result_update(entry, error, datetime.utcnow())
+    await db.email_outbox.update_one({"id": entry["id"], "claimed_by": entry["claimed_by"]}, {"$set": update})
+    if error is None:
+        logger.info(f"Email {entry['kind']} sent to {entry['to']}")
+    return error is None
+
+async def deliver_email_batch(entries: List[dict]) -> int:
+    """Send claimed entries in one Resend batch call. Returns emails sent."""
+    error = await post_email([build_email(e) for e in entries], path="/emails/batch")
+    if error is not None and not error.startswith("retry:") and len(entries) > 1:
+        # Resend rejects the whole batch if one message is invalid; send them singly
+        # so only the bad one is dead-lettered
+        logger.warning(f"Email batch of {len(entries)} rejected ({error}), sending individually")
+        results = await asyncio.gather(*(deliver_email_entry(e) for e in entries))
+        return sum(results)
+    now = datetime.utcnow()
+    await db.email_outbox.bulk_write([
+        UpdateOne({"id": e["id"], "claimed_by": e["claimed_by"]}, {"$set": email_result_update(e, error, now)})
+        for e in entries
+    ], ordered=False)
+    if error is None:
+        logger.info(f"Email batch of {len(entries)} {entries[0]['kind']} sent")
+        return len(entries)
+    return 0
+
+async def process_email_outbox() -> int:
+    """Deliver due emails a claimed page at a time until none are left. Returns emails sent."""
+    sent = 0
+    while True:
+        now = datetime.utcnow()
+        entries = await claim_email_outbox(now)
+        batch = await claim_email_outbox(now, batch=True)
+        if not entries and not batch:
+            return sent
+        deliveries = [deliver_email_entry(e) for e in entries] + ([deliver_email_batch(batch)] if batch else [])
+        results = await asyncio.gather(*deliveries, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                # Claim expires and the entries are retried
+                logger.error(f"Error delivering email: {result}")
+        sent += sum(r for r in results if not isinstance(r, Exception))
+
+async def email_outbox_worker():
+    """Drain the outbox whenever mail is queued in this process, and poll for the rest."""
+    while True:
+        try:
+            await asyncio.wait_for(_email_outbox_wakeup.wait(), timeout=EMAIL_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _email_outbox_wakeup.clear()
+        try:
+            await process_email_outbox()
+        except Exception as e:
+            logger.error(f"Error in email outbox worker: {e}")
+
+@api_router.get("/admin/email-outbox")
+async def get_email_outbox(admin: dict = Depends(require_admin)):
+    """Email outbox depth per status plus the most recent dead letters."""
+    depth = {
+        row["_id"]: row["count"] async for row in db.email_outbox.aggregate([
+            {"$match": {"status": {"$in": ["pending", "dead"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+    dead = await db.email_outbox.find({"status": "dead"}, {"_id": 0, "html": 0}).sort("created_at", -1).limit(20).to_list(20)
+    return {"pending": depth.get("pending", 0), "dead": depth.get("dead", 0), "recent_dead": dead}
+
+# ===================== PASSWORD RESET ROUTES =====================
+
+async def send_password_reset_email(email: str, token: str, user_name: str):
+    """Queue the password reset email (sent by the email outbox)"""
+    html_content = render_email("password_reset", token=token, user_name=user_name)
+    return await enqueue_email(email, f"Reset your {APP_NAME} password", html_content, kind="password_reset")
 
 @api_router.post("/auth/forgot-password")
 @limiter.limit("3/hour")
-async def forgot_password(request: Request, reset_request: PasswordResetRequest, background_tasks: BackgroundTasks):
+async def forgot_password(request: Request, reset_request: PasswordResetRequest):
     """Request a password reset email"""
     email_lower = reset_request.email.lower().strip()
     
@@ -1581,9 +3034,9 @@ async def forgot_password(request: Request, reset_request: PasswordResetRequest,
     }
     await db.password_reset_tokens.insert_one(reset_token)
     
-    # Send email in background
+    # Queue the email; the outbox sends it
     user_name = user.get("displayName") or user.get("name", "User")
-    background_tasks.add_task(send_password_reset_email, email_lower, reset_code, user_name)
+    await send_password_reset_email(email_lower, reset_code, user_name)
     
     logger.info(f"Password reset token created for user: {user['id']}")
     return {"success": True, "message": "If an account exists with this email, you will receive a reset code."}
@@ -1770,18 +3223,15 @@ async def create_problem(problem_data: ProblemCreate, user: dict = Depends(requi
     
     await db.problems.insert_one(problem_dict)
     
-    # If this is a local frikt, notify all members of the community (except author)
-    # who have local_new_frikts enabled.
-    if is_local and local_community_id:
-        asyncio.create_task(
-            notify_local_members_of_new_frikt(
-                community_id=local_community_id,
-                problem_id=problem.id,
-                problem_title=problem.title,
-                author_id=user["id"],
-                author_name=user["name"],
-            )
-        )
+    # Community notifications for local frikts run in the event workers
+    await emit_event("problem.created", {
+        "problem_id": problem.id,
+        "problem_title": problem.title,
+        "is_local": is_local,
+        "community_id": local_community_id,
+        "author_id": user["id"],
+        "author_name": user["name"],
+    })
     
     # Update user post count
     if user.get("last_post_date") == today:
@@ -1790,8 +3240,7 @@ async def create_problem(problem_data: ProblemCreate, user: dict = Depends(requi
         await db.users.update_one({"id": user["id"]}, {"$set": {"posts_today": 1, "last_post_date": today}})
     
     # GAMIFICATION: Update stats and check badges
-    stats = await increment_user_stat(user["id"], "total_posts")
-    stats = await increment_category_posts(user["id"], category_id)
+    stats = await record_activity(user["id"], "post_created", category_id=category_id, problem_id=problem.id)
     newly_awarded = await check_and_award_badges(user["id"], user, stats, "create")
     
     response = ProblemResponse(
@@ -1806,6 +3255,20 @@ async def create_problem(problem_data: ProblemCreate, user: dict = Depends(requi
         "newly_awarded_badges": newly_awarded
     }
 
+@on_domain_event("problem.created")
+async def handle_problem_local_notifications(event: dict):
+    """If this is a local frikt, notify all members of the community (except author)
+    who have local_new_frikts enabled."""
+    if event.get("is_local") and event.get("community_id"):
+        await notify_local_members_of_new_frikt(
+            community_id=event["community_id"],
+            problem_id=event["problem_id"],
+            problem_title=event["problem_title"],
+            author_id=event["author_id"],
+            author_name=event["author_name"],
+            job_id=event_key(event, "local_members"),
+        )
+
 class ProblemUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=10)
     category_id: Optional[str] = None
@@ -2185,7 +3648,7 @@ async def get_problem(problem_id: str, user: dict = Depends(get_current_user)):
         # GAMIFICATION: Track frikt opened (for explorer badges)
         # Only count if viewing someone else's post
         if problem["user_id"] != user["id"]:
-            stats = await increment_user_stat(user["id"], "total_frikts_opened")
+            stats = await record_activity(user["id"], "frikt_opened", problem_id=problem_id)
             newly_awarded = await check_and_award_badges(user["id"], user, stats, "explore")
     
     response = ProblemResponse(
@@ -2238,6 +3701,9 @@ async def get_related_problems(problem_id: str, limit: int = 5):
 
 # ===================== RELATE ROUTES =====================
 
+# Collections whose unique (target, user) index was confirmed at startup
+_unique_indexes_ready: set = set()
+
 @api_router.post("/problems/{problem_id}/relate")
 async def relate_to_problem(problem_id: str, user: dict = Depends(require_auth)):
     problem = await db.problems.find_one({"id": problem_id})
@@ -2263,52 +3729,68 @@ async def relate_to_problem(problem_id: str, user: dict = Depends(require_auth))
         if not membership:
             raise HTTPException(status_code=403, detail="Only community members can relate to local frikts")
     
-    # Check if already related
-    existing = await db.relates.find_one({"problem_id": problem_id, "user_id": user["id"]})
-    if existing:
+    # Until the unique index is confirmed it can't be the only guard
+    if "relates" not in _unique_indexes_ready and await db.relates.find_one({"problem_id": problem_id, "user_id": user["id"]}, {"_id": 1}):
         raise HTTPException(status_code=400, detail="Already related to this problem")
     
-    # Check if problem owner is banned (don't send notifications to banned users)
-    problem_owner = await db.users.find_one({"id": problem["user_id"]})
-    owner_is_banned = problem_owner and problem_owner.get("status") in ["banned", "shadowbanned"]
-    
-    # Create relate
+    # Create relate (unique index on problem_id + user_id rejects duplicates)
     relate = Relate(problem_id=problem_id, user_id=user["id"])
-    await db.relates.insert_one(relate.dict())
-    
-    # Update problem count and signal score
-    new_count = problem["relates_count"] + 1
-    problem["relates_count"] = new_count
-    new_score = calculate_signal_score(problem)
+    try:
+        await db.relates.insert_one(relate.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already related to this problem")
     
-    await db.problems.update_one(
+    # Atomically bump the count and derive the signal score from the returned document
+    problem = await db.problems.find_one_and_update(
         {"id": problem_id},
-        {"$set": {"relates_count": new_count, "signal_score": new_score}}
+        {"$inc": {"relates_count": 1}},
+        return_document=ReturnDocument.AFTER
     )
+    if not problem:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    new_count = problem["relates_count"]
+    new_score = await refresh_signal_score(problem)
     
-    # GAMIFICATION: Update stats for the relater (user giving the relate)
-    relater_stats = await increment_user_stat(user["id"], "total_relates_given")
+    # GAMIFICATION: Update stats for the relater (badges are shown in the response)
+    relater_stats = await record_activity(user["id"], "relate_given", problem_id=problem_id,
+                                          category_id=problem.get("category_id"))
     relater_badges = await check_and_award_badges(user["id"], user, relater_stats, "relate")
     
-    # GAMIFICATION: Update stats for the post author (receiving the relate)
-    post_author_id = problem["user_id"]
-    await increment_user_stat(post_author_id, "total_relates_received")
+    # Post author gamification and notifications run in the event workers
+    await emit_event("relate.created", {
+        "problem_id": problem_id,
+        "problem_user_id": problem["user_id"],
+        "problem_title": problem.get("title", ""),
+        "category_id": problem.get("category_id"),
+        "relates_count": new_count,
+        "actor_id": user["id"],
+        "actor_name": user["name"],
+        "actor_status": user.get("status"),
+    })
     
-    # Check if this post now has the most relates for the author
-    author_stats = await get_or_create_user_stats(post_author_id)
-    current_max = author_stats.get("max_relates_on_single_post", 0)
-    if new_count > current_max:
-        await update_user_stats(post_author_id, {"max_relates_on_single_post": new_count})
-        author_stats["max_relates_on_single_post"] = new_count
+    return {
+        "relates_count": new_count,
+        "signal_score": new_score,
+        "newly_awarded_badges": relater_badges
+    }
+
+@on_domain_event("relate.created")
+async def handle_relate_author_gamification(event: dict):
+    """Update the post author's stats and award impact/viral badges."""
+    post_author_id = event["problem_user_id"]
+    new_count = event["relates_count"]
+    # relates_count feeds max_relates_on_single_post when the event is folded
+    author_stats = await record_activity(
+        post_author_id, "relate_received", source_id=event_key(event, "relate_received"),
+        problem_id=event["problem_id"], relates_count=new_count
+    )
     
     # Check badges for the post author (impact + viral badges)
     post_author = await db.users.find_one({"id": post_author_id})
     if post_author:
-        author_badges = await check_and_award_badges(post_author_id, post_author, author_stats, "impact")
-        author_viral_badges = await check_and_award_badges(post_author_id, post_author, author_stats, "viral")
+        all_author_badges = await check_and_award_badges(post_author_id, post_author, author_stats, ["impact", "viral"])
         
         # Store pending badges for author to see on next app open
-        all_author_badges = author_badges + author_viral_badges
         if all_author_badges:
             for badge in all_author_badges:
                 await db.pending_badge_notifications.insert_one({
@@ -2316,50 +3798,58 @@ async def relate_to_problem(problem_id: str, user: dict = Depends(require_auth))
                     "badge": badge,
                     "created_at": datetime.utcnow()
                 })
+
+@on_domain_event("relate.created")
+async def handle_relate_owner_notification(event: dict):
+    """Notify the problem owner (batched), unless either side should stay silent."""
+    owner_id = event["problem_user_id"]
+    problem_id = event["problem_id"]
+    actor_name = event["actor_name"]
     
-    # Create notification for problem owner (if not self and not banned)
-    # Also skip if actor (current user) is shadowbanned — they should be invisible
-    actor_is_shadowbanned = user.get("status") == "shadowbanned"
-    if problem["user_id"] != user["id"] and not owner_is_banned and not actor_is_shadowbanned:
-        # Check global push toggle first
-        settings = await db.notification_settings.find_one({"user_id": problem["user_id"]})
-        global_push_enabled = not settings or settings.get("push_notifications", True)
-        relates_enabled = not settings or settings.get("new_relates", True)
-        
-        if global_push_enabled and relates_enabled:
-            # Use notification batching
-            should_send_immediate = await add_to_notification_batch(
-                recipient_user_id=problem["user_id"],
-                batch_type="relate_batch",
-                target_id=problem_id,
-                target_title=problem.get("title", "your Frikt"),
-                actor_user_id=user["id"],
-                actor_user_name=user["name"]
-            )
-            
-            if should_send_immediate:
-                # First relate - send immediate notification
-                notification = Notification(
-                    user_id=problem["user_id"],
-                    type="new_relate",
-                    problem_id=problem_id,
-                    message=f"{user['name']} related to your Frikt"
-                )
-                await db.notifications.insert_one(notification.dict())
-                
-                await send_notification_to_user(
-                    problem["user_id"],
-                    "Someone related to your Frikt",
-                    f"{user['name']} related to: {problem['title'][:50]}...",
-                    {"type": "new_relate", "problemId": problem_id}
-                )
-            # If not immediate, the batch processor will send later
+    # Skip if actor is shadowbanned — they should be invisible
+    if owner_id == event["actor_id"] or event.get("actor_status") == "shadowbanned":
+        return
     
-    return {
-        "relates_count": new_count,
-        "signal_score": new_score,
-        "newly_awarded_badges": relater_badges
-    }
+    # Don't send notifications to banned users
+    problem_owner = await db.users.find_one({"id": owner_id}, {"status": 1})
+    if problem_owner and problem_owner.get("status") in ["banned", "shadowbanned"]:
+        return
+    
+    # Check global push toggle first
+    if not wants_push(await get_notification_settings(owner_id), "new_relates"):
+        return
+    
+    # Already notified on an earlier attempt; batching again would notify twice
+    notification_id = event_key(event, "owner_notification")
+    if await notification_exists(owner_id, notification_id):
+        return
+    
+    # Use notification batching
+    should_send_immediate = await add_to_notification_batch(
+        recipient_user_id=owner_id,
+        batch_type="relate_batch",
+        target_id=problem_id,
+        target_title=event["problem_title"] or "your Frikt",
+        actor_user_id=event["actor_id"],
+        actor_user_name=actor_name
+    )
+    
+    if should_send_immediate:
+        # First relate - send immediate notification
+        notification = Notification(
+            id=notification_id,
+            user_id=owner_id,
+            type="new_relate",
+            problem_id=problem_id,
+            message=f"{actor_name} related to your Frikt"
+        )
+        await insert_notifications([notification.dict()], pushes=[{
+            "user_id": owner_id,
+            "title": "Someone related to your Frikt",
+            "body": f"{actor_name} related to: {event['problem_title'][:50]}...",
+            "data": {"type": "new_relate", "problemId": problem_id},
+        }])
+    # If not immediate, the batch processor will send later
 
 @api_router.delete("/problems/{problem_id}/relate")
 async def unrelate_to_problem(problem_id: str, user: dict = Depends(require_auth)):
@@ -2367,17 +3857,17 @@ async def unrelate_to_problem(problem_id: str, user: dict = Depends(require_auth
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not related to this problem")
     
-    problem = await db.problems.find_one({"id": problem_id})
+    # Guard on relates_count > 0 so the counter never goes negative
+    problem = await db.problems.find_one_and_update(
+        {"id": problem_id, "relates_count": {"$gt": 0}},
+        {"$inc": {"relates_count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not problem:
+        problem = await db.problems.find_one({"id": problem_id})
     if problem:
-        new_count = max(0, problem["relates_count"] - 1)
-        problem["relates_count"] = new_count
-        new_score = calculate_signal_score(problem)
-        
-        await db.problems.update_one(
-            {"id": problem_id},
-            {"$set": {"relates_count": new_count, "signal_score": new_score}}
-        )
-        return {"relates_count": new_count, "signal_score": new_score}
+        new_score = await refresh_signal_score(problem)
+        return {"relates_count": problem["relates_count"], "signal_score": new_score}
     
     return {"relates_count": 0}
 
@@ -2490,188 +3980,183 @@ async def create_comment(comment_data: CommentCreate, user: dict = Depends(requi
     
     await db.comments.insert_one(comment.dict())
     
-    # Update problem stats (replies count toward comments_count)
-    comments_count = problem["comments_count"] + 1
-    
     # Check if user is a unique commenter (replies also count for uniqueness)
     existing_comment = await db.comments.find_one({
         "problem_id": comment_data.problem_id,
         "user_id": user["id"],
-        "id": {"$ne": comment.id}
+        "id": {"$ne": comment.id},
+        "status": {"$nin": UNCOUNTED_COMMENT_STATUSES},
     })
-    unique_commenters = problem["unique_commenters"]
-    if not existing_comment:
-        unique_commenters += 1
     
-    problem["comments_count"] = comments_count
-    problem["unique_commenters"] = unique_commenters
-    new_score = calculate_signal_score(problem)
-    
-    await db.problems.update_one(
+    # Atomically update problem stats (replies count toward comments_count)
+    counter_inc = {"comments_count": 1}
+    if not existing_comment:
+        counter_inc["unique_commenters"] = 1
+    updated_problem = await db.problems.find_one_and_update(
         {"id": comment_data.problem_id},
-        {"$set": {
-            "comments_count": comments_count,
-            "unique_commenters": unique_commenters,
-            "signal_score": new_score
-        }}
+        {"$inc": counter_inc},
+        return_document=ReturnDocument.AFTER
     )
+    if updated_problem:
+        problem = updated_problem
+        await refresh_signal_score(problem)
     
     # GAMIFICATION: Update stats and check badges (same for replies)
-    stats = await increment_user_stat(user["id"], "total_comments")
+    stats = await record_activity(user["id"], "comment_created", problem_id=comment_data.problem_id, comment_id=comment.id,
+                                  category_id=problem.get("category_id"))
     newly_awarded = await check_and_award_badges(user["id"], user, stats, "comment")
     
+    # Owner, follower and reply notifications run in the event workers
+    await emit_event("comment.created", {
+        "problem_id": comment_data.problem_id,
+        "problem_user_id": problem["user_id"],
+        "problem_title": problem.get("title", ""),
+        "category_id": problem.get("category_id"),
+        "content": comment_data.content,
+        "reply_to_user_id": reply_to_user_id,
+        "actor_id": user["id"],
+        "actor_name": user["name"],
+        "actor_status": user.get("status"),
+    })
+    
+    response = CommentResponse(**comment.dict())
+    return {**response.dict(), "newly_awarded_badges": newly_awarded}
+
+@on_domain_event("comment.created")
+async def handle_comment_owner_notification(event: dict):
+    """Notify the problem owner of a new comment (batched)."""
+    problem_id = event["problem_id"]
+    problem_user_id = event["problem_user_id"]
+    content = event["content"]
+    actor_id = event["actor_id"]
+    actor_name = event["actor_name"]
+    
+    # Skip if actor (commenter) is shadowbanned — they should be invisible to others
+    if event.get("actor_status") == "shadowbanned":
+        return
+    
     # Check if problem owner is banned
-    problem_owner = await db.users.find_one({"id": problem["user_id"]})
+    problem_owner = await db.users.find_one({"id": problem_user_id})
     owner_is_banned = problem_owner and problem_owner.get("status") in ["banned", "shadowbanned"]
     
-    # Check if actor (commenter) is shadowbanned — they should be invisible to others
-    actor_is_shadowbanned = user.get("status") == "shadowbanned"
-    
-    # Create notification for problem owner (with batching)
-    if problem["user_id"] != user["id"] and not owner_is_banned and not actor_is_shadowbanned:
-        settings = await db.notification_settings.find_one({"user_id": problem["user_id"]})
-        global_push_enabled = not settings or settings.get("push_notifications", True)
-        comments_enabled = not settings or settings.get("new_comments", True)
-        
-        if global_push_enabled and comments_enabled:
+    # Create notification for problem owner (with batching), unless an earlier
+    # attempt of this handler already did
+    notification_id = event_key(event, "owner_notification")
+    if problem_user_id != actor_id and not owner_is_banned and not await notification_exists(problem_user_id, notification_id):
+        if wants_push(await get_notification_settings(problem_user_id), "new_comments"):
             # Use notification batching for comments (3 min window)
             should_send_immediate = await add_to_notification_batch(
-                recipient_user_id=problem["user_id"],
+                recipient_user_id=problem_user_id,
                 batch_type="comment_batch",
-                target_id=comment_data.problem_id,
-                target_title=problem.get("title", "your Frikt"),
-                actor_user_id=user["id"],
-                actor_user_name=user["name"]
+                target_id=problem_id,
+                target_title=event["problem_title"] or "your Frikt",
+                actor_user_id=actor_id,
+                actor_user_name=actor_name
             )
             
             if should_send_immediate:
                 # First comment - send immediate notification
                 notification = Notification(
-                    user_id=problem["user_id"],
+                    id=notification_id,
+                    user_id=problem_user_id,
                     type="new_comment",
-                    problem_id=comment_data.problem_id,
-                    message=f"{user['name']} commented on your Frikt"
-                )
-                await db.notifications.insert_one(notification.dict())
-                
-                await send_notification_to_user(
-                    problem["user_id"],
-                    "New comment on your Frikt",
-                    f"{user['name']}: {comment_data.content[:50]}...",
-                    {"type": "new_comment", "problemId": comment_data.problem_id}
+                    problem_id=problem_id,
+                    message=f"{actor_name} commented on your Frikt"
                 )
+                await insert_notifications([notification.dict()], pushes=[{
+                    "user_id": problem_user_id,
+                    "title": "New comment on your Frikt",
+                    "body": f"{actor_name}: {content[:50]}...",
+                    "data": {"type": "new_comment", "problemId": problem_id},
+                }])
             # If not immediate, the batch processor will send later
-    
-    # Notify followers - optimized with projections and batch query
-    # Skip entirely if actor is shadowbanned — they should be invisible
-    if not actor_is_shadowbanned:
-        followers = await db.users.find(
-            {"followed_problems": comment_data.problem_id},
-            {"id": 1}
-        ).to_list(100)
-        
-        # Get all follower IDs to exclude current user and problem owner
-        follower_ids = set(
-            f["id"] for f in followers
-            if f["id"] != user["id"] and f["id"] != problem["user_id"]
-        )
 
-        # NEW: Also notify everyone who has previously commented on this Frikt
-        # (excluding the current commenter and the problem owner — they're already handled).
-        # This gives engaged users notifications even if they didn't explicitly follow.
-        prev_commenter_ids = await db.comments.distinct(
-            "user_id",
-            {
-                "problem_id": comment_data.problem_id,
-                "status": "active",
-                "user_id": {"$nin": [user["id"], problem["user_id"]]},
-            }
-        )
-        for cid in prev_commenter_ids:
-            if cid:
-                follower_ids.add(cid)
+@on_domain_event("comment.created")
+async def handle_comment_follower_notifications(event: dict):
+    """Notify followers and previous commenters of a new comment (batched)."""
+    problem_id = event["problem_id"]
+    problem_user_id = event["problem_user_id"]
+    content = event["content"]
+    actor_id = event["actor_id"]
+    actor_name = event["actor_name"]
+    
+    # Skip if actor (commenter) is shadowbanned — they should be invisible to others
+    if event.get("actor_status") == "shadowbanned":
+        return
+    
+    # Followers and everyone who has previously commented on this Frikt (excluding the
+    # current commenter and the problem owner — they're already handled). This gives
+    # engaged users notifications even if they didn't explicitly follow.
+    await enqueue_fanout(
+        audience=[
+            audience_source("users", {"followed_problems": problem_id}, field="id"),
+            audience_source("comments", {"problem_id": problem_id, "status": "active"}, distinct=True),
+        ],
+        exclude=[actor_id, problem_user_id],
+        toggle="new_comments",
+        batch={
+            "batch_type": "comment_batch",
+            "target_id": problem_id,
+            "target_title": event["problem_title"] or "a followed Frikt",
+            "actor_user_id": actor_id,
+            "actor_user_name": actor_name,
+        },
+        notification={
+            "type": "new_comment",
+            "problem_id": problem_id,
+            "message": "New comment on a Frikt you joined",
+        },
+        push={
+            "title": "New comment on a Frikt you joined",
+            "body": f"{actor_name}: {content[:50]}...",
+            "data": {"type": "new_comment", "problemId": problem_id},
+        },
+        job_id=event_key(event, "followers"),
+    )
 
-        follower_ids = list(follower_ids)
-    else:
-        follower_ids = []
-    
-    if follower_ids:
-        # Batch query notification settings to avoid N+1
-        follower_settings_list = await db.notification_settings.find(
-            {"user_id": {"$in": follower_ids}},
-            {"user_id": 1, "new_comments": 1, "push_notifications": 1}
-        ).to_list(100)
-        follower_settings_map = {s["user_id"]: s for s in follower_settings_list}
-        
-        for follower_id in follower_ids:
-            follower_settings = follower_settings_map.get(follower_id)
-            global_push = not follower_settings or follower_settings.get("push_notifications", True)
-            comments_on = not follower_settings or follower_settings.get("new_comments", True)
-            
-            if global_push and comments_on:
-                # Also use batching for followers
-                should_send = await add_to_notification_batch(
-                    recipient_user_id=follower_id,
-                    batch_type="comment_batch",
-                    target_id=comment_data.problem_id,
-                    target_title=problem.get("title", "a followed Frikt"),
-                    actor_user_id=user["id"],
-                    actor_user_name=user["name"]
-                )
-                
-                if should_send:
-                    notification = Notification(
-                        user_id=follower_id,
-                        type="new_comment",
-                        problem_id=comment_data.problem_id,
-                        message=f"New comment on a Frikt you joined"
-                    )
-                    await db.notifications.insert_one(notification.dict())
-                    
-                    await send_notification_to_user(
-                        follower_id,
-                        "New comment on a Frikt you joined",
-                        f"{user['name']}: {comment_data.content[:50]}...",
-                        {"type": "new_comment", "problemId": comment_data.problem_id}
-                    )
-    
-    # NEW: Notify the person whose Reply button was tapped (comment_reply notification)
-    # Skip if actor is shadowbanned
-    if reply_to_user_id and reply_to_user_id != user["id"] and reply_to_user_id != problem["user_id"] and not actor_is_shadowbanned:
+@on_domain_event("comment.created")
+async def handle_comment_reply_notification(event: dict):
+    """Notify the person whose Reply button was tapped (comment_reply notification)."""
+    problem_id = event["problem_id"]
+    problem_user_id = event["problem_user_id"]
+    content = event["content"]
+    actor_id = event["actor_id"]
+    actor_name = event["actor_name"]
+    
+    # Skip if actor (commenter) is shadowbanned — they should be invisible to others
+    if event.get("actor_status") == "shadowbanned":
+        return
+    
+    reply_to_user_id = event.get("reply_to_user_id")
+    notification_id = event_key(event, "reply_notification")
+    if (reply_to_user_id and reply_to_user_id != actor_id and reply_to_user_id != problem_user_id
+            and not await notification_exists(reply_to_user_id, notification_id)):
         # Check if target user has comment_replies notifications enabled
-        reply_target_settings = await db.notification_settings.find_one({"user_id": reply_to_user_id})
-        reply_target_push_enabled = not reply_target_settings or reply_target_settings.get("push_notifications", True)
-        reply_target_replies_enabled = not reply_target_settings or reply_target_settings.get("comment_replies", True)
-        
-        if reply_target_push_enabled and reply_target_replies_enabled:
+        if wants_push(await get_notification_settings(reply_to_user_id), "comment_replies"):
             # Use batching for replies too
             should_send_reply_notif = await add_to_notification_batch(
                 recipient_user_id=reply_to_user_id,
                 batch_type="comment_batch",
-                target_id=comment_data.problem_id,
+                target_id=problem_id,
                 target_title=f"your comment",
-                actor_user_id=user["id"],
-                actor_user_name=user["name"]
+                actor_user_id=actor_id,
+                actor_user_name=actor_name
             )
             
             if should_send_reply_notif:
                 reply_notification = Notification(
+                    id=notification_id,
                     user_id=reply_to_user_id,
                     type="comment_reply",
-                    problem_id=comment_data.problem_id,
-                    message=f"{user['name']} replied to your comment"
-                )
-                await db.notifications.insert_one(reply_notification.dict())
-                
-                await send_notification_to_user(
-                    reply_to_user_id,
-                    "Someone replied to your comment",
-                    f"{user['name']}: {comment_data.content[:50]}...",
-                    {"type": "comment_reply", "problemId": comment_data.problem_id}
+                    problem_id=problem_id,
+                    message=f"{actor_name} replied to your comment"
                 )
-    
-    response = CommentResponse(**comment.dict())
-    return {**response.dict(), "newly_awarded_badges": newly_awarded}
+                await insert_notifications([reply_notification.dict()], pushes=[{
+                    "user_id": reply_to_user_id,
+                    "title": "Someone replied to your comment",
+                    "body": f"{actor_name}: {content[:50]}...",
+                    "data": {"type": "comment_reply", "problemId": problem_id},
+                }])
 
 @api_router.get("/problems/{problem_id}/comments")
 async def get_comments(problem_id: str, user: dict = Depends(get_current_user)):
@@ -2771,12 +4256,18 @@ async def mark_helpful(comment_id: str, user: dict = Depends(require_auth)):
         raise HTTPException(status_code=400, detail="Already marked as helpful")
     
     helpful = Helpful(comment_id=comment_id, user_id=user["id"])
-    await db.helpfuls.insert_one(helpful.dict())
+    try:
+        await db.helpfuls.insert_one(helpful.dict())
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Already marked as helpful")
     
-    new_count = comment["helpful_count"] + 1
-    await db.comments.update_one({"id": comment_id}, {"$set": {"helpful_count": new_count}})
+    comment = await db.comments.find_one_and_update(
+        {"id": comment_id},
+        {"$inc": {"helpful_count": 1}},
+        return_document=ReturnDocument.AFTER
+    )
     
-    return {"helpful_count": new_count}
+    return {"helpful_count": comment["helpful_count"] if comment else 0}
 
 @api_router.delete("/comments/{comment_id}/helpful")
 async def unmark_helpful(comment_id: str, user: dict = Depends(require_auth)):
@@ -2784,11 +4275,14 @@ async def unmark_helpful(comment_id: str, user: dict = Depends(require_auth)):
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Not marked as helpful")
     
-    comment = await db.comments.find_one({"id": comment_id})
+    # Guard on helpful_count > 0 so the counter never goes negative
+    comment = await db.comments.find_one_and_update(
+        {"id": comment_id, "helpful_count": {"$gt": 0}},
+        {"$inc": {"helpful_count": -1}},
+        return_document=ReturnDocument.AFTER
+    )
     if comment:
-        new_count = max(0, comment["helpful_count"] - 1)
-        await db.comments.update_one({"id": comment_id}, {"$set": {"helpful_count": new_count}})
-        return {"helpful_count": new_count}
+        return {"helpful_count": comment["helpful_count"]}
     
     return {"helpful_count": 0}
 
@@ -2825,6 +4319,51 @@ async def edit_comment(comment_id: str, request: CommentEditRequest, user: dict
     updated_comment = await db.comments.find_one({"id": comment_id}, {"_id": 0})
     return updated_comment
 
+# Removed and hidden comments don't count toward their problem's comments_count and
+# unique_commenters (the definition the admin sync and the reconciler check against), so
+# every status change or delete that moves a comment in or out of that set adjusts them.
+UNCOUNTED_COMMENT_STATUSES = ["removed", "hidden"]
+
+def comment_is_counted(comment: dict) -> bool:
+    return comment.get("status") not in UNCOUNTED_COMMENT_STATUSES
+
+async def adjust_comment_counters(comment: dict, delta: int) -> Optional[dict]:
+    """Move the comment's problem counters by one comment (delta 1 or -1) after it entered
+    or left the counted set. unique_commenters moves with it when the author has no other
+    counted comment there. Returns the updated problem."""
+    others = await db.comments.count_documents({
+        "problem_id": comment["problem_id"], "user_id": comment["user_id"], "id": {"$ne": comment["id"]},
+        "status": {"$nin": UNCOUNTED_COMMENT_STATUSES},
+    }, limit=1)
+    inc = {"comments_count": delta}
+    if not others:
+        inc["unique_commenters"] = delta
+    query = {"id": comment["problem_id"]}
+    if delta < 0:
+        # Guarded so they never go negative
+        query.update({field: {"$gt": 0} for field in inc})
+    problem = await db.problems.find_one_and_update(query, {"$inc": inc}, return_document=ReturnDocument.AFTER)
+    if problem:
+        await refresh_signal_score(problem)
+    return problem
+
+async def set_comment_fields(comment_id: str, fields: dict, match: Optional[dict] = None) -> Optional[dict]:
+    """$set fields on a comment (matching `match` too, if given), adjusting its problem's
+    counters if its status moved it in or out of the counted set. Returns the comment
+    as it was before, or None if nothing matched."""
+    before = await db.comments.find_one_and_update({"id": comment_id, **(match or {})}, {"$set": fields})
+    if before and "status" in fields and comment_is_counted(before) != comment_is_counted(fields):
+        await adjust_comment_counters(before, 1 if comment_is_counted(fields) else -1)
+    return before
+
+async def delete_comment_doc(comment_id: str) -> tuple[Optional[dict], Optional[dict]]:
+    """Delete a comment, adjusting its problem's counters if it was counted. Returns
+    (deleted comment or None, updated problem or None)."""
+    comment = await db.comments.find_one_and_delete({"id": comment_id})
+    if not comment or not comment_is_counted(comment):
+        return comment, None
+    return comment, await adjust_comment_counters(comment, -1)
+
 @api_router.delete("/comments/{comment_id}")
 async def delete_comment(comment_id: str, user: dict = Depends(require_auth)):
     """Delete a comment. Only the comment author can delete.
@@ -2846,69 +4385,642 @@ async def delete_comment(comment_id: str, user: dict = Depends(require_auth)):
     has_replies = await db.comments.count_documents({"parent_comment_id": comment_id}) > 0
     
     if has_replies:
-        # SOFT DELETE: Replace content with [deleted], keep structure for replies
-        await db.comments.update_one(
-            {"id": comment_id},
-            {"$set": {
-                "content": "[deleted]",
-                "user_name": "[deleted]",
-                "status": "removed"
-            }}
-        )
-        # Note: Don't decrement comment count since the "slot" still exists
+        # SOFT DELETE: Replace content with [deleted], keep structure for replies.
+        # The placeholder no longer counts toward the problem's comment counters.
+        await set_comment_fields(comment_id, {
+            "content": "[deleted]",
+            "user_name": "[deleted]",
+            "status": "removed"
+        })
         return {"success": True, "message": "Comment removed", "soft_deleted": True}
     else:
-        # HARD DELETE: Actually remove the comment
-        await db.comments.delete_one({"id": comment_id})
-        
-        # Update problem's comment count
-        problem = await db.problems.find_one({"id": problem_id})
-        if problem:
-            new_count = max(0, problem["comments_count"] - 1)
-            await db.problems.update_one(
-                {"id": problem_id},
-                {"$set": {"comments_count": new_count}}
-            )
+        # HARD DELETE: Actually remove the comment (and count it out of the problem)
+        _, problem = await delete_comment_doc(comment_id)
+        if not problem:
+            problem = await db.problems.find_one({"id": problem_id}, {"_id": 0, "category_id": 1}) or {}
         
         # Decrement user's comment count in gamification stats (but don't revoke badges)
-        await db.user_stats.update_one(
-            {"user_id": user["id"]},
-            {"$inc": {"total_comments": -1}}
-        )
+        await append_activity_events([{
+            "user_id": user["id"], "type": "comment_deleted", "comment_id": comment_id,
+            "category_id": problem.get("category_id"), "created_at": datetime.utcnow()
+        }])
         
         # Also delete any helpfuls on this comment
         await db.helpfuls.delete_many({"comment_id": comment_id})
         
         return {"success": True, "message": "Comment deleted", "soft_deleted": False}
 
+# ===================== TREND DETECTION =====================
+# Relate and comment events feed a per-problem velocity: an exponentially decaying event
+# count (half-life TREND_HALF_LIFE_SECONDS), so each event costs one read and one guarded
+# write and nothing ever scans problems. Each category keeps a running mean/variance of
+# the velocities its events produce; a problem is trending when its velocity is
+# TREND_Z_THRESHOLD standard deviations above its category's mean (and at least
+# TREND_MIN_VELOCITY). Its author and followers get a "problem_trending" notification at
+# most once per TREND_NOTIFY_COOLDOWN.
+#
+# Only the first relate / comment per (problem, actor) within TREND_ACTOR_WINDOW counts,
+# recorded as a unique trend_actors document, so toggling a relate or repeat commenting
+# can't push a problem into trending. The author's own actions never count.
+
+TREND_HALF_LIFE_SECONDS = float(os.environ.get("TREND_HALF_LIFE_SECONDS", "3600"))
+TREND_EVENT_WEIGHTS = {"relate": 1.0, "comment": 1.5}
+TREND_MIN_VELOCITY = float(os.environ.get("TREND_MIN_VELOCITY", "8"))
+TREND_Z_THRESHOLD = 3.0
+TREND_BASELINE_ALPHA = 0.02
+# Until a category has seen this many events its baseline isn't trusted and only
+# twice the minimum velocity counts as trending
+TREND_BASELINE_WARMUP = 50
+TREND_NOTIFY_COOLDOWN = timedelta(days=7)
+TREND_ACTOR_WINDOW = timedelta(hours=24)
+TREND_UPDATE_ATTEMPTS = 5
+
+def decayed_velocity(velocity: float, since: datetime, now: datetime) -> float:
+    elapsed = max((now - since).total_seconds(), 0)
+    return velocity * 0.5 ** (elapsed / TREND_HALF_LIFE_SECONDS)
+
+def trend_rank_key(velocity: float, at: datetime) -> float:
+    """Orders problems by current velocity without decaying every document: all
+    velocities decay at the same rate, so log2(velocity) + age in half-lives is fixed."""
+    return math.log2(velocity) + (at - datetime(1970, 1, 1)).total_seconds() / TREND_HALF_LIFE_SECONDS
+
+def trend_threshold(baseline: Optional[dict]) -> float:
+    if not baseline or baseline["samples"] < TREND_BASELINE_WARMUP:
+        return TREND_MIN_VELOCITY * 2
+    return max(TREND_MIN_VELOCITY, baseline["mean"] + TREND_Z_THRESHOLD * baseline["var"] ** 0.5)
+
+async def update_versioned(collection, key: dict, compute: Callable[[Optional[dict]], dict]) -> tuple[Optional[dict], Optional[dict]]:
+    """Read-modify-write one document with optimistic concurrency on its `version`.
+    Returns (before, after); after is None if every attempt lost a race."""
+    for _ in range(TREND_UPDATE_ATTEMPTS):
+        before = await collection.find_one(key, {"_id": 0})
+        fields = compute(before)
+        if before is None:
+            try:
+                await collection.insert_one({**key, **fields, "version": 1})
+                return None, {**key, **fields}
+            except DuplicateKeyError:
+                continue
+        result = await collection.update_one({**key, "version": before["version"]}, {"$set": fields, "$inc": {"version": 1}})
+        if result.matched_count:
+            return before, {**before, **fields}
+    return None, None
+
+async def record_trend_event(problem_id: str, category_id: Optional[str], kind: str, now: Optional[datetime] = None,
+                             actor_id: Optional[str] = None) -> Optional[float]:
+    """Fold one relate/comment into the problem's velocity and check it against its
+    category baseline. Returns the new velocity, or None if the actor already counted
+    for this problem within TREND_ACTOR_WINDOW."""
+    now = now or datetime.utcnow()
+    category_id = category_id or "other"
+    if actor_id:
+        try:
+            await db.trend_actors.insert_one({
+                "_id": f"{problem_id}:{kind}:{actor_id}",
+                "problem_id": problem_id,
+                "expires_at": now + TREND_ACTOR_WINDOW,
+            })
+        except DuplicateKeyError:
+            return None
+    
+    def bump(state: Optional[dict]) -> dict:
+        at = max(now, state["updated_at"]) if state else now
+        velocity = (decayed_velocity(state["velocity"], state["updated_at"], at) if state else 0.0) + TREND_EVENT_WEIGHTS[kind]
+        return {
+            "category_id": category_id,
+            "velocity": velocity,
+            "rank_key": trend_rank_key(velocity, at),
+            "updated_at": at,
+            "expires_at": at + TREND_NOTIFY_COOLDOWN,
+        }
+    _, state = await update_versioned(db.problem_trends, {"problem_id": problem_id}, bump)
+    if state is None:
+        return None
+    velocity = state["velocity"]
+    
+    # Checked against the baseline before this sample; a lost race only drops a sample
+    def observe(baseline: Optional[dict]) -> dict:
+        if not baseline:
+            return {"mean": velocity, "var": 0.0, "samples": 1}
+        diff = velocity - baseline["mean"]
+        return {
+            "mean": baseline["mean"] + TREND_BASELINE_ALPHA * diff,
+            "var": (1 - TREND_BASELINE_ALPHA) * (baseline["var"] + TREND_BASELINE_ALPHA * diff * diff),
+            "samples": baseline["samples"] + 1,
+        }
+    baseline, _ = await update_versioned(db.trend_baselines, {"category_id": category_id}, observe)
+    
+    if velocity >= trend_threshold(baseline):
+        await flag_trending(problem_id, velocity, now)
+    return velocity
+
+async def flag_trending(problem_id: str, velocity: float, now: datetime):
+    """Mark a problem trending and notify its author and followers (once per cooldown)."""
+    result = await db.problem_trends.update_one(
+        {"problem_id": problem_id, "$or": [
+            {"trending_notified_at": None},
+            {"trending_notified_at": {"$lt": now - TREND_NOTIFY_COOLDOWN}},
+        ]},
+        {"$set": {"trending_notified_at": now, "trending_velocity": velocity}}
+    )
+    if not result.modified_count:
+        return
+    problem = await db.problems.find_one({"id": problem_id}, {"_id": 0, "user_id": 1, "title": 1, "is_hidden": 1, "status": 1})
+    if not problem or problem.get("is_hidden") or problem.get("status", "active") != "active":
+        return
+    title = problem.get("title") or "A Frikt"
+    truncated_title = title if len(title) <= 80 else title[:77] + "..."
+    logger.info(f"Problem {problem_id} is trending (velocity {velocity:.1f})")
+    
+    author_id = problem["user_id"]
+    if wants_push(await get_notification_settings(author_id), "trending"):
+        notification = Notification(
+            user_id=author_id,
+            type="problem_trending",
+            problem_id=problem_id,
+            message=f"Your Frikt is trending: {truncated_title}"
+        )
+        await insert_notification(notification.dict())
+        await send_notification_to_user(
+            author_id,
+            "Your Frikt is trending 🔥",
+            truncated_title,
+            {"type": "problem_trending", "problemId": problem_id}
+        )
+    await enqueue_fanout(
+        audience=[audience_source("users", {"followed_problems": problem_id}, field="id")],
+        exclude=[author_id],
+        toggle="trending",
+        notification={
+            "type": "problem_trending",
+            "problem_id": problem_id,
+            "message": f"A Frikt you follow is trending: {truncated_title}",
+        },
+        push={
+            "title": "A Frikt you follow is trending",
+            "body": truncated_title,
+            "data": {"type": "problem_trending", "problemId": problem_id},
+        },
+    )
+
+def counts_for_trend(event: dict) -> bool:
+    return event.get("actor_status") != "shadowbanned" and event["actor_id"] != event.get("problem_user_id")
+
+@on_domain_event("relate.created")
+async def handle_relate_trend(event: dict):
+    if counts_for_trend(event):
+        await record_trend_event(event["problem_id"], event.get("category_id"), "relate", actor_id=event["actor_id"])
+
+@on_domain_event("comment.created")
+async def handle_comment_trend(event: dict):
+    if counts_for_trend(event):
+        await record_trend_event(event["problem_id"], event.get("category_id"), "comment", actor_id=event["actor_id"])
+
+@api_router.get("/admin/trending")
+async def get_trending_problems(limit: int = 20, admin: dict = Depends(require_admin)):
+    """Fastest-moving problems right now, with their category baselines."""
+    now = datetime.utcnow()
+    states = await db.problem_trends.find({}, {"_id": 0}).sort("rank_key", -1).limit(limit).to_list(limit)
+    for state in states:
+        state["velocity"] = round(decayed_velocity(state["velocity"], state["updated_at"], now), 2)
+    baselines = {
+        b["category_id"]: {"mean": round(b["mean"], 2), "std": round(b["var"] ** 0.5, 2),
+                           "samples": b["samples"], "threshold": round(trend_threshold(b), 2)}
+        async for b in db.trend_baselines.find({}, {"_id": 0})
+    }
+    return {"problems": states, "baselines": baselines}
+
 # ===================== NOTIFICATIONS ROUTES =====================
 
 @api_router.get("/notifications")
 async def get_notifications(user: dict = Depends(require_auth), limit: int = 50):
+    counter = await get_notification_counter(user["id"])
     notifications = await db.notifications.find(
         {"user_id": user["id"]}, {"_id": 0}
     ).sort("created_at", -1).limit(limit).to_list(limit)
+    apply_read_watermark(notifications, counter.get("last_read_at"))
     
-    unread_count = await db.notifications.count_documents({"user_id": user["id"], "is_read": False})
-    
-    return {"notifications": notifications, "unread_count": unread_count}
+    return {"notifications": notifications, "unread_count": max(counter.get("unread", 0), 0)}
 
 @api_router.post("/notifications/read")
 async def mark_notifications_read(user: dict = Depends(require_auth)):
-    await db.notifications.update_many(
-        {"user_id": user["id"], "is_read": False},
-        {"$set": {"is_read": True}}
-    )
+    await mark_all_notifications_read(user["id"])
     return {"success": True}
 
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, user: dict = Depends(require_auth)):
-    await db.notifications.update_one(
-        {"id": notification_id, "user_id": user["id"]},
-        {"$set": {"is_read": True}}
-    )
+    await mark_notification_ids_read(user["id"], [notification_id])
     return {"success": True}
 
+# ===================== NOTIFICATION RETENTION =====================
+# notifications is the hot tier: per user, at most NOTIFICATION_HOT_MAX_PER_USER and
+# nothing older than NOTIFICATION_HOT_DAYS. A background job (lease holder only) moves
+# everything else, a batch at a time, into notifications_archive as compact documents,
+# copy first and delete second (the archive is unique on id, so a crash in between
+# can't duplicate). Archived notifications leave the unread and total counters; the
+# inbox and badges only ever read the hot tier.
+
+NOTIFICATION_ARCHIVE_JOB = "notification_archiver"
+NOTIFICATION_ARCHIVE_INTERVAL_SECONDS = float(os.environ.get("NOTIFICATION_ARCHIVE_INTERVAL_SECONDS", "3600"))
+NOTIFICATION_HOT_DAYS = int(os.environ.get("NOTIFICATION_HOT_DAYS", "90"))
+NOTIFICATION_HOT_MAX_PER_USER = int(os.environ.get("NOTIFICATION_HOT_MAX_PER_USER", "200"))
+NOTIFICATION_ARCHIVE_BATCH_SIZE = 1000
+NOTIFICATION_ARCHIVE_MAX_BATCHES = 50  # per tick, so one run can't hold the lease for long
+NOTIFICATION_RETENTION_HISTORY = 48  # storage samples kept in job_state
+
+def archived_notification(notification: dict, last_read_at: Optional[datetime]) -> dict:
+    """Compact archive form; read state is resolved against the watermark."""
+    is_read = notification.get("is_read", False) or bool(
+        last_read_at and notification.get("created_at") and notification["created_at"] <= last_read_at
+    )
+    doc = {
+        "id": notification["id"],
+        "user_id": notification["user_id"],
+        "type": notification.get("type"),
+        "problem_id": notification.get("problem_id") or "",
+        "message": notification.get("message") or "",
+        "is_read": is_read,
+        "created_at": notification.get("created_at"),
+        "archived_at": datetime.utcnow(),
+    }
+    if notification.get("broadcast_id"):
+        doc["broadcast_id"] = notification["broadcast_id"]
+    return doc
+
+async def move_notifications_to_archive(notifications: List[dict]) -> int:
+    """Archive the given notification documents and update their owners' counters for the
+    ones removed from the inbox. Returns how many were removed."""
+    user_ids = list({n["user_id"] for n in notifications})
+    watermarks = {
+        c["user_id"]: c.get("last_read_at")
+        async for c in db.notification_counters.find({"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "last_read_at": 1})
+    }
+    archived = [archived_notification(n, watermarks.get(n["user_id"])) for n in notifications]
+    try:
+        await db.notifications_archive.insert_many(archived, ordered=False)
+    except BulkWriteError as e:
+        # Already archived by a run that stopped before deleting
+        if len(duplicate_key_indexes(e)) != len(e.details.get("writeErrors", [])):
+            raise
+    # Decrement only for what this call deleted: one delete per owner and read state,
+    # so each result says exactly how many of that group's notifications left the inbox
+    groups: Dict[tuple, list] = {}
+    for notification, doc in zip(notifications, archived):
+        groups.setdefault((doc["user_id"], doc["is_read"]), []).append(notification["_id"])
+    keys = list(groups)
+    results = await asyncio.gather(*(db.notifications.delete_many({"_id": {"$in": groups[k]}}) for k in keys))
+    
+    per_user: Dict[str, dict] = {}
+    for (user_id, is_read), result in zip(keys, results):
+        if not result.deleted_count:
+            continue
+        counts = per_user.setdefault(user_id, {"total": 0, "unread": 0})
+        counts["total"] -= result.deleted_count
+        if not is_read:
+            counts["unread"] -= result.deleted_count
+    if per_user:
+        await db.notification_counters.bulk_write([
+            UpdateOne({"user_id": uid}, {"$inc": inc}) for uid, inc in per_user.items()
+        ], ordered=False)
+    return sum(result.deleted_count for result in results)
+
+async def archive_expired_notifications() -> int:
+    """Move notifications older than the hot window."""
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_HOT_DAYS)
+    moved = 0
+    for _ in range(NOTIFICATION_ARCHIVE_MAX_BATCHES):
+        batch = await db.notifications.find({"created_at": {"$lt": cutoff}}).limit(NOTIFICATION_ARCHIVE_BATCH_SIZE).to_list(NOTIFICATION_ARCHIVE_BATCH_SIZE)
+        if not batch:
+            break
+        moved += await move_notifications_to_archive(batch)
+    return moved
+
+async def archive_overflow_notifications() -> int:
+    """Move each user's notifications beyond the newest NOTIFICATION_HOT_MAX_PER_USER."""
+    moved = 0
+    over = await db.notification_counters.find(
+        {"total": {"$gt": NOTIFICATION_HOT_MAX_PER_USER}}, {"_id": 0, "user_id": 1}
+    ).limit(NOTIFICATION_ARCHIVE_BATCH_SIZE).to_list(NOTIFICATION_ARCHIVE_BATCH_SIZE)
+    for counter in over:
+        user_id = counter["user_id"]
+        batch = await db.notifications.find({"user_id": user_id}).sort("created_at", -1).skip(
+            NOTIFICATION_HOT_MAX_PER_USER
+        ).limit(NOTIFICATION_ARCHIVE_BATCH_SIZE).to_list(NOTIFICATION_ARCHIVE_BATCH_SIZE)
+        if batch:
+            moved += await move_notifications_to_archive(batch)
+        else:
+            # Stale total: the inbox is within bounds
+            total = await db.notifications.count_documents({"user_id": user_id})
+            await db.notification_counters.update_one({"user_id": user_id}, {"$set": {"total": total}})
+    return moved
+
+async def collection_storage(name: str) -> dict:
+    try:
+        stats = await db.command("collStats", name)
+        return {
+            "count": stats.get("count", 0),
+            "size_bytes": stats.get("size", 0),
+            "storage_bytes": stats.get("storageSize", 0),
+            "index_bytes": stats.get("totalIndexSize", 0),
+        }
+    except Exception:
+        return {"count": await db[name].estimated_document_count()}
+
+async def run_notification_archiver():
+    """One archiver tick: age-based then size-based moves, plus a storage sample."""
+    expired = await archive_expired_notifications()
+    overflow = await archive_overflow_notifications()
+    sample = {
+        "at": datetime.utcnow(),
+        "moved": expired + overflow,
+        "hot": await collection_storage("notifications"),
+        "archive": await collection_storage("notifications_archive"),
+    }
+    await db.job_state.update_one(
+        {"_id": NOTIFICATION_ARCHIVE_JOB},
+        {
+            "$set": {"last_run_at": sample["at"]},
+            "$inc": {"moved.expired": expired, "moved.overflow": overflow},
+            "$push": {"history": {"$each": [sample], "$slice": -NOTIFICATION_RETENTION_HISTORY}},
+        },
+        upsert=True
+    )
+    if expired or overflow:
+        logger.info(f"Archived {expired} expired and {overflow} overflow notifications")
+
+@api_router.get("/notifications/archive")
+async def get_archived_notifications(before: Optional[datetime] = None, limit: int = 50, user: dict = Depends(require_auth)):
+    """Older notifications, newest first; page with `before` = created_at of the last one."""
+    limit = max(1, min(limit, 100))
+    query = {"user_id": user["id"]}
+    if before:
+        query["created_at"] = {"$lt": before}
+    notifications = await db.notifications_archive.find(
+        query, {"_id": 0, "archived_at": 0}
+    ).sort("created_at", -1).limit(limit).to_list(limit)
+    return {"notifications": notifications}
+
+@api_router.get("/admin/notification-retention")
+async def get_notification_retention(admin: dict = Depends(require_admin)):
+    """Hot/archive sizes, moves so far and growth per day over the recorded samples."""
+    state = await db.job_state.find_one({"_id": NOTIFICATION_ARCHIVE_JOB}, {"_id": 0}) or {}
+    history = state.get("history", [])
+    growth = {}
+    if len(history) >= 2:
+        days = (history[-1]["at"] - history[0]["at"]).total_seconds() / 86400
+        if days > 0:
+            for tier in ("hot", "archive"):
+                for key in ("count", "storage_bytes"):
+                    if key in history[-1][tier] and key in history[0][tier]:
+                        growth[f"{tier}_{key}_per_day"] = round((history[-1][tier][key] - history[0][tier][key]) / days, 1)
+    return {
+        "hot_days": NOTIFICATION_HOT_DAYS,
+        "hot_max_per_user": NOTIFICATION_HOT_MAX_PER_USER,
+        "hot": await collection_storage("notifications"),
+        "archive": await collection_storage("notifications_archive"),
+        "moved": state.get("moved", {}),
+        "last_run_at": state.get("last_run_at"),
+        "growth": growth,
+        "history": history,
+    }
+
+# ===================== BATCHED ACTIONS =====================
+# Lets the mobile app replay its offline action queue in one request (one auth,
+# one round trip). Every action sets a state, so for each target only the last
+# action in the list takes effect and replaying a batch is harmless.
+
+MAX_BATCH_ACTIONS = 200
+
+# action type -> (group, desired state)
+BATCH_ACTION_TYPES = {
+    "relate": ("relate", True),
+    "unrelate": ("relate", False),
+    "save": ("save", True),
+    "unsave": ("save", False),
+    "follow_problem": ("follow_problem", True),
+    "unfollow_problem": ("follow_problem", False),
+    "follow_category": ("follow_category", True),
+    "unfollow_category": ("follow_category", False),
+    "helpful": ("helpful", True),
+    "unhelpful": ("helpful", False),
+    "mark_read": ("mark_read", True),
+}
+
+# users array field backing each list-style group
+BATCH_USER_LIST_FIELDS = {
+    "save": "saved_problems",
+    "follow_problem": "followed_problems",
+    "follow_category": "followed_categories",
+}
+
+class BatchAction(BaseModel):
+    type: str
+    target_id: Optional[str] = None  # problem/comment/category/notification id; omit on mark_read for all
+    client_id: Optional[str] = None  # echoed back so the client can match results to its queue
+
+class BatchActionsRequest(BaseModel):
+    actions: List[BatchAction]
+
+class _BatchState:
+    """Final desired state per (group, target) plus the action indexes that map to it."""
+
+    def __init__(self, actions: List[BatchAction]):
+        self.results = [
+            {"index": i, "type": a.type, "target_id": a.target_id, "client_id": a.client_id, "success": True}
+            for i, a in enumerate(actions)
+        ]
+        self.final: Dict[tuple, bool] = {}
+        self.indexes: Dict[tuple, List[int]] = {}
+        for i, action in enumerate(actions):
+            spec = BATCH_ACTION_TYPES.get(action.type)
+            if not spec:
+                self.results[i].update(success=False, error="Unknown action type")
+                continue
+            group, state = spec
+            if not action.target_id and group != "mark_read":
+                self.results[i].update(success=False, error="target_id is required")
+                continue
+            key = (group, action.target_id)
+            self.final.pop(key, None)  # re-insert so dict order follows the last action
+            self.final[key] = state
+            self.indexes.setdefault(key, []).append(i)
+
+    def targets(self, group: str, state: Optional[bool] = None) -> List[Optional[str]]:
+        return [t for (g, t), s in self.final.items() if g == group and (state is None or s == state)]
+
+    def fail(self, group: str, target_id: str, error: str):
+        for i in self.indexes[(group, target_id)]:
+            self.results[i].update(success=False, error=error)
+
+    def annotate(self, group: str, target_id: str, **fields):
+        for i in self.indexes[(group, target_id)]:
+            if self.results[i]["success"]:
+                self.results[i].update(fields)
+
+async def _batch_user_lists(user_id: str, batch: _BatchState):
+    ops = []
+    for group, field in BATCH_USER_LIST_FIELDS.items():
+        add = batch.targets(group, True)
+        remove = batch.targets(group, False)
+        if add:
+            ops.append(UpdateOne({"id": user_id}, {"$addToSet": {field: {"$each": add}}}))
+        if remove:
+            ops.append(UpdateOne({"id": user_id}, {"$pull": {field: {"$in": remove}}}))
+    if ops:
+        await db.users.bulk_write(ops, ordered=False)
+
+async def _batch_mark_read(user_id: str, batch: _BatchState):
+    notification_ids = batch.targets("mark_read")
+    if not notification_ids:
+        return
+    if None in notification_ids:
+        await mark_all_notifications_read(user_id)
+    else:
+        await mark_notification_ids_read(user_id, notification_ids)
+
+async def _batch_relates(user: dict, batch: _BatchState) -> List[dict]:
+    relate_ids = batch.targets("relate", True)
+    unrelate_ids = batch.targets("relate", False)
+    if not relate_ids and not unrelate_ids:
+        return []
+    
+    problems = {
+        p["id"]: p async for p in db.problems.find(
+            {"id": {"$in": relate_ids + unrelate_ids}},
+            {"_id": 0, "id": 1, "user_id": 1, "title": 1, "category_id": 1, "is_local": 1, "community_id": 1}
+        )
+    }
+    blocked_ids = set(await get_blocked_user_ids(user["id"]))
+    membership = await db.community_members.find_one({"user_id": user["id"]}, {"community_id": 1})
+    member_of = membership["community_id"] if membership else None
+    
+    # Same checks as relate_to_problem
+    valid_relate_ids = []
+    for pid in relate_ids:
+        problem = problems.get(pid)
+        if not problem:
+            batch.fail("relate", pid, "Problem not found")
+        elif problem["user_id"] in blocked_ids:
+            batch.fail("relate", pid, "Cannot interact with this user")
+        elif problem["user_id"] == user["id"]:
+            batch.fail("relate", pid, "Cannot relate to your own post")
+        elif problem.get("is_local") and problem.get("community_id") and problem["community_id"] != member_of:
+            batch.fail("relate", pid, "Only community members can relate to local frikts")
+        else:
+            valid_relate_ids.append(pid)
+    
+    existing = set(await db.relates.distinct(
+        "problem_id", {"user_id": user["id"], "problem_id": {"$in": valid_relate_ids + unrelate_ids}}
+    ))
+    to_insert = [pid for pid in valid_relate_ids if pid not in existing]
+    to_delete = [pid for pid in unrelate_ids if pid in existing]
+    
+    ops = [InsertOne(Relate(problem_id=pid, user_id=user["id"]).dict()) for pid in to_insert]
+    ops += [DeleteOne({"problem_id": pid, "user_id": user["id"]}) for pid in to_delete]
+    if not ops:
+        return []
+    try:
+        await db.relates.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        duplicates = duplicate_key_indexes(e)
+        to_insert = [pid for i, pid in enumerate(to_insert) if i not in duplicates]
+    
+    counter_ops = [UpdateOne({"id": pid}, {"$inc": {"relates_count": 1}}) for pid in to_insert]
+    counter_ops += [
+        UpdateOne({"id": pid, "relates_count": {"$gt": 0}}, {"$inc": {"relates_count": -1}})
+        for pid in to_delete if pid in problems
+    ]
+    if counter_ops:
+        await db.problems.bulk_write(counter_ops, ordered=False)
+    
+    updated = await db.problems.find({"id": {"$in": to_insert + to_delete}}, {"_id": 0}).to_list(len(ops))
+    await refresh_signal_scores(updated)
+    for p in updated:
+        batch.annotate("relate", p["id"], relates_count=p["relates_count"])
+    
+    if not to_insert:
+        return []
+    
+    # GAMIFICATION: relater stats and badges once for the whole batch
+    categories: Dict[str, int] = {}
+    for pid in to_insert:
+        if problems[pid].get("category_id"):
+            categories[problems[pid]["category_id"]] = categories.get(problems[pid]["category_id"], 0) + 1
+    relater_stats = await record_activity(user["id"], "relate_given", amount=len(to_insert), categories=categories)
+    newly_awarded = await check_and_award_badges(user["id"], user, relater_stats, "relate")
+    
+    counts = {p["id"]: p["relates_count"] for p in updated}
+    for pid in to_insert:
+        await emit_event("relate.created", {
+            "problem_id": pid,
+            "problem_user_id": problems[pid]["user_id"],
+            "problem_title": problems[pid].get("title", ""),
+            "category_id": problems[pid].get("category_id"),
+            "relates_count": counts.get(pid, 0),
+            "actor_id": user["id"],
+            "actor_name": user["name"],
+            "actor_status": user.get("status"),
+        })
+    return newly_awarded
+
+async def _batch_helpfuls(user_id: str, batch: _BatchState):
+    helpful_ids = batch.targets("helpful", True)
+    unhelpful_ids = batch.targets("helpful", False)
+    if not helpful_ids and not unhelpful_ids:
+        return
+    
+    comment_ids = set(await db.comments.distinct("id", {"id": {"$in": helpful_ids + unhelpful_ids}}))
+    for cid in helpful_ids:
+        if cid not in comment_ids:
+            batch.fail("helpful", cid, "Comment not found")
+    
+    existing = set(await db.helpfuls.distinct(
+        "comment_id", {"user_id": user_id, "comment_id": {"$in": list(comment_ids)}}
+    ))
+    to_insert = [cid for cid in helpful_ids if cid in comment_ids and cid not in existing]
+    to_delete = [cid for cid in unhelpful_ids if cid in existing]
+    
+    ops = [InsertOne(Helpful(comment_id=cid, user_id=user_id).dict()) for cid in to_insert]
+    ops += [DeleteOne({"comment_id": cid, "user_id": user_id}) for cid in to_delete]
+    if not ops:
+        return
+    try:
+        await db.helpfuls.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        duplicates = duplicate_key_indexes(e)
+        to_insert = [cid for i, cid in enumerate(to_insert) if i not in duplicates]
+    
+    counter_ops = [UpdateOne({"id": cid}, {"$inc": {"helpful_count": 1}}) for cid in to_insert]
+    counter_ops += [
+        UpdateOne({"id": cid, "helpful_count": {"$gt": 0}}, {"$inc": {"helpful_count": -1}})
+        for cid in to_delete
+    ]
+    if counter_ops:
+        await db.comments.bulk_write(counter_ops, ordered=False)
+    
+    async for c in db.comments.find({"id": {"$in": to_insert + to_delete}}, {"_id": 0, "id": 1, "helpful_count": 1}):
+        batch.annotate("helpful", c["id"], helpful_count=c["helpful_count"])
+
+@api_router.post("/actions/batch")
+async def apply_batch_actions(request: BatchActionsRequest, user: dict = Depends(require_auth)):
+    """Apply an ordered list of idempotent actions (relate, save, follow, helpful, mark read)
+    with grouped bulk writes. Returns one result per action, in request order."""
+    if len(request.actions) > MAX_BATCH_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_BATCH_ACTIONS} actions per batch")
+    
+    batch = _BatchState(request.actions)
+    newly_awarded = []
+    try:
+        await _batch_user_lists(user["id"], batch)
+        await _batch_mark_read(user["id"], batch)
+        newly_awarded = await _batch_relates(user, batch)
+        await _batch_helpfuls(user["id"], batch)
+    except Exception as e:
+        logger.error(f"Error applying action batch for user {user['id']}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to apply actions")
+    
+    return {"results": batch.results, "newly_awarded_badges": newly_awarded}
+
 # ===================== MISSION OF THE DAY =====================
 
 @api_router.get("/mission")
@@ -3095,10 +5207,10 @@ async def get_my_gamification_stats(user: dict = Depends(require_auth)):
 async def track_visit(user: dict = Depends(require_auth)):
     """Track app visit for streak calculation"""
     updated_stats, is_qualifying = await update_visit_streak(user["id"])
-    newly_awarded = []
     
-    if is_qualifying:
-        newly_awarded = await check_and_award_badges(user["id"], user, updated_stats, "visit")
+    # Streak badges on qualifying visits; special badges (OG Member, Early Frikter) on every visit
+    triggers = ["visit", "special"] if is_qualifying else ["special"]
+    newly_awarded = await check_and_award_badges(user["id"], user, updated_stats, triggers)
     
     # Also check for pending badge notifications from other users' actions
     pending_badges = await db.pending_badge_notifications.find(
@@ -3113,10 +5225,6 @@ async def track_visit(user: dict = Depends(require_auth)):
             if pb.get("badge"):
                 newly_awarded.append(pb["badge"])
     
-    # Check special badges (OG Member, Early Frikter) on visit
-    special_badges = await check_and_award_badges(user["id"], user, updated_stats, "special")
-    newly_awarded.extend(special_badges)
-    
     return {
         "stats": updated_stats,
         "is_qualifying_visit": is_qualifying,
@@ -3156,7 +5264,7 @@ async def follow_user(user_id: str, user: dict = Depends(require_auth)):
     })
     
     # GAMIFICATION: Update stats and check badges
-    stats = await increment_user_stat(user["id"], "users_followed")
+    stats = await record_activity(user["id"], "user_followed", target_user_id=user_id)
     newly_awarded = await check_and_award_badges(user["id"], user, stats, "follow")
     
     # Send notification to the user being followed (if not banned and actor not shadowbanned)
@@ -3170,13 +5278,10 @@ async def follow_user(user_id: str, user: dict = Depends(require_auth)):
             problem_id="",  # No problem associated
             message=f"{user['name']} started following you"
         )
-        await db.notifications.insert_one(notification.dict())
+        await insert_notification(notification.dict())
         
         # Check settings and send push
-        settings = await db.notification_settings.find_one({"user_id": user_id})
-        global_push = not settings or settings.get("push_notifications", True)
-        follows_enabled = not settings or settings.get("follows", True)
-        if global_push and follows_enabled:
+        if wants_push(await get_notification_settings(user_id), "follows"):
             await send_notification_to_user(
                 user_id,
                 "New follower!",
@@ -3440,6 +5545,228 @@ async def upload_avatar_base64(data: AvatarBase64Upload, user: dict = Depends(re
     
     return {"url": avatar_url, "message": "Avatar uploaded successfully"}
 
+# ===================== LEADERBOARDS =====================
+# Ranked snapshots are materialized periodically into db.leaderboards (one document per
+# rank, tagged with the snapshot id). User boards are ranked from the counters already
+# kept in user_stats (totals and per-category maps), so a rebuild never joins relates or
+# comments to problems. Excluded users are dropped while building, so a read is a
+# single indexed page query on the current snapshot.
+
+LEADERBOARD_JOB = "leaderboards"
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get("LEADERBOARD_REFRESH_SECONDS", "600"))
+LEADERBOARD_SIZE = 100
+COMMUNITY_ACTIVITY_WINDOW_DAYS = 7
+
+# board -> user_stats field it ranks by (global / community scopes)
+LEADERBOARD_STAT_FIELDS = {
+    "creators": "total_relates_received",
+    "relaters": "total_relates_given",
+    "commenters": "total_comments",
+}
+# board -> user_stats per-category map it ranks by (category scope)
+LEADERBOARD_CATEGORY_FIELDS = {
+    "relaters": "relates_given_per_category",
+    "commenters": "comments_per_category",
+}
+LEADERBOARD_BOARDS = list(LEADERBOARD_STAT_FIELDS) + ["communities"]
+
+async def leaderboard_excluded_user_ids() -> List[str]:
+    """Shadowbanned, banned and test accounts never appear on leaderboards."""
+    test_names = [re.compile(f"^{re.escape(name)}$", re.IGNORECASE) for name in TEST_ACCOUNTS]
+    return [u["id"] async for u in db.users.find(
+        {"$or": [{"status": {"$in": ["shadowbanned", "banned"]}}, {"name": {"$in": test_names}}]},
+        {"_id": 0, "id": 1}
+    )]
+
+async def top_users_by_stat(field: str, excluded: List[str], user_ids: Optional[List[str]] = None) -> List[tuple]:
+    """(user_id, score) for the top users by a user_stats field (uses the field's index)."""
+    query = {"user_id": {"$nin": excluded}, field: {"$gt": 0}}
+    if user_ids is not None:
+        query["user_id"]["$in"] = user_ids
+    cursor = db.user_stats.find(query, {"_id": 0, "user_id": 1, field: 1}).sort(field, -1).limit(LEADERBOARD_SIZE)
+    return [(s["user_id"], s[field]) async for s in cursor]
+
+async def top_users_per_category(collection, pipeline: list, excluded: set) -> Dict[str, List[tuple]]:
+    """Run a pipeline yielding {_id: {category_id, user_id}, score} sorted by category then
+    score desc, keeping the top users per category."""
+    ranked: Dict[str, List[tuple]] = {}
+    async for row in collection.aggregate(pipeline + [{"$sort": {"_id.category_id": 1, "score": -1}}], allowDiskUse=True):
+        cat_id, user_id = row["_id"].get("category_id"), row["_id"].get("user_id")
+        if not cat_id or user_id in excluded:
+            continue
+        rows = ranked.setdefault(cat_id, [])
+        if len(rows) < LEADERBOARD_SIZE:
+            rows.append((user_id, row["score"]))
+    return ranked
+
+def category_stat_pipeline(field: str) -> list:
+    """Pipeline unwinding a user_stats per-category map into (category, user) scores."""
+    return [
+        {"$match": {field: {"$exists": True, "$ne": {}}}},
+        {"$project": {"user_id": 1, "counts": {"$objectToArray": f"${field}"}}},
+        {"$unwind": "$counts"},
+        {"$match": {"counts.v": {"$gt": 0}}},
+        {"$project": {"_id": {"category_id": "$counts.k", "user_id": "$user_id"}, "score": "$counts.v"}},
+    ]
+
+def group_by_problem_category(match: dict) -> list:
+    """Pipeline for relates/comments counted per (problem category, user). Used to
+    rebuild the per-category counters in user_stats."""
+    return [
+        {"$match": match},
+        {"$lookup": {"from": "problems", "localField": "problem_id", "foreignField": "id", "as": "problem"}},
+        {"$unwind": "$problem"},
+        {"$group": {"_id": {"category_id": "$problem.category_id", "user_id": "$user_id"}, "score": {"$sum": 1}}},
+    ]
+
+async def community_activity_scores(since: datetime) -> Dict[str, dict]:
+    """Local posts, relates and comments per community since the given time."""
+    scores: Dict[str, dict] = {}
+    
+    def community(cid: str) -> dict:
+        return scores.setdefault(cid, {"posts": 0, "relates": 0, "comments": 0})
+    
+    async for row in db.problems.aggregate([
+        {"$match": {"is_local": True, "community_id": {"$ne": None}, "created_at": {"$gte": since}}},
+        {"$group": {"_id": "$community_id", "count": {"$sum": 1}}},
+    ]):
+        community(row["_id"])["posts"] = row["count"]
+    for collection, key in [(db.relates, "relates"), (db.comments, "comments")]:
+        async for row in collection.aggregate([
+            {"$match": {"created_at": {"$gte": since}}},
+            {"$lookup": {"from": "problems", "localField": "problem_id", "foreignField": "id", "as": "problem"}},
+            {"$unwind": "$problem"},
+            {"$match": {"problem.is_local": True, "problem.community_id": {"$ne": None}}},
+            {"$group": {"_id": "$problem.community_id", "count": {"$sum": 1}}},
+        ], allowDiskUse=True):
+            community(row["_id"])[key] = row["count"]
+    return scores
+
+def build_user_entries(snapshot_id: str, board: str, scope: str, ranked: List[tuple], users: Dict[str, dict]) -> List[dict]:
+    entries = []
+    for user_id, score in ranked:
+        user = users.get(user_id)
+        if not user:
+            continue  # deleted account
+        entries.append({
+            "snapshot_id": snapshot_id, "board": board, "scope": scope, "rank": len(entries) + 1,
+            "user_id": user_id, "name": user.get("displayName") or user.get("name"),
+            "avatar_url": user.get("avatarUrl"), "score": score,
+        })
+    return entries
+
+async def materialize_leaderboards():
+    """Build a full leaderboard snapshot, switch readers to it and drop the previous one."""
+    snapshot_id = str(uuid.uuid4())
+    excluded = await leaderboard_excluded_user_ids()
+    excluded_set = set(excluded)
+    ranked: Dict[tuple, List[tuple]] = {}
+    
+    for board, field in LEADERBOARD_STAT_FIELDS.items():
+        ranked[(board, "global")] = await top_users_by_stat(field, excluded)
+    
+    members: Dict[str, List[str]] = {}
+    async for m in db.community_members.find({}, {"_id": 0, "user_id": 1, "community_id": 1}):
+        members.setdefault(m["community_id"], []).append(m["user_id"])
+    for community_id, user_ids in members.items():
+        for board, field in LEADERBOARD_STAT_FIELDS.items():
+            ranked[(board, f"community:{community_id}")] = await top_users_by_stat(field, excluded, user_ids)
+    
+    per_category = {
+        "creators": await top_users_per_category(db.problems, [
+            {"$match": {"status": "active", "relates_count": {"$gt": 0}}},
+            {"$group": {"_id": {"category_id": "$category_id", "user_id": "$user_id"}, "score": {"$sum": "$relates_count"}}},
+        ], excluded_set),
+    }
+    for board, field in LEADERBOARD_CATEGORY_FIELDS.items():
+        per_category[board] = await top_users_per_category(db.user_stats, category_stat_pipeline(field), excluded_set)
+    for board, categories in per_category.items():
+        for cat_id, rows in categories.items():
+            ranked[(board, f"category:{cat_id}")] = rows
+    
+    user_ids = list({user_id for rows in ranked.values() for user_id, _ in rows})
+    users = {u["id"]: u async for u in db.users.find(
+        {"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "name": 1, "displayName": 1, "avatarUrl": 1}
+    )}
+    docs = []
+    for (board, scope), rows in ranked.items():
+        docs.extend(build_user_entries(snapshot_id, board, scope, rows, users))
+    
+    since = datetime.utcnow() - timedelta(days=COMMUNITY_ACTIVITY_WINDOW_DAYS)
+    activity = await community_activity_scores(since)
+    communities = {c["id"]: c async for c in db.communities.find(
+        {"id": {"$in": list(activity)}}, {"_id": 0, "id": 1, "name": 1, "avatar_url": 1}
+    )}
+    top_communities = sorted(
+        ((cid, counts) for cid, counts in activity.items() if cid in communities),
+        key=lambda item: sum(item[1].values()), reverse=True
+    )[:LEADERBOARD_SIZE]
+    for rank, (cid, counts) in enumerate(top_communities, start=1):
+        docs.append({
+            "snapshot_id": snapshot_id, "board": "communities", "scope": "global", "rank": rank,
+            "community_id": cid, "name": communities[cid]["name"], "avatar_url": communities[cid].get("avatar_url"),
+            "score": sum(counts.values()), **counts,
+        })
+    
+    for i in range(0, len(docs), 1000):
+        await db.leaderboards.insert_many(docs[i:i + 1000])
+    await db.job_state.update_one(
+        {"_id": LEADERBOARD_JOB},
+        {"$set": {"snapshot_id": snapshot_id, "generated_at": datetime.utcnow(), "entries": len(docs)}},
+        upsert=True
+    )
+    await db.leaderboards.delete_many({"snapshot_id": {"$ne": snapshot_id}})
+    logger.info(f"Materialized leaderboards snapshot {snapshot_id}: {len(docs)} entries")
+
+@api_router.get("/leaderboards/{board}")
+async def get_leaderboard(
+    board: str,
+    category_id: Optional[str] = None,
+    community_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 20,
+    user: dict = Depends(require_auth)
+):
+    """
+    Ranked leaderboard page. Boards: creators (relates received), relaters, commenters
+    and communities (weekly local activity). User boards can be scoped to a category
+    or a community (members only).
+    """
+    if board not in LEADERBOARD_BOARDS:
+        raise HTTPException(status_code=404, detail="Leaderboard not found")
+    if category_id and community_id:
+        raise HTTPException(status_code=400, detail="Use either category_id or community_id, not both")
+    if board == "communities" and (category_id or community_id):
+        raise HTTPException(status_code=400, detail="The communities leaderboard is global only")
+    
+    scope = "global"
+    if category_id:
+        if category_id not in CATEGORY_IDS:
+            raise HTTPException(status_code=400, detail="Invalid category")
+        scope = f"category:{category_id}"
+    elif community_id:
+        membership = await db.community_members.find_one({"user_id": user["id"], "community_id": community_id})
+        if not membership and not is_admin(user):
+            raise HTTPException(status_code=403, detail="You are not a member of this community")
+        scope = f"community:{community_id}"
+    
+    skip = max(skip, 0)
+    limit = max(1, min(limit, LEADERBOARD_SIZE))
+    state = await db.job_state.find_one({"_id": LEADERBOARD_JOB}) or {}
+    entries = []
+    if state.get("snapshot_id"):
+        entries = await db.leaderboards.find(
+            {"snapshot_id": state["snapshot_id"], "board": board, "scope": scope},
+            {"_id": 0, "snapshot_id": 0, "board": 0, "scope": 0}
+        ).sort("rank", 1).skip(skip).limit(limit).to_list(limit)
+    
+    return {
+        "board": board,
+        "scope": scope,
+        "entries": entries,
+        "generated_at": state.get("generated_at"),
+    }
+
 # ===================== DELETE ACCOUNT =====================
 
 @api_router.delete("/users/me")
@@ -3504,9 +5831,10 @@ async def delete_account(user: dict = Depends(require_auth)):
     ))
     for pid in affected_problem_ids:
         relates_count = await db.relates.count_documents({"problem_id": pid})
-        comments_count = await db.comments.count_documents({"problem_id": pid, "status": {"$ne": "removed"}})
+        counted = {"problem_id": pid, "status": {"$nin": UNCOUNTED_COMMENT_STATUSES}}
+        comments_count = await db.comments.count_documents(counted)
         unique_commenters = len(set([
-            c["user_id"] async for c in db.comments.find({"problem_id": pid, "status": {"$ne": "removed"}}, {"user_id": 1})
+            c["user_id"] async for c in db.comments.find(counted, {"user_id": 1})
         ]))
         await db.problems.update_one(
             {"id": pid},
@@ -3525,12 +5853,16 @@ async def delete_account(user: dict = Depends(require_auth)):
     
     # 9. Delete auth and notification data
     await db.notifications.delete_many({"user_id": user_id})
+    await db.notification_counters.delete_many({"user_id": user_id})
+    await db.notifications_archive.delete_many({"user_id": user_id})
     await db.push_tokens.delete_many({"user_id": user_id})
     await db.notification_settings.delete_many({"user_id": user_id})
+    invalidate_notification_settings(user_id)
     await db.password_reset_tokens.delete_many({"user_id": user_id})
     await db.pending_badge_notifications.delete_many({"user_id": user_id})
     await db.pending_notification_batches.delete_many({"recipient_user_id": user_id})
     await db.user_stats.delete_many({"user_id": user_id})
+    await db.activity_events.delete_many({"user_id": user_id})
     await db.user_achievements.delete_many({"user_id": user_id})
     await db.feedback.delete_many({"user_id": user_id})
     
@@ -3691,22 +6023,49 @@ def invalidate_shadowban_cache():
 
 # ===================== REPORT =====================
 
+# Content is auto-hidden once it collects this many reports
+REPORT_AUTO_HIDE_THRESHOLD = 3
+
+async def increment_problem_reports(problem_id: str) -> Optional[dict]:
+    """Atomically bump reports_count and auto-hide the problem once it crosses the threshold.
+    Returns the updated problem, or None if it doesn't exist."""
+    problem = await db.problems.find_one_and_update(
+        {"id": problem_id},
+        {"$inc": {"reports_count": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if problem and problem["reports_count"] >= REPORT_AUTO_HIDE_THRESHOLD and not problem.get("is_hidden"):
+        await db.problems.update_one(
+            {"id": problem_id, "reports_count": {"$gte": REPORT_AUTO_HIDE_THRESHOLD}},
+            {"$set": {"is_hidden": True, "status": "hidden"}}
+        )
+        problem["is_hidden"] = True
+        problem["status"] = "hidden"
+    return problem
+
+async def increment_comment_reports(comment_id: str) -> Optional[dict]:
+    """Atomically bump reports_count and auto-hide the comment once it crosses the threshold.
+    Returns the updated comment, or None if it doesn't exist."""
+    comment = await db.comments.find_one_and_update(
+        {"id": comment_id},
+        {"$inc": {"reports_count": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if comment and comment["reports_count"] >= REPORT_AUTO_HIDE_THRESHOLD and comment.get("status") != "hidden":
+        await set_comment_fields(
+            comment_id, {"status": "hidden"},
+            match={"status": {"$ne": "hidden"}, "reports_count": {"$gte": REPORT_AUTO_HIDE_THRESHOLD}}
+        )
+        comment["status"] = "hidden"
+    return comment
+
 @api_router.post("/problems/{problem_id}/report")
 async def report_problem(problem_id: str, user: dict = Depends(require_auth)):
-    problem = await db.problems.find_one({"id": problem_id})
+    problem = await increment_problem_reports(problem_id)
     if not problem:
         raise HTTPException(status_code=404, detail="Problem not found")
     
-    new_count = problem.get("reports_count", 0) + 1
-    is_hidden = new_count >= 3
-    status = "hidden" if is_hidden else problem.get("status", "active")
-    
-    await db.problems.update_one(
-        {"id": problem_id},
-        {"$set": {"reports_count": new_count, "is_hidden": is_hidden, "status": status}}
-    )
-    
-    return {"reported": True, "is_hidden": is_hidden}
+    return {"reported": True, "is_hidden": problem.get("is_hidden", False)}
 
 # Enhanced Report endpoint with reason
 class ReportRequest(BaseModel):
@@ -3743,14 +6102,9 @@ async def create_problem_report(problem_id: str, report_data: ReportRequest, use
     await db.reports.insert_one(report.dict())
     
     # Update problem report count
-    new_count = problem.get("reports_count", 0) + 1
-    is_hidden = new_count >= 3
-    status = "hidden" if is_hidden else problem.get("status", "active")
-    
-    await db.problems.update_one(
-        {"id": problem_id},
-        {"$set": {"reports_count": new_count, "is_hidden": is_hidden, "status": status}}
-    )
+    problem = await increment_problem_reports(problem_id) or problem
+    new_count = problem.get("reports_count", 0)
+    is_hidden = problem.get("is_hidden", False)
     
     # Fire-and-forget admin alert (push + email)
     asyncio.create_task(notify_admins_of_report(
@@ -3792,14 +6146,9 @@ async def create_comment_report(comment_id: str, report_data: ReportRequest, use
     await db.reports.insert_one(report.dict())
     
     # Update comment report count
-    new_count = comment.get("reports_count", 0) + 1
-    is_hidden = new_count >= 3
-    status = "hidden" if is_hidden else comment.get("status", "active")
-    
-    await db.comments.update_one(
-        {"id": comment_id},
-        {"$set": {"reports_count": new_count, "status": status}}
-    )
+    comment = await increment_comment_reports(comment_id) or comment
+    new_count = comment.get("reports_count", 0)
+    is_hidden = new_count >= REPORT_AUTO_HIDE_THRESHOLD
     
     # Fire-and-forget admin alert (push + email)
     asyncio.create_task(notify_admins_of_report(
@@ -4161,7 +6510,7 @@ async def delete_problem(problem_id: str, admin: dict = Depends(require_admin)):
             "is_read": False,
             "created_at": datetime.utcnow(),
         }
-        await db.notifications.insert_one(notification)
+        await insert_notification(notification)
         await send_notification_to_user(
             problem["user_id"],
             "Frikt removed",
@@ -4210,7 +6559,7 @@ async def mark_needs_context(problem_id: str, admin: dict = Depends(require_admi
         problem_id=problem_id,
         message="Your problem needs more context. Please add more details."
     )
-    await db.notifications.insert_one(notification.dict())
+    await insert_notification(notification.dict())
     # Also send a push so the user knows immediately
     try:
         await send_notification_to_user(
@@ -4238,14 +6587,167 @@ async def clear_needs_context(problem_id: str, admin: dict = Depends(require_adm
     return {"success": True, "needs_context": False}
 
 # ===================== BROADCAST NOTIFICATIONS =====================
+# Broadcasts run as background jobs recorded in broadcast_logs. Recipients are streamed
+# from push_tokens in user_id order; after each page the job checkpoints its cursor and
+# delivery stats, so a job interrupted by a restart resumes where it stopped (a page in
+# flight may get its pushes twice; in-app notifications are not duplicated). A job that
+# keeps failing is retried with backoff and marked failed after BROADCAST_MAX_ATTEMPTS.
+
+BROADCAST_PAGE_USERS = 500
+BROADCAST_LEASE_SECONDS = 120
+BROADCAST_RESUME_INTERVAL_SECONDS = 60
+BROADCAST_MAX_ATTEMPTS = 5
+BROADCAST_BACKOFF_BASE_SECONDS = 60
+BROADCAST_BACKOFF_MAX_SECONDS = 1800
+
+# Broadcast jobs running in this process
+_running_broadcasts: set = set()
 
 class BroadcastNotificationRequest(BaseModel):
     title: str
     body: str
 
+async def count_broadcast_recipients() -> int:
+    """Users with an active push token who haven't disabled push notifications."""
+    result = await db.push_tokens.aggregate([
+        {"$match": {"is_active": True}},
+        {"$group": {"_id": "$user_id"}},
+        {"$lookup": {"from": "notification_settings", "localField": "_id", "foreignField": "user_id", "as": "settings"}},
+        {"$match": {"settings.push_notifications": {"$ne": False}}},
+        {"$count": "recipients"},
+    ], allowDiskUse=True).to_list(1)
+    return result[0]["recipients"] if result else 0
+
+async def iter_broadcast_recipient_pages(after_user_id: Optional[str]):
+    """Yield pages of (user_id, tokens) from active push tokens, in user_id order."""
+    query = {"is_active": True}
+    if after_user_id:
+        query["user_id"] = {"$gt": after_user_id}
+    page: List[tuple] = []
+    current_user, current_tokens = None, []
+    async for t in db.push_tokens.find(query, {"_id": 0, "user_id": 1, "token": 1}).sort("user_id", 1):
+        if t["user_id"] != current_user:
+            if current_user is not None:
+                page.append((current_user, current_tokens))
+                if len(page) >= BROADCAST_PAGE_USERS:
+                    yield page
+                    page = []
+            current_user, current_tokens = t["user_id"], []
+        current_tokens.append(t["token"])
+    if current_user is not None:
+        page.append((current_user, current_tokens))
+    if page:
+        yield page
+
+async def send_broadcast_page(broadcast: dict, page: List[tuple]) -> dict:
+    """In-app notifications, bulk badge counts and chunked pushes for one page. Returns stat increments."""
+    user_ids = [uid for uid, _ in page]
+    disabled = {
+        s["user_id"] async for s in db.notification_settings.find(
+            {"user_id": {"$in": user_ids}, "push_notifications": False}, {"_id": 0, "user_id": 1}
+        )
+    }
+    recipients = [(uid, tokens) for uid, tokens in page if uid not in disabled]
+    if not recipients:
+        return {"stats.users_processed": len(page)}
+    recipient_ids = [uid for uid, _ in recipients]
+    
+    # Store the broadcast in each recipient's notifications FIRST so the unread count
+    # used for the badge includes it (skipping users notified before a restart)
+    already = set(await db.notifications.distinct("user_id", {"broadcast_id": broadcast["id"], "user_id": {"$in": recipient_ids}}))
+    now = datetime.utcnow()
+    new_notifications = [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": uid,
+            "type": "broadcast",
+            "problem_id": "",  # No problem associated
+            "message": f"{broadcast['title']}: {broadcast['body'][:80]}...",
+            "is_read": False,
+            "broadcast_id": broadcast["id"],
+            "created_at": now,
+        }
+        for uid in recipient_ids if uid not in already
+    ]
+    if new_notifications:
+        await insert_notifications(new_notifications)
+    
+    unread = await get_unread_counts(recipient_ids)
+    messages = []
+    for uid, tokens in recipients:
+        messages.extend(build_push_messages(tokens, broadcast["title"], broadcast["body"], {"type": "broadcast"},
+                                            badge=max(unread.get(uid, 0), 1)))
+    tickets = await send_push_messages(messages)
+    ok = sum(1 for t in tickets if t.get("status") == "ok")
+    return {
+        "stats.users_processed": len(page),
+        "stats.recipients": len(recipients),
+        "stats.notifications_created": len(new_notifications),
+        "stats.messages_sent": len(messages),
+        "tokens_count": len(messages),
+        "stats.tickets_ok": ok,
+        "stats.tickets_error": len(tickets) - ok,
+    }
+
+async def run_broadcast_job(broadcast_id: str):
+    """Send (or resume) a broadcast. Only the holder of the broadcast's lease runs it."""
+    lease = f"broadcast:{broadcast_id}"
+    if broadcast_id in _running_broadcasts or not await acquire_lease(lease, BROADCAST_LEASE_SECONDS):
+        return
+    _running_broadcasts.add(broadcast_id)
+    broadcast = None
+    try:
+        broadcast = await db.broadcast_logs.find_one({"id": broadcast_id}, {"_id": 0})
+        if not broadcast or broadcast.get("status") != "running":
+            return
+        if broadcast.get("cursor"):
+            logger.info(f"Resuming broadcast {broadcast_id} after user {broadcast['cursor']}")
+        
+        async for page in iter_broadcast_recipient_pages(broadcast.get("cursor")):
+            stats = await send_broadcast_page(broadcast, page)
+            if not await acquire_lease(lease, BROADCAST_LEASE_SECONDS):
+                # Lease expired and another worker resumed it from the last checkpoint
+                logger.warning(f"Broadcast {broadcast_id} lease lost, stopping")
+                return
+            await db.broadcast_logs.update_one(
+                {"id": broadcast_id},
+                {"$set": {"cursor": page[-1][0], "updated_at": datetime.utcnow()}, "$inc": stats}
+            )
+        
+        await db.broadcast_logs.update_one(
+            {"id": broadcast_id},
+            {"$set": {"status": "completed", "completed_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+        )
+        logger.info(f"Broadcast {broadcast_id} completed")
+    except Exception as e:
+        # Retried from the last checkpoint by the resume pass once its backoff has
+        # passed, until it runs out of attempts
+        attempts = (broadcast or {}).get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": str(e), "updated_at": datetime.utcnow()}
+        if attempts >= BROADCAST_MAX_ATTEMPTS:
+            update["status"] = "failed"
+            logger.error(f"Broadcast {broadcast_id} failed after {attempts} attempts: {e}")
+        else:
+            update["next_attempt_at"] = datetime.utcnow() + retry_backoff(attempts, BROADCAST_BACKOFF_BASE_SECONDS, BROADCAST_BACKOFF_MAX_SECONDS)
+            logger.warning(f"Broadcast {broadcast_id} interrupted, retrying from its cursor: {e}")
+        await db.broadcast_logs.update_one({"id": broadcast_id}, {"$set": update})
+    finally:
+        _running_broadcasts.discard(broadcast_id)
+        await release_lease(lease)
+
+async def resume_broadcast_jobs():
+    """Restart broadcasts left running by a worker that stopped (their lease has expired)
+    or due for a retry."""
+    async for b in db.broadcast_logs.find({
+        "status": "running",
+        "$or": [{"next_attempt_at": None}, {"next_attempt_at": {"$lte": datetime.utcnow()}}],
+    }, {"_id": 0, "id": 1}):
+        if b["id"] not in _running_broadcasts:
+            asyncio.create_task(run_broadcast_job(b["id"]))
+
 @api_router.post("/admin/broadcast-notification")
 async def broadcast_notification(request: BroadcastNotificationRequest, admin: dict = Depends(require_admin)):
-    """Send a push notification to all users with notifications enabled"""
+    """Send a push notification to all users with notifications enabled (runs in the background)"""
     
     # Validate input
     if len(request.title) > 50:
@@ -4270,61 +6772,11 @@ async def broadcast_notification(request: BroadcastNotificationRequest, admin: d
             detail=f"Rate limit exceeded. Max 3 broadcasts per day. You have sent {broadcasts_today} today."
         )
     
-    # Get all users with notifications enabled
-    # First get users who have NOT disabled notifications (default is enabled)
-    users_with_disabled = await db.notification_settings.find(
-        {"push_notifications": False},
-        {"user_id": 1}
-    ).to_list(10000)
-    disabled_user_ids = {u["user_id"] for u in users_with_disabled}
-    
-    # Get all active push tokens for users who haven't disabled notifications
-    all_tokens = await db.push_tokens.find(
-        {"is_active": True},
-        {"token": 1, "user_id": 1}
-    ).to_list(50000)
-    
-    # Filter out tokens for users who disabled notifications
-    active_tokens = [t for t in all_tokens if t["user_id"] not in disabled_user_ids]
-    
-    if not active_tokens:
+    recipient_count = await count_broadcast_recipients()
+    if not recipient_count:
         raise HTTPException(status_code=400, detail="No users with push notifications enabled")
     
-    # Send notifications in batches
-    tokens_list = [t["token"] for t in active_tokens]
-    recipient_count = len(set(t["user_id"] for t in active_tokens))  # Unique users
-    recipient_user_ids = list(set(t["user_id"] for t in active_tokens))
-    
-    # Store broadcast in each recipient's notifications collection FIRST so the
-    # unread count is correct when send_notification_to_user computes the badge.
-    broadcast_notifications = [
-        {
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "type": "broadcast",
-            "problem_id": "",  # No problem associated
-            "message": f"{request.title.strip()}: {request.body.strip()[:80]}...",
-            "is_read": False,
-            "created_at": datetime.utcnow()
-        }
-        for user_id in recipient_user_ids
-    ]
-    if broadcast_notifications:
-        await db.notifications.insert_many(broadcast_notifications)
-    
-    # Send push per-user so each gets the right iOS badge count
-    for user_id in recipient_user_ids:
-        try:
-            await send_notification_to_user(
-                user_id,
-                request.title.strip(),
-                request.body.strip(),
-                {"type": "broadcast"}
-            )
-        except Exception as e:
-            logger.error(f"Broadcast push failed for user {user_id}: {e}")
-    
-    # Log the broadcast
+    # Log the broadcast; the job records progress and delivery stats on it
     broadcast_log = {
         "id": str(uuid.uuid4()),
         "admin_id": admin["id"],
@@ -4333,9 +6785,18 @@ async def broadcast_notification(request: BroadcastNotificationRequest, admin: d
         "body": request.body.strip(),
         "sent_at": datetime.utcnow(),
         "recipient_count": recipient_count,
-        "tokens_count": len(tokens_list)
+        "tokens_count": 0,
+        "status": "running",
+        "cursor": None,
+        "attempts": 0,
+        "next_attempt_at": None,
+        "stats": {
+            "users_processed": 0, "recipients": 0, "notifications_created": 0,
+            "messages_sent": 0, "tickets_ok": 0, "tickets_error": 0,
+        },
     }
-    await db.broadcast_logs.insert_one(broadcast_log)
+    await db.broadcast_logs.insert_one(dict(broadcast_log))
+    asyncio.create_task(run_broadcast_job(broadcast_log["id"]))
     
     # Also log as admin action
     await log_admin_action(admin, "broadcast_notification", "broadcast", broadcast_log["id"], {
@@ -4345,8 +6806,10 @@ async def broadcast_notification(request: BroadcastNotificationRequest, admin: d
     
     return {
         "success": True,
-        "message": f"Notification sent to {recipient_count} users",
-        "recipient_count": recipient_count
+        "message": f"Notification sending to {recipient_count} users",
+        "recipient_count": recipient_count,
+        "broadcast_id": broadcast_log["id"],
+        "status": "running",
     }
 
 @api_router.get("/admin/broadcast-history")
@@ -4468,10 +6931,7 @@ async def test_push_notification(admin: dict = Depends(require_admin)):
     
     # Send test notification with badge for testing badge functionality
     try:
-        unread_count = await db.notifications.count_documents({
-            "user_id": admin["id"],
-            "is_read": False,
-        })
+        unread_count = await get_unread_count(admin["id"])
     except Exception:
         unread_count = 1
     # Always pass at least 1 so admin can verify the iOS badge UI
@@ -4543,7 +7003,7 @@ async def hide_comment(comment_id: str, admin: dict = Depends(require_admin)):
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    await db.comments.update_one({"id": comment_id}, {"$set": {"status": "hidden"}})
+    await set_comment_fields(comment_id, {"status": "hidden"})
     
     await log_admin_action(admin, "hide_comment", "comment", comment_id)
     return {"success": True, "status": "hidden"}
@@ -4555,7 +7015,7 @@ async def unhide_comment(comment_id: str, admin: dict = Depends(require_admin)):
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    await db.comments.update_one({"id": comment_id}, {"$set": {"status": "active"}})
+    await set_comment_fields(comment_id, {"status": "active"})
     
     await log_admin_action(admin, "unhide_comment", "comment", comment_id)
     return {"success": True, "status": "active"}
@@ -4567,15 +7027,10 @@ async def delete_comment(comment_id: str, admin: dict = Depends(require_admin)):
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
     
-    # Update problem comment count
-    await db.problems.update_one(
-        {"id": comment["problem_id"]},
-        {"$inc": {"comments_count": -1}}
-    )
-    
     await db.helpfuls.delete_many({"comment_id": comment_id})
     await db.reports.delete_many({"target_type": "comment", "target_id": comment_id})
-    await db.comments.delete_one({"id": comment_id})
+    # Also updates the problem's comment counters
+    await delete_comment_doc(comment_id)
     
     await log_admin_action(admin, "delete_comment", "comment", comment_id)
     return {"success": True, "deleted": True}
@@ -4673,52 +7128,102 @@ async def unban_user(user_id: str, admin: dict = Depends(require_admin)):
     return {"success": True, "status": "active"}
 
 # --- Admin: Analytics ---
-
-@api_router.get("/admin/analytics")
-async def get_analytics(admin: dict = Depends(require_admin)):
-    """Get basic analytics with proper DAU/WAU and signal breakdown"""
+# The dashboard reads one snapshot document (job_state "admin_analytics"), rebuilt every
+# ANALYTICS_REFRESH_SECONDS by the lease holder from a handful of concurrent $group
+# pipelines and indexed reads. DAU/WAU are counted in the database from the posts,
+# relates and comments themselves (not the activity log, which only starts at its deploy).
+
+ANALYTICS_JOB = "admin_analytics"
+ANALYTICS_REFRESH_SECONDS = float(os.environ.get("ANALYTICS_REFRESH_SECONDS", "60"))
+def count_if(condition: dict) -> dict:
+    return {"$sum": {"$cond": [condition, 1, 0]}}
+
+def active_user_actions(created: dict) -> list:
+    """Pipeline on db.problems yielding {"user_id", "created_at"} for every post, relate
+    and comment created in `created`: the actions that make a user "active" (follows
+    don't have timestamps, so we skip them). Each leg reads a created_at index."""
+    def actions(extra: list) -> list:
+        return [{"$match": {"created_at": created}}, {"$project": {"_id": 0, "user_id": 1, "created_at": 1}}, *extra]
+    return actions([{"$unionWith": {"coll": coll, "pipeline": actions([])}} for coll in ("relates", "comments")])
+
+async def analytics_user_counts() -> dict:
+    rows = await db.users.aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "active": count_if({"$eq": ["$status", "active"]}),
+            "banned": count_if({"$in": ["$status", ["banned", "shadowbanned"]]}),
+        }},
+    ]).to_list(1)
+    return rows[0] if rows else {"total": 0, "active": 0, "banned": 0}
+
+async def analytics_active_users(today_start: datetime, week_start: datetime) -> dict:
+    """DAU/WAU: users with a post, relate or comment today / in the last 7 days."""
+    rows = await db.problems.aggregate([
+        *active_user_actions({"$gte": week_start}),
+        {"$group": {"_id": "$user_id", "last": {"$max": "$created_at"}}},
+        {"$group": {
+            "_id": None,
+            "wau": {"$sum": 1},
+            "dau": count_if({"$gte": ["$last", today_start]}),
+        }},
+    ], allowDiskUse=True).to_list(1)
+    return rows[0] if rows else {"dau": 0, "wau": 0}
+
+async def analytics_problem_counts(today_start: datetime, week_start: datetime) -> dict:
+    today, week = {"$gte": ["$created_at", today_start]}, {"$gte": ["$created_at", week_start]}
+    local = {"$eq": ["$is_local", True]}
+    rows = await db.problems.aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "today": count_if(today),
+            "week": count_if(week),
+            "local_total": count_if({"$and": [local, {"$eq": ["$status", "active"]}]}),
+            "local_today": count_if({"$and": [local, today]}),
+            "local_week": count_if({"$and": [local, week]}),
+        }},
+    ]).to_list(1)
+    return rows[0] if rows else {}
+
+async def analytics_top_problems() -> List[dict]:
+    """Top 10 active problems by signal score (walks the (status, signal_score) index)."""
+    return await db.problems.find({"status": "active"}, {"_id": 0}).sort("signal_score", -1).limit(10).to_list(10)
+
+async def analytics_comment_counts(today_start: datetime, week_start: datetime) -> dict:
+    rows = await db.comments.aggregate([
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "today": count_if({"$gte": ["$created_at", today_start]}),
+            "week": count_if({"$gte": ["$created_at", week_start]}),
+        }},
+    ]).to_list(1)
+    return rows[0] if rows else {}
+
+async def compute_analytics() -> dict:
+    """Build the admin analytics snapshot."""
     now = datetime.utcnow()
     today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
     week_start = today_start - timedelta(days=7)
     
-    # User counts
-    total_users = await db.users.count_documents({})
-    active_users = await db.users.count_documents({"status": "active"})
-    banned_users = await db.users.count_documents({"status": {"$in": ["banned", "shadowbanned"]}})
-    
-    # DAU - unique users who performed an ACTION today (post / relate / comment / follow)
-    # "Active" = at least one action, not just app open
-    dau_posted = await db.problems.distinct("user_id", {"created_at": {"$gte": today_start}})
-    dau_commented = await db.comments.distinct("user_id", {"created_at": {"$gte": today_start}})
-    dau_related = await db.relates.distinct("user_id", {"created_at": {"$gte": today_start}})
-    # Note: follows don't have timestamps, so we skip them for now
-    dau = len(set(dau_posted + dau_commented + dau_related))
-    
-    # WAU - unique users who performed an ACTION in last 7 days
-    wau_posted = await db.problems.distinct("user_id", {"created_at": {"$gte": week_start}})
-    wau_commented = await db.comments.distinct("user_id", {"created_at": {"$gte": week_start}})
-    wau_related = await db.relates.distinct("user_id", {"created_at": {"$gte": week_start}})
-    wau = len(set(wau_posted + wau_commented + wau_related))
-    
-    # Content counts
-    total_problems = await db.problems.count_documents({})
-    problems_today = await db.problems.count_documents({"created_at": {"$gte": today_start}})
-    problems_week = await db.problems.count_documents({"created_at": {"$gte": week_start}})
-    
-    total_comments = await db.comments.count_documents({})
-    comments_today = await db.comments.count_documents({"created_at": {"$gte": today_start}})
-    comments_week = await db.comments.count_documents({"created_at": {"$gte": week_start}})
-    
-    # Top problems by SignalScore WITH BREAKDOWN
-    top_problems_cursor = await db.problems.find(
-        {"status": "active"},
-        {"_id": 0}
-    ).sort("signal_score", -1).limit(10).to_list(10)
+    (users, active, counts, top, comments, pending_reports, total_communities, total_members,
+     pending_community_requests, pending_join_requests) = await asyncio.gather(
+        analytics_user_counts(),
+        analytics_active_users(today_start, week_start),
+        analytics_problem_counts(today_start, week_start),
+        analytics_top_problems(),
+        analytics_comment_counts(today_start, week_start),
+        db.reports.count_documents({"status": "pending"}),
+        db.communities.estimated_document_count(),
+        db.community_members.estimated_document_count(),
+        db.community_requests.estimated_document_count(),
+        db.community_join_requests.count_documents({"status": "pending"}),
+    )
     
-    # Build top problems with signal breakdown
+    # Top problems by SignalScore WITH BREAKDOWN (recalculated for transparency)
     top_problems = []
-    for p in top_problems_cursor:
-        # Recalculate with breakdown for transparency
+    for p in top:
         signal_data = calculate_signal_score(p, include_breakdown=True)
         top_problems.append({
             "id": p.get("id", ""),
@@ -4730,28 +7235,25 @@ async def get_analytics(admin: dict = Depends(require_admin)):
             "unique_commenters": p.get("unique_commenters", 0),
         })
     
-    # Pending reports
-    pending_reports = await db.reports.count_documents({"status": "pending"})
-    
     return {
         "users": {
-            "total": total_users,
-            "active": active_users,
-            "banned": banned_users,
-            "dau": dau,
-            "wau": wau,
+            "total": users["total"],
+            "active": users["active"],
+            "banned": users["banned"],
+            "dau": active["dau"],
+            "wau": active["wau"],
             "dau_definition": "Users who posted, related, or commented today",
             "wau_definition": "Users who posted, related, or commented in last 7 days"
         },
         "problems": {
-            "total": total_problems,
-            "today": problems_today,
-            "week": problems_week
+            "total": counts.get("total", 0),
+            "today": counts.get("today", 0),
+            "week": counts.get("week", 0)
         },
         "comments": {
-            "total": total_comments,
-            "today": comments_today,
-            "week": comments_week
+            "total": comments.get("total", 0),
+            "today": comments.get("today", 0),
+            "week": comments.get("week", 0)
         },
         "top_problems": top_problems,
         "signal_formula": {
@@ -4761,16 +7263,33 @@ async def get_analytics(admin: dict = Depends(require_admin)):
         },
         "pending_reports": pending_reports,
         "local": {
-            "total_communities": await db.communities.count_documents({}),
-            "total_members": await db.community_members.count_documents({}),
-            "local_frikts_total": await db.problems.count_documents({"is_local": True, "status": "active"}),
-            "local_frikts_today": await db.problems.count_documents({"is_local": True, "created_at": {"$gte": today_start}}),
-            "local_frikts_week": await db.problems.count_documents({"is_local": True, "created_at": {"$gte": week_start}}),
-            "pending_community_requests": await db.community_requests.count_documents({}),
-            "pending_join_requests": await db.community_join_requests.count_documents({"status": "pending"}),
-        }
+            "total_communities": total_communities,
+            "total_members": total_members,
+            "local_frikts_total": counts.get("local_total", 0),
+            "local_frikts_today": counts.get("local_today", 0),
+            "local_frikts_week": counts.get("local_week", 0),
+            "pending_community_requests": pending_community_requests,
+            "pending_join_requests": pending_join_requests,
+        },
+        "generated_at": now,
     }
 
+async def refresh_analytics_snapshot() -> dict:
+    snapshot = await compute_analytics()
+    await db.job_state.update_one({"_id": ANALYTICS_JOB}, {"$set": {"snapshot": snapshot}}, upsert=True)
+    return snapshot
+
+@api_router.get("/admin/analytics")
+async def get_analytics(admin: dict = Depends(require_admin)):
+    """Get basic analytics with proper DAU/WAU and signal breakdown (snapshot, refreshed every minute)"""
+    state = await db.job_state.find_one({"_id": ANALYTICS_JOB}, {"_id": 0, "snapshot": 1}) or {}
+    snapshot = state.get("snapshot")
+    stale_before = datetime.utcnow() - timedelta(seconds=ANALYTICS_REFRESH_SECONDS * 3)
+    if not snapshot or snapshot["generated_at"] < stale_before:
+        # First load, or the refresh job isn't running
+        snapshot = await refresh_analytics_snapshot()
+    return snapshot
+
 # --- Admin: Audit Log ---
 
 @api_router.get("/admin/audit-log")
@@ -4794,43 +7313,219 @@ async def get_audit_log(
     return {"logs": logs, "total": total}
 
 # --- Admin: Sync User Stats ---
+# The full sync runs as a background job tracked in db.admin_jobs: users are streamed
+# in chunks, and each chunk's counters come from a handful of $group aggregations
+# restricted to its users ($in), so memory stays bounded by the chunk and the lease
+# is renewed between chunks.
 
-@api_router.post("/admin/sync-all-user-stats")
-async def admin_sync_all_user_stats(admin: dict = Depends(require_admin)):
+SYNC_ALL_USER_STATS_JOB = "sync_all_user_stats"
+SYNC_ALL_USER_STATS_CHUNK_SIZE = 1000
+SYNC_ALL_USER_STATS_LEASE_SECONDS = 300
+
+async def update_admin_job(job_id: str, fields: dict):
+    await db.admin_jobs.update_one({"id": job_id}, {"$set": {**fields, "updated_at": datetime.utcnow()}})
+
+def empty_user_counters() -> dict:
+    return {
+        "total_posts": 0, "total_comments": 0, "total_relates_given": 0,
+        "total_relates_received": 0, "posts_per_category": {},
+        "relates_given_per_category": {}, "comments_per_category": {},
+    }
+
+async def compute_user_counters(user_ids: List[str]) -> Dict[str, dict]:
+    """Posts, comments and relates (given/received) for the given users, from source collections."""
+    counters: Dict[str, dict] = {}
+    by_user = {"user_id": {"$in": user_ids}}
+    
+    def user_counters(user_id: str) -> dict:
+        return counters.setdefault(user_id, empty_user_counters())
+    
+    async for row in db.problems.aggregate([
+        {"$match": {**by_user, "status": "active"}},
+        {"$group": {"_id": {"user_id": "$user_id", "category_id": "$category_id"}, "count": {"$sum": 1}}},
+    ], allowDiskUse=True):
+        c = user_counters(row["_id"]["user_id"])
+        c["total_posts"] += row["count"]
+        if row["_id"].get("category_id"):
+            c["posts_per_category"][row["_id"]["category_id"]] = row["count"]
+    
+    async for row in db.comments.aggregate([
+        {"$match": by_user}, {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        user_counters(row["_id"])["total_comments"] = row["count"]
+    
+    async for row in db.relates.aggregate([
+        {"$match": by_user}, {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        user_counters(row["_id"])["total_relates_given"] = row["count"]
+    
+    for collection, field in [(db.relates, "relates_given_per_category"), (db.comments, "comments_per_category")]:
+        async for row in collection.aggregate(group_by_problem_category(by_user), allowDiskUse=True):
+            if row["_id"].get("category_id"):
+                user_counters(row["_id"]["user_id"])[field][row["_id"]["category_id"]] = row["score"]
+    
+    # Relates received: per-problem counts joined to problem owners (any status)
+    owners = {p["id"]: p["user_id"] async for p in db.problems.find(by_user, {"_id": 0, "id": 1, "user_id": 1})}
+    async for row in db.relates.aggregate([
+        {"$match": {"problem_id": {"$in": list(owners)}}}, {"$group": {"_id": "$problem_id", "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        owner = owners.get(row["_id"])
+        if owner:
+            user_counters(owner)["total_relates_received"] += row["count"]
+    
+    return counters
+
+async def pending_activity_by_user(user_ids: List[str], existing: Dict[str, dict]) -> tuple[Dict[str, dict], Dict[str, ObjectId]]:
     """
-    Sync stats for ALL users from actual database counts.
-    This fixes badge progress desynchronization for existing users.
+    Bulk form of pending_activity_changes: $inc of each user's events not yet folded into
+    their stored stats (existing: user_id -> user_stats doc), plus each user's latest event id.
     """
-    # Get all users
-    users = await db.users.find({}, {"id": 1}).to_list(10000)
+    seqs = [existing.get(uid, {}).get("activity_seq") for uid in user_ids]
+    query = {"user_id": {"$in": user_ids}}
+    if seqs and all(seqs):
+        query["_id"] = {"$gt": min(seqs)}
+    pending: Dict[str, dict] = {}
+    last_ids: Dict[str, ObjectId] = {}
+    async for event in db.activity_events.find(query, {"user_id": 1, "type": 1, "amount": 1, "category_id": 1, "categories": 1}).sort("_id", 1):
+        seq = existing.get(event["user_id"], {}).get("activity_seq")
+        if seq and event["_id"] <= seq:
+            continue
+        fold_activity_event(event, pending.setdefault(event["user_id"], {}), {})
+        last_ids[event["user_id"]] = event["_id"]
+    return pending, last_ids
+
+async def sync_user_stats_chunk(users: List[dict]) -> tuple[int, int]:
+    """Write synced stats for a chunk of users and award badges. Returns (users_synced, badges_awarded)."""
+    user_ids = [u["id"] for u in users]
+    counters = await compute_user_counters(user_ids)
+    existing = {s["user_id"]: s async for s in db.user_stats.find({"user_id": {"$in": user_ids}}, {"_id": 0})}
+    # Activity events not folded yet still count towards the counters kept from user_stats
+    pending, last_ids = await pending_activity_by_user(user_ids, existing)
+    
+    ops = []
+    entries = []
+    for user in users:
+        user_id = user["id"]
+        current = existing.get(user_id, {})
+        pending_inc = pending.get(user_id, {})
+        c = counters.get(user_id) or empty_user_counters()
+        updated_stats = {
+            **c,
+            "total_frikts_opened": current.get("total_frikts_opened", 0) + pending_inc.get("total_frikts_opened", 0),
+            "current_visit_streak": current.get("current_visit_streak", 0),
+            "users_followed": current.get("users_followed", 0) + pending_inc.get("users_followed", 0),
+        }
+        if user_id in last_ids:
+            updated_stats["activity_seq"] = last_ids[user_id]
+        ops.append(UpdateOne({"user_id": user_id}, build_user_stats_update(user_id, set_fields=updated_stats), upsert=True))
+        
+        stats = {**UserStats(user_id=user_id).dict(), **current, **updated_stats}
+        entries.append((user, stats, "all"))
     
+    if ops:
+        await db.user_stats.bulk_write(ops, ordered=False)
+    awarded = await check_and_award_badges_bulk(entries)
+    return len(ops), sum(len(badges) for badges in awarded.values())
+
+async def run_sync_all_user_stats_job(job_id: str):
+    """Background job behind POST /admin/sync-all-user-stats."""
     synced_count = 0
     badges_awarded = 0
     
-    for user_doc in users:
-        user_id = user_doc["id"]
-        try:
-            # Sync stats from actual database
-            stats = await sync_user_stats_from_db(user_id)
-            
-            # Get user data for badge check
-            user = await db.users.find_one({"id": user_id})
-            if user:
-                # Check and award any badges they should have earned
-                new_badges = await check_and_award_badges(user_id, user, stats, "all")
-                badges_awarded += len(new_badges)
-            
-            synced_count += 1
-        except Exception as e:
-            logger.error(f"Error syncing stats for user {user_id}: {e}")
+    async def renew_lease():
+        # Lease expired and another sync started: leave the users to it
+        if not await acquire_lease(SYNC_ALL_USER_STATS_JOB, SYNC_ALL_USER_STATS_LEASE_SECONDS):
+            raise RuntimeError("lease lost to another stats sync")
     
-    logger.info(f"Admin sync completed: {synced_count} users synced, {badges_awarded} badges awarded")
-    
-    return {
-        "success": True,
-        "users_synced": synced_count,
-        "badges_awarded": badges_awarded
+    try:
+        # Fold what the aggregator has pending first so the kept counters are current
+        if await acquire_lease(ACTIVITY_AGGREGATOR_JOB, max(30, int(ACTIVITY_AGGREGATOR_INTERVAL_SECONDS * 3))):
+            await run_activity_aggregator()
+            await renew_lease()
+        
+        users_total = await db.users.count_documents({})
+        await update_admin_job(job_id, {"progress.users_total": users_total})
+        
+        chunk = []
+        cursor = db.users.find({}, {"_id": 0, "id": 1, "name": 1, "created_at": 1})
+        async for user in cursor:
+            chunk.append(user)
+            if len(chunk) < SYNC_ALL_USER_STATS_CHUNK_SIZE:
+                continue
+            synced, awarded = await sync_user_stats_chunk(chunk)
+            synced_count += synced
+            badges_awarded += awarded
+            chunk = []
+            await renew_lease()
+            await update_admin_job(job_id, {"progress.users_synced": synced_count, "progress.badges_awarded": badges_awarded})
+        if chunk:
+            synced, awarded = await sync_user_stats_chunk(chunk)
+            synced_count += synced
+            badges_awarded += awarded
+        
+        logger.info(f"Admin sync completed: {synced_count} users synced, {badges_awarded} badges awarded")
+        await update_admin_job(job_id, {
+            "status": "completed",
+            "progress.users_synced": synced_count,
+            "progress.badges_awarded": badges_awarded,
+            "result": {"success": True, "users_synced": synced_count, "badges_awarded": badges_awarded},
+            "finished_at": datetime.utcnow(),
+        })
+    except Exception as e:
+        logger.error(f"Error in sync-all-user-stats job {job_id}: {e}")
+        await update_admin_job(job_id, {
+            "status": "failed",
+            "error": str(e),
+            "progress.users_synced": synced_count,
+            "progress.badges_awarded": badges_awarded,
+            "finished_at": datetime.utcnow(),
+        })
+    finally:
+        await release_lease(SYNC_ALL_USER_STATS_JOB)
+
+@api_router.post("/admin/sync-all-user-stats")
+async def admin_sync_all_user_stats(admin: dict = Depends(require_admin)):
+    """
+    Sync stats for ALL users from actual database counts.
+    This fixes badge progress desynchronization for existing users.
+    Runs in the background; poll GET /admin/jobs/{job_id} for progress and the result.
+    """
+    if not await acquire_lease(SYNC_ALL_USER_STATS_JOB, SYNC_ALL_USER_STATS_LEASE_SECONDS):
+        running = await db.admin_jobs.find_one(
+            {"type": SYNC_ALL_USER_STATS_JOB, "status": "running"}, {"_id": 0}, sort=[("created_at", -1)]
+        )
+        if running:
+            return {"success": True, "job_id": running["id"], "status": running["status"], "progress": running["progress"]}
+        raise HTTPException(status_code=409, detail="A stats sync is already running")
+    
+    # Jobs left "running" by a worker that died without finishing
+    await db.admin_jobs.update_many(
+        {"type": SYNC_ALL_USER_STATS_JOB, "status": "running"},
+        {"$set": {"status": "failed", "error": "interrupted", "updated_at": datetime.utcnow()}}
+    )
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": SYNC_ALL_USER_STATS_JOB,
+        "status": "running",
+        "progress": {"users_total": None, "users_synced": 0, "badges_awarded": 0},
+        "result": None,
+        "created_by": admin["id"],
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow(),
     }
+    await db.admin_jobs.insert_one(dict(job))
+    asyncio.create_task(run_sync_all_user_stats_job(job["id"]))
+    await log_admin_action(admin, "sync_all_user_stats", "job", job["id"])
+    
+    return {"success": True, "job_id": job["id"], "status": job["status"], "progress": job["progress"]}
+
+@api_router.get("/admin/jobs/{job_id}")
+async def admin_get_job(job_id: str, admin: dict = Depends(require_admin)):
+    """Status, progress and result of a background admin job."""
+    job = await db.admin_jobs.find_one({"id": job_id}, {"_id": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @api_router.post("/admin/sync-user-stats/{user_id}")
 async def admin_sync_user_stats(user_id: str, admin: dict = Depends(require_admin)):
@@ -4852,19 +7547,272 @@ async def admin_sync_user_stats(user_id: str, admin: dict = Depends(require_admi
         "new_badges": new_badges
     }
 
-# ===================== PUSH NOTIFICATIONS =====================
+# --- Admin: Activity Log ---
 
-EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+@api_router.get("/admin/activity-aggregator")
+async def admin_activity_aggregator_status(admin: dict = Depends(require_admin)):
+    """Aggregator checkpoint, throughput and backlog."""
+    state = await db.job_state.find_one({"_id": ACTIVITY_AGGREGATOR_JOB}) or {}
+    backlog_query = {"_id": {"$gt": state["checkpoint"]}} if state.get("checkpoint") else {}
+    backlog = await db.activity_events.count_documents(backlog_query)
+    lease = await db.job_leases.find_one({"_id": ACTIVITY_AGGREGATOR_JOB}, {"_id": 0})
 
-async def send_push_notification(tokens: List[str], title: str, body: str, data: dict = None, badge: int = None):
-    """Send push notification via Expo's push notification service.
+    return {
+        "checkpoint": str(state["checkpoint"]) if state.get("checkpoint") else None,
+        "checkpoint_time": state["checkpoint"].generation_time.isoformat() if state.get("checkpoint") else None,
+        "events_processed": state.get("events_processed", 0),
+        "last_batch_size": state.get("last_batch_size", 0),
+        "last_batch_seconds": state.get("last_batch_seconds"),
+        "last_batch_events_per_second": state.get("last_batch_events_per_second"),
+        "updated_at": state.get("updated_at"),
+        "backlog": backlog,
+        "lease": lease,
+    }
+
+@api_router.get("/admin/counter-reconciler")
+async def admin_counter_reconciler_status(admin: dict = Depends(require_admin)):
+    """Reconciler cursors, pass counts and counter divergence found per collection/field."""
+    state = await db.job_state.find_one({"_id": RECONCILER_JOB}, {"_id": 0}) or {}
+    lease = await db.job_leases.find_one({"_id": RECONCILER_JOB}, {"_id": 0})
+    return {
+        "interval_seconds": RECONCILER_INTERVAL_SECONDS,
+        "batch_size": RECONCILER_BATCH_SIZE,
+        "cursors": state.get("cursors", {}),
+        "passes": state.get("passes", {}),
+        "checked": state.get("checked", {}),
+        "repaired": state.get("repaired", {}),
+        "divergence": state.get("divergence", {}),
+        "recent_drift": state.get("recent_drift", []),
+        "updated_at": state.get("updated_at"),
+        "lease": lease,
+    }
+
+@api_router.post("/admin/rebuild-user-stats/{user_id}")
+async def admin_rebuild_user_stats(user_id: str, admin: dict = Depends(require_admin)):
+    """Recompute a user's stats from the activity log alone."""
+    user = await db.users.find_one({"id": user_id})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    stats = await rebuild_user_stats_from_activity(user_id)
+    await log_admin_action(admin, "rebuild_user_stats", "user", user_id)
+    return {"success": True, "stats": stats}
+
+# ===================== DAILY METRICS =====================
+# One metrics_daily document per (scope, date): scope "global", or "community:<id>" for
+# each community with activity that day. A lease-held job rolls up each day once it has
+# closed, reading only that day's slice of the raw collections (indexed date ranges),
+# and re-rolls today as a partial row. Every write is an upsert keyed by (scope, date),
+# so re-running a day is harmless. Time-series endpoints read a few hundred rows.
+
+METRICS_ROLLUP_JOB = "metrics_rollup"
+METRICS_ROLLUP_INTERVAL_SECONDS = float(os.environ.get("METRICS_ROLLUP_INTERVAL_SECONDS", "900"))
+METRICS_BACKFILL_DAYS = 90  # history built on the first run
+METRICS_SERIES_MAX_DAYS = 366
+METRICS_FIELDS = ["signups", "posts", "comments", "relates", "dau", "local_posts", "local_comments", "local_relates"]
+# For a community: signups are new members, dau is active members, and everything
+# counted is on its local Frikts
+METRICS_COMMUNITY_FIELDS = ["signups", "posts", "comments", "relates", "dau"]
+
+def metrics_date(day_start: datetime) -> str:
+    return day_start.strftime("%Y-%m-%d")
+
+async def count_per_community(collection, pipeline: list) -> Dict[Optional[str], int]:
+    """Run a pipeline ending in {"_id": community_id or None, "count"} rows."""
+    return {row["_id"]: row["count"] async for row in collection.aggregate(pipeline, allowDiskUse=True)}
+
+def by_problem_community(match: dict) -> list:
+    """Count a day's comments/relates by the community of the local Frikt they are on."""
+    return [
+        {"$match": match},
+        {"$lookup": {"from": "problems", "localField": "problem_id", "foreignField": "id", "as": "problem"}},
+        {"$unwind": {"path": "$problem", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": {"$cond": [{"$eq": ["$problem.is_local", True]}, "$problem.community_id", None]},
+            "count": {"$sum": 1},
+        }},
+    ]
+
+async def rollup_metrics_day(day_start: datetime, partial: bool = False) -> int:
+    """Write the global and per-community rows for one day. Returns rows written."""
+    day_end = day_start + timedelta(days=1)
+    in_day = {"$gte": day_start, "$lt": day_end}
+    
+    signups, members, posts, comments, relates, active = await asyncio.gather(
+        db.users.count_documents({"created_at": in_day}),
+        count_per_community(db.community_members, [
+            {"$match": {"joined_at": in_day}},
+            {"$group": {"_id": "$community_id", "count": {"$sum": 1}}},
+        ]),
+        count_per_community(db.problems, [
+            {"$match": {"created_at": in_day}},
+            {"$group": {"_id": {"$cond": [{"$eq": ["$is_local", True]}, "$community_id", None]}, "count": {"$sum": 1}}},
+        ]),
+        count_per_community(db.comments, by_problem_community({"created_at": in_day})),
+        count_per_community(db.relates, by_problem_community({"created_at": in_day})),
+        # Same definition as the analytics DAU: a post, relate or comment that day
+        count_per_community(db.problems, [
+            *active_user_actions(in_day),
+            {"$group": {"_id": "$user_id"}},
+            {"$lookup": {"from": "community_members", "localField": "_id", "foreignField": "user_id", "as": "member"}},
+            {"$unwind": {"path": "$member", "preserveNullAndEmptyArrays": True}},
+            {"$group": {"_id": "$member.community_id", "count": {"$sum": 1}}},
+        ]),
+    )
     
-    If `badge` is provided, iOS will set the app icon badge to that number.
-    """
-    if not tokens:
-        logger.warning("send_push_notification called with empty tokens list")
-        return
+    def local(counts: Dict[Optional[str], int]) -> int:
+        return sum(n for cid, n in counts.items() if cid is not None)
+    
+    now = datetime.utcnow()
+    date = metrics_date(day_start)
+    rows = {"global": {
+        "signups": signups,
+        "posts": sum(posts.values()),
+        "comments": sum(comments.values()),
+        "relates": sum(relates.values()),
+        "dau": sum(active.values()),
+        "local_posts": local(posts),
+        "local_comments": local(comments),
+        "local_relates": local(relates),
+    }}
+    community_ids = {cid for counts in (members, posts, comments, relates, active) for cid in counts if cid is not None}
+    for cid in community_ids:
+        rows[f"community:{cid}"] = {
+            "signups": members.get(cid, 0),
+            "posts": posts.get(cid, 0),
+            "comments": comments.get(cid, 0),
+            "relates": relates.get(cid, 0),
+            "dau": active.get(cid, 0),
+        }
+    await db.metrics_daily.bulk_write([
+        UpdateOne(
+            {"scope": scope, "date": date},
+            {"$set": {**metrics, "day_start": day_start, "partial": partial, "updated_at": now}},
+            upsert=True
+        )
+        for scope, metrics in rows.items()
+    ], ordered=False)
+    return len(rows)
+
+async def run_metrics_rollup(now: Optional[datetime] = None):
+    """Roll up every closed day since the last run, then today so far."""
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    state = await db.job_state.find_one({"_id": METRICS_ROLLUP_JOB}) or {}
+    if state.get("rolled_through"):
+        day = datetime.strptime(state["rolled_through"], "%Y-%m-%d") + timedelta(days=1)
+    else:
+        day = today - timedelta(days=METRICS_BACKFILL_DAYS)
     
+    while day < today:
+        await rollup_metrics_day(day)
+        await db.job_state.update_one(
+            {"_id": METRICS_ROLLUP_JOB}, {"$set": {"rolled_through": metrics_date(day)}}, upsert=True
+        )
+        day += timedelta(days=1)
+    await rollup_metrics_day(today, partial=True)
+    await db.job_state.update_one({"_id": METRICS_ROLLUP_JOB}, {"$set": {"last_run_at": datetime.utcnow()}}, upsert=True)
+
+@api_router.get("/admin/metrics/daily")
+async def get_daily_metrics(days: int = 90, community_id: Optional[str] = None, admin: dict = Depends(require_admin)):
+    """Daily series for the last `days` days (oldest first, missing days as zeros),
+    globally or for one community."""
+    days = max(1, min(days, METRICS_SERIES_MAX_DAYS))
+    scope = f"community:{community_id}" if community_id else "global"
+    fields = METRICS_COMMUNITY_FIELDS if community_id else METRICS_FIELDS
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = [metrics_date(today - timedelta(days=i)) for i in range(days - 1, -1, -1)]
+    rows = {
+        r["date"]: r async for r in db.metrics_daily.find(
+            {"scope": scope, "date": {"$gte": dates[0]}}, {"_id": 0, "scope": 0, "day_start": 0, "updated_at": 0}
+        )
+    }
+    series = [
+        {"date": d, **{f: rows.get(d, {}).get(f, 0) for f in fields}, "partial": rows.get(d, {}).get("partial", False)}
+        for d in dates
+    ]
+    return {"scope": scope, "days": days, "metrics": fields, "series": series}
+
+@api_router.get("/admin/metrics/communities")
+async def get_community_metrics(days: int = 30, metric: str = "posts", limit: int = 20, admin: dict = Depends(require_admin)):
+    """Communities ranked by one metric summed over the last `days` days."""
+    if metric not in METRICS_COMMUNITY_FIELDS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRICS_COMMUNITY_FIELDS)}")
+    days = max(1, min(days, METRICS_SERIES_MAX_DAYS))
+    limit = max(1, min(limit, 100))
+    since = metrics_date(datetime.utcnow() - timedelta(days=days - 1))
+    ranked = await db.metrics_daily.aggregate([
+        {"$match": {"scope": {"$regex": "^community:"}, "date": {"$gte": since}}},
+        {"$group": {"_id": "$scope", "total": {"$sum": f"${metric}"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": limit},
+    ]).to_list(limit)
+    ids = [r["_id"].split(":", 1)[1] for r in ranked]
+    names = {c["id"]: c["name"] async for c in db.communities.find({"id": {"$in": ids}}, {"_id": 0, "id": 1, "name": 1})}
+    return {
+        "metric": metric,
+        "days": days,
+        "communities": [{"community_id": cid, "name": names.get(cid), "total": r["total"]} for cid, r in zip(ids, ranked)],
+    }
+
+# ===================== PUSH NOTIFICATIONS =====================
+# One long-lived Expo client per process (pooled keep-alive connections, HTTP/2 when
+# the h2 package is installed). Messages are sent in Expo's 100-per-request chunks,
+# gzip-compressed, with a bounded number of requests in flight.
+#
+# Every ticket is stored in push_tickets. Tickets Expo accepted are "pending" until the
+# receipts poller (lease holder only) fetches their receipts, 1000 ids per request,
+# once Expo's recommended delay has passed. DeviceNotRegistered deactivates the token,
+# InvalidCredentials raises an alert; the stored outcomes give delivery rates per platform.
+
+EXPO_PUSH_URL = os.environ.get("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+EXPO_RECEIPTS_URL = os.environ.get("EXPO_RECEIPTS_URL", "https://exp.host/--/api/v2/push/getReceipts")
+EXPO_RECEIPT_BATCH_SIZE = 1000  # Expo's per-request limit
+PUSH_RECEIPTS_JOB = "push_receipts"
+PUSH_RECEIPT_POLL_SECONDS = float(os.environ.get("PUSH_RECEIPT_POLL_SECONDS", "300"))
+# Expo recommends waiting ~15 minutes; receipts not ready yet are retried later and
+# given up on once Expo has dropped them (kept for about a day)
+PUSH_RECEIPT_DELAY_SECONDS = float(os.environ.get("PUSH_RECEIPT_DELAY_SECONDS", "900"))
+PUSH_RECEIPT_RETRY_SECONDS = 600
+PUSH_RECEIPT_MAX_AGE = timedelta(hours=24)
+# Ticket documents expire (TTL index on expires_at) after this
+PUSH_TICKET_RETENTION = timedelta(days=7)
+EXPO_PUSH_CHUNK_SIZE = 100  # Expo's per-request limit
+EXPO_PUSH_MAX_IN_FLIGHT = int(os.environ.get("EXPO_PUSH_MAX_IN_FLIGHT", "6"))
+EXPO_PUSH_TIMEOUT_SECONDS = 30.0
+# Ticket errors that mean the token will never work again
+EXPO_DEACTIVATING_ERRORS = {"DeviceNotRegistered"}
+# About the project's FCM/APNs credentials, not the device: alert instead of
+# deactivating, or one misconfiguration would switch off every token
+EXPO_CREDENTIAL_ERRORS = {"InvalidCredentials"}
+
+_push_client: Optional[httpx.AsyncClient] = None
+_push_semaphore: Optional[asyncio.Semaphore] = None
+
+def get_push_client() -> httpx.AsyncClient:
+    global _push_client, _push_semaphore
+    if _push_client is None or _push_client.is_closed:
+        _push_client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=EXPO_PUSH_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=EXPO_PUSH_MAX_IN_FLIGHT, max_keepalive_connections=EXPO_PUSH_MAX_IN_FLIGHT),
+            headers={
+                "Accept": "application/json",
+                "Accept-Encoding": "gzip, deflate",
+                "Content-Type": "application/json",
+            },
+        )
+        _push_semaphore = asyncio.Semaphore(EXPO_PUSH_MAX_IN_FLIGHT)
+    return _push_client
+
+async def close_push_client():
+    global _push_client
+    if _push_client is not None:
+        await _push_client.aclose()
+        _push_client = None
+
+def build_push_messages(tokens: List[str], title: str, body: str, data: dict = None, badge: int = None) -> List[dict]:
+    """Expo messages for the valid tokens (simulator/web/malformed tokens are skipped)."""
     messages = []
     skipped_tokens = []
     for token in tokens:
@@ -4896,155 +7844,242 @@ async def send_push_notification(tokens: List[str], title: str, body: str, data:
     
     if skipped_tokens:
         logger.warning(f"Skipped {len(skipped_tokens)} invalid tokens: {skipped_tokens[:5]}")
-    
-    if not messages:
-        logger.warning("No valid messages to send after filtering tokens")
-        return
-    
-    logger.info(f"Sending {len(messages)} push notifications with title: {title}")
-    
-    try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
+    return messages
+
+async def post_push_chunk(messages: List[dict]) -> List[dict]:
+    """POST one chunk to Expo. Returns one ticket per message (error tickets if the request failed)."""
+    client = get_push_client()
+    async with _push_semaphore:
+        try:
             response = await client.post(
                 EXPO_PUSH_URL,
-                json=messages,
-                headers={
-                    "Accept": "application/json",
-                    "Accept-Encoding": "gzip, deflate",
-                    "Content-Type": "application/json",
-                }
+                content=gzip.compress(json.dumps(messages).encode()),
+                headers={"Content-Encoding": "gzip"},
             )
             result = response.json()
-            logger.info(f"Expo Push API response status: {response.status_code}")
-            logger.info(f"Expo Push API result: {result}")
-            
-            # Handle failed tokens (remove them from database)
-            if "data" in result:
-                success_count = 0
-                error_count = 0
-                for i, ticket in enumerate(result["data"]):
-                    if ticket.get("status") == "ok":
-                        success_count += 1
-                    elif ticket.get("status") == "error":
-                        error_count += 1
-                        error_type = ticket.get("details", {}).get("error")
-                        error_message = ticket.get("message", "")
-                        logger.error(f"Push ticket error: {error_type} - {error_message} for token: {messages[i]['to'][:30]}...")
-                        
-                        if error_type in ["DeviceNotRegistered", "InvalidCredentials"]:
-                            # Mark invalid token as inactive (keep historical record)
-                            await db.push_tokens.update_one(
-                                {"token": messages[i]["to"]},
-                                {"$set": {
-                                    "is_active": False,
-                                    "deactivated_at": datetime.utcnow(),
-                                    "deactivation_reason": error_type,
-                                }}
-                            )
-                            logger.info(f"Deactivated invalid push token ({error_type}): {messages[i]['to'][:30]}...")
-                
-                logger.info(f"Push notification results: {success_count} success, {error_count} errors")
-            else:
-                logger.warning(f"Unexpected Expo response format: {result}")
-                
-    except httpx.TimeoutException:
-        logger.error("Timeout sending push notification to Expo API")
+            logger.debug(f"Expo Push API response {response.status_code}: {result}")
+        except httpx.TimeoutException:
+            logger.error(f"Timeout sending {len(messages)} push notifications to Expo API")
+            return [{"status": "error", "details": {"error": "RequestTimeout"}}] * len(messages)
+        except Exception as e:
+            logger.error(f"Failed to send push notification chunk: {e}")
+            return [{"status": "error", "details": {"error": "RequestFailed"}}] * len(messages)
+    
+    tickets = result.get("data") if isinstance(result, dict) else None
+    if not isinstance(tickets, list) or len(tickets) != len(messages):
+        logger.warning(f"Unexpected Expo response format ({response.status_code}): {str(result)[:500]}")
+        return [{"status": "error", "details": {"error": "BadResponse"}}] * len(messages)
+    return tickets
+
+async def deactivate_push_tokens(reasons: Dict[str, str]):
+    """Mark tokens inactive in one bulk write (token -> Expo error; keeps historical record)."""
+    if not reasons:
+        return
+    now = datetime.utcnow()
+    await db.push_tokens.bulk_write([
+        UpdateOne({"token": token}, {"$set": {
+            "is_active": False,
+            "deactivated_at": now,
+            "deactivation_reason": reason,
+        }})
+        for token, reason in reasons.items()
+    ], ordered=False)
+    logger.info(f"Deactivated {len(reasons)} invalid push tokens")
+
+def alert_push_credential_errors(errors: Dict[str, int], stage: str):
+    """Log and report (Sentry) credential errors from a batch of tickets or receipts."""
+    count = sum(n for error_type, n in errors.items() if error_type in EXPO_CREDENTIAL_ERRORS)
+    if not count:
+        return
+    logger.error(f"{count} push {stage}s failed with InvalidCredentials - check the FCM/APNs credentials configured in Expo")
+    sentry_sdk.capture_message(f"Expo push {stage}s failing with InvalidCredentials", level="error")
+
+async def send_push_messages(messages: List[dict]) -> List[dict]:
+    """Send prepared Expo messages in concurrent 100-message chunks. Returns tickets in message order."""
+    if not messages:
+        return []
+    get_push_client()
+    chunks = [messages[i:i + EXPO_PUSH_CHUNK_SIZE] for i in range(0, len(messages), EXPO_PUSH_CHUNK_SIZE)]
+    tickets = [t for chunk_tickets in await asyncio.gather(*(post_push_chunk(c) for c in chunks)) for t in chunk_tickets]
+    
+    errors: Dict[str, int] = {}
+    deactivate = {}
+    for message, ticket in zip(messages, tickets):
+        if ticket.get("status") == "ok":
+            continue
+        error_type = (ticket.get("details") or {}).get("error") or "Unknown"
+        errors[error_type] = errors.get(error_type, 0) + 1
+        logger.debug(f"Push ticket error: {error_type} - {ticket.get('message', '')} for token: {message['to'][:30]}...")
+        if error_type in EXPO_DEACTIVATING_ERRORS:
+            deactivate[message["to"]] = error_type
+    
+    if errors:
+        logger.warning(f"Push notification results: {len(messages) - sum(errors.values())} success, errors: {errors}")
+        alert_push_credential_errors(errors, "ticket")
+    try:
+        await deactivate_push_tokens(deactivate)
     except Exception as e:
-        logger.error(f"Failed to send push notification: {e}")
+        logger.error(f"Failed to deactivate push tokens: {e}")
+    try:
+        await record_push_tickets(messages, tickets)
+    except Exception as e:
+        logger.error(f"Failed to record push tickets: {e}")
+    return tickets
+
+async def record_push_tickets(messages: List[dict], tickets: List[dict]):
+    """Store one push_tickets document per message: pending a receipt, or the ticket error."""
+    platforms = {
+        t["token"]: t.get("platform")
+        async for t in db.push_tokens.find({"token": {"$in": list({m["to"] for m in messages})}}, {"_id": 0, "token": 1, "platform": 1})
+    }
+    now = datetime.utcnow()
+    docs = []
+    for message, ticket in zip(messages, tickets):
+        doc = {
+            "token": message["to"],
+            "platform": platforms.get(message["to"]) or "unknown",
+            "created_at": now,
+            "expires_at": now + PUSH_TICKET_RETENTION,
+        }
+        if ticket.get("status") == "ok" and ticket.get("id"):
+            doc.update(ticket_id=ticket["id"], status="pending", check_after=now + timedelta(seconds=PUSH_RECEIPT_DELAY_SECONDS))
+        else:
+            doc.update(status="error", stage="ticket", error=(ticket.get("details") or {}).get("error") or "Unknown")
+        docs.append(doc)
+    await db.push_tickets.insert_many(docs, ordered=False)
+
+async def fetch_push_receipts(ticket_ids: List[str]) -> Dict[str, dict]:
+    """Receipts Expo has for the given ticket ids (ids without one yet are absent)."""
+    client = get_push_client()
+    async with _push_semaphore:
+        response = await client.post(EXPO_RECEIPTS_URL, json={"ids": ticket_ids})
+    result = response.json()
+    receipts = result.get("data") if isinstance(result, dict) else None
+    if not isinstance(receipts, dict):
+        raise ValueError(f"Unexpected Expo receipts response ({response.status_code}): {str(result)[:500]}")
+    return receipts
+
+async def poll_push_receipts() -> int:
+    """Resolve pending tickets past the receipt delay. Returns how many were resolved."""
+    resolved = 0
+    while True:
+        now = datetime.utcnow()
+        tickets = await db.push_tickets.find(
+            {"status": "pending", "check_after": {"$lte": now}},
+            {"_id": 1, "ticket_id": 1, "token": 1, "created_at": 1}
+        ).sort("check_after", 1).limit(EXPO_RECEIPT_BATCH_SIZE).to_list(EXPO_RECEIPT_BATCH_SIZE)
+        if not tickets:
+            break
+        try:
+            receipts = await fetch_push_receipts([t["ticket_id"] for t in tickets])
+        except Exception as e:
+            logger.error(f"Failed to fetch push receipts: {e}")
+            break
+        
+        ops = []
+        deactivate = {}
+        errors: Dict[str, int] = {}
+        for ticket in tickets:
+            receipt = receipts.get(ticket["ticket_id"])
+            if receipt is None:
+                if now - ticket["created_at"] > PUSH_RECEIPT_MAX_AGE:
+                    update = {"status": "expired", "checked_at": now}
+                else:
+                    update = {"check_after": now + timedelta(seconds=PUSH_RECEIPT_RETRY_SECONDS)}
+            elif receipt.get("status") == "ok":
+                update = {"status": "ok", "checked_at": now}
+            else:
+                error_type = (receipt.get("details") or {}).get("error") or "Unknown"
+                update = {"status": "error", "stage": "receipt", "error": error_type, "checked_at": now}
+                errors[error_type] = errors.get(error_type, 0) + 1
+                if error_type in EXPO_DEACTIVATING_ERRORS:
+                    deactivate[ticket["token"]] = error_type
+            if "status" in update:
+                resolved += 1
+            ops.append(UpdateOne({"_id": ticket["_id"]}, {"$set": update}))
+        await db.push_tickets.bulk_write(ops, ordered=False)
+        await deactivate_push_tokens(deactivate)
+        alert_push_credential_errors(errors, "receipt")
+        if len(tickets) < EXPO_RECEIPT_BATCH_SIZE:
+            break
+    if resolved:
+        logger.info(f"Resolved {resolved} push receipts")
+    return resolved
+
+async def push_delivery_stats(since: datetime) -> Dict[str, dict]:
+    """Ticket outcomes per platform for pushes sent since the given time."""
+    platforms = {}
+    async for row in db.push_tickets.aggregate([
+        {"$match": {"created_at": {"$gte": since}}},
+        {"$group": {"_id": {"platform": "$platform", "status": "$status", "error": "$error"}, "count": {"$sum": 1}}},
+    ]):
+        key = row["_id"]
+        stats = platforms.setdefault(key.get("platform") or "unknown", {
+            "sent": 0, "ok": 0, "error": 0, "pending": 0, "expired": 0, "errors": {},
+        })
+        stats["sent"] += row["count"]
+        stats[key["status"]] += row["count"]
+        if key.get("error"):
+            stats["errors"][key["error"]] = stats["errors"].get(key["error"], 0) + row["count"]
+    for stats in platforms.values():
+        # Share of pushes with a known outcome that reached Apple/Google
+        known = stats["ok"] + stats["error"]
+        stats["success_rate"] = round(stats["ok"] / known, 4) if known else None
+    return platforms
+
+@api_router.get("/admin/push-delivery-stats")
+async def get_push_delivery_stats(hours: int = 24, admin: dict = Depends(require_admin)):
+    """Push delivery success rates per platform over the last `hours`."""
+    since = datetime.utcnow() - timedelta(hours=max(1, min(hours, PUSH_TICKET_RETENTION.days * 24)))
+    return {"since": since, "platforms": await push_delivery_stats(since)}
 
-async def send_notification_to_user(user_id: str, title: str, body: str, data: dict = None):
-    """Send push notification to a specific user.
+async def send_push_notification(tokens: List[str], title: str, body: str, data: dict = None, badge: int = None):
+    """Send push notification via Expo's push notification service.
     
-    Computes the user's unread notification count and sends it as the iOS
-    badge value so the app icon shows a red bubble with the number.
+    If `badge` is provided, iOS will set the app icon badge to that number.
     """
-    # Get user's notification settings
-    settings = await db.notification_settings.find_one({"user_id": user_id})
-    
-    # Get user's push tokens
-    tokens_cursor = db.push_tokens.find({"user_id": user_id, "is_active": True})
-    tokens = [t["token"] async for t in tokens_cursor]
-    
     if not tokens:
+        logger.warning("send_push_notification called with empty tokens list")
         return
-
-    # Compute unread notification count for the badge
-    try:
-        unread_count = await db.notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False,
-        })
-        # Ensure at least 1 if there's no record yet but we're sending a push
-        if unread_count == 0:
-            unread_count = 1
-    except Exception:
-        unread_count = 1
     
-    await send_push_notification(tokens, title, body, data, badge=unread_count)
-
-async def notify_local_members_of_new_frikt(community_id: str, problem_id: str, problem_title: str, author_id: str, author_name: str):
-    """Push notification to all members of a local community when a new frikt
-    is posted there. Skips the author. Respects users' per-user
-    notification_settings.local_new_frikts (default True)."""
-    try:
-        # Get all members of this community except the author
-        members_cursor = db.community_members.find(
-            {"community_id": community_id, "user_id": {"$ne": author_id}},
-            {"_id": 0, "user_id": 1}
-        )
-        member_ids = [m["user_id"] async for m in members_cursor]
-        if not member_ids:
-            return
-
-        # Filter to those who have local_new_frikts enabled (or no settings → default True)
-        settings_cursor = db.notification_settings.find(
-            {"user_id": {"$in": member_ids}},
-            {"_id": 0, "user_id": 1, "push_notifications": 1, "local_new_frikts": 1}
-        )
-        opted_out = set()
-        async for s in settings_cursor:
-            if s.get("push_notifications") is False:
-                opted_out.add(s["user_id"])
-            elif s.get("local_new_frikts") is False:
-                opted_out.add(s["user_id"])
-
-        target_ids = [uid for uid in member_ids if uid not in opted_out]
-        if not target_ids:
-            return
-
-        truncated_title = problem_title if len(problem_title) <= 80 else problem_title[:77] + "..."
-
-        # Insert in-app notifications so the bell shows them and badge increments
-        in_app_notifs = [
-            {
-                "id": str(uuid.uuid4()),
-                "user_id": uid,
-                "type": "local_new_frikt",
-                "problem_id": problem_id,
-                "message": f"{author_name} posted a new local Frikt: {truncated_title}",
-                "is_read": False,
-                "created_at": datetime.utcnow(),
-            }
-            for uid in target_ids
-        ]
-        try:
-            await db.notifications.insert_many(in_app_notifs)
-        except Exception as e:
-            logger.error(f"Failed inserting local-frikt in-app notifications: {e}")
+    messages = build_push_messages(tokens, title, body, data, badge)
+    if not messages:
+        logger.warning("No valid messages to send after filtering tokens")
+        return
+    
+    logger.debug(f"Sending {len(messages)} push notifications with title: {title}")
+    await send_push_messages(messages)
 
-        # Send push per user so each gets the right iOS badge count
-        for uid in target_ids:
-            try:
-                await send_notification_to_user(
-                    uid,
-                    "New local Frikt",
-                    f"{author_name}: {truncated_title}",
-                    {"type": "local_new_frikt", "problemId": problem_id}
-                )
-            except Exception as e:
-                logger.error(f"Local new frikt push failed for user {uid}: {e}")
-    except Exception as e:
-        logger.error(f"notify_local_members_of_new_frikt failed: {e}")
+async def send_notification_to_user(user_id: str, title: str, body: str, data: dict = None):
+    """Queue a push notification to a specific user.
+    
+    Delivered by the push outbox workers, which send the user's unread notification
+    count as the iOS badge value so the app icon shows a red bubble with the number.
+    """
+    await enqueue_pushes([{"user_id": user_id, "title": title, "body": body, "data": data}])
+
+async def notify_local_members_of_new_frikt(community_id: str, problem_id: str, problem_title: str, author_id: str, author_name: str,
+                                            job_id: Optional[str] = None):
+    """Notify all members of a local community when a new frikt is posted there
+    (in-app + push, delivered by a fan-out job). Skips the author. Respects users'
+    per-user notification_settings.local_new_frikts (default True)."""
+    truncated_title = problem_title if len(problem_title) <= 80 else problem_title[:77] + "..."
+    await enqueue_fanout(
+        audience=[audience_source("community_members", {"community_id": community_id})],
+        exclude=[author_id],
+        toggle="local_new_frikts",
+        notification={
+            "type": "local_new_frikt",
+            "problem_id": problem_id,
+            "message": f"{author_name} posted a new local Frikt: {truncated_title}",
+        },
+        push={
+            "title": "New local Frikt",
+            "body": f"{author_name}: {truncated_title}",
+            "data": {"type": "local_new_frikt", "problemId": problem_id},
+        },
+        job_id=job_id,
+    )
 
 async def notify_admins_of_report(target_type: str, target_id: str, reporter_name: str, reason: str):
     """Send push + email alert to all admins about a new report. Throttled per target_type."""
@@ -5056,63 +8091,30 @@ async def notify_admins_of_report(target_type: str, target_id: str, reporter_nam
 
         if should_send_push:
             _last_admin_alert_time[target_type] = now_ts
-            # Find all admin users
-            admin_users = await db.users.find(
-                {"role": "admin"},
-                {"_id": 0, "id": 1}
-            ).to_list(100)
-            admin_ids = [a["id"] for a in admin_users]
-            if admin_ids:
-                # Insert in-app notification per admin so the iOS badge
-                # increments correctly and they see it in the bell list.
-                admin_notifications = [
-                    {
-                        "id": str(uuid.uuid4()),
-                        "user_id": admin_id,
-                        "type": "admin_report",
-                        "problem_id": target_id if target_type == "problem" else "",
-                        "message": f"{reporter_name} reported a {target_type} ({reason})",
-                        "is_read": False,
-                        "created_at": datetime.utcnow(),
-                    }
-                    for admin_id in admin_ids
-                ]
-                try:
-                    await db.notifications.insert_many(admin_notifications)
-                except Exception as e:
-                    logger.error(f"Failed inserting admin alert notifications: {e}")
-
-                # Send push per admin so each gets the right iOS badge count
-                for admin_id in admin_ids:
-                    try:
-                        await send_notification_to_user(
-                            admin_id,
-                            "New report received",
-                            f"{reporter_name} reported a {target_type} ({reason})",
-                            {"type": "admin_report", "target_type": target_type, "target_id": target_id}
-                        )
-                    except Exception as e:
-                        logger.error(f"Admin alert push failed for {admin_id}: {e}")
-
-        # Always send email (lightweight, async, no throttle)
-        if RESEND_API_KEY and RESEND_AVAILABLE and ADMIN_ALERT_EMAIL:
-            params = {
-                "from": SENDER_EMAIL,
-                "to": [ADMIN_ALERT_EMAIL],
-                "subject": f"[FRIKT] New {target_type} report",
-                "html": f"""
-                <h3>New report received</h3>
-                <p><strong>Reporter:</strong> {reporter_name}</p>
-                <p><strong>Target type:</strong> {target_type}</p>
-                <p><strong>Target ID:</strong> {target_id}</p>
-                <p><strong>Reason:</strong> {reason}</p>
-                <p>Review it in the FRIKT admin panel.</p>
-                """
-            }
-            try:
-                await asyncio.to_thread(resend.Emails.send, params)
-            except Exception as e:
-                logger.error(f"Failed to send admin alert email: {e}")
+            # In-app notification + push per admin, so the iOS badge increments
+            # correctly and they see it in the bell list
+            await enqueue_fanout(
+                audience=admin_audience(),
+                notification={
+                    "type": "admin_report",
+                    "problem_id": target_id if target_type == "problem" else "",
+                    "message": f"{reporter_name} reported a {target_type} ({reason})",
+                },
+                push={
+                    "title": "New report received",
+                    "body": f"{reporter_name} reported a {target_type} ({reason})",
+                    "data": {"type": "admin_report", "target_type": target_type, "target_id": target_id},
+                },
+            )
+
+        # Always email (no throttle); alerts within the digest window go out as one email
+        if ADMIN_ALERT_EMAIL:
+            await enqueue_admin_alert_email(ADMIN_ALERT_EMAIL, {
+                "reporter_name": reporter_name,
+                "target_type": target_type,
+                "target_id": target_id,
+                "reason": reason,
+            })
     except Exception as e:
         logger.error(f"notify_admins_of_report failed: {e}")
 
@@ -5174,16 +8176,7 @@ async def unregister_push_token(user: dict = Depends(require_auth)):
 @api_router.get("/push/settings")
 async def get_push_settings(user: dict = Depends(require_auth)):
     """Get user's notification settings (returns all toggles with defaults)"""
-    settings = await db.notification_settings.find_one({"user_id": user["id"]}) or {}
-    return {
-        "push_notifications": settings.get("push_notifications", True),
-        "new_comments": settings.get("new_comments", True),
-        "new_relates": settings.get("new_relates", True),
-        "comment_replies": settings.get("comment_replies", True),
-        "follows": settings.get("follows", True),
-        "trending": settings.get("trending", True),
-        "local_new_frikts": settings.get("local_new_frikts", True),
-    }
+    return dict(await get_notification_settings(user["id"]))
 
 @api_router.put("/push/settings")
 async def update_push_settings(
@@ -5201,6 +8194,7 @@ async def update_push_settings(
         {"$set": update_data},
         upsert=True
     )
+    invalidate_notification_settings(user["id"])
     
     return {"success": True, "updated": update_data}
 
@@ -5215,6 +8209,552 @@ async def test_push_notification(user: dict = Depends(require_auth)):
     )
     return {"success": True, "message": "Test notification sent"}
 
+# ===================== PUSH OUTBOX =====================
+# Pushes are queued in push_outbox and delivered by outbox workers, so request handlers
+# never wait on Expo and a restart doesn't lose them. Workers claim pages of due entries
+# with a short lease, look up tokens and badge counts for the whole page, and send them
+# through the pooled client. Entries whose every ticket failed with a transient error are
+# retried with exponential backoff; after PUSH_OUTBOX_MAX_ATTEMPTS they are dead-lettered
+# (status "dead") and can be requeued by an admin.
+
+PUSH_OUTBOX_WORKERS = int(os.environ.get("PUSH_OUTBOX_WORKERS", "2"))
+PUSH_OUTBOX_POLL_SECONDS = float(os.environ.get("PUSH_OUTBOX_POLL_SECONDS", "2"))
+PUSH_OUTBOX_PAGE_SIZE = 500
+PUSH_OUTBOX_CLAIM_SECONDS = 120
+PUSH_OUTBOX_MAX_ATTEMPTS = 8
+PUSH_OUTBOX_BACKOFF_BASE_SECONDS = 5
+PUSH_OUTBOX_BACKOFF_MAX_SECONDS = 3600
+# Delivered entries expire (TTL index on expires_at) after this; dead letters are kept
+PUSH_OUTBOX_RETENTION = timedelta(days=2)
+# Ticket errors worth retrying (the request failed, or Expo asked us to slow down)
+PUSH_RETRYABLE_ERRORS = {"RequestTimeout", "RequestFailed", "BadResponse", "MessageRateExceeded"}
+
+_push_outbox_wakeup = asyncio.Event()
+
+async def enqueue_pushes(pushes: List[dict]):
+    """Queue pushes ({"user_id", "title", "body", "data"}) for the outbox workers."""
+    if not pushes:
+        return
+    now = datetime.utcnow()
+    await db.push_outbox.insert_many([
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": push["user_id"],
+            "title": push["title"],
+            "body": push["body"],
+            "data": push.get("data") or {},
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "claimed_by": None,
+            "claimed_until": None,
+            "created_at": now,
+            "expires_at": None,
+        }
+        for push in pushes
+    ])
+    _push_outbox_wakeup.set()
+
+async def claim_push_outbox(now: datetime) -> List[dict]:
+    """Lease a page of due outbox entries to this worker."""
+    unclaimed = {
+        "status": "pending",
+        "next_attempt_at": {"$lte": now},
+        "$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}],
+    }
+    due = await db.push_outbox.find(unclaimed, {"_id": 0, "id": 1}).sort("next_attempt_at", 1).limit(PUSH_OUTBOX_PAGE_SIZE).to_list(PUSH_OUTBOX_PAGE_SIZE)
+    if not due:
+        return []
+    
+    claim = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    await db.push_outbox.update_many(
+        {**unclaimed, "id": {"$in": [e["id"] for e in due]}},
+        {"$set": {"claimed_by": claim, "claimed_until": now + timedelta(seconds=PUSH_OUTBOX_CLAIM_SECONDS)}}
+    )
+    return await db.push_outbox.find({"claimed_by": claim}, {"_id": 0}).to_list(PUSH_OUTBOX_PAGE_SIZE)
+
+async def deliver_push_outbox_entries(entries: List[dict]) -> int:
+    """Send a claimed page and record each entry's outcome. Returns entries delivered."""
+    user_ids = list({e["user_id"] for e in entries})
+    tokens: Dict[str, List[str]] = {}
+    async for t in db.push_tokens.find({"user_id": {"$in": user_ids}, "is_active": True}, {"_id": 0, "user_id": 1, "token": 1}):
+        tokens.setdefault(t["user_id"], []).append(t["token"])
+    unread = await get_unread_counts([uid for uid in user_ids if uid in tokens])
+    
+    messages, spans = [], []
+    for entry in entries:
+        # At least 1 so a push always shows a badge
+        entry_messages = build_push_messages(tokens.get(entry["user_id"], []), entry["title"], entry["body"],
+                                             entry["data"], badge=max(unread.get(entry["user_id"], 0), 1))
+        spans.append((len(messages), len(messages) + len(entry_messages)))
+        messages.extend(entry_messages)
+    tickets = await send_push_messages(messages)
+    
+    now = datetime.utcnow()
+    ops = []
+    delivered = 0
+    for entry, (start, end) in zip(entries, spans):
+        errors = [(t.get("details") or {}).get("error") for t in tickets[start:end] if t.get("status") != "ok"]
+        update = {"claimed_by": None, "claimed_until": None, "attempts": entry["attempts"] + 1}
+        if start == end:
+            update.update(status="skipped", expires_at=now + PUSH_OUTBOX_RETENTION)
+        elif len(errors) == end - start and all(e in PUSH_RETRYABLE_ERRORS for e in errors):
+            update["last_error"] = errors[0]
+            if update["attempts"] >= PUSH_OUTBOX_MAX_ATTEMPTS:
+                update["status"] = "dead"
+                logger.warning(f"Push outbox entry {entry['id']} dead-lettered after {update['attempts']} attempts: {errors[0]}")
+            else:
+                update["next_attempt_at"] = now + retry_backoff(update["attempts"], PUSH_OUTBOX_BACKOFF_BASE_SECONDS, PUSH_OUTBOX_BACKOFF_MAX_SECONDS)
+        else:
+            update.update(status="sent", sent_at=now, expires_at=now + PUSH_OUTBOX_RETENTION)
+            delivered += 1
+        ops.append(UpdateOne({"id": entry["id"], "claimed_by": entry["claimed_by"]}, {"$set": update}))
+    await db.push_outbox.bulk_write(ops, ordered=False)
+    return delivered
+
+async def process_push_outbox() -> int:
+    """Deliver due outbox entries a claimed page at a time until none are left. Returns entries delivered."""
+    delivered = 0
+    while True:
+        entries = await claim_push_outbox(datetime.utcnow())
+        if not entries:
+            return delivered
+        try:
+            delivered += await deliver_push_outbox_entries(entries)
+        except Exception as e:
+            # Claims expire and the page is retried
+            logger.error(f"Error delivering push outbox page: {e}")
+            return delivered
+
+async def push_outbox_worker():
+    """Drain the outbox whenever pushes are queued in this process, and poll for the rest."""
+    while True:
+        try:
+            await asyncio.wait_for(_push_outbox_wakeup.wait(), timeout=PUSH_OUTBOX_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _push_outbox_wakeup.clear()
+        try:
+            await process_push_outbox()
+        except Exception as e:
+            logger.error(f"Error in push outbox worker: {e}")
+
+async def push_outbox_metrics() -> dict:
+    """Outbox depth per status and age of the oldest undelivered entry."""
+    now = datetime.utcnow()
+    depth = {
+        row["_id"]: row["count"] async for row in db.push_outbox.aggregate([
+            {"$match": {"status": {"$in": ["pending", "dead"]}}},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+    oldest = await db.push_outbox.find_one({"status": "pending"}, {"_id": 0, "created_at": 1}, sort=[("created_at", 1)])
+    return {
+        "pending": depth.get("pending", 0),
+        "due": await db.push_outbox.count_documents({"status": "pending", "next_attempt_at": {"$lte": now}}),
+        "dead": depth.get("dead", 0),
+        "oldest_pending_age_seconds": (now - oldest["created_at"]).total_seconds() if oldest else 0,
+    }
+
+@api_router.get("/admin/push-outbox")
+async def get_push_outbox(admin: dict = Depends(require_admin)):
+    """Push outbox depth/age plus the most recent dead letters."""
+    dead = await db.push_outbox.find({"status": "dead"}, {"_id": 0}).sort("created_at", -1).limit(20).to_list(20)
+    return {**await push_outbox_metrics(), "recent_dead": dead}
+
+@api_router.post("/admin/push-outbox/requeue-dead")
+async def requeue_dead_pushes(admin: dict = Depends(require_admin)):
+    """Give dead-lettered pushes a fresh set of attempts."""
+    result = await db.push_outbox.update_many(
+        {"status": "dead"},
+        {"$set": {"status": "pending", "attempts": 0, "next_attempt_at": datetime.utcnow()}}
+    )
+    _push_outbox_wakeup.set()
+    return {"success": True, "requeued": result.modified_count}
+
+# ===================== FAN-OUT JOBS =====================
+# Notifications that go to an open-ended audience (a Frikt's followers and commenters, a
+# community, the admins) are recorded as a fanout_jobs document and delivered by fan-out
+# workers, so the request or event that caused them never loops over recipients. A job
+# streams its audience in user_id order from one or more sources, a page at a time:
+# settings are looked up in bulk, batched notification types go through
+# add_to_notification_batches, and the page's notifications are written with insert_many
+# while its pushes go to the push outbox (which packs them into Expo chunks). The job
+# checkpoints its cursor after each page; a page replayed after a crash skips recipients
+# who already have the job's notification.
+
+FANOUT_WORKERS = int(os.environ.get("FANOUT_WORKERS", "4"))
+FANOUT_POLL_SECONDS = float(os.environ.get("FANOUT_POLL_SECONDS", "5"))
+FANOUT_PAGE_SIZE = 1000
+FANOUT_CLAIM_SECONDS = 120
+FANOUT_MAX_ATTEMPTS = 5
+FANOUT_BACKOFF_BASE_SECONDS = 10
+FANOUT_BACKOFF_MAX_SECONDS = 600
+# Finished jobs expire (TTL index on expires_at) after this; failed ones are kept
+FANOUT_RETENTION = timedelta(days=2)
+
+_fanout_wakeup = asyncio.Event()
+
+def audience_source(collection: str, match: dict, field: str = "user_id", distinct: bool = False) -> dict:
+    """One source of a fan-out audience: the `field` values of documents in `collection`
+    matching `match`. Set `distinct` when several documents can share a value."""
+    return {"collection": collection, "match": match, "field": field, "distinct": distinct}
+
+def admin_audience() -> List[dict]:
+    return [audience_source("users", {"role": "admin"}, field="id")]
+
+async def enqueue_fanout(
+    audience: List[dict],
+    notification: dict,
+    push: Optional[dict] = None,
+    toggle: Optional[str] = None,
+    exclude: Optional[List[str]] = None,
+    batch: Optional[dict] = None,
+    job_id: Optional[str] = None,
+) -> str:
+    """Queue a fan-out job. Returns its id.
+
+    `notification` holds the in-app notification fields ({"type", "message", "problem_id"})
+    and `push` the push ({"title", "body", "data"}). With `toggle`, only recipients whose
+    notification settings allow it are notified. With `batch` ({"batch_type", "target_id",
+    "target_title", "actor_user_id", "actor_user_name"}), recipients whose batch window is
+    open are added to their batch instead. Queuing again with the same `job_id` is a no-op.
+    """
+    now = datetime.utcnow()
+    job = {
+        "id": job_id or str(uuid.uuid4()),
+        "audience": audience,
+        "notification": notification,
+        "push": push,
+        "toggle": toggle,
+        "exclude": [uid for uid in (exclude or []) if uid],
+        "batch": batch,
+        "status": "pending",
+        "cursor": {"source": 0, "after": None},
+        "stats": {"users_processed": 0, "notified": 0, "batched": 0},
+        "attempts": 0,
+        "next_attempt_at": now,
+        "claimed_by": None,
+        "claimed_until": None,
+        "created_at": now,
+        "expires_at": None,
+    }
+    try:
+        await db.fanout_jobs.insert_one(job)
+    except DuplicateKeyError:
+        return job["id"]  # already queued
+    _fanout_wakeup.set()
+    return job["id"]
+
+async def audience_page(source: dict, after: Optional[str], limit: int) -> List[str]:
+    """The next `limit` recipient ids of a source after `after`, in order."""
+    field = source["field"]
+    match = dict(source["match"])
+    if after is not None:
+        match = {"$and": [match, {field: {"$gt": after}}]}
+    collection = db[source["collection"]]
+    if source.get("distinct"):
+        rows = await collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": f"${field}"}},
+            {"$match": {"_id": {"$ne": None}}},
+            {"$sort": {"_id": 1}},
+            {"$limit": limit},
+        ]).to_list(limit)
+        return [r["_id"] for r in rows]
+    rows = await collection.find(match, {"_id": 0, field: 1}).sort(field, 1).limit(limit).to_list(limit)
+    return [r[field] for r in rows if r.get(field)]
+
+async def audience_members(source: dict, user_ids: List[str]) -> set:
+    """Which of `user_ids` a source contains."""
+    field = source["field"]
+    return set(await db[source["collection"]].distinct(field, {"$and": [source["match"], {field: {"$in": user_ids}}]}))
+
+async def deliver_fanout_page(job: dict, source_index: int, user_ids: List[str]) -> dict:
+    """Notify one page of a job's audience. Returns stat increments."""
+    recipients = set(user_ids) - set(job["exclude"])
+    # Recipients also in an earlier source were notified with that source
+    for source in job["audience"][:source_index]:
+        if recipients:
+            recipients -= await audience_members(source, list(recipients))
+    if recipients and job.get("toggle"):
+        settings = await get_notification_settings_bulk(list(recipients))
+        recipients = {uid for uid in recipients if wants_push(settings[uid], job["toggle"])}
+    if recipients:
+        recipients -= set(await db.notifications.distinct("user_id", {"fanout_id": job["id"], "user_id": {"$in": list(recipients)}}))
+    recipients = sorted(recipients)
+
+    batched = 0
+    if recipients and job.get("batch"):
+        immediate = await add_to_notification_batches(recipients, **job["batch"])
+        batched = len(recipients) - len(immediate)
+        recipients = [uid for uid in recipients if uid in immediate]
+
+    notifications = []
+    for uid in recipients:
+        notification = Notification(user_id=uid, **job["notification"]).dict()
+        notification["fanout_id"] = job["id"]
+        notifications.append(notification)
+    pushes = [{"user_id": uid, **job["push"]} for uid in recipients] if job.get("push") else []
+    await insert_notifications(notifications, pushes=pushes)
+    return {"stats.users_processed": len(user_ids), "stats.notified": len(notifications), "stats.batched": batched}
+
+async def claim_fanout_job(now: datetime) -> Optional[dict]:
+    """Lease the oldest due job to this worker."""
+    unclaimed = {
+        "status": {"$in": ["pending", "running"]},
+        "next_attempt_at": {"$lte": now},
+        "$or": [{"claimed_until": None}, {"claimed_until": {"$lt": now}}],
+    }
+    due = await db.fanout_jobs.find_one(unclaimed, {"_id": 0, "id": 1}, sort=[("next_attempt_at", 1)])
+    if not due:
+        return None
+    
+    claim = f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+    result = await db.fanout_jobs.update_one(
+        {**unclaimed, "id": due["id"]},
+        {"$set": {"status": "running", "claimed_by": claim, "claimed_until": now + timedelta(seconds=FANOUT_CLAIM_SECONDS)}}
+    )
+    if not result.modified_count:
+        return await claim_fanout_job(now)  # Another worker took it
+    return await db.fanout_jobs.find_one({"id": due["id"], "claimed_by": claim}, {"_id": 0})
+
+async def run_fanout_job(job: dict):
+    """Page through the job's audience from its cursor, checkpointing after each page."""
+    claim = {"id": job["id"], "claimed_by": job["claimed_by"]}
+    source_index, after = job["cursor"]["source"], job["cursor"]["after"]
+    try:
+        while source_index < len(job["audience"]):
+            user_ids = await audience_page(job["audience"][source_index], after, FANOUT_PAGE_SIZE)
+            if not user_ids:
+                source_index, after = source_index + 1, None
+                continue
+            stats = await deliver_fanout_page(job, source_index, user_ids)
+            after = user_ids[-1]
+            result = await db.fanout_jobs.update_one(claim, {
+                "$set": {"cursor": {"source": source_index, "after": after},
+                         "claimed_until": datetime.utcnow() + timedelta(seconds=FANOUT_CLAIM_SECONDS)},
+                "$inc": stats,
+            })
+            if not result.matched_count:
+                return  # Lease lost to another worker
+        now = datetime.utcnow()
+        await db.fanout_jobs.update_one(claim, {"$set": {
+            "status": "completed", "completed_at": now, "expires_at": now + FANOUT_RETENTION,
+            "claimed_by": None, "claimed_until": None,
+        }})
+    except Exception as e:
+        attempts = job["attempts"] + 1
+        update = {"attempts": attempts, "last_error": str(e), "claimed_by": None, "claimed_until": None}
+        if attempts >= FANOUT_MAX_ATTEMPTS:
+            update["status"] = "failed"
+            logger.error(f"Fan-out job {job['id']} failed after {attempts} attempts: {e}")
+        else:
+            update["next_attempt_at"] = datetime.utcnow() + retry_backoff(attempts, FANOUT_BACKOFF_BASE_SECONDS, FANOUT_BACKOFF_MAX_SECONDS)
+            logger.warning(f"Fan-out job {job['id']} interrupted, retrying from its cursor: {e}")
+        await db.fanout_jobs.update_one(claim, {"$set": update})
+
+async def process_fanout_jobs() -> int:
+    """Run due jobs one after another until none are left. Returns jobs run."""
+    ran = 0
+    while True:
+        job = await claim_fanout_job(datetime.utcnow())
+        if not job:
+            return ran
+        await run_fanout_job(job)
+        ran += 1
+
+async def fanout_worker():
+    """Run jobs whenever one is queued in this process, and poll for the rest."""
+    while True:
+        try:
+            await asyncio.wait_for(_fanout_wakeup.wait(), timeout=FANOUT_POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _fanout_wakeup.clear()
+        try:
+            await process_fanout_jobs()
+        except Exception as e:
+            logger.error(f"Error in fan-out worker: {e}")
+
+@api_router.get("/admin/fanout-jobs")
+async def get_fanout_jobs(admin: dict = Depends(require_admin)):
+    """Fan-out jobs per status plus the most recent failures."""
+    counts = {
+        row["_id"]: row["count"] async for row in db.fanout_jobs.aggregate([
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+        ])
+    }
+    failed = await db.fanout_jobs.find({"status": "failed"}, {"_id": 0}).sort("created_at", -1).limit(20).to_list(20)
+    return {"counts": counts, "recent_failed": failed}
+
+# ===================== WEEKLY DIGEST =====================
+# Once a week (WEEKLY_DIGEST_WEEKDAY at WEEKLY_DIGEST_HOUR_UTC) the lease holder builds
+# a digest run: the top WEEKLY_DIGEST_TOP_N Frikts of the past week per category and
+# per community are computed once and stored on the run. Users are then streamed in
+# id order a page at a time; each user's digest is assembled from their followed
+# categories and community, and goes out as one push (through the push outbox) and
+# one email (through the email outbox, which sends them in batches). The run checkpoints its cursor and throughput
+# after each page, so a restart resumes it (a page in flight may be sent twice).
+
+WEEKLY_DIGEST_JOB = "weekly_digest"
+WEEKLY_DIGEST_CHECK_SECONDS = float(os.environ.get("WEEKLY_DIGEST_CHECK_SECONDS", "900"))
+WEEKLY_DIGEST_WEEKDAY = int(os.environ.get("WEEKLY_DIGEST_WEEKDAY", "0"))  # Monday
+WEEKLY_DIGEST_HOUR_UTC = int(os.environ.get("WEEKLY_DIGEST_HOUR_UTC", "15"))
+WEEKLY_DIGEST_TOP_N = 5
+WEEKLY_DIGEST_PAGE_USERS = 1000
+WEEKLY_DIGEST_LEASE_SECONDS = 300
+
+def digest_week(now: datetime) -> tuple[str, datetime]:
+    """ISO week id and the time this week's digest is due."""
+    year, week, weekday = now.isocalendar()
+    week_start = datetime(now.year, now.month, now.day) - timedelta(days=weekday - 1)
+    return f"{year}-W{week:02d}", week_start + timedelta(days=WEEKLY_DIGEST_WEEKDAY, hours=WEEKLY_DIGEST_HOUR_UTC)
+
+async def top_problems_by(group_field: str, match: dict) -> Dict[str, List[dict]]:
+    """Top Frikts per value of group_field, ranked like the trending feed."""
+    rows = db.problems.aggregate([
+        {"$match": {**match, "is_hidden": {"$ne": True}, "status": "active", group_field: {"$ne": None}}},
+        {"$addFields": {"hot_score": {"$add": [
+            {"$multiply": [{"$ifNull": ["$relates_count", 0]}, 3]},
+            {"$multiply": [{"$ifNull": ["$comments_count", 0]}, 2]},
+            {"$ifNull": ["$unique_commenters", 0]},
+        ]}}},
+        {"$sort": {"hot_score": -1, "created_at": -1}},
+        {"$group": {"_id": f"${group_field}", "problems": {"$push": {
+            "id": "$id", "title": "$title", "user_id": "$user_id", "category_id": "$category_id",
+            "relates_count": "$relates_count", "comments_count": "$comments_count", "hot_score": "$hot_score",
+        }}}},
+        {"$project": {"problems": {"$slice": ["$problems", WEEKLY_DIGEST_TOP_N + 1]}}},
+    ], allowDiskUse=True)
+    # One extra per group, in case the user's own Frikt has to be dropped
+    return {row["_id"]: row["problems"] async for row in rows}
+
+async def start_digest_run(week: str, now: datetime) -> dict:
+    """This week's run, computing its top lists if it doesn't exist yet."""
+    run = await db.digest_runs.find_one({"id": week}, {"_id": 0})
+    if run:
+        return run
+    since = now - timedelta(days=7)
+    run = {
+        "id": week,
+        "status": "running",
+        "since": since,
+        "top_categories": await top_problems_by("category_id", {"created_at": {"$gte": since}, "is_local": {"$ne": True}}),
+        "top_communities": await top_problems_by("community_id", {"created_at": {"$gte": since}, "is_local": True}),
+        "cursor": None,
+        "stats": {"users_processed": 0, "digests": 0, "pushes": 0, "emails": 0},
+        "started_at": now,
+        "elapsed_seconds": 0.0,
+    }
+    try:
+        await db.digest_runs.insert_one(dict(run))
+    except DuplicateKeyError:
+        return await db.digest_runs.find_one({"id": week}, {"_id": 0})
+    return run
+
+def assemble_digest(run: dict, user: dict, community_id: Optional[str]) -> List[dict]:
+    """A user's top Frikts: their community's first, then their followed categories by score."""
+    picked, seen = [], set()
+    community = [dict(p, context="Your Local") for p in run["top_communities"].get(community_id, [])] if community_id else []
+    followed = sorted(
+        (dict(p, context=next((c["name"] for c in CATEGORIES if c["id"] == cat), cat))
+         for cat in user.get("followed_categories") or [] for p in run["top_categories"].get(cat, [])),
+        key=lambda p: p["hot_score"], reverse=True
+    )
+    for p in community + followed:
+        if p["id"] not in seen and p["user_id"] != user["id"]:
+            seen.add(p["id"])
+            picked.append(p)
+    return picked[:WEEKLY_DIGEST_TOP_N]
+
+def render_digest_email(user: dict, problems: List[dict]) -> str:
+    items = "".join(
+        render_email("weekly_digest_item", title=p["title"], context=p["context"],
+                     relates_count=p.get("relates_count") or 0, comments_count=p.get("comments_count") or 0)
+        for p in problems
+    )
+    name = html.escape(user.get("displayName") or user.get("name") or "there")
+    return email_template("weekly_digest").substitute(user_name=name, items=items)
+
+async def send_digest_page(run: dict, users: List[dict], send_email: bool) -> dict:
+    """Assemble and queue one page of digests. Returns stat increments."""
+    user_ids = [u["id"] for u in users]
+    communities = {
+        m["user_id"]: m["community_id"] async for m in db.community_members.find(
+            {"user_id": {"$in": user_ids}}, {"_id": 0, "user_id": 1, "community_id": 1}
+        )
+    }
+    settings = await get_notification_settings_bulk(user_ids)
+    pushes, emails, digests = [], [], 0
+    for user in users:
+        if user.get("status") in ("banned", "shadowbanned") or not settings[user["id"]]["weekly_digest"]:
+            continue
+        problems = assemble_digest(run, user, communities.get(user["id"]))
+        if not problems:
+            continue
+        digests += 1
+        if settings[user["id"]]["push_notifications"]:
+            more = f" and {len(problems) - 1} more" if len(problems) > 1 else ""
+            pushes.append({
+                "user_id": user["id"],
+                "title": "Your week on FRIKT",
+                "body": f"Top this week: {problems[0]['title'][:80]}{more}",
+                "data": {"type": "weekly_digest", "problemIds": [p["id"] for p in problems]},
+            })
+        if send_email and user.get("email"):
+            emails.append({"to": user["email"], "subject": "Your week on FRIKT", "html": render_digest_email(user, problems)})
+    await enqueue_pushes(pushes)
+    queued = await enqueue_emails(emails, kind="weekly_digest") if emails else 0
+    return {"stats.users_processed": len(users), "stats.digests": digests, "stats.pushes": len(pushes), "stats.emails": queued}
+
+async def run_weekly_digest(now: Optional[datetime] = None):
+    """Send (or resume) this week's digest once it is due. Run by the lease holder."""
+    now = now or datetime.utcnow()
+    week, due_at = digest_week(now)
+    if now < due_at:
+        return
+    run = await start_digest_run(week, now)
+    if run["status"] != "running":
+        return
+    
+    send_email = email_configured()
+    elapsed = run["elapsed_seconds"]
+    processed = run["stats"]["users_processed"]
+    cursor = run["cursor"]
+    projection = {"_id": 0, "id": 1, "email": 1, "name": 1, "displayName": 1, "status": 1, "followed_categories": 1}
+    while True:
+        started = time.perf_counter()
+        query = {"id": {"$gt": cursor}} if cursor else {}
+        users = await db.users.find(query, projection).sort("id", 1).limit(WEEKLY_DIGEST_PAGE_USERS).to_list(WEEKLY_DIGEST_PAGE_USERS)
+        if not users:
+            break
+        stats = await send_digest_page(run, users, send_email)
+        cursor = users[-1]["id"]
+        elapsed += time.perf_counter() - started
+        processed += len(users)
+        await db.digest_runs.update_one({"id": week}, {
+            "$set": {"cursor": cursor, "elapsed_seconds": elapsed,
+                     "users_per_second": round(processed / elapsed, 1) if elapsed else None},
+            "$inc": stats,
+        })
+        if not await acquire_lease(WEEKLY_DIGEST_JOB, WEEKLY_DIGEST_LEASE_SECONDS):
+            return  # Another worker took over; it resumes from the cursor
+    
+    run = await db.digest_runs.find_one_and_update(
+        {"id": week}, {"$set": {"status": "completed", "completed_at": datetime.utcnow()}},
+        projection={"_id": 0, "top_categories": 0, "top_communities": 0}, return_document=ReturnDocument.AFTER
+    )
+    logger.info(f"Weekly digest {week} completed: {run['stats']} at {run.get('users_per_second')} users/sec")
+
+@api_router.get("/admin/weekly-digest")
+async def get_weekly_digest_runs(admin: dict = Depends(require_admin)):
+    """Recent digest runs with their progress and throughput."""
+    runs = await db.digest_runs.find(
+        {}, {"_id": 0, "top_categories": 0, "top_communities": 0}
+    ).sort("started_at", -1).limit(10).to_list(10)
+    return {"runs": runs}
+
 # ===================== FEEDBACK =====================
 
 class FeedbackCreate(BaseModel):
@@ -5244,24 +8784,22 @@ async def submit_feedback(feedback_data: FeedbackCreate, user: dict = Depends(re
     
     await db.feedbacks.insert_one(feedback.dict())
     
-    # Send push notification to all admin users
-    admin_users = await db.users.find({"role": "admin"}, {"id": 1}).to_list(100)
-    for admin in admin_users:
-        if admin["id"] != user["id"]:  # Don't notify if admin sends feedback to themselves
-            await send_notification_to_user(
-                admin["id"],
-                "New Feedback Received",
-                f"From {user.get('displayName') or user['name']}: {feedback_data.message[:60]}...",
-                {"type": "new_feedback", "feedbackId": feedback.id}
-            )
-            # Also create in-app notification
-            notification = Notification(
-                user_id=admin["id"],
-                type="new_feedback",
-                problem_id=feedback.id,  # Repurpose this field for feedback ID
-                message=f"New feedback from {user.get('displayName') or user['name']}"
-            )
-            await db.notifications.insert_one(notification.dict())
+    # Notify all admin users (not an admin sending feedback to themselves)
+    sender_name = user.get('displayName') or user['name']
+    await enqueue_fanout(
+        audience=admin_audience(),
+        exclude=[user["id"]],
+        notification={
+            "type": "new_feedback",
+            "problem_id": feedback.id,  # Repurpose this field for feedback ID
+            "message": f"New feedback from {sender_name}",
+        },
+        push={
+            "title": "New Feedback Received",
+            "body": f"From {sender_name}: {feedback_data.message[:60]}...",
+            "data": {"type": "new_feedback", "feedbackId": feedback.id},
+        },
+    )
     
     logger.info(f"Feedback submitted by {user['email']}: {feedback_data.message[:50]}...")
     return {"success": True, "id": feedback.id}
@@ -5824,49 +9362,68 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+SYNC_PROBLEM_STATS_BATCH_SIZE = 1000
+
+async def iter_problem_actual_counts():
+    """
+    Stream (problem, actual_counts) for every problem, with counts recomputed from
+    relates and comments. Problems and the two per-problem $group results are read
+    as cursors sorted by problem id and merge-joined, so memory stays bounded.
+    """
+    problems = db.problems.find(
+        {"id": {"$type": "string"}},
+        {"_id": 0, "id": 1, "relates_count": 1, "comments_count": 1, "unique_commenters": 1}
+    ).sort("id", 1)
+    match = {"problem_id": {"$type": "string"}}
+    relates = db.relates.aggregate(relate_counts_pipeline(match) + [{"$sort": {"_id": 1}}], allowDiskUse=True)
+    comments = db.comments.aggregate(comment_counts_pipeline(match) + [{"$sort": {"_id": 1}}], allowDiskUse=True)
+    
+    async def next_row(cursor):
+        try:
+            return await cursor.__anext__()
+        except StopAsyncIteration:
+            return None
+    
+    relate_row = await next_row(relates)
+    comment_row = await next_row(comments)
+    async for problem in problems:
+        pid = problem["id"]
+        # Skip groups for problem ids that no longer exist
+        while relate_row and relate_row["_id"] < pid:
+            relate_row = await next_row(relates)
+        while comment_row and comment_row["_id"] < pid:
+            comment_row = await next_row(comments)
+        
+        actual = {
+            "relates_count": relate_row["count"] if relate_row and relate_row["_id"] == pid else 0,
+            "comments_count": comment_row["count"] if comment_row and comment_row["_id"] == pid else 0,
+            "unique_commenters": comment_row["unique"] if comment_row and comment_row["_id"] == pid else 0,
+        }
+        yield problem, actual
+
 @api_router.post("/admin/sync-problem-stats")
 async def sync_problem_stats(admin: dict = Depends(require_admin)):
     """Recalculate relates_count, comments_count, and unique_commenters for all problems."""
     corrections = 0
-    problems = await db.problems.find({}, {"id": 1, "relates_count": 1, "comments_count": 1, "unique_commenters": 1}).to_list(50000)
+    total_problems = 0
+    ops = []
     
-    for problem in problems:
-        pid = problem["id"]
-        
-        # Count relates
-        actual_relates = await db.relates.count_documents({"problem_id": pid})
-        
-        # Count non-removed/hidden comments
-        actual_comments = await db.comments.count_documents({
-            "problem_id": pid,
-            "status": {"$nin": ["removed", "hidden"]}
-        })
-        
-        # Count unique commenters
-        commenter_ids = await db.comments.distinct("user_id", {
-            "problem_id": pid,
-            "status": {"$nin": ["removed", "hidden"]}
-        })
-        actual_unique = len(commenter_ids)
-        
-        old_relates = problem.get("relates_count", 0)
-        old_comments = problem.get("comments_count", 0)
-        old_unique = problem.get("unique_commenters", 0)
-        
-        if old_relates != actual_relates or old_comments != actual_comments or old_unique != actual_unique:
-            await db.problems.update_one(
-                {"id": pid},
-                {"$set": {
-                    "relates_count": actual_relates,
-                    "comments_count": actual_comments,
-                    "unique_commenters": actual_unique
-                }}
-            )
-            corrections += 1
-    
-    await log_admin_action(admin, "sync_problem_stats", "system", "", {"corrections": corrections, "total_problems": len(problems)})
-    logger.info(f"Problem stats sync complete: {corrections} corrections out of {len(problems)} problems")
-    return {"success": True, "corrections": corrections, "total_problems": len(problems)}
+    async for problem, actual in iter_problem_actual_counts():
+        total_problems += 1
+        if all(problem.get(field, 0) == value for field, value in actual.items()):
+            continue
+        ops.append(UpdateOne({"id": problem["id"]}, {"$set": actual}))
+        if len(ops) >= SYNC_PROBLEM_STATS_BATCH_SIZE:
+            await db.problems.bulk_write(ops, ordered=False)
+            corrections += len(ops)
+            ops = []
+    if ops:
+        await db.problems.bulk_write(ops, ordered=False)
+        corrections += len(ops)
+    
+    await log_admin_action(admin, "sync_problem_stats", "system", "", {"corrections": corrections, "total_problems": total_problems})
+    logger.info(f"Problem stats sync complete: {corrections} corrections out of {total_problems} problems")
+    return {"success": True, "corrections": corrections, "total_problems": total_problems}
 
 # Include router
 app.include_router(api_router)
@@ -5882,10 +9439,148 @@ app.add_middleware(
 )
 
 
+async def ensure_unique_index(collection, keys: List[str], keep: Optional[dict] = None) -> bool:
+    """
+    Build a unique index on `keys`, first deleting documents that would violate it:
+    per key combination the first one in `keep` order (default: oldest) stays. The
+    full-collection scan happens once per collection and keys; it is recorded as done
+    in job_state only after the index exists, so a startup that failed in between
+    (say, a duplicate written mid-build) repeats it. False if the index isn't there
+    yet (another instance holds the lease and is building it).
+    """
+    job = f"drop_duplicates:{collection.name}:{','.join(keys)}"
+    index = [(k, 1) for k in keys]
+    if await db.job_state.find_one({"_id": job, "done": True}):
+        await collection.create_index(index, unique=True)
+        return True
+    if not await acquire_lease(job, 600):
+        return False
+    try:
+        removed = 0
+        duplicates = collection.aggregate([
+            {"$sort": keep or {"_id": 1}},
+            {"$group": {"_id": {k: f"${k}" for k in keys}, "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        async for dup in duplicates:
+            result = await collection.delete_many({"_id": {"$in": dup["ids"][1:]}})
+            removed += result.deleted_count
+        if removed:
+            logger.info(f"Dropped {removed} duplicate {collection.name} documents on {keys}")
+        await collection.create_index(index, unique=True)
+        await db.job_state.update_one(
+            {"_id": job},
+            {"$set": {"done": True, "removed": removed, "done_at": datetime.utcnow()}},
+            upsert=True
+        )
+        return True
+    finally:
+        await release_lease(job)
+
+# Indexes for background jobs and queries, as (collection, keys, options). Each is
+# created on its own: one that already exists with other options (say a unique id_1
+# built by hand) only logs a warning instead of skipping every index after it.
+QUERY_INDEXES = [
+    ("activity_events", [("user_id", 1), ("_id", 1)], {}),
+    ("activity_events", "source_id", {"unique": True, "partialFilterExpression": {"source_id": {"$exists": True}}}),
+    ("admin_jobs", "id", {"unique": True}),
+    ("push_tokens", [("is_active", 1), ("user_id", 1)], {}),
+    ("push_tokens", "token", {}),
+    ("push_tickets", [("status", 1), ("check_after", 1)], {}),
+    ("push_tickets", "created_at", {}),
+    ("push_outbox", [("status", 1), ("next_attempt_at", 1)], {}),
+    ("push_outbox", "claimed_by", {}),
+    ("email_outbox", [("status", 1), ("next_attempt_at", 1)], {}),
+    ("email_outbox", "claimed_by", {}),
+    ("email_outbox", [("kind", 1), ("to", 1), ("status", 1)], {}),
+    ("notifications", [("broadcast_id", 1), ("user_id", 1)], {"sparse": True}),
+    ("notifications", [("fanout_id", 1), ("user_id", 1)], {"sparse": True}),
+    ("fanout_jobs", [("status", 1), ("next_attempt_at", 1)], {}),
+    ("fanout_jobs", "id", {"unique": True}),
+    ("problem_trends", "problem_id", {"unique": True}),
+    ("problem_trends", [("rank_key", -1)], {}),
+    ("trend_baselines", "category_id", {"unique": True}),
+    ("digest_runs", "id", {"unique": True}),
+    ("users", "id", {}),
+    ("problems", [("status", 1), ("signal_score", -1)], {}),
+    ("comments", "created_at", {}),
+    ("metrics_daily", [("scope", 1), ("date", 1)], {"unique": True}),
+    ("users", "created_at", {}),
+    ("relates", "created_at", {}),
+    ("community_members", "joined_at", {}),
+    ("problems", "id", {}),
+    ("problems", [("created_at", -1)], {}),
+    # Fan-out audiences are streamed in user id order
+    ("users", [("followed_problems", 1), ("id", 1)], {}),
+    ("users", [("role", 1), ("id", 1)], {}),
+    ("comments", [("problem_id", 1), ("status", 1), ("user_id", 1)], {}),
+    ("community_members", [("community_id", 1), ("user_id", 1)], {}),
+    ("notifications", [("user_id", 1), ("created_at", -1)], {}),
+    ("notification_counters", "user_id", {"unique": True}),
+    ("notification_counters", "total", {}),
+    ("notifications", "created_at", {}),
+    ("notifications_archive", "id", {"unique": True}),
+    ("notifications_archive", [("user_id", 1), ("created_at", -1)], {}),
+    ("leaderboards", [("snapshot_id", 1), ("board", 1), ("scope", 1), ("rank", 1)], {}),
+] + [("user_stats", [(field, -1)], {}) for field in LEADERBOARD_STAT_FIELDS.values()]
+
+async def ensure_query_indexes():
+    for collection, keys, options in QUERY_INDEXES:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            logger.warning(f"Index warning for {collection} {keys}: {e}")
+
+async def ensure_unique_indexes():
+    """Unique indexes the write paths rely on instead of check-then-insert. Built before
+    any background worker starts, so none of them writes a duplicate mid-build."""
+    # One relate / helpful per user, so concurrent duplicate requests can't double-count.
+    # Until the relates index exists the relate endpoint keeps its "already related" lookup.
+    for collection, keys in [(db.relates, ["problem_id", "user_id"]), (db.helpfuls, ["comment_id", "user_id"])]:
+        try:
+            if await ensure_unique_index(collection, keys):
+                _unique_indexes_ready.add(collection.name)
+        except Exception as e:
+            logger.error(f"{collection.name} unique index missing, duplicate checks stay on the request path: {e}")
+
+    # One notification batch per (recipient, type, target)
+    try:
+        await migrate_legacy_notification_batches()
+        await ensure_unique_index(db.pending_notification_batches, ["recipient_user_id", "batch_type", "target_id"])
+    except Exception as e:
+        logger.error(f"Notification batch unique index missing: {e}")
+
+    # One achievement per (user, badge) and one stats doc per user. Of duplicate stats
+    # docs the one folded furthest (highest activity_seq) is kept, then the newest.
+    try:
+        await ensure_unique_index(db.user_achievements, ["user_id", "badge_id"])
+        await ensure_unique_index(db.user_stats, ["user_id"], keep={"activity_seq": -1, "_id": -1})
+    except Exception as e:
+        logger.error(f"Gamification unique index missing: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Start background tasks on app startup."""
+    await ensure_unique_indexes()
     asyncio.create_task(notification_batch_processor())
+    start_event_workers()
+    asyncio.create_task(run_periodic_job(EVENT_RECOVERY_JOB, EVENT_RECOVERY_INTERVAL_SECONDS, recover_domain_events))
+    asyncio.create_task(start_activity_aggregator())
+    asyncio.create_task(run_periodic_job(LEADERBOARD_JOB, LEADERBOARD_REFRESH_SECONDS, materialize_leaderboards))
+    asyncio.create_task(run_periodic_job("broadcast_resume", BROADCAST_RESUME_INTERVAL_SECONDS, resume_broadcast_jobs, leased=False))
+    asyncio.create_task(run_periodic_job(PUSH_RECEIPTS_JOB, PUSH_RECEIPT_POLL_SECONDS, poll_push_receipts))
+    asyncio.create_task(run_periodic_job(NOTIFICATION_ARCHIVE_JOB, NOTIFICATION_ARCHIVE_INTERVAL_SECONDS, run_notification_archiver))
+    asyncio.create_task(run_periodic_job(WEEKLY_DIGEST_JOB, WEEKLY_DIGEST_CHECK_SECONDS, run_weekly_digest))
+    asyncio.create_task(run_periodic_job(ANALYTICS_JOB, ANALYTICS_REFRESH_SECONDS, refresh_analytics_snapshot))
+    asyncio.create_task(run_periodic_job(METRICS_ROLLUP_JOB, METRICS_ROLLUP_INTERVAL_SECONDS, run_metrics_rollup))
+    for _ in range(PUSH_OUTBOX_WORKERS):
+        asyncio.create_task(push_outbox_worker())
+    for _ in range(EMAIL_OUTBOX_WORKERS):
+        asyncio.create_task(email_outbox_worker())
+    for _ in range(FANOUT_WORKERS):
+        asyncio.create_task(fanout_worker())
+    if RECONCILER_BATCH_SIZE > 0:
+        asyncio.create_task(run_periodic_job(RECONCILER_JOB, RECONCILER_INTERVAL_SECONDS, run_counter_reconciler))
     
     # Create unique indexes for data integrity
     try:
@@ -5897,7 +9592,30 @@ async def startup_event():
         logger.info("Database indexes created successfully")
     except Exception as e:
         logger.warning(f"Index creation warning (may already exist): {e}")
-    
+
+    try:
+        await db.domain_events.create_index([("status", 1), ("created_at", 1)])
+        await db.domain_events.create_index([("status", 1), ("next_attempt_at", 1)])
+    except Exception as e:
+        logger.warning(f"Domain event index warning: {e}")
+
+    await ensure_query_indexes()
+
+    await ensure_expiry_indexes()
+    try:
+        await db.password_reset_tokens.create_index([("token", 1), ("used", 1)])
+        await db.password_reset_tokens.create_index([("email", 1), ("created_at", -1)])
+        await db.community_join_requests.create_index([("user_id", 1), ("community_id", 1), ("status", 1)])
+        await db.pending_badge_notifications.create_index("user_id")
+    except Exception as e:
+        logger.warning(f"Ephemeral collection index warning: {e}")
+
+    try:
+        await db.pending_notification_batches.create_index([("notification_sent", 1), ("due_at", 1)])
+        await db.pending_notification_batches.create_index("claimed_by")
+    except Exception as e:
+        logger.warning(f"Notification batch index warning: {e}")
+
     # FIX 16: Mark all existing users without onboarding_completed as completed
     try:
         result = await db.users.update_many(
@@ -5913,4 +9631,7 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await stop_event_workers()
+    await close_push_client()
+    await close_email_client()
     client.close()
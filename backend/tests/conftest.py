@@ -0,0 +1,117 @@
+"""
+Shared scaffolding for the in-process tests (server imported directly instead of
+going through BASE_URL).
+
+- `server` is importable from here; modules do `server = pytest.importorskip("server")`
+  so they skip cleanly where the backend dependencies aren't installed
+- tests that touch the database take the `db` fixture and are skipped when
+  MONGO_URL is not set; pure helper tests in the same modules still run
+- one event loop for the whole session, since Motor binds its client to the
+  first loop it runs on
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_CONFIGURED = bool(os.environ.get("MONGO_URL"))
+# server reads MONGO_URL at import; Motor only connects on the first query, so a
+# placeholder is enough for the tests that don't need a database
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+
+try:
+    from pymongo import monitoring
+except ImportError:  # backend dependencies not installed, every in-process module skips
+    monitoring = None
+
+
+# Commands sent per collection, for the round-trip tests. Registered here so it
+# is in place before server creates its Mongo client, whichever module imports it first.
+MONGO_COMMANDS = Counter()
+
+if monitoring:
+    class CommandCounter(monitoring.CommandListener):
+        """Counts commands per target collection"""
+
+        def started(self, event):
+            collection = event.command.get(event.command_name)
+            if isinstance(collection, str):
+                MONGO_COMMANDS[collection] += 1
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(CommandCounter())
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture
+def db(loop):
+    if not DATABASE_CONFIGURED:
+        pytest.skip("MONGO_URL not set - in-process tests need a database")
+    server = pytest.importorskip("server")
+    return server.db
+
+
+@pytest.fixture
+def mongo_commands(db):
+    """Per-collection command counts; call .clear() before the section being measured."""
+    MONGO_COMMANDS.clear()
+    return MONGO_COMMANDS
+
+
+@pytest.fixture
+def make_user():
+    """Factory for test user documents (not inserted)."""
+    def factory(prefix="User", **fields):
+        unique_id = uuid.uuid4().hex[:8]
+        return {
+            "id": f"TEST_{prefix}_{unique_id}",
+            "name": f"Test{prefix}{unique_id}",
+            "email": f"test_{prefix.lower()}_{unique_id}@example.com",
+            "status": "active",
+            "created_at": datetime.utcnow(),
+            **fields,
+        }
+    return factory
+
+
+@pytest.fixture
+def delete_test_data(db):
+    """Remove what the in-process tests create for the given users / problems."""
+    async def delete(user_ids=(), problem_ids=()):
+        user_ids, problem_ids = list(user_ids), list(problem_ids)
+        if problem_ids:
+            comment_ids = await db.comments.distinct("id", {"problem_id": {"$in": problem_ids}})
+            await db.problems.delete_many({"id": {"$in": problem_ids}})
+            await db.relates.delete_many({"problem_id": {"$in": problem_ids}})
+            await db.comments.delete_many({"problem_id": {"$in": problem_ids}})
+            await db.helpfuls.delete_many({"comment_id": {"$in": comment_ids}})
+            await db.reports.delete_many({"target_id": {"$in": comment_ids + problem_ids}})
+            await db.notifications.delete_many({"problem_id": {"$in": problem_ids}})
+            await db.pending_notification_batches.delete_many({"target_id": {"$in": problem_ids}})
+        if user_ids:
+            await db.problems.delete_many({"user_id": {"$in": user_ids}})
+            await db.relates.delete_many({"user_id": {"$in": user_ids}})
+            await db.comments.delete_many({"user_id": {"$in": user_ids}})
+            await db.users.delete_many({"id": {"$in": user_ids}})
+            for collection in ["user_stats", "user_badges", "user_achievements",
+                               "pending_badge_notifications", "activity_events"]:
+                await db[collection].delete_many({"user_id": {"$in": user_ids}})
+    return delete
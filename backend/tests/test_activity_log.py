@@ -0,0 +1,218 @@
+"""
+Test event-sourced activity log for FRIKT App
+- handlers append one activity event (post, relate given/received, comment, follow, open, visit)
+- event ids are assigned by the database, so app server clock skew can't put them behind the checkpoint
+- posts, relates given and comments are also counted per category
+- the aggregator folds events into user_stats in batches from a checkpoint
+- re-folding a batch after a crash (checkpoint not written) doesn't double count
+- events past an activity_seq moved into a batch (sync / rebuild) are still folded
+- user_stats can be rebuilt from the log alone
+- aggregator throughput (events/sec) is recorded in job_state
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import time
+
+server = pytest.importorskip("server")
+
+# Fold everything immediately in tests (ObjectId timestamps have 1s resolution)
+server.ACTIVITY_AGGREGATOR_LAG_SECONDS = -1
+
+
+async def append_activity(user_id):
+    await server.record_activity(user_id, "post_created", category_id="work")
+    await server.record_activity(user_id, "post_created", category_id="tech")
+    await server.record_activity(user_id, "relate_given", amount=3, categories={"work": 2, "tech": 1})
+    await server.record_activity(user_id, "relate_received", relates_count=4)
+    await server.record_activity(user_id, "relate_received", relates_count=2)
+    await server.record_activity(user_id, "comment_created", category_id="work")
+    await server.record_activity(user_id, "comment_created", category_id="tech")
+    await server.db.activity_events.insert_one(
+        {"user_id": user_id, "type": "comment_deleted", "category_id": "tech", "created_at": server.datetime.utcnow()}
+    )
+    await server.record_activity(user_id, "user_followed")
+    await server.record_activity(user_id, "frikt_opened")
+
+
+EXPECTED = {
+    "total_posts": 2,
+    "posts_per_category": {"work": 1, "tech": 1},
+    "total_relates_given": 3,
+    "relates_given_per_category": {"work": 2, "tech": 1},
+    "total_relates_received": 2,
+    "max_relates_on_single_post": 4,
+    "total_comments": 1,
+    "comments_per_category": {"work": 1, "tech": 0},
+    "users_followed": 1,
+    "total_frikts_opened": 1,
+}
+
+
+def assert_expected(stats):
+    for field, value in EXPECTED.items():
+        assert stats[field] == value, f"{field}: {stats[field]} != {value}"
+
+
+class TestActivityAggregation:
+    """Folding the log into user_stats"""
+
+    def test_projection_before_aggregation(self, loop, db, make_user, delete_test_data):
+        """record_activity returns stats including events not folded yet"""
+        async def run():
+            user_id = make_user("Activity")["id"]
+            try:
+                stats = await server.record_activity(user_id, "relate_given")
+                assert stats["total_relates_given"] == 1
+                await server.run_activity_aggregator()
+                stats = await server.record_activity(user_id, "relate_given")
+                assert stats["total_relates_given"] == 2
+                assert "activity_seq" not in stats
+            finally:
+                await delete_test_data([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Projected stats are the stored stats plus the new event")
+
+    def test_event_ids_assigned_by_database(self, loop, db, make_user, delete_test_data):
+        """Appended events get their _id from the database clock; a repeated source_id is skipped"""
+        async def run():
+            user_id = make_user("Activity")["id"]
+            await server.db.activity_events.create_index(
+                "source_id", unique=True, partialFilterExpression={"source_id": {"$exists": True}}
+            )
+            try:
+                await server.record_activity(user_id, "relate_received", source_id=f"{user_id}:relate")
+                await server.record_activity(user_id, "relate_received", source_id=f"{user_id}:relate")
+                events = await server.db.activity_events.find({"user_id": user_id}).to_list(None)
+                assert len(events) == 1
+                db_now = await server.database_now()
+                assert abs((events[0]["_id"].generation_time.replace(tzinfo=None) - db_now).total_seconds()) < 5
+            finally:
+                await delete_test_data([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Activity event ids come from the database")
+
+    def test_seq_moved_inside_batch(self, loop, db, make_user, delete_test_data):
+        """Events past an activity_seq that a sync moved into the batch's range are still folded"""
+        async def run():
+            user_id = make_user("Activity")["id"]
+            try:
+                def relates(n):
+                    return [{"user_id": user_id, "type": "relate_given", "created_at": server.datetime.utcnow()}
+                            for _ in range(n)]
+
+                result = await server.db.activity_events.insert_many(relates(4))
+                # A sync already counted the first two events
+                await server.db.user_stats.insert_one({
+                    **server.UserStats(user_id=user_id).dict(),
+                    "total_relates_given": 2,
+                    "activity_seq": result.inserted_ids[1],
+                })
+                await server.run_activity_aggregator()
+                stats = await server.db.user_stats.find_one({"user_id": user_id})
+                assert stats["total_relates_given"] == 4
+                assert stats["activity_seq"] == result.inserted_ids[-1]
+
+                # Seq moved again between the aggregator's read and its write
+                result = await server.db.activity_events.insert_many(relates(3))
+                await server.db.user_stats.update_one(
+                    {"user_id": user_id}, {"$set": {"total_relates_given": 5, "activity_seq": result.inserted_ids[0]}}
+                )
+                await server.fold_pending_activity(user_id, result.inserted_ids[-1])
+                stats = await server.db.user_stats.find_one({"user_id": user_id})
+                assert stats["total_relates_given"] == 7
+                assert stats["activity_seq"] == result.inserted_ids[-1]
+            finally:
+                await delete_test_data([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Only events past activity_seq are folded")
+
+    def test_aggregate_and_replay_is_idempotent(self, loop, db, make_user, delete_test_data):
+        """Aggregator folds events exactly once even if a batch is re-run"""
+        async def run():
+            user_id = make_user("Activity")["id"]
+            try:
+                await server.db.users.insert_one(
+                    {"id": user_id, "name": user_id, "created_at": server.datetime.utcnow()}
+                )
+                state_before = await server.db.job_state.find_one({"_id": server.ACTIVITY_AGGREGATOR_JOB})
+                await append_activity(user_id)
+                await server.run_activity_aggregator()
+                stats = await server.db.user_stats.find_one({"user_id": user_id})
+                assert_expected(stats)
+
+                # Simulate a crash before the checkpoint write: rewind and fold again
+                await server.db.job_state.update_one(
+                    {"_id": server.ACTIVITY_AGGREGATOR_JOB},
+                    {"$set": {"checkpoint": state_before.get("checkpoint") if state_before else None}}
+                )
+                await server.run_activity_aggregator()
+                stats = await server.db.user_stats.find_one({"user_id": user_id})
+                assert_expected(stats)
+
+                # Badges were checked for the user after folding
+                achievements = await server.db.user_achievements.distinct("badge_id", {"user_id": user_id})
+                assert "creator_1" in achievements and "relater_1" in achievements
+            finally:
+                await delete_test_data([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Aggregation is exact and idempotent on replay")
+
+    def test_rebuild_from_log(self, loop, db, make_user, delete_test_data):
+        """Stats rebuilt from the log match the aggregated stats"""
+        async def run():
+            user_id = make_user("Activity")["id"]
+            try:
+                await append_activity(user_id)
+                await server.db.activity_events.insert_many([
+                    {"user_id": user_id, "type": "visit", "date": date, "created_at": server.datetime.utcnow()}
+                    for date in ["2026-01-01", "2026-01-02", "2026-01-04", "2026-01-10"]
+                ])
+                await server.run_activity_aggregator()
+
+                # Corrupt the stored stats, then rebuild
+                await server.db.user_stats.update_one({"user_id": user_id}, {"$set": {"total_posts": 99}})
+                stats = await server.rebuild_user_stats_from_activity(user_id)
+                assert_expected(stats)
+                assert stats["current_visit_streak"] == 1
+                assert stats["last_visit_date"] == "2026-01-10"
+            finally:
+                await delete_test_data([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Stats rebuilt from the activity log")
+
+
+class TestAggregatorThroughput:
+    """Events/sec reported by the aggregator"""
+
+    def test_throughput(self, loop, db, make_user, delete_test_data):
+        """Fold 5000 events across 500 users and report events/sec"""
+        async def run():
+            user_ids = [make_user("Activity")["id"] for _ in range(500)]
+            try:
+                await server.db.activity_events.insert_many([
+                    {"user_id": user_ids[i % len(user_ids)], "type": "relate_given", "created_at": server.datetime.utcnow()}
+                    for i in range(5000)
+                ])
+                start = time.perf_counter()
+                await server.run_activity_aggregator()
+                elapsed = time.perf_counter() - start
+
+                stats = await server.db.user_stats.find_one({"user_id": user_ids[0]})
+                assert stats["total_relates_given"] == 10
+                state = await server.db.job_state.find_one({"_id": server.ACTIVITY_AGGREGATOR_JOB})
+                assert state["events_processed"] >= 5000
+                print(f"  aggregator: {5000 / elapsed:.0f} events/sec overall, "
+                      f"last batch {state['last_batch_events_per_second']} events/sec")
+            finally:
+                await delete_test_data(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Aggregator throughput measured")
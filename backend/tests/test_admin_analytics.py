@@ -0,0 +1,104 @@
+"""
+Test admin analytics snapshot for FRIKT App
+- counts from the grouped pipelines match direct queries
+- top problems are read through the (status, signal_score) index, not an in-memory sort
+- DAU/WAU count distinct users with a post, relate or comment in the window
+- the dashboard reads a cached snapshot and rebuilds it when it is stale
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_Analytics_admin"}
+
+
+class TestAdminAnalytics:
+    """Snapshot contents and caching"""
+
+    def test_snapshot_matches_direct_counts(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            now = server.datetime.utcnow()
+            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            users = [f"TEST_Analytics_{tag}_{i}" for i in range(4)]
+            before = await server.compute_analytics()
+            try:
+                await server.db.users.insert_many([
+                    {"id": users[0], "status": "active"}, {"id": users[1], "status": "banned"},
+                    {"id": users[2], "status": "shadowbanned"}, {"id": users[3], "status": "active"},
+                ])
+                await server.db.problems.insert_many([
+                    {"id": f"TEST_Analytics_{tag}_p{i}", "user_id": users[0], "status": "active", "is_local": i % 2 == 0,
+                     "signal_score": 10_000 + i, "created_at": now - server.timedelta(days=i * 3)}
+                    for i in range(4)
+                ])
+                await server.db.comments.insert_one({"id": f"TEST_Analytics_{tag}_c", "user_id": users[3],
+                                                     "created_at": today_start - server.timedelta(days=3)})
+                await server.db.relates.insert_many([
+                    {"problem_id": f"TEST_Analytics_{tag}_p0", "user_id": users[1], "created_at": today_start - server.timedelta(days=1)},
+                    {"problem_id": f"TEST_Analytics_{tag}_p0", "user_id": users[2], "created_at": today_start - server.timedelta(days=10)},
+                ])
+                snapshot = await server.compute_analytics()
+
+                week_start = today_start - server.timedelta(days=7)
+                assert snapshot["users"]["total"] == await db.users.count_documents({})
+                assert snapshot["users"]["active"] == await db.users.count_documents({"status": "active"})
+                assert snapshot["users"]["banned"] == await db.users.count_documents({"status": {"$in": ["banned", "shadowbanned"]}})
+                assert snapshot["problems"] == {
+                    "total": await db.problems.count_documents({}),
+                    "today": await db.problems.count_documents({"created_at": {"$gte": today_start}}),
+                    "week": await db.problems.count_documents({"created_at": {"$gte": week_start}}),
+                }
+                assert snapshot["comments"]["total"] == await db.comments.count_documents({})
+                assert snapshot["local"]["local_frikts_total"] == await db.problems.count_documents({"is_local": True, "status": "active"})
+                assert snapshot["local"]["local_frikts_week"] == await db.problems.count_documents({"is_local": True, "created_at": {"$gte": week_start}})
+                assert [p["id"] for p in snapshot["top_problems"][:4]] == [f"TEST_Analytics_{tag}_p{i}" for i in (3, 2, 1, 0)]
+                assert "signal_breakdown" in snapshot["top_problems"][0]
+
+                # users[0] posted today; users[1] related and users[3] commented this week
+                assert snapshot["users"]["dau"] == before["users"]["dau"] + 1
+                assert snapshot["users"]["wau"] == before["users"]["wau"] + 3
+            finally:
+                await server.db.users.delete_many({"id": {"$in": users}})
+                await server.db.problems.delete_many({"id": {"$regex": f"^TEST_Analytics_{tag}"}})
+                await server.db.comments.delete_many({"id": f"TEST_Analytics_{tag}_c"})
+                await server.db.relates.delete_many({"user_id": {"$in": users}})
+
+        loop.run_until_complete(run())
+        print("✓ Grouped analytics match direct counts; DAU/WAU from posts, relates and comments")
+
+    def test_dashboard_reads_snapshot(self, loop, db):
+        async def run():
+            try:
+                await server.db.job_state.delete_one({"_id": server.ANALYTICS_JOB})
+                await server.get_analytics(admin=ADMIN)  # builds the first snapshot
+                first = await server.get_analytics(admin=ADMIN)
+                second = await server.get_analytics(admin=ADMIN)
+                assert second["generated_at"] == first["generated_at"]
+
+                # A snapshot the refresh job stopped updating is rebuilt on read
+                stale = server.datetime.utcnow() - server.timedelta(seconds=server.ANALYTICS_REFRESH_SECONDS * 5)
+                await server.db.job_state.update_one({"_id": server.ANALYTICS_JOB}, {"$set": {"snapshot.generated_at": stale}})
+                third = await server.get_analytics(admin=ADMIN)
+                assert third["generated_at"] > stale
+            finally:
+                await server.db.job_state.delete_one({"_id": server.ANALYTICS_JOB})
+
+        loop.run_until_complete(run())
+        print("✓ Dashboard served from the cached snapshot")
+
+    def test_top_problems_use_index(self, loop, db):
+        async def run():
+            await server.db.problems.create_index([("status", 1), ("signal_score", -1)])
+            plan = await server.db.problems.find({"status": "active"}).sort("signal_score", -1).limit(10).explain()
+            winning = str(plan["queryPlanner"]["winningPlan"])
+            assert "status_1_signal_score_-1" in winning
+            assert "'stage': 'SORT'" not in winning
+
+        loop.run_until_complete(run())
+        print("✓ Top problems read through the signal score index")
@@ -0,0 +1,150 @@
+"""
+Test atomic counter updates for FRIKT App
+- relates_count, comments_count, helpful_count and reports_count use $inc
+  instead of read-modify-write, so concurrent requests can't lose updates
+- 1000 parallel relates on one problem must land exactly 1000 on relates_count
+- a repeat relate is rejected even before the unique relates index is confirmed
+
+These tests run the route handlers in-process against the database configured
+by MONGO_URL / DB_NAME (skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+
+PARALLEL_RELATES = 1000
+
+
+async def create_test_problem(author):
+    await server.db.users.insert_one(dict(author))
+    problem = server.Problem(
+        user_id=author["id"],
+        user_name=author["name"],
+        title=f"TEST_atomic_counters {uuid.uuid4()}",
+        category_id="work",
+    )
+    await server.db.problems.insert_one(problem.dict())
+    return problem.id
+
+
+class TestAtomicRelates:
+    """relates_count stays exact under concurrency"""
+
+    def test_parallel_relates_exact_count(self, loop, db, make_user, delete_test_data):
+        """1000 parallel relates -> relates_count == 1000"""
+        async def run():
+            author = make_user("Author")
+            relaters = [make_user("Relater") for _ in range(PARALLEL_RELATES)]
+            problem_id = await create_test_problem(author)
+            try:
+                results = await asyncio.gather(
+                    *(server.relate_to_problem(problem_id, user=u) for u in relaters),
+                    return_exceptions=True
+                )
+                errors = [r for r in results if isinstance(r, Exception)]
+                assert not errors, f"{len(errors)} relates failed, first: {errors[0]!r}"
+
+                problem = await server.db.problems.find_one({"id": problem_id})
+                relate_docs = await server.db.relates.count_documents({"problem_id": problem_id})
+                assert relate_docs == PARALLEL_RELATES
+                assert problem["relates_count"] == PARALLEL_RELATES
+                assert problem["signal_score"] == server.calculate_signal_score(problem)
+            finally:
+                await delete_test_data([author["id"]] + [u["id"] for u in relaters], [problem_id])
+
+        loop.run_until_complete(run())
+        print(f"✓ {PARALLEL_RELATES} parallel relates counted exactly")
+
+    def test_repeat_relate_rejected_without_unique_index(self, loop, db, make_user, delete_test_data):
+        """Until startup confirms the unique index, the lookup still rejects a repeat relate"""
+        async def run():
+            author, relater = make_user("Author"), make_user("Relater")
+            problem_id = await create_test_problem(author)
+            ready = set(server._unique_indexes_ready)
+            server._unique_indexes_ready.clear()
+            try:
+                await server.db.relates.insert_one({"id": str(uuid.uuid4()), "problem_id": problem_id, "user_id": relater["id"]})
+                with pytest.raises(server.HTTPException) as exc:
+                    await server.relate_to_problem(problem_id, user=relater)
+                assert exc.value.status_code == 400
+                assert (await server.db.problems.find_one({"id": problem_id}))["relates_count"] == 0
+            finally:
+                server._unique_indexes_ready.update(ready)
+                await delete_test_data([author["id"], relater["id"]], [problem_id])
+
+        loop.run_until_complete(run())
+        print("✓ Repeat relate rejected before the unique index is confirmed")
+
+    def test_parallel_unrelates_never_negative(self, loop, db, make_user, delete_test_data):
+        """Relate then unrelate in parallel -> relates_count back to 0"""
+        async def run():
+            author = make_user("Author")
+            relaters = [make_user("Relater") for _ in range(100)]
+            problem_id = await create_test_problem(author)
+            try:
+                await asyncio.gather(*(server.relate_to_problem(problem_id, user=u) for u in relaters))
+                await asyncio.gather(*(server.unrelate_to_problem(problem_id, user=u) for u in relaters))
+
+                problem = await server.db.problems.find_one({"id": problem_id})
+                assert problem["relates_count"] == 0
+            finally:
+                await delete_test_data([author["id"]] + [u["id"] for u in relaters], [problem_id])
+
+        loop.run_until_complete(run())
+        print("✓ Parallel unrelates return relates_count to 0")
+
+
+class TestAtomicCommentsAndHelpfuls:
+    """comments_count, unique_commenters and helpful_count stay exact under concurrency"""
+
+    def test_parallel_comments_and_helpfuls(self, loop, db, make_user, delete_test_data):
+        """100 parallel comments and helpfuls are all counted"""
+        async def run():
+            author = make_user("Author")
+            commenters = [make_user("Commenter") for _ in range(100)]
+            problem_id = await create_test_problem(author)
+            try:
+                comments = await asyncio.gather(*(
+                    server.create_comment(
+                        server.CommentCreate(problem_id=problem_id, content="Same here, happens every day"), user=u
+                    )
+                    for u in commenters
+                ))
+                problem = await server.db.problems.find_one({"id": problem_id})
+                assert problem["comments_count"] == len(commenters)
+                assert problem["unique_commenters"] == len(commenters)
+
+                target_comment_id = comments[0]["id"]
+                await asyncio.gather(*(server.mark_helpful(target_comment_id, user=u) for u in commenters))
+                comment = await server.db.comments.find_one({"id": target_comment_id})
+                assert comment["helpful_count"] == len(commenters)
+            finally:
+                await delete_test_data([author["id"]] + [u["id"] for u in commenters], [problem_id])
+
+        loop.run_until_complete(run())
+        print("✓ Parallel comments and helpfuls counted exactly")
+
+
+class TestAtomicReports:
+    """reports_count is exact and auto-hide triggers at the threshold"""
+
+    def test_parallel_reports_auto_hide(self, loop, db, make_user, delete_test_data):
+        """10 parallel reports -> reports_count == 10 and problem hidden"""
+        async def run():
+            author = make_user("Author")
+            reporters = [make_user("Reporter") for _ in range(10)]
+            problem_id = await create_test_problem(author)
+            try:
+                await asyncio.gather(*(server.report_problem(problem_id, user=u) for u in reporters))
+                problem = await server.db.problems.find_one({"id": problem_id})
+                assert problem["reports_count"] == len(reporters)
+                assert problem["is_hidden"] is True
+                assert problem["status"] == "hidden"
+            finally:
+                await delete_test_data([author["id"]] + [u["id"] for u in reporters], [problem_id])
+
+        loop.run_until_complete(run())
+        print("✓ Parallel reports counted exactly and problem auto-hidden")
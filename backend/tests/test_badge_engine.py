@@ -0,0 +1,197 @@
+"""
+Test table-driven badge engine for FRIKT App
+- BADGE_RULES evaluated in memory per trigger (or list of triggers)
+- user achievements read once, new badges written with one insert_many
+- unique (user_id, badge_id) index keeps concurrent awards single
+- duplicates left before the index are dropped once, not on every startup; the scan is
+  recorded as done only once the index exists, and the furthest-folded user_stats doc is kept
+- benchmark: Mongo commands per trigger, legacy (find_one + insert per badge) vs engine
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+
+# Stats that satisfy every threshold badge
+MAXED_STATS = {
+    "current_visit_streak": 100,
+    "total_frikts_opened": 100,
+    "total_relates_given": 500,
+    "total_posts": 10,
+    "total_comments": 25,
+    "total_relates_received": 100,
+    "max_relates_on_single_post": 50,
+    "users_followed": 5,
+    "posts_per_category": {cat_id: 5 for cat_id in server.CATEGORY_IDS},
+}
+
+
+async def legacy_award_badge(user_id, badge_id):
+    """The per-badge path the engine replaced: has_badge find_one, then insert if missing"""
+    if await server.db.user_achievements.find_one({"user_id": user_id, "badge_id": badge_id}):
+        return None
+    await server.db.user_achievements.insert_one(server.UserAchievement(user_id=user_id, badge_id=badge_id).dict())
+    return badge_id
+
+
+class TestBadgeRules:
+    """In-memory rule evaluation matches the documented thresholds"""
+
+    def test_rules_cover_all_badges(self):
+        """Every badge in BADGES has exactly one rule"""
+        rule_ids = [rule[0] for rule in server.BADGE_RULES]
+        assert sorted(rule_ids) == sorted(server.BADGES.keys())
+        print(f"✓ {len(rule_ids)} badge rules cover all badges")
+
+    def test_thresholds(self, make_user):
+        """Thresholds and trigger filtering"""
+        user = make_user("Badges", created_at=server.datetime(2026, 1, 1))
+        assert server.evaluate_badge_rules(user, {"total_relates_given": 9}, "relate") == ["relater_1"]
+        assert server.evaluate_badge_rules(user, {"total_relates_given": 10}, "comment") == []
+        assert server.evaluate_badge_rules(
+            user, {"total_relates_received": 5, "max_relates_on_single_post": 20}, ["impact", "viral"]
+        ) == ["impact_5", "drama_influencer"]
+        assert server.evaluate_badge_rules(user, {"posts_per_category": {"work": 5}}, "category") == [
+            "category_work_apprentice", "category_work_master"
+        ]
+        assert server.evaluate_badge_rules(user, {}, "special") == ["og_member", "early_frikter"]
+        test_account = {**user, "name": server.TEST_ACCOUNTS[0]}
+        assert server.evaluate_badge_rules(test_account, {}, "special") == []
+        print("✓ Badge thresholds evaluated in memory")
+
+
+class TestBadgeEngineQueries:
+    """Query counts per trigger"""
+
+    def test_query_counts_per_trigger(self, loop, mongo_commands, make_user):
+        """Engine uses at most 2 user_achievements commands per check, and 0 when nothing qualifies"""
+        async def run():
+            user = make_user("Badges", created_at=server.datetime(2026, 1, 1))
+            try:
+                report = []
+                for trigger in ["visit", "explore", "relate", "create", "comment",
+                                "impact", "viral", "follow", "category", "special", "all"]:
+                    satisfied = server.evaluate_badge_rules(user, MAXED_STATS, trigger)
+                    await server.db.user_achievements.delete_many({"user_id": user["id"]})
+                    mongo_commands.clear()
+                    for badge_id in satisfied:
+                        await legacy_award_badge(user["id"], badge_id)
+                    legacy = mongo_commands["user_achievements"]
+                    await server.db.user_achievements.delete_many({"user_id": user["id"]})
+
+                    mongo_commands.clear()
+                    awarded = await server.check_and_award_badges(user["id"], user, MAXED_STATS, trigger)
+                    first = mongo_commands["user_achievements"]
+                    assert len(awarded) == len(satisfied)
+
+                    mongo_commands.clear()
+                    again = await server.check_and_award_badges(user["id"], user, MAXED_STATS, trigger)
+                    repeat = mongo_commands["user_achievements"]
+                    assert again == []
+
+                    assert first <= 2 and repeat <= 1
+                    assert first <= legacy
+                    report.append(f"  {trigger:<9} badges={len(satisfied):>2}  legacy={legacy:>3}  engine={first}  repeat={repeat}")
+
+                mongo_commands.clear()
+                assert await server.check_and_award_badges(user["id"], user, {}, "relate") == []
+                assert mongo_commands["user_achievements"] == 0
+                print("\n".join(report))
+            finally:
+                await server.db.user_achievements.delete_many({"user_id": user["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Badge engine query counts per trigger")
+
+    def test_concurrent_awards_single_achievement(self, loop, db, make_user):
+        """Parallel checks award each badge once"""
+        async def run():
+            await server.db.user_achievements.create_index([("user_id", 1), ("badge_id", 1)], unique=True)
+            user = make_user("Badges", created_at=server.datetime(2026, 1, 1))
+            stats = {"total_relates_given": 10}
+            try:
+                results = await asyncio.gather(*(
+                    server.check_and_award_badges(user["id"], user, stats, "relate") for _ in range(20)
+                ))
+                awarded = [b["badge_id"] for r in results for b in r]
+                assert sorted(awarded) == ["relater_1", "relater_10"]
+                assert await server.db.user_achievements.count_documents({"user_id": user["id"]}) == 2
+            finally:
+                await server.db.user_achievements.delete_many({"user_id": user["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Concurrent badge checks award each badge once")
+
+    def test_duplicates_dropped_once(self, loop, db):
+        """ensure_unique_index drops duplicates, builds the index, then records it as done"""
+        async def run():
+            collection = server.db[f"test_dedupe_{uuid.uuid4().hex[:6]}"]
+            job = f"drop_duplicates:{collection.name}:user_id,badge_id"
+            try:
+                await collection.insert_many([{"user_id": "u1", "badge_id": "b1"} for _ in range(3)]
+                                             + [{"user_id": "u1", "badge_id": "b2"}])
+                assert await server.ensure_unique_index(collection, ["user_id", "badge_id"]) is True
+                assert await collection.count_documents({}) == 2
+                assert (await server.db.job_state.find_one({"_id": job}))["removed"] == 2
+                assert "user_id_1_badge_id_1" in await collection.index_information()
+
+                # Later startups skip the scan; the index keeps duplicates out
+                assert await server.ensure_unique_index(collection, ["user_id", "badge_id"]) is True
+                with pytest.raises(server.DuplicateKeyError):
+                    await collection.insert_one({"user_id": "u1", "badge_id": "b1"})
+            finally:
+                await collection.drop()
+                await server.db.job_state.delete_one({"_id": job})
+                await server.db.job_leases.delete_one({"_id": job})
+
+        loop.run_until_complete(run())
+        print("✓ Duplicates dropped once")
+
+    def test_failed_index_build_is_retried(self, loop, db):
+        """Nothing is recorded as done until the index exists"""
+        async def run():
+            collection = server.db[f"test_dedupe_{uuid.uuid4().hex[:6]}"]
+            job = f"drop_duplicates:{collection.name}:user_id"
+            try:
+                # An index on the same key with other options makes the unique build fail
+                await collection.create_index("user_id", sparse=True)
+                await collection.insert_many([{"user_id": "u1"}, {"user_id": "u1"}])
+                with pytest.raises(server.OperationFailure):
+                    await server.ensure_unique_index(collection, ["user_id"])
+                assert await server.db.job_state.find_one({"_id": job}) is None
+                assert await server.db.job_leases.find_one({"_id": job, "expires_at": {"$gt": server.datetime.utcnow()}}) is None
+            finally:
+                await collection.drop()
+                await server.db.job_state.delete_one({"_id": job})
+                await server.db.job_leases.delete_one({"_id": job})
+
+        loop.run_until_complete(run())
+        print("✓ Failed index build retried on the next startup")
+
+    def test_latest_user_stats_kept(self, loop, db):
+        """Of duplicate stats docs the one folded furthest is kept"""
+        async def run():
+            collection = server.db[f"test_dedupe_{uuid.uuid4().hex[:6]}"]
+            job = f"drop_duplicates:{collection.name}:user_id"
+            seqs = [server.ObjectId() for _ in range(2)]
+            try:
+                await collection.insert_many([
+                    {"user_id": "u1", "total_posts": 1, "activity_seq": seqs[0]},
+                    {"user_id": "u1", "total_posts": 5, "activity_seq": seqs[1]},
+                    {"user_id": "u1", "total_posts": 0},
+                ])
+                await server.ensure_unique_index(collection, ["user_id"], keep={"activity_seq": -1, "_id": -1})
+                kept = await collection.find({}).to_list(None)
+                assert [d["total_posts"] for d in kept] == [5]
+            finally:
+                await collection.drop()
+                await server.db.job_state.delete_one({"_id": job})
+                await server.db.job_leases.delete_one({"_id": job})
+
+        loop.run_until_complete(run())
+        print("✓ Most recently folded stats doc kept")
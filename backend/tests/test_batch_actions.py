@@ -0,0 +1,110 @@
+"""
+Test batched offline action endpoint for FRIKT App
+- POST /api/actions/batch applies relate/unrelate, save/unsave, follow/unfollow
+  (problem or category), helpful and mark-read actions in one request
+- last action per target wins, replaying the same batch is a no-op
+- per-action results come back in request order
+
+These tests run the route handlers in-process against the database configured
+by MONGO_URL / DB_NAME (skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+
+async def create_test_problem(author):
+    problem = server.Problem(
+        user_id=author["id"],
+        user_name=author["name"],
+        title=f"TEST_batch_actions {uuid.uuid4()}",
+        category_id="work",
+    )
+    await server.db.problems.insert_one(problem.dict())
+    return problem.id
+
+
+EMPTY_LISTS = {"saved_problems": [], "followed_problems": [], "followed_categories": []}
+
+
+def batch(*actions):
+    return server.BatchActionsRequest(actions=[server.BatchAction(**a) for a in actions])
+
+
+class TestBatchActions:
+    """Grouped application of offline actions"""
+
+    def test_mixed_batch_and_replay(self, loop, db, make_user):
+        """Mixed batch applies final state per target and is idempotent on replay"""
+        async def run():
+            author = make_user("Author", **EMPTY_LISTS)
+            actor = make_user("Actor", **EMPTY_LISTS)
+            await server.db.users.insert_many([dict(author), dict(actor)])
+            problem_ids = [await create_test_problem(author) for _ in range(3)]
+            comment = server.Comment(problem_id=problem_ids[0], user_id=author["id"],
+                                     user_name=author["name"], content="Batch test comment")
+            await server.db.comments.insert_one(comment.dict())
+            notification = server.Notification(user_id=actor["id"], type="new_relate", message="test")
+            await server.db.notifications.insert_one(notification.dict())
+            try:
+                request = batch(
+                    {"type": "relate", "target_id": problem_ids[0], "client_id": "a"},
+                    {"type": "relate", "target_id": problem_ids[1]},
+                    {"type": "unrelate", "target_id": problem_ids[1]},
+                    {"type": "save", "target_id": problem_ids[2]},
+                    {"type": "follow_problem", "target_id": problem_ids[0]},
+                    {"type": "follow_category", "target_id": "work"},
+                    {"type": "helpful", "target_id": comment.id},
+                    {"type": "mark_read", "target_id": notification.id},
+                    {"type": "relate", "target_id": "missing-problem"},
+                    {"type": "bogus", "target_id": problem_ids[0]},
+                )
+                for _ in range(2):  # second run is an offline replay
+                    result = await server.apply_batch_actions(request, user=actor)
+                    results = result["results"]
+                    assert [r["index"] for r in results] == list(range(10))
+                    assert results[0]["client_id"] == "a"
+                    assert all(r["success"] for r in results[:8])
+                    assert results[8]["error"] == "Problem not found"
+                    assert results[9]["error"] == "Unknown action type"
+
+                problems = {p["id"]: p async for p in server.db.problems.find({"id": {"$in": problem_ids}})}
+                assert problems[problem_ids[0]]["relates_count"] == 1
+                assert problems[problem_ids[1]]["relates_count"] == 0
+                assert await server.db.relates.count_documents({"user_id": actor["id"]}) == 1
+
+                user_doc = await server.db.users.find_one({"id": actor["id"]})
+                assert user_doc["saved_problems"] == [problem_ids[2]]
+                assert user_doc["followed_problems"] == [problem_ids[0]]
+                assert user_doc["followed_categories"] == ["work"]
+
+                comment_doc = await server.db.comments.find_one({"id": comment.id})
+                assert comment_doc["helpful_count"] == 1
+                notification_doc = await server.db.notifications.find_one({"id": notification.id})
+                assert notification_doc["is_read"] is True
+            finally:
+                await server.db.problems.delete_many({"id": {"$in": problem_ids}})
+                await server.db.relates.delete_many({"problem_id": {"$in": problem_ids}})
+                await server.db.comments.delete_many({"id": comment.id})
+                await server.db.helpfuls.delete_many({"comment_id": comment.id})
+                await server.db.notifications.delete_many({"user_id": {"$in": [author["id"], actor["id"]]}})
+                await server.db.users.delete_many({"id": {"$in": [author["id"], actor["id"]]}})
+                await server.db.user_stats.delete_many({"user_id": {"$in": [author["id"], actor["id"]]}})
+                await server.db.user_badges.delete_many({"user_id": {"$in": [author["id"], actor["id"]]}})
+
+        loop.run_until_complete(run())
+        print("✓ Mixed action batch applied and replay is idempotent")
+
+    def test_batch_size_limit(self, loop, db, make_user):
+        """More than MAX_BATCH_ACTIONS actions -> 400"""
+        async def run():
+            actor = make_user("Actor", **EMPTY_LISTS)
+            request = batch(*[{"type": "save", "target_id": str(i)} for i in range(server.MAX_BATCH_ACTIONS + 1)])
+            with pytest.raises(server.HTTPException) as exc:
+                await server.apply_batch_actions(request, user=actor)
+            assert exc.value.status_code == 400
+
+        loop.run_until_complete(run())
+        print("✓ Oversized batch rejected")
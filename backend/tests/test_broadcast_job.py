@@ -0,0 +1,216 @@
+"""
+Test background broadcast job for FRIKT App
+- POST /admin/broadcast-notification records the broadcast and returns immediately
+- recipients are streamed in pages; pushes go out in Expo chunks with bulk badge counts
+- progress and delivery stats are checkpointed on broadcast_logs
+- an interrupted job resumes from its cursor without duplicating in-app notifications
+- a job that keeps failing backs off and ends up failed
+- a job whose lease was taken over stops without checkpointing
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+from test_push_client import ExpoStandIn  # noqa: E402
+
+ADMIN = {"id": "TEST_Broadcast_admin", "email": "admin@example.com"}
+
+
+async def seed_recipients():
+    tag = uuid.uuid4().hex[:6]
+    user_ids = [f"TEST_Broadcast_{tag}_{i}" for i in range(5)]
+    tokens = []
+    for i, uid in enumerate(user_ids):
+        for j in range(2 if i == 0 else 1):
+            tokens.append({"id": str(uuid.uuid4()), "user_id": uid, "is_active": True,
+                           "token": f"ExponentPushToken[{tag}{i}{j}]"})
+    await server.db.push_tokens.insert_many(tokens)
+    # User 4 has push turned off
+    await server.db.notification_settings.insert_one({"user_id": user_ids[4], "push_notifications": False})
+    # User 1 has unread notifications already
+    await server.db.notifications.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": user_ids[1], "type": "new_relate", "is_read": False} for _ in range(3)
+    ])
+    return user_ids
+
+
+async def cleanup(user_ids):
+    db = server.db
+    await db.push_tokens.delete_many({"user_id": {"$in": user_ids}})
+    await db.notification_settings.delete_many({"user_id": {"$in": user_ids}})
+    await db.notifications.delete_many({"user_id": {"$in": user_ids}})
+    await db.broadcast_logs.delete_many({"admin_id": ADMIN["id"]})
+    await db.admin_audit_logs.delete_many({"admin_id": ADMIN["id"]})
+
+
+class TestBroadcastJob:
+    """Background broadcast delivery"""
+
+    def test_broadcast_runs_in_background(self, loop, db):
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            server.BROADCAST_PAGE_USERS = 2
+            user_ids = await seed_recipients()
+            try:
+                response = await server.broadcast_notification(
+                    server.BroadcastNotificationRequest(title="Hello", body="A broadcast test"), admin=ADMIN
+                )
+                assert response["success"] is True
+                assert response["recipient_count"] == 4
+
+                for _ in range(100):
+                    log = await server.db.broadcast_logs.find_one({"id": response["broadcast_id"]})
+                    if log["status"] == "completed":
+                        break
+                    await asyncio.sleep(0.05)
+                assert log["status"] == "completed"
+                assert log["stats"]["recipients"] == 4
+                assert log["stats"]["notifications_created"] == 4
+                assert log["stats"]["messages_sent"] == 5
+                assert log["stats"]["tickets_ok"] == 5
+                assert log["tokens_count"] == 5
+                assert log["cursor"] == user_ids[-1]
+
+                assert await server.db.notifications.count_documents(
+                    {"broadcast_id": log["id"], "user_id": {"$in": user_ids}}
+                ) == 4
+                assert sum(r["count"] for r in stand_in.requests) == 5
+            finally:
+                stand_in.close()
+                await cleanup(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Broadcast delivered by a background job")
+
+    def test_resume_from_cursor(self, loop, db):
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            server.BROADCAST_PAGE_USERS = 2
+            user_ids = await seed_recipients()
+            broadcast_id = str(uuid.uuid4())
+            try:
+                # Interrupted after the first user; user 2 got the in-app notification
+                # before the crash but the page wasn't checkpointed
+                await server.db.broadcast_logs.insert_one({
+                    "id": broadcast_id, "admin_id": ADMIN["id"], "admin_email": ADMIN["email"],
+                    "title": "Hello", "body": "Resumed", "sent_at": server.datetime.utcnow(),
+                    "recipient_count": 4, "tokens_count": 2, "status": "running", "cursor": user_ids[0],
+                    "stats": {"users_processed": 1, "recipients": 1, "notifications_created": 1,
+                              "messages_sent": 2, "tickets_ok": 2, "tickets_error": 0},
+                })
+                await server.db.notifications.insert_one({
+                    "id": str(uuid.uuid4()), "user_id": user_ids[2], "type": "broadcast",
+                    "is_read": False, "broadcast_id": broadcast_id,
+                })
+
+                await server.resume_broadcast_jobs()
+                for _ in range(100):
+                    log = await server.db.broadcast_logs.find_one({"id": broadcast_id})
+                    if log["status"] == "completed":
+                        break
+                    await asyncio.sleep(0.05)
+                assert log["status"] == "completed"
+                assert log["stats"]["users_processed"] == 5
+                assert log["stats"]["notifications_created"] == 3  # user 0, then users 1 and 3
+                assert log["tokens_count"] == 5
+                assert sum(r["count"] for r in stand_in.requests) == 3  # users 1-3
+
+                assert await server.db.notifications.count_documents(
+                    {"broadcast_id": broadcast_id, "user_id": user_ids[2]}
+                ) == 1
+                assert await server.db.notifications.count_documents(
+                    {"broadcast_id": broadcast_id, "user_id": user_ids[0]}
+                ) == 0
+            finally:
+                stand_in.close()
+                await cleanup(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Interrupted broadcast resumed from its cursor")
+
+    def test_failing_broadcast_backs_off_then_fails(self, loop, db):
+        async def run():
+            broadcast_id = str(uuid.uuid4())
+            send_page = server.send_broadcast_page
+
+            async def failing_page(broadcast, page):
+                raise RuntimeError("Expo down")
+
+            server.send_broadcast_page = failing_page
+            user_ids = await seed_recipients()
+            try:
+                await server.db.broadcast_logs.insert_one({
+                    "id": broadcast_id, "admin_id": ADMIN["id"], "admin_email": ADMIN["email"],
+                    "title": "Hello", "body": "Failing", "sent_at": server.datetime.utcnow(),
+                    "recipient_count": 4, "tokens_count": 0, "status": "running", "cursor": None,
+                    "attempts": 0, "next_attempt_at": None, "stats": {},
+                })
+                await server.run_broadcast_job(broadcast_id)
+                log = await server.db.broadcast_logs.find_one({"id": broadcast_id})
+                assert log["status"] == "running" and log["attempts"] == 1
+                assert log["next_attempt_at"] > server.datetime.utcnow()
+
+                # Not due yet: the resume pass leaves it alone
+                await server.resume_broadcast_jobs()
+                await asyncio.sleep(0.1)
+                log = await server.db.broadcast_logs.find_one({"id": broadcast_id})
+                assert log["attempts"] == 1
+
+                for _ in range(server.BROADCAST_MAX_ATTEMPTS - 1):
+                    await server.run_broadcast_job(broadcast_id)
+                log = await server.db.broadcast_logs.find_one({"id": broadcast_id})
+                assert log["status"] == "failed"
+                assert log["attempts"] == server.BROADCAST_MAX_ATTEMPTS
+                assert log["last_error"] == "Expo down"
+            finally:
+                server.send_broadcast_page = send_page
+                await cleanup(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Failing broadcast retried with backoff, then marked failed")
+
+    def test_lost_lease_stops_the_job(self, loop, db):
+        async def run():
+            broadcast_id = str(uuid.uuid4())
+            lease = f"broadcast:{broadcast_id}"
+            send_page = server.send_broadcast_page
+            pages = []
+
+            async def slow_page(broadcast, page):
+                # The lease expired mid-page and another worker resumed the broadcast
+                pages.append(page)
+                await server.db.job_leases.update_one(
+                    {"_id": lease},
+                    {"$set": {"owner": "other-worker", "expires_at": server.datetime.utcnow() + server.timedelta(minutes=5)}}
+                )
+                return {"stats.users_processed": len(page)}
+
+            server.send_broadcast_page = slow_page
+            server.BROADCAST_PAGE_USERS = 2
+            user_ids = await seed_recipients()
+            try:
+                await server.db.broadcast_logs.insert_one({
+                    "id": broadcast_id, "admin_id": ADMIN["id"], "admin_email": ADMIN["email"],
+                    "title": "Hello", "body": "Taken over", "sent_at": server.datetime.utcnow(),
+                    "recipient_count": 4, "tokens_count": 0, "status": "running", "cursor": None,
+                    "attempts": 0, "next_attempt_at": None, "stats": {},
+                })
+                await server.run_broadcast_job(broadcast_id)
+                assert len(pages) == 1
+                log = await server.db.broadcast_logs.find_one({"id": broadcast_id})
+                assert (log["status"], log["cursor"], log["attempts"]) == ("running", None, 0)
+                assert (await server.db.job_leases.find_one({"_id": lease}))["owner"] == "other-worker"
+            finally:
+                server.send_broadcast_page = send_page
+                await server.db.job_leases.delete_one({"_id": lease})
+                await cleanup(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Broadcast stops when its lease is taken over")
@@ -0,0 +1,170 @@
+"""
+Test continuous counter-drift reconciler for FRIKT App
+- problems (relates/comments/unique commenters), comments (helpful_count) and user_stats
+  are walked with resumable cursors and drift is repaired
+- user_stats drift accounts for activity events the aggregator hasn't folded yet
+- divergence per collection/field is recorded in job_state
+- drift isn't repaired while domain events from before the check are still pending
+- soft delete, hide and unhide move comments_count / unique_commenters with the comment
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+server.RECONCILER_CONFIRM_DELAY_SECONDS = 0
+server.RECONCILER_SETTLE_TIMEOUT_SECONDS = 0
+server.RECONCILER_BATCH_SIZE = 2
+
+
+class TestCounterReconciler:
+    """Drift found and repaired across ticks"""
+
+    def test_repairs_drift_and_records_divergence(self, loop, db):
+        async def run():
+            uid = str(uuid.uuid4())[:8]
+            author = f"TEST_Reconcile_{uid}"
+            relater = f"TEST_Reconcile_r{uid}"
+            problems = [
+                server.Problem(user_id=author, user_name="TestReconcile", title=f"TEST_reconcile {i}",
+                               category_id="work").dict()
+                for i in range(3)
+            ]
+            problems[0]["relates_count"] = 5  # actual: 1
+            comment = server.Comment(problem_id=problems[1]["id"], user_id=relater, user_name="R",
+                                     content="reconciler test comment").dict()
+            comment["helpful_count"] = 4  # actual: 1
+            problems[1]["comments_count"] = 1
+            problems[1]["unique_commenters"] = 1
+            try:
+                await db.job_state.delete_one({"_id": server.RECONCILER_JOB})
+                # No event workers run here; settle events other tests left pending
+                await db.domain_events.update_many({"status": "pending"}, {"$set": {"status": "done"}})
+                await db.problems.insert_many([dict(p) for p in problems])
+                await db.comments.insert_one(dict(comment))
+                await db.relates.insert_one({"id": str(uuid.uuid4()), "problem_id": problems[0]["id"], "user_id": relater})
+                await db.helpfuls.insert_one({"id": str(uuid.uuid4()), "comment_id": comment["id"], "user_id": author})
+                # Author: 3 posts, but stats say 1; one post_created event not folded yet
+                await db.user_stats.insert_one({**server.UserStats(user_id=author).dict(),
+                                                "total_posts": 1, "posts_per_category": {"work": 1}})
+                await db.activity_events.insert_one({"user_id": author, "type": "post_created", "category_id": "work",
+                                                     "created_at": server.datetime.utcnow()})
+                # Relater stats are accurate
+                await db.user_stats.insert_one({**server.UserStats(user_id=relater).dict(),
+                                                "total_relates_given": 1, "total_comments": 1})
+
+                for _ in range(50):
+                    await server.run_counter_reconciler()
+                    state = await db.job_state.find_one({"_id": server.RECONCILER_JOB})
+                    if all(state.get("passes", {}).get(c) for c in server.RECONCILER_TARGETS):
+                        break
+
+                stored = await db.problems.find_one({"id": problems[0]["id"]})
+                assert stored["relates_count"] == 1
+                assert (await db.comments.find_one({"id": comment["id"]}))["helpful_count"] == 1
+
+                # Stored + unfolded event == actual, and folding it later stays correct
+                author_stats = await db.user_stats.find_one({"user_id": author})
+                assert author_stats["total_posts"] == 2
+                assert author_stats["posts_per_category"]["work"] == 2
+                relater_stats = await db.user_stats.find_one({"user_id": relater})
+                assert relater_stats["total_relates_given"] == 1
+
+                divergence = state["divergence"]
+                assert divergence["problems"]["relates_count"]["drifted"] >= 1
+                assert divergence["comments"]["helpful_count"]["delta"] <= -3
+                assert divergence["user_stats"]["total_posts"]["drifted"] >= 1
+                assert divergence["user_stats"]["posts_per_category_work"]["drifted"] >= 1
+                assert relater not in [s["id"] for s in state["recent_drift"]]
+            finally:
+                ids = [p["id"] for p in problems]
+                await db.problems.delete_many({"id": {"$in": ids}})
+                await db.comments.delete_many({"problem_id": {"$in": ids}})
+                await db.relates.delete_many({"problem_id": {"$in": ids}})
+                await db.helpfuls.delete_many({"comment_id": comment["id"]})
+                await db.user_stats.delete_many({"user_id": {"$in": [author, relater]}})
+                await db.activity_events.delete_many({"user_id": {"$in": [author, relater]}})
+                await db.job_state.delete_one({"_id": server.RECONCILER_JOB})
+
+        loop.run_until_complete(run())
+        print("✓ Reconciler repairs drift and records divergence")
+
+    def test_waits_for_pending_events(self, loop, db):
+        async def run():
+            problem = server.Problem(user_id=f"TEST_Reconcile_{uuid.uuid4().hex[:8]}", user_name="TestReconcile",
+                                     title="TEST_reconcile pending", category_id="work").dict()
+            problem["relates_count"] = 1  # relate written, its event not handled yet
+            event_id = str(uuid.uuid4())
+            try:
+                await db.domain_events.update_many({"status": "pending"}, {"$set": {"status": "done"}})
+                await db.problems.insert_one(dict(problem))
+                await db.domain_events.insert_one({"_id": event_id, "name": "problem_related", "payload": {},
+                                                   "status": "pending", "created_at": server.datetime.utcnow()})
+                after = problem["id"][:-1]  # cursor just before this problem
+                _, _, drift = await server.reconcile_batch("problems", after)
+                assert problem["id"] not in drift
+                assert (await db.problems.find_one({"id": problem["id"]}))["relates_count"] == 1
+
+                await db.domain_events.update_one({"_id": event_id}, {"$set": {"status": "done"}})
+                _, _, drift = await server.reconcile_batch("problems", after)
+                assert problem["id"] in drift
+                assert (await db.problems.find_one({"id": problem["id"]}))["relates_count"] == 0
+            finally:
+                await db.problems.delete_one({"id": problem["id"]})
+                await db.domain_events.delete_one({"_id": event_id})
+
+        loop.run_until_complete(run())
+        print("✓ Drift confirmed only after pending events are handled")
+
+    def test_comment_status_changes_keep_counters_exact(self, loop, db):
+        async def run():
+            uid = uuid.uuid4().hex[:8]
+            admin = {"id": f"TEST_Reconcile_admin{uid}", "email": f"admin_{uid}@example.com"}
+            alice, bob = f"TEST_Reconcile_a{uid}", f"TEST_Reconcile_b{uid}"
+            problem = server.Problem(user_id=alice, user_name="TestReconcile", title="TEST_reconcile statuses",
+                                     category_id="work").dict()
+            comments = [
+                server.Comment(problem_id=problem["id"], user_id=user_id, user_name="C", content=f"status test {i}").dict()
+                for i, user_id in enumerate([alice, alice, bob])
+            ]
+            reply = server.Comment(problem_id=problem["id"], user_id=bob, user_name="C", content="reply",
+                                   parent_comment_id=comments[0]["id"]).dict()
+            problem.update(comments_count=4, unique_commenters=2)
+            try:
+                await db.problems.insert_one(dict(problem))
+                await db.comments.insert_many([dict(c) for c in comments + [reply]])
+
+                async def counters():
+                    stored = await db.problems.find_one({"id": problem["id"]})
+                    assert not await server.find_problem_drift([problem["id"]])
+                    return stored["comments_count"], stored["unique_commenters"]
+
+                # Soft delete (has a reply): alice still has another comment
+                await server.delete_comment(comments[0]["id"], user={"id": alice})
+                assert await counters() == (3, 2)
+                # Hiding bob's only top-level comment keeps his reply counted
+                await server.hide_comment(comments[2]["id"], admin=admin)
+                assert await counters() == (2, 2)
+                await server.hide_comment(comments[2]["id"], admin=admin)
+                assert await counters() == (2, 2)
+                await server.hide_comment(comments[1]["id"], admin=admin)
+                assert await counters() == (1, 1)
+                await server.unhide_comment(comments[1]["id"], admin=admin)
+                assert await counters() == (2, 2)
+                # Deleting bob's reply counts him out; deleting his hidden comment changes nothing
+                await server.delete_comment(reply["id"], user={"id": bob})
+                assert await counters() == (1, 1)
+                await server.delete_comment(comments[2]["id"], user={"id": bob})
+                assert await counters() == (1, 1)
+            finally:
+                await db.problems.delete_one({"id": problem["id"]})
+                await db.comments.delete_many({"problem_id": problem["id"]})
+                await db.activity_events.delete_many({"user_id": bob})
+                await db.admin_audit_logs.delete_many({"admin_id": admin["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Soft delete, hide and unhide keep comment counters exact")
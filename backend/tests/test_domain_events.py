@@ -0,0 +1,218 @@
+"""
+Test post-commit domain event pipeline for FRIKT App
+- relate/comment/problem endpoints commit the core write and emit an event
+- author gamification, notifications and pushes run in the event worker pool
+- relater badges stay on the request path (returned in the response)
+- failed handlers are retried with backoff, then dead-lettered; events left pending are recovered
+- handlers write keyed on the event id, so a retry notifies once
+
+These tests run the route handlers in-process against the database configured
+by MONGO_URL / DB_NAME (skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import time
+import uuid
+
+server = pytest.importorskip("server")
+
+
+async def create_test_problem(author):
+    await server.db.users.insert_one(dict(author))
+    problem = server.Problem(
+        user_id=author["id"],
+        user_name=author["name"],
+        title=f"TEST_domain_events {uuid.uuid4()}",
+        category_id="work",
+    )
+    await server.db.problems.insert_one(problem.dict())
+    return problem.id
+
+
+class TestRelateEvents:
+    """relate.created side effects run after the response"""
+
+    def test_relate_side_effects_processed_by_workers(self, loop, db, make_user, delete_test_data):
+        """Author stats and owner notification are written by the event workers"""
+        async def run():
+            server.start_event_workers()
+            author = make_user("Author")
+            relaters = [make_user("Relater") for _ in range(20)]
+            problem_id = await create_test_problem(author)
+            try:
+                latencies = []
+                for u in relaters:
+                    start = time.perf_counter()
+                    result = await server.relate_to_problem(problem_id, user=u)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    assert "newly_awarded_badges" in result
+
+                await asyncio.wait_for(server.get_event_queue().join(), timeout=30)
+                # Author stats come from the activity log once the aggregator folds it
+                server.ACTIVITY_AGGREGATOR_LAG_SECONDS = -1
+                await server.run_activity_aggregator()
+
+                author_stats = await server.db.user_stats.find_one({"user_id": author["id"]})
+                assert author_stats["total_relates_received"] == len(relaters)
+                assert author_stats["max_relates_on_single_post"] == len(relaters)
+
+                # First relate is sent immediately, the rest are batched
+                notifications = await server.db.notifications.count_documents(
+                    {"user_id": author["id"], "problem_id": problem_id, "type": "new_relate"}
+                )
+                assert notifications == 1
+
+                latencies.sort()
+                print(f"  relate p50: {latencies[len(latencies) // 2]:.1f} ms")
+            finally:
+                await delete_test_data([author["id"]] + [u["id"] for u in relaters], [problem_id])
+
+        loop.run_until_complete(run())
+        print("✓ relate.created side effects processed by event workers")
+
+    def test_failed_handlers_are_retried(self, loop, db):
+        """A failing handler is retried after its backoff, later handlers still run once,
+        and the event is done only when every handler is"""
+        async def run():
+            calls = {"flaky": 0, "after": 0}
+
+            async def flaky(event):
+                calls["flaky"] += 1
+                if calls["flaky"] == 1:
+                    raise RuntimeError("after the first write")
+
+            async def after(event):
+                calls["after"] += 1
+
+            server._event_handlers["test.event"] = [flaky, after]
+            try:
+                event_id = f"TEST_event_{uuid.uuid4().hex[:8]}"
+                await server.db.domain_events.insert_one({"_id": event_id, "name": "test.event", "status": "pending"})
+                await server.run_event_handlers("test.event", {}, event_id)
+                assert calls == {"flaky": 1, "after": 1}
+
+                run_doc = await server.db.event_handler_runs.find_one({"_id": f"{event_id}:flaky"})
+                assert (run_doc["status"], run_doc["attempts"], run_doc["error"]) == ("failed", 1, "after the first write")
+                event = await server.db.domain_events.find_one({"_id": event_id})
+                assert event["status"] == "pending" and event["next_attempt_at"] == run_doc["next_attempt_at"]
+
+                # Delivered again before the backoff has passed: nothing runs
+                await server.run_event_handlers("test.event", {}, event_id)
+                assert calls == {"flaky": 1, "after": 1}
+
+                await server.db.event_handler_runs.update_one(
+                    {"_id": f"{event_id}:flaky"}, {"$set": {"next_attempt_at": server.datetime.utcnow()}}
+                )
+                await server.db.domain_events.update_one(
+                    {"_id": event_id}, {"$set": {"next_attempt_at": server.datetime.utcnow()}}
+                )
+                await server.recover_domain_events()
+                assert calls == {"flaky": 2, "after": 1}
+                assert (await server.db.event_handler_runs.find_one({"_id": f"{event_id}:flaky"}))["status"] == "done"
+                assert (await server.db.domain_events.find_one({"_id": event_id}))["status"] == "done"
+            finally:
+                server._event_handlers.pop("test.event", None)
+                await server.db.domain_events.delete_many({"name": "test.event"})
+                await server.db.event_handler_runs.delete_many({"event": "test.event"})
+
+        loop.run_until_complete(run())
+        print("✓ Failed event handlers retried")
+
+    def test_lost_and_exhausted_runs(self, loop, db):
+        """A run left running by a dead process is retried; one that keeps failing is dead-lettered"""
+        async def run():
+            calls = {"lost": 0, "broken": 0}
+
+            async def lost(event):
+                calls["lost"] += 1
+
+            async def broken(event):
+                calls["broken"] += 1
+                raise RuntimeError("always")
+
+            server._event_handlers["test.event"] = [lost, broken]
+            max_attempts = server.EVENT_HANDLER_MAX_ATTEMPTS
+            server.EVENT_HANDLER_MAX_ATTEMPTS = 2
+            try:
+                event_id = f"TEST_event_{uuid.uuid4().hex[:8]}"
+                past = server.datetime.utcnow() - server.timedelta(seconds=1)
+                await server.db.domain_events.insert_one({"_id": event_id, "name": "test.event", "status": "pending"})
+                # Claimed by a process that died mid-handler
+                await server.db.event_handler_runs.insert_one({
+                    "_id": f"{event_id}:lost", "event": "test.event", "status": "running", "attempts": 1, "claimed_until": past,
+                })
+                await server.run_event_handlers("test.event", {}, event_id)
+                assert calls == {"lost": 1, "broken": 1}
+                assert (await server.db.event_handler_runs.find_one({"_id": f"{event_id}:lost"}))["attempts"] == 2
+
+                await server.db.event_handler_runs.update_one({"_id": f"{event_id}:broken"}, {"$set": {"next_attempt_at": past}})
+                await server.run_event_handlers("test.event", {}, event_id)
+                assert calls == {"lost": 1, "broken": 2}
+                run_doc = await server.db.event_handler_runs.find_one({"_id": f"{event_id}:broken"})
+                assert (run_doc["status"], run_doc["error"]) == ("dead", "always")
+                assert (await server.db.domain_events.find_one({"_id": event_id}))["status"] == "done"
+            finally:
+                server.EVENT_HANDLER_MAX_ATTEMPTS = max_attempts
+                server._event_handlers.pop("test.event", None)
+                await server.db.domain_events.delete_many({"name": "test.event"})
+                await server.db.event_handler_runs.delete_many({"event": "test.event"})
+
+        loop.run_until_complete(run())
+        print("✓ Lost runs retried, exhausted runs dead-lettered")
+
+    def test_retried_handler_notifies_once(self, loop, db, make_user, delete_test_data):
+        """Running the owner-notification handler again for the same event writes nothing new"""
+        async def run():
+            owner, actor = make_user("Owner"), make_user("Actor")
+            await server.db.users.insert_many([dict(owner), dict(actor)])
+            event = {
+                "event_id": f"TEST_event_{uuid.uuid4().hex[:8]}",
+                "problem_id": f"TEST_problem_{uuid.uuid4().hex[:8]}",
+                "problem_title": "TEST_domain_events retry",
+                "problem_user_id": owner["id"],
+                "actor_id": actor["id"],
+                "actor_name": actor["name"],
+            }
+            try:
+                for _ in range(2):
+                    await server.handle_relate_owner_notification(event)
+                assert await server.db.notifications.count_documents({"user_id": owner["id"], "type": "new_relate"}) == 1
+                assert await server.db.push_outbox.count_documents({"user_id": owner["id"]}) == 1
+                batch = await server.db.pending_notification_batches.find_one({"recipient_user_id": owner["id"]})
+                assert batch["user_ids"] == []
+            finally:
+                await server.db.push_outbox.delete_many({"user_id": owner["id"]})
+                await server.db.notification_counters.delete_many({"user_id": owner["id"]})
+                await delete_test_data([owner["id"], actor["id"]], [event["problem_id"]])
+
+        loop.run_until_complete(run())
+        print("✓ Retried handler notifies once")
+
+    def test_pending_events_are_recovered(self, loop, db):
+        """Events left pending by a stopped process are run by the recovery job"""
+        async def run():
+            seen = []
+
+            async def handler(event):
+                seen.append(event["n"])
+
+            server._event_handlers["test.event"] = [handler]
+            try:
+                stale = server.datetime.utcnow() - server.timedelta(seconds=server.EVENT_RECOVERY_AFTER_SECONDS + 1)
+                await server.db.domain_events.insert_many([
+                    {"_id": f"TEST_event_{uuid.uuid4().hex[:8]}", "name": "test.event", "payload": {"n": 1},
+                     "status": "pending", "created_at": stale, "expires_at": server.datetime.utcnow() + server.EVENT_RETENTION},
+                    {"_id": f"TEST_event_{uuid.uuid4().hex[:8]}", "name": "test.event", "payload": {"n": 2},
+                     "status": "pending", "created_at": server.datetime.utcnow(), "expires_at": server.datetime.utcnow() + server.EVENT_RETENTION},
+                ])
+                await server.recover_domain_events()
+                assert seen == [1]
+                assert await server.db.domain_events.count_documents({"name": "test.event", "status": "pending"}) == 1
+            finally:
+                server._event_handlers.pop("test.event", None)
+                await server.db.domain_events.delete_many({"name": "test.event"})
+                await server.db.event_handler_runs.delete_many({"event": "test.event"})
+
+        loop.run_until_complete(run())
+        print("✓ Pending domain events recovered")
@@ -0,0 +1,211 @@
+"""
+Test email outbox for FRIKT App
+- password reset mail is queued and sent through the Resend REST API by outbox workers
+- admin report alerts to the same recipient are coalesced into one digest
+- 5xx / 429 responses are retried with backoff; 4xx responses are dead-lettered
+- rendered templates escape user input; parsed templates are cached
+- a worker claims no more entries than it can have in flight
+- weekly digests go out through the batch endpoint; requests are paced to the rate cap
+
+The stand-in (ResendStandIn below) accepts POST /emails and /emails/batch like Resend
+and can be told to fail the next requests.
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_Email_admin"}
+
+
+class ResendStandIn:
+    """Local HTTP server speaking the Resend send-email API"""
+
+    def __init__(self):
+        self.emails = []
+        self.paths = []
+        self.fail_with = []  # status codes for the next requests
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                message = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if stand_in.fail_with:
+                    status, payload = stand_in.fail_with.pop(0), {"message": "failed"}
+                else:
+                    assert self.headers["Authorization"] == f"Bearer {server.RESEND_API_KEY}"
+                    stand_in.paths.append(self.path)
+                    if self.path == "/emails/batch":
+                        stand_in.emails.extend(message)
+                        status, payload = 200, {"data": [{"id": str(uuid.uuid4())} for _ in message]}
+                    else:
+                        stand_in.emails.append(message)
+                        status, payload = 200, {"id": str(uuid.uuid4())}
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def use_stand_in():
+    stand_in = ResendStandIn()
+    server.EMAIL_REQUESTS_PER_SECOND = 100
+    server.RESEND_API_URL = stand_in.url
+    server.RESEND_API_KEY = "re_test_key"
+    return stand_in
+
+
+async def make_due(recipient):
+    await server.db.email_outbox.update_many({"to": recipient}, {"$set": {"next_attempt_at": server.datetime.utcnow()}})
+
+
+class TestEmailOutbox:
+    """Queued delivery, digests and retries"""
+
+    def test_password_reset_and_admin_digest(self, loop, db):
+        async def run():
+            stand_in = use_stand_in()
+            tag = uuid.uuid4().hex[:6]
+            user_email, admin_email = f"test_email_{tag}@example.com", f"admin_{tag}@example.com"
+            try:
+                assert await server.send_password_reset_email(user_email, "123456", "<b>Sam</b>") is True
+                for i in range(3):
+                    await server.enqueue_admin_alert_email(admin_email, {
+                        "reporter_name": f"Reporter {i}", "target_type": "problem", "target_id": f"p{i}", "reason": "spam",
+                    })
+                # Digest waits for its window; the reset email goes out now
+                assert await server.process_email_outbox() == 1
+                assert [e["to"] for e in stand_in.emails] == [[user_email]]
+                assert "123456" in stand_in.emails[0]["html"]
+                assert "&lt;b&gt;Sam&lt;/b&gt;" in stand_in.emails[0]["html"]
+
+                await make_due(admin_email)
+                assert await server.process_email_outbox() == 1
+                digest = stand_in.emails[1]
+                assert digest["to"] == [admin_email]
+                assert digest["subject"] == "[FRIKT] 3 new reports"
+                assert all(f"Reporter {i}" in digest["html"] for i in range(3))
+
+                # Rendering again reuses the parsed templates, not rendered output
+                hits = server.email_template.cache_info().hits
+                server.build_email({"kind": "admin_alert_digest", "to": admin_email, "items": [
+                    {"reporter_name": "Reporter 0", "target_type": "problem", "target_id": "p0", "reason": "spam"}
+                ]})
+                assert server.email_template.cache_info().hits == hits + 2
+            finally:
+                stand_in.close()
+                await server.db.email_outbox.delete_many({"to": {"$in": [user_email, admin_email]}})
+
+        loop.run_until_complete(run())
+        print("✓ Reset email sent, admin alerts coalesced into a digest")
+
+    def test_retry_and_dead_letter(self, loop, db):
+        async def run():
+            stand_in = use_stand_in()
+            tag = uuid.uuid4().hex[:6]
+            flaky, bad = f"flaky_{tag}@example.com", f"bad_{tag}@example.com"
+            try:
+                stand_in.fail_with = [503]
+                await server.enqueue_email(flaky, "Hello", "<p>Hi</p>")
+                assert await server.process_email_outbox() == 0
+                entry = await server.db.email_outbox.find_one({"to": flaky})
+                assert (entry["status"], entry["attempts"], entry["last_error"]) == ("pending", 1, "retry:HTTP 503")
+                assert entry["next_attempt_at"] > server.datetime.utcnow()
+
+                await make_due(flaky)
+                assert await server.process_email_outbox() == 1
+                assert (await server.db.email_outbox.find_one({"to": flaky}))["status"] == "sent"
+
+                stand_in.fail_with = [422]
+                await server.enqueue_email(bad, "Hello", "<p>Hi</p>")
+                await server.process_email_outbox()
+                entry = await server.db.email_outbox.find_one({"to": bad})
+                assert entry["status"] == "dead" and entry["attempts"] == 1
+                outbox = await server.get_email_outbox(admin=ADMIN)
+                assert entry["id"] in [e["id"] for e in outbox["recent_dead"]]
+            finally:
+                stand_in.close()
+                await server.db.email_outbox.delete_many({"to": {"$in": [flaky, bad]}})
+
+        loop.run_until_complete(run())
+        print("✓ Transient failures retried, permanent failures dead-lettered")
+
+    def test_claim_is_capped_at_in_flight(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            recipients = [f"claim_{tag}_{i}@example.com" for i in range(server.EMAIL_MAX_IN_FLIGHT + 2)]
+            server.RESEND_API_KEY = "re_test_key"
+            try:
+                await server.enqueue_emails([{"to": r, "subject": "Hello", "html": "<p>Hi</p>"} for r in recipients])
+                claimed = await server.claim_email_outbox(server.datetime.utcnow())
+                assert 0 < len(claimed) <= server.EMAIL_MAX_IN_FLIGHT
+            finally:
+                await server.db.email_outbox.delete_many({"to": {"$in": recipients}})
+
+        loop.run_until_complete(run())
+        print("✓ Claims no more emails than can be in flight")
+
+    def test_digests_sent_in_batches(self, loop, db):
+        async def run():
+            stand_in = use_stand_in()
+            tag = uuid.uuid4().hex[:6]
+            recipients = [f"digest_{tag}_{i}@example.com" for i in range(3)]
+            bad = [f"digest_bad_{tag}_{i}@example.com" for i in range(2)]
+            try:
+                await server.enqueue_emails([{"to": r, "subject": "Your week", "html": "<p>Hi</p>"} for r in recipients],
+                                            kind="weekly_digest")
+                assert await server.process_email_outbox() == 3
+                assert stand_in.paths == ["/emails/batch"]
+                assert sorted(e["to"][0] for e in stand_in.emails) == recipients
+                assert await server.db.email_outbox.count_documents({"to": {"$in": recipients}, "status": "sent"}) == 3
+
+                # A rejected batch is retried message by message, so only the bad one dead-letters
+                stand_in.fail_with = [422, 422]
+                await server.enqueue_emails([{"to": r, "subject": "Your week", "html": "<p>Hi</p>"} for r in bad],
+                                            kind="weekly_digest")
+                assert await server.process_email_outbox() == 1
+                statuses = {e["to"]: e["status"] async for e in server.db.email_outbox.find({"to": {"$in": bad}})}
+                assert sorted(statuses.values()) == ["dead", "sent"]
+            finally:
+                stand_in.close()
+                await server.db.email_outbox.delete_many({"to": {"$in": recipients + bad}})
+
+        loop.run_until_complete(run())
+        print("✓ Digests sent through the batch endpoint")
+
+
+class TestEmailRateCap:
+    """Pacing of Resend requests"""
+
+    def test_requests_are_spaced(self, loop):
+        async def run():
+            server.EMAIL_REQUESTS_PER_SECOND = 20
+            started = time.monotonic()
+            for _ in range(4):
+                await server.wait_for_email_slot()
+            assert time.monotonic() - started >= 3 / 20
+
+        loop.run_until_complete(run())
+        print("✓ Requests spaced to the rate cap")
@@ -0,0 +1,35 @@
+"""
+Test expiry policy registry for FRIKT App
+- every ephemeral collection gets a TTL index on its declared field
+- documents written by the app carry a date in that field, so Mongo can evict them
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+
+server = pytest.importorskip("server")
+
+
+class TestExpiryPolicies:
+    """TTL indexes from EXPIRY_POLICIES"""
+
+    def test_ttl_indexes_created(self, loop, db):
+        async def run():
+            await server.ensure_expiry_indexes()
+            for collection, (field, seconds) in server.EXPIRY_POLICIES.items():
+                indexes = await server.db[collection].index_information()
+                ttl = [i for i in indexes.values() if i["key"] == [(field, 1)] and "expireAfterSeconds" in i]
+                assert len(ttl) == 1, collection
+                assert ttl[0]["expireAfterSeconds"] == seconds
+            # Running again (every startup) is a no-op
+            await server.ensure_expiry_indexes()
+
+        loop.run_until_complete(run())
+        print("✓ TTL index per expiry policy")
+
+    def test_models_set_expiry_field(self):
+        assert server.CommunityJoinRequest(user_id="u", user_email="e", community_id="c").expires_at > server.datetime.utcnow()
+        assert server.CommunityRequest(email="e", community_name="n").expires_at > server.datetime.utcnow()
+        print("✓ Ephemeral models carry an expiry date")
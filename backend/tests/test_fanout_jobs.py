@@ -0,0 +1,148 @@
+"""
+Test notification fan-out jobs for FRIKT App
+- a comment on a followed Frikt notifies every follower and previous commenter once,
+  streamed in pages with no 100-recipient cap
+- opted-out recipients are skipped and open batch windows absorb the action
+- a job replayed from its cursor doesn't notify anyone twice
+- feedback notifies the admins, not the admin who sent it
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+
+async def cleanup(user_ids, problem_id=None):
+    db = server.db
+    await db.users.delete_many({"id": {"$in": user_ids}})
+    await db.notification_settings.delete_many({"user_id": {"$in": user_ids}})
+    await db.notifications.delete_many({"user_id": {"$in": user_ids}})
+    await db.notification_counters.delete_many({"user_id": {"$in": user_ids}})
+    await db.push_outbox.delete_many({"user_id": {"$in": user_ids}})
+    await db.pending_notification_batches.delete_many({"recipient_user_id": {"$in": user_ids}})
+    if problem_id:
+        await db.comments.delete_many({"problem_id": problem_id})
+        await db.fanout_jobs.delete_many({"audience.match.followed_problems": problem_id})
+    for uid in user_ids:
+        server.invalidate_notification_settings(uid)
+
+
+def comment_event(problem_id, owner, actor):
+    return {
+        "problem_id": problem_id, "problem_user_id": owner, "problem_title": "A test Frikt",
+        "content": "A comment for the fan-out test", "actor_id": actor, "actor_name": "Commenter",
+    }
+
+
+class TestFanoutJobs:
+    """Durable, paged notification fan-out"""
+
+    def test_comment_followers_fanout(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            problem_id = f"TEST_Fanout_p{tag}"
+            owner, actor = f"TEST_Fanout_{tag}_owner", f"TEST_Fanout_{tag}_actor"
+            followers = [f"TEST_Fanout_{tag}_f{i:03d}" for i in range(130)]
+            commenters = [f"TEST_Fanout_{tag}_c{i:03d}" for i in range(20)]
+            everyone = followers + commenters + [owner, actor]
+            server.FANOUT_PAGE_SIZE = 40
+            try:
+                await server.db.users.insert_many(
+                    [{"id": uid, "followed_problems": [problem_id]} for uid in followers + [owner, actor]]
+                    + [{"id": uid, "followed_problems": []} for uid in commenters]
+                )
+                # Some followers commented too; the owner and actor commented
+                await server.db.comments.insert_many([
+                    {"id": str(uuid.uuid4()), "problem_id": problem_id, "user_id": uid, "status": "active"}
+                    for uid in commenters + followers[:10] + [owner, actor, actor]
+                ])
+                await server.db.notification_settings.insert_one({"user_id": followers[5], "new_comments": False})
+                # An open window: this follower's notification is batched
+                assert await server.add_to_notification_batch(followers[7], "comment_batch", problem_id, "A test Frikt",
+                                                              "TEST_Fanout_other", "Other") is True
+
+                await server.handle_comment_follower_notifications(comment_event(problem_id, owner, actor))
+                assert await server.process_fanout_jobs() == 1
+
+                notified = await server.db.notifications.find(
+                    {"user_id": {"$in": everyone}, "type": "new_comment"}, {"_id": 0}
+                ).to_list(1000)
+                expected = sorted(set(followers + commenters) - {followers[5], followers[7]})
+                assert sorted(n["user_id"] for n in notified) == expected
+                assert await server.db.push_outbox.count_documents({"user_id": {"$in": everyone}}) == len(expected)
+                batch = await server.db.pending_notification_batches.find_one({"recipient_user_id": followers[7]})
+                assert batch["user_ids"] == [actor]
+
+                job = await server.db.fanout_jobs.find_one({"audience.match.followed_problems": problem_id})
+                assert job["status"] == "completed"
+                assert job["stats"] == {"users_processed": 130 + 2 + 30 + 2, "notified": len(expected), "batched": 1}
+
+                # The next comment inside the window is batched for everyone but the
+                # first commenter, who hears about it now
+                await server.handle_comment_follower_notifications(comment_event(problem_id, owner, commenters[0]))
+                await server.process_fanout_jobs()
+                assert await server.db.notifications.count_documents({"user_id": {"$in": everyone}}) == len(expected) + 1
+                assert await server.db.notifications.count_documents({"user_id": actor}) == 1
+            finally:
+                server.FANOUT_PAGE_SIZE = 1000
+                await cleanup(everyone, problem_id)
+
+        loop.run_until_complete(run())
+        print("✓ Followers and commenters notified once, in pages")
+
+    def test_replayed_page_not_duplicated(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            community = f"TEST_Fanout_community_{tag}"
+            members = [f"TEST_Fanout_{tag}_m{i}" for i in range(6)]
+            server.FANOUT_PAGE_SIZE = 4
+            try:
+                await server.db.community_members.insert_many([{"community_id": community, "user_id": m} for m in members])
+                job_id = await server.enqueue_fanout(
+                    audience=[server.audience_source("community_members", {"community_id": community})],
+                    notification={"type": "local_new_frikt", "problem_id": "p", "message": "New local Frikt"},
+                    push={"title": "New local Frikt", "body": "Body", "data": {}},
+                )
+                # A worker delivered part of the first page, then crashed before checkpointing
+                await server.insert_notifications([
+                    {**server.Notification(user_id=members[1], type="local_new_frikt", message="New local Frikt").dict(),
+                     "fanout_id": job_id}
+                ])
+                await server.process_fanout_jobs()
+
+                counts = {m: await server.db.notifications.count_documents({"fanout_id": job_id, "user_id": m}) for m in members}
+                assert counts == {m: 1 for m in members}
+                job = await server.db.fanout_jobs.find_one({"id": job_id})
+                assert job["cursor"] == {"source": 0, "after": members[-1]}
+                assert job["stats"]["notified"] == 5
+            finally:
+                server.FANOUT_PAGE_SIZE = 1000
+                await server.db.community_members.delete_many({"community_id": community})
+                await server.db.fanout_jobs.delete_many({"id": job_id})
+                await cleanup(members)
+
+        loop.run_until_complete(run())
+        print("✓ Replayed page skips recipients already notified")
+
+    def test_feedback_notifies_other_admins(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            admins = [f"TEST_Fanout_{tag}_admin{i}" for i in range(3)]
+            try:
+                await server.db.users.insert_many([{"id": a, "role": "admin"} for a in admins])
+                sender = {"id": admins[0], "name": "Admin Zero", "email": f"{tag}@example.com"}
+                response = await server.submit_feedback(server.FeedbackCreate(message="Works nicely"), user=sender)
+                await server.process_fanout_jobs()
+                notified = await server.db.notifications.distinct("user_id", {"problem_id": response["id"], "user_id": {"$in": admins}})
+                assert sorted(notified) == admins[1:]
+                assert await server.db.push_outbox.count_documents({"user_id": {"$in": admins}}) == 2
+            finally:
+                await server.db.feedbacks.delete_many({"user_email": f"{tag}@example.com"})
+                await cleanup(admins)
+
+        loop.run_until_complete(run())
+        print("✓ Feedback fans out to the other admins")
@@ -0,0 +1,93 @@
+"""
+Test materialized leaderboards for FRIKT App
+- creators / relaters / commenters ranked globally, per category and per community,
+  from the counters kept in user_stats
+- communities ranked by weekly local activity
+- shadowbanned and test accounts are excluded when the snapshot is built
+- reads page through the current snapshot; a rebuild replaces the previous one
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+
+class TestLeaderboards:
+    """Snapshot build and reads"""
+
+    def test_snapshot_rankings_and_exclusions(self, loop, db, make_user):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            alice = make_user("Leaderboard", name=f"alice{tag}")
+            bob = make_user("Leaderboard", name=f"bob{tag}")
+            shadow = make_user("Leaderboard", name=f"shadow{tag}", status="shadowbanned")
+            tester = make_user("Leaderboard", name=server.TEST_ACCOUNTS[0].title())
+            users = [alice, bob, shadow, tester]
+            community = {"id": f"TEST_Leaderboard_c{tag}", "name": f"Community {tag}"}
+            problem = server.Problem(user_id=alice["id"], user_name=alice["name"], title=f"TEST_leaderboard {tag}",
+                                     category_id="tech", is_local=True, community_id=community["id"]).dict()
+            problem["relates_count"] = 3
+            try:
+                await db.users.insert_many([dict(u) for u in users])
+                await db.communities.insert_one(dict(community))
+                await db.community_members.insert_many([
+                    {"user_id": alice["id"], "community_id": community["id"]},
+                    {"user_id": bob["id"], "community_id": community["id"]},
+                ])
+                await db.problems.insert_one(dict(problem))
+                await db.relates.insert_many([
+                    {"id": str(uuid.uuid4()), "problem_id": problem["id"], "user_id": u["id"],
+                     "created_at": server.datetime.utcnow()}
+                    for u in [bob, shadow, tester]
+                ])
+                await db.user_stats.insert_many([
+                    {**server.UserStats(user_id=alice["id"]).dict(), "total_relates_received": 10**6},
+                    {**server.UserStats(user_id=bob["id"]).dict(), "total_relates_received": 10**6 - 1,
+                     "total_relates_given": 5, "relates_given_per_category": {"tech": 1}},
+                    {**server.UserStats(user_id=shadow["id"]).dict(), "total_relates_received": 10**7},
+                    {**server.UserStats(user_id=tester["id"]).dict(), "total_relates_received": 10**7},
+                ])
+
+                await server.materialize_leaderboards()
+
+                page = await server.get_leaderboard("creators", user=alice)
+                top_ids = [e["user_id"] for e in page["entries"]]
+                assert top_ids[:2] == [alice["id"], bob["id"]]
+                assert shadow["id"] not in top_ids and tester["id"] not in top_ids
+                assert page["entries"][0]["rank"] == 1
+
+                page = await server.get_leaderboard("creators", skip=1, limit=1, user=alice)
+                assert [e["user_id"] for e in page["entries"]] == [bob["id"]]
+
+                page = await server.get_leaderboard("relaters", category_id="tech", user=alice)
+                assert [e["user_id"] for e in page["entries"] if e["user_id"].startswith("TEST_Leaderboard")] == [bob["id"]]
+
+                page = await server.get_leaderboard("creators", community_id=community["id"], user=bob)
+                assert [e["user_id"] for e in page["entries"]] == [alice["id"], bob["id"]]
+                with pytest.raises(server.HTTPException) as exc:
+                    await server.get_leaderboard("creators", community_id=community["id"], user=shadow)
+                assert exc.value.status_code == 403
+
+                page = await server.get_leaderboard("communities", user=alice)
+                entry = next(e for e in page["entries"] if e["community_id"] == community["id"])
+                assert (entry["posts"], entry["relates"], entry["score"]) == (1, 3, 4)
+
+                # Rebuild replaces the previous snapshot
+                first = (await db.job_state.find_one({"_id": server.LEADERBOARD_JOB}))["snapshot_id"]
+                await server.materialize_leaderboards()
+                assert await db.leaderboards.count_documents({"snapshot_id": first}) == 0
+            finally:
+                user_ids = [u["id"] for u in users]
+                await db.users.delete_many({"id": {"$in": user_ids}})
+                await db.user_stats.delete_many({"user_id": {"$in": user_ids}})
+                await db.communities.delete_many({"id": community["id"]})
+                await db.community_members.delete_many({"community_id": community["id"]})
+                await db.problems.delete_many({"id": problem["id"]})
+                await db.relates.delete_many({"problem_id": problem["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Leaderboard snapshot ranks, scopes and exclusions")
@@ -0,0 +1,102 @@
+"""
+Test daily metrics rollups for FRIKT App
+- a closed day is rolled up into one global row and one row per active community
+- the first run backfills history from the posts, comments and relates themselves
+- re-running a day overwrites its rows (idempotent upserts)
+- the job rolls up only days after its checkpoint, then today as a partial row
+- time-series endpoints serve zero-filled daily series and community rankings
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_Metrics_admin"}
+
+
+class TestMetricsRollup:
+    """Daily rollup rows and series endpoints"""
+
+    def test_rollup_and_series(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            community = f"TEST_Metrics_{tag}_c"
+            users = [f"TEST_Metrics_{tag}_u{i}" for i in range(3)]
+            today = server.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+            # A day far enough back that no other test writes into it
+            day = today - server.timedelta(days=40)
+            at = day + server.timedelta(hours=12)
+            date = server.metrics_date(day)
+            try:
+                await server.db.communities.insert_one({"id": community, "name": "Metrics Town"})
+                await server.db.users.insert_many([{"id": u, "created_at": at} for u in users])
+                await server.db.community_members.insert_many([
+                    {"community_id": community, "user_id": users[0], "joined_at": at},
+                    {"community_id": community, "user_id": users[1], "joined_at": day - server.timedelta(days=3)},
+                ])
+                await server.db.problems.insert_many([
+                    {"id": f"TEST_Metrics_{tag}_local", "user_id": users[0], "is_local": True, "community_id": community, "created_at": at},
+                    {"id": f"TEST_Metrics_{tag}_global", "user_id": users[2], "is_local": False, "created_at": at},
+                ])
+                await server.db.comments.insert_many([
+                    {"id": f"TEST_Metrics_{tag}_c{i}", "problem_id": pid, "user_id": users[1], "created_at": at}
+                    for i, pid in enumerate([f"TEST_Metrics_{tag}_local", f"TEST_Metrics_{tag}_local", f"TEST_Metrics_{tag}_global"])
+                ])
+                await server.db.relates.insert_one({"problem_id": f"TEST_Metrics_{tag}_local", "user_id": users[2], "created_at": at})
+
+                # First run: backfills the day, which has no activity log events
+                await server.db.job_state.delete_one({"_id": server.METRICS_ROLLUP_JOB})
+                await server.run_metrics_rollup()
+                await server.rollup_metrics_day(day)  # idempotent
+                rows = await server.db.metrics_daily.find({"scope": f"community:{community}"}, {"_id": 0}).to_list(10)
+                assert len(rows) == 1
+                assert {k: rows[0][k] for k in server.METRICS_COMMUNITY_FIELDS} == {
+                    "signups": 1, "posts": 1, "comments": 2, "relates": 1, "dau": 2,
+                }
+                assert rows[0]["date"] == date and rows[0]["partial"] is False
+
+                glob = await server.db.metrics_daily.find_one({"scope": "global", "date": date})
+                in_day = {"$gte": day, "$lt": day + server.timedelta(days=1)}
+                assert glob["signups"] == await server.db.users.count_documents({"created_at": in_day})
+                assert glob["comments"] == await server.db.comments.count_documents({"created_at": in_day})
+                assert glob["local_comments"] >= 2 and glob["dau"] >= 3
+
+                # The job picks up from its checkpoint: only the days after it, plus today
+                await server.db.job_state.update_one(
+                    {"_id": server.METRICS_ROLLUP_JOB},
+                    {"$set": {"rolled_through": server.metrics_date(today - server.timedelta(days=2))}}, upsert=True
+                )
+                await server.run_metrics_rollup()
+                state = await server.db.job_state.find_one({"_id": server.METRICS_ROLLUP_JOB})
+                assert state["rolled_through"] == server.metrics_date(today - server.timedelta(days=1))
+                assert (await server.db.metrics_daily.find_one({"scope": "global", "date": server.metrics_date(today)}))["partial"] is True
+                assert await server.db.metrics_daily.find_one({"scope": "global", "date": server.metrics_date(today - server.timedelta(days=3))}) is None
+
+                series = await server.get_daily_metrics(days=45, community_id=community, admin=ADMIN)
+                assert len(series["series"]) == 45
+                assert series["series"][-1]["date"] == server.metrics_date(today)
+                point = next(p for p in series["series"] if p["date"] == date)
+                assert point["comments"] == 2
+                assert sum(p["posts"] for p in series["series"]) == 1
+
+                ranked = await server.get_community_metrics(days=45, metric="comments", admin=ADMIN)
+                mine = next(c for c in ranked["communities"] if c["community_id"] == community)
+                assert mine == {"community_id": community, "name": "Metrics Town", "total": 2}
+                with pytest.raises(server.HTTPException):
+                    await server.get_community_metrics(metric="nope", admin=ADMIN)
+            finally:
+                await server.db.communities.delete_many({"id": community})
+                await server.db.users.delete_many({"id": {"$in": users}})
+                await server.db.community_members.delete_many({"community_id": community})
+                await server.db.problems.delete_many({"id": {"$regex": f"^TEST_Metrics_{tag}"}})
+                await server.db.comments.delete_many({"id": {"$regex": f"^TEST_Metrics_{tag}"}})
+                await server.db.relates.delete_many({"user_id": {"$in": users}})
+                await server.db.metrics_daily.delete_many({"$or": [{"scope": f"community:{community}"}, {"date": date}]})
+                await server.db.job_state.delete_one({"_id": server.METRICS_ROLLUP_JOB})
+
+        loop.run_until_complete(run())
+        print("✓ Days rolled up once into global and community rows, served as series")
@@ -0,0 +1,139 @@
+"""
+Test notification batch scheduler for FRIKT App
+- one batch document per (recipient, type, target); first action notified immediately
+- concurrent actions open exactly one window, the rest are batched
+- due batches are claimed with a lease, so parallel processors never double send
+- actors added while a batch is being sent stay pending for the next flush
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+
+
+def make_key():
+    unique_id = uuid.uuid4().hex[:8]
+    return f"TEST_Batch_recipient_{unique_id}", f"TEST_Batch_target_{unique_id}"
+
+
+async def add(recipient, target, actor):
+    return await server.add_to_notification_batch(
+        recipient_user_id=recipient, batch_type="relate_batch", target_id=target,
+        target_title="A test Frikt", actor_user_id=actor, actor_user_name=actor[-4:]
+    )
+
+
+async def make_due(recipient):
+    await server.db.pending_notification_batches.update_many(
+        {"recipient_user_id": recipient}, {"$set": {"due_at": server.datetime.utcnow() - server.timedelta(seconds=1)}}
+    )
+
+
+async def cleanup(recipients):
+    await server.db.pending_notification_batches.delete_many({"recipient_user_id": {"$in": recipients}})
+    await server.db.notifications.delete_many({"user_id": {"$in": recipients}})
+
+
+async def ensure_indexes():
+    await server.db.pending_notification_batches.create_index(
+        [("recipient_user_id", 1), ("batch_type", 1), ("target_id", 1)], unique=True
+    )
+
+
+class TestBatching:
+    """add_to_notification_batch"""
+
+    def test_first_action_immediate_rest_batched(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            recipient, target = make_key()
+            try:
+                results = await asyncio.gather(*(add(recipient, target, f"TEST_Batch_actor_{i:04d}") for i in range(50)))
+                assert results.count(True) == 1
+                docs = await server.db.pending_notification_batches.find({"recipient_user_id": recipient}).to_list(10)
+                assert len(docs) == 1
+                assert len(docs[0]["user_ids"]) == 49
+                assert docs[0]["notification_sent"] is False
+                assert docs[0]["due_at"].second % server.NOTIFICATION_BATCH_BUCKET_SECONDS == 0
+
+                # Same actor again is a no-op
+                assert await add(recipient, target, docs[0]["user_ids"][0]) is False
+                doc = await server.db.pending_notification_batches.find_one({"recipient_user_id": recipient})
+                assert len(doc["user_ids"]) == 49
+            finally:
+                await cleanup([recipient])
+
+        loop.run_until_complete(run())
+        print("✓ One immediate notification, the rest batched into one document")
+
+
+class TestProcessing:
+    """Claimed processing of due batches"""
+
+    def test_parallel_processors_send_once(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            keys = [make_key() for _ in range(30)]
+            recipients = [r for r, _ in keys]
+            try:
+                for recipient, target in keys:
+                    assert await add(recipient, target, "TEST_Batch_actor_a") is True
+                    assert await add(recipient, target, "TEST_Batch_actor_b") is False
+                    assert await add(recipient, target, "TEST_Batch_actor_c") is False
+                    await make_due(recipient)
+
+                server.NOTIFICATION_BATCH_PAGE_SIZE = 7
+                sent = await asyncio.gather(*(server.process_pending_notification_batches() for _ in range(4)))
+                assert sum(sent) == len(keys)
+
+                notifications = await server.db.notifications.find(
+                    {"user_id": {"$in": recipients}, "type": "batched_relate_batch"}
+                ).to_list(100)
+                assert len(notifications) == len(keys)
+                assert notifications[0]["message"] == "or_b and or_c related to your Frikt"
+
+                docs = await server.db.pending_notification_batches.find({"recipient_user_id": {"$in": recipients}}).to_list(100)
+                assert all(d["notification_sent"] and d["user_ids"] == [] and d["claimed_by"] is None for d in docs)
+
+                # Window closed after the flush: the next action is immediate again
+                recipient, target = keys[0]
+                await server.db.pending_notification_batches.update_one(
+                    {"recipient_user_id": recipient}, {"$set": {"window_until": server.datetime.utcnow()}}
+                )
+                assert await add(recipient, target, "TEST_Batch_actor_d") is True
+            finally:
+                await cleanup(recipients)
+
+        loop.run_until_complete(run())
+        print("✓ Parallel processors send each batch once")
+
+    def test_actor_added_during_send_stays_pending(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            recipient, target = make_key()
+            try:
+                await add(recipient, target, "TEST_Batch_actor_a")
+                await add(recipient, target, "TEST_Batch_actor_b")
+                await make_due(recipient)
+                claimed = await server.claim_due_notification_batches(server.datetime.utcnow())
+                assert len(claimed) == 1
+
+                await asyncio.sleep(0.01)
+                await add(recipient, target, "TEST_Batch_actor_c")  # arrives mid-send
+                await server.complete_notification_batch(claimed[0])
+
+                doc = await server.db.pending_notification_batches.find_one({"recipient_user_id": recipient})
+                assert doc["user_ids"] == ["TEST_Batch_actor_c"]
+                assert doc["user_names"] == ["or_c"]
+                assert doc["notification_sent"] is False
+                assert doc["claimed_by"] is None
+            finally:
+                await cleanup([recipient])
+
+        loop.run_until_complete(run())
+        print("✓ Actors added mid-send stay pending")
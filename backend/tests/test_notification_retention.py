@@ -0,0 +1,96 @@
+"""
+Test notification retention tiers for FRIKT App
+- notifications beyond the per-user hot limit or older than the hot window are archived
+- archived notifications leave the unread/total counters and the inbox; notifications
+  already gone from the inbox aren't counted again
+- the archive is readable page by page; storage samples are recorded for reporting
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_Retention_admin"}
+
+
+def make_notification(user_id, age):
+    notification = server.Notification(user_id=user_id, type="new_relate", problem_id="", message="Test").dict()
+    notification["created_at"] = server.datetime.utcnow() - age
+    return notification
+
+
+class TestNotificationRetention:
+    """Hot tier limits and the archive"""
+
+    def test_archive_overflow_and_expired(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            busy, quiet = {"id": f"TEST_Retention_busy_{tag}"}, {"id": f"TEST_Retention_quiet_{tag}"}
+            server.NOTIFICATION_HOT_MAX_PER_USER = 3
+            try:
+                await server.insert_notifications(
+                    [make_notification(busy["id"], server.timedelta(minutes=i)) for i in range(5)]
+                    + [make_notification(quiet["id"], server.timedelta(days=server.NOTIFICATION_HOT_DAYS + 1)),
+                       make_notification(quiet["id"], server.timedelta(days=1))]
+                )
+                # busy has read the oldest notification
+                oldest = await db.notifications.find_one({"user_id": busy["id"]}, sort=[("created_at", 1)])
+                await server.mark_notification_ids_read(busy["id"], [oldest["id"]])
+                assert await server.get_unread_count(busy["id"]) == 4
+
+                await server.run_notification_archiver()
+
+                assert await db.notifications.count_documents({"user_id": busy["id"]}) == 3
+                assert await db.notifications.count_documents({"user_id": quiet["id"]}) == 1
+                counters = {c["user_id"]: c async for c in db.notification_counters.find({"user_id": {"$in": [busy["id"], quiet["id"]]}})}
+                assert (counters[busy["id"]]["total"], counters[busy["id"]]["unread"]) == (3, 3)
+                assert (counters[quiet["id"]]["total"], counters[quiet["id"]]["unread"]) == (1, 1)
+                assert await server.find_unread_drift([busy["id"], quiet["id"]]) == {}
+
+                page = await server.get_archived_notifications(limit=1, user=busy)
+                assert len(page["notifications"]) == 1
+                page = await server.get_archived_notifications(before=page["notifications"][0]["created_at"], user=busy)
+                assert [n["is_read"] for n in page["notifications"]] == [True]
+
+                # Nothing left to move; archive is idempotent on id
+                await server.run_notification_archiver()
+                assert await db.notifications_archive.count_documents({"user_id": busy["id"]}) == 2
+
+                report = await server.get_notification_retention(admin=ADMIN)
+                assert report["moved"]["overflow"] >= 2 and report["moved"]["expired"] >= 1
+                assert len(report["history"]) >= 2
+                assert report["archive"]["count"] >= 3
+            finally:
+                server.NOTIFICATION_HOT_MAX_PER_USER = 200
+                ids = [busy["id"], quiet["id"]]
+                await db.notifications.delete_many({"user_id": {"$in": ids}})
+                await db.notifications_archive.delete_many({"user_id": {"$in": ids}})
+                await db.notification_counters.delete_many({"user_id": {"$in": ids}})
+
+        loop.run_until_complete(run())
+        print("✓ Overflow and expired notifications archived, counters follow")
+
+    def test_counters_follow_deleted_only(self, loop, db):
+        async def run():
+            user = {"id": f"TEST_Retention_gone_{uuid.uuid4().hex[:6]}"}
+            try:
+                await server.insert_notifications([make_notification(user["id"], server.timedelta(minutes=i)) for i in range(3)])
+                batch = await db.notifications.find({"user_id": user["id"]}).to_list(3)
+                # One is removed (and its counters adjusted) before the archiver gets to it
+                await db.notifications.delete_one({"_id": batch[0]["_id"]})
+                await db.notification_counters.update_one({"user_id": user["id"]}, {"$inc": {"unread": -1, "total": -1}})
+
+                assert await server.move_notifications_to_archive(batch) == 2
+                counter = await db.notification_counters.find_one({"user_id": user["id"]})
+                assert (counter["total"], counter["unread"]) == (0, 0)
+            finally:
+                await db.notifications.delete_many({"user_id": user["id"]})
+                await db.notifications_archive.delete_many({"user_id": user["id"]})
+                await db.notification_counters.delete_many({"user_id": user["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Counters decremented only for notifications actually removed")
@@ -0,0 +1,77 @@
+"""
+Test cached notification settings for FRIKT App
+- defaults are applied for users without saved settings
+- batch lookups fill the cache; repeated lookups don't hit the database
+- PUT /push/settings invalidates the cached entry
+- local-frikt fan-out respects opt-outs read through the cache
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+
+class TestNotificationSettingsCache:
+    """Cached settings lookups"""
+
+    def test_defaults_cache_and_invalidation(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            quiet, fresh = f"TEST_Settings_quiet_{tag}", f"TEST_Settings_fresh_{tag}"
+            try:
+                await server.db.notification_settings.insert_one({"user_id": quiet, "new_comments": False, "follows": None})
+                settings = await server.get_notification_settings_bulk([quiet, fresh, quiet])
+                assert set(settings) == {quiet, fresh}
+                assert settings[quiet]["new_comments"] is False
+                assert settings[quiet]["follows"] is True  # null falls back to the default
+                assert settings[fresh] == {k: True for k in settings[fresh]}
+                assert not server.wants_push(settings[quiet], "new_comments")
+                assert server.wants_push(settings[fresh], "local_new_frikts")
+
+                # Served from the cache until invalidated
+                await server.db.notification_settings.update_one({"user_id": quiet}, {"$set": {"push_notifications": False}})
+                assert (await server.get_notification_settings(quiet))["push_notifications"] is True
+
+                await server.update_push_settings(server.NotificationSettingsUpdate(trending=False), user={"id": quiet})
+                settings = await server.get_push_settings(user={"id": quiet})
+                assert settings["push_notifications"] is False and settings["trending"] is False
+                assert "user_id" not in settings
+            finally:
+                await server.db.notification_settings.delete_many({"user_id": {"$in": [quiet, fresh]}})
+                server.invalidate_notification_settings(quiet)
+                server.invalidate_notification_settings(fresh)
+
+        loop.run_until_complete(run())
+        print("✓ Settings cached with defaults and invalidated on update")
+
+    def test_local_fanout_respects_opt_outs(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            community = f"TEST_Settings_c{tag}"
+            members = [f"TEST_Settings_m{tag}_{i}" for i in range(4)]
+            try:
+                await server.db.community_members.insert_many([{"community_id": community, "user_id": m} for m in members])
+                await server.db.notification_settings.insert_many([
+                    {"user_id": members[1], "local_new_frikts": False},
+                    {"user_id": members[2], "push_notifications": False},
+                ])
+                await server.notify_local_members_of_new_frikt(community, "p1", "A local Frikt", members[0], "Author")
+                await server.process_fanout_jobs()
+                notified = await server.db.notifications.distinct("user_id", {"user_id": {"$in": members}})
+                assert notified == [members[3]]
+                assert await server.db.push_outbox.count_documents({"user_id": {"$in": members}}) == 1
+            finally:
+                await server.db.community_members.delete_many({"community_id": community})
+                await server.db.notification_settings.delete_many({"user_id": {"$in": members}})
+                await server.db.notifications.delete_many({"user_id": {"$in": members}})
+                await server.db.notification_counters.delete_many({"user_id": {"$in": members}})
+                await server.db.push_outbox.delete_many({"user_id": {"$in": members}})
+                for m in members:
+                    server.invalidate_notification_settings(m)
+
+        loop.run_until_complete(run())
+        print("✓ Local-frikt fan-out respects cached opt-outs")
@@ -0,0 +1,242 @@
+"""
+Test pooled Expo push client for FRIKT App
+- messages are sent in chunks of at most 100, gzip-compressed, over a shared client
+- DeviceNotRegistered tokens are deactivated in one bulk write
+- receipts are polled in batches of up to 1000 and dead tokens deactivated
+- InvalidCredentials never deactivates tokens
+- delivery success rates are reported per platform
+- benchmark: messages/sec against a local Expo stand-in server
+
+The stand-in (ExpoStandIn below) accepts the Expo push API request format and answers
+with one ticket per message, and serves receipts for the tickets it issued. To benchmark:
+    MONGO_URL=... DB_NAME=... python -m pytest tests/test_push_client.py -k throughput -s
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import gzip
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+server = pytest.importorskip("server")
+
+
+class ExpoStandIn:
+    """Local HTTP server speaking the Expo push send and receipts APIs"""
+
+    def __init__(self, latency=0.0):
+        self.requests = []
+        self.messages = []
+        self.receipt_requests = []
+        self.tickets = {}  # ticket id -> token
+        self.receipts_ready = True
+        self.latency = latency
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers["Content-Length"]))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    raw = gzip.decompress(raw)
+                if self.path.endswith("/getReceipts"):
+                    payload = json.dumps({"data": stand_in.receipts(json.loads(raw)["ids"])}).encode()
+                else:
+                    payload = json.dumps({"data": stand_in.send(json.loads(raw), self.headers)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/--/api/v2/push/send"
+        self.receipts_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/--/api/v2/push/getReceipts"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def send(self, messages, headers):
+        self.requests.append({"count": len(messages), "gzip": headers.get("Content-Encoding") == "gzip"})
+        self.messages.extend(messages)
+        if self.latency:
+            time.sleep(self.latency)
+        tickets = []
+        for m in messages:
+            if "Unregistered" in m["to"]:
+                tickets.append({"status": "error", "message": "not registered", "details": {"error": "DeviceNotRegistered"}})
+            elif "BadCreds" in m["to"]:
+                tickets.append({"status": "error", "message": "bad FCM key", "details": {"error": "InvalidCredentials"}})
+            else:
+                ticket_id = str(uuid.uuid4())
+                self.tickets[ticket_id] = m["to"]
+                tickets.append({"status": "ok", "id": ticket_id})
+        return tickets
+
+    def receipts(self, ids):
+        """Tokens containing "Gone" were uninstalled after the ticket was issued;
+        "Revoked" ones hit credentials revoked after it."""
+        self.receipt_requests.append(len(ids))
+        if not self.receipts_ready:
+            return {}
+        receipts = {}
+        for i in ids:
+            if i not in self.tickets:
+                continue
+            if "Gone" in self.tickets[i]:
+                receipts[i] = {"status": "error", "message": "gone", "details": {"error": "DeviceNotRegistered"}}
+            elif "Revoked" in self.tickets[i]:
+                receipts[i] = {"status": "error", "message": "bad APNs key", "details": {"error": "InvalidCredentials"}}
+            else:
+                receipts[i] = {"status": "ok"}
+        return receipts
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def make_tokens(n, prefix="Ok"):
+    return [f"ExponentPushToken[{prefix}{uuid.uuid4().hex[:12]}]" for _ in range(n)]
+
+
+async def benchmark(total=5000, latency=0.02):
+    stand_in = ExpoStandIn(latency=latency)
+    server.EXPO_PUSH_URL = stand_in.url
+    try:
+        messages = server.build_push_messages(make_tokens(total), "Benchmark", "Body")
+        start = time.perf_counter()
+        tickets = await server.send_push_messages(messages)
+        elapsed = time.perf_counter() - start
+        assert len(tickets) == total
+        return total / elapsed, len(stand_in.requests)
+    finally:
+        stand_in.close()
+
+
+class TestPushClient:
+    """Chunking, compression and token deactivation"""
+
+    def test_chunks_gzip_and_deactivation(self, loop, db):
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            bad = make_tokens(3, prefix="Unregistered")
+            await server.db.push_tokens.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": "TEST_Push_user", "token": t, "is_active": True} for t in bad
+            ])
+            try:
+                tokens = make_tokens(247) + bad + ["simulator-abc", "not-a-token"]
+                await server.send_push_notification(tokens, "Title", "Body", {"type": "test"}, badge=2)
+
+                assert sum(r["count"] for r in stand_in.requests) == 250
+                assert sorted(r["count"] for r in stand_in.requests) == [50, 100, 100]
+                assert all(r["gzip"] for r in stand_in.requests)
+
+                inactive = await server.db.push_tokens.count_documents(
+                    {"token": {"$in": bad}, "is_active": False, "deactivation_reason": "DeviceNotRegistered"}
+                )
+                assert inactive == 3
+                # The client is reused across sends
+                client = server.get_push_client()
+                await server.send_push_notification(make_tokens(1), "Title", "Body")
+                assert server.get_push_client() is client
+            finally:
+                stand_in.close()
+                await server.db.push_tokens.delete_many({"user_id": "TEST_Push_user"})
+
+        loop.run_until_complete(run())
+        print("✓ Pushes chunked, gzipped and bad tokens deactivated in bulk")
+
+    def test_throughput(self, loop, db):
+        rate, requests = loop.run_until_complete(benchmark())
+        assert requests == 50
+        print(f"  push client: {rate:.0f} messages/sec (20 ms stand-in latency, "
+              f"{server.EXPO_PUSH_MAX_IN_FLIGHT} in flight)")
+        print("✓ Push throughput measured")
+
+
+class TestPushReceipts:
+    """Receipt polling, token hygiene and delivery stats"""
+
+    def test_receipts_deactivate_dead_tokens(self, loop, db):
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            server.EXPO_RECEIPTS_URL = stand_in.receipts_url
+            server.PUSH_RECEIPT_DELAY_SECONDS = 0
+            server.EXPO_RECEIPT_BATCH_SIZE = 100
+            user_id = f"TEST_Receipts_{uuid.uuid4().hex[:8]}"
+            ios, gone, android = make_tokens(200), make_tokens(5, prefix="Gone"), make_tokens(2, prefix="Unregistered")
+            await server.db.push_tokens.insert_many(
+                [{"id": str(uuid.uuid4()), "user_id": user_id, "token": t, "platform": "ios", "is_active": True} for t in ios + gone]
+                + [{"id": str(uuid.uuid4()), "user_id": user_id, "token": t, "platform": "android", "is_active": True} for t in android]
+            )
+            started = server.datetime.utcnow()
+            try:
+                await server.send_push_notification(ios + gone + android, "Title", "Body")
+                assert await server.db.push_tickets.count_documents({"token": {"$in": ios + gone}, "status": "pending"}) == 205
+
+                # Receipts not ready yet: tickets stay pending and are retried later
+                stand_in.receipts_ready = False
+                assert await server.poll_push_receipts() == 0
+                assert stand_in.receipt_requests == [100, 100, 5]
+                assert await server.db.push_tickets.count_documents({"token": {"$in": ios}, "status": "pending"}) == 200
+
+                stand_in.receipts_ready = True
+                await server.db.push_tickets.update_many({"token": {"$in": ios + gone}}, {"$set": {"check_after": started}})
+                assert await server.poll_push_receipts() == 205
+                assert stand_in.receipt_requests[3:] == [100, 100, 5]
+
+                inactive = await server.db.push_tokens.find({"user_id": user_id, "is_active": False}).to_list(100)
+                assert sorted(t["token"] for t in inactive) == sorted(gone + android)
+                assert await server.poll_push_receipts() == 0
+
+                platforms = await server.push_delivery_stats(started)
+                assert platforms["ios"]["sent"] == 205
+                assert platforms["ios"]["errors"] == {"DeviceNotRegistered": 5}
+                assert platforms["ios"]["success_rate"] == round(200 / 205, 4)
+                assert platforms["android"]["success_rate"] == 0
+            finally:
+                stand_in.close()
+                server.EXPO_RECEIPT_BATCH_SIZE = 1000
+                await server.db.push_tokens.delete_many({"user_id": user_id})
+                await server.db.push_tickets.delete_many({"token": {"$in": ios + gone + android}})
+
+        loop.run_until_complete(run())
+        print("✓ Receipts polled in batches, dead tokens deactivated, rates per platform")
+
+    def test_invalid_credentials_keep_tokens_active(self, loop, db):
+        """InvalidCredentials (ticket or receipt) is a project problem: tokens stay active"""
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            server.EXPO_RECEIPTS_URL = stand_in.receipts_url
+            server.PUSH_RECEIPT_DELAY_SECONDS = 0
+            user_id = f"TEST_Receipts_{uuid.uuid4().hex[:8]}"
+            tokens = make_tokens(3, prefix="BadCreds") + make_tokens(3, prefix="Revoked")
+            await server.db.push_tokens.insert_many([
+                {"id": str(uuid.uuid4()), "user_id": user_id, "token": t, "platform": "android", "is_active": True}
+                for t in tokens
+            ])
+            try:
+                await server.send_push_notification(tokens, "Title", "Body")
+                await server.poll_push_receipts()
+                errors = await server.db.push_tickets.distinct("error", {"token": {"$in": tokens}})
+                assert errors == ["InvalidCredentials"]
+                assert await server.db.push_tickets.count_documents({"token": {"$in": tokens}, "status": "error"}) == 6
+                assert await server.db.push_tokens.count_documents({"user_id": user_id, "is_active": True}) == 6
+            finally:
+                stand_in.close()
+                await server.db.push_tokens.delete_many({"user_id": user_id})
+                await server.db.push_tickets.delete_many({"token": {"$in": tokens}})
+
+        loop.run_until_complete(run())
+        print("✓ InvalidCredentials alerts without deactivating tokens")
+
@@ -0,0 +1,117 @@
+"""
+Test durable push outbox for FRIKT App
+- pushes are queued with the in-app notification and delivered by outbox workers
+- badges come from the unread counters; users without tokens are skipped
+- parallel workers deliver each entry once
+- transient failures back off, then dead-letter; dead letters can be requeued
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+from test_push_client import ExpoStandIn  # noqa: E402
+
+ADMIN = {"id": "TEST_Outbox_admin"}
+
+
+async def seed_users(n):
+    tag = uuid.uuid4().hex[:6]
+    user_ids = [f"TEST_Outbox_{tag}_{i}" for i in range(n)]
+    await server.db.push_tokens.insert_many([
+        {"id": str(uuid.uuid4()), "user_id": uid, "is_active": True, "token": f"ExponentPushToken[{tag}{i}]"}
+        for i, uid in enumerate(user_ids)
+    ])
+    return user_ids
+
+
+async def cleanup(user_ids):
+    db = server.db
+    tokens = await db.push_tokens.distinct("token", {"user_id": {"$in": user_ids}})
+    await db.push_tickets.delete_many({"token": {"$in": tokens}})
+    await db.push_tokens.delete_many({"user_id": {"$in": user_ids}})
+    await db.push_outbox.delete_many({"user_id": {"$in": user_ids}})
+    await db.notifications.delete_many({"user_id": {"$in": user_ids}})
+    await db.notification_counters.delete_many({"user_id": {"$in": user_ids}})
+
+
+class TestPushOutbox:
+    """Queued delivery, retries and dead letters"""
+
+    def test_queued_with_notifications_and_delivered_once(self, loop, db):
+        async def run():
+            stand_in = ExpoStandIn()
+            server.EXPO_PUSH_URL = stand_in.url
+            server.PUSH_OUTBOX_PAGE_SIZE = 7
+            user_ids = await seed_users(20)
+            no_tokens = f"TEST_Outbox_none_{uuid.uuid4().hex[:6]}"
+            try:
+                notifications = [
+                    server.Notification(user_id=uid, type="new_relate", problem_id="", message="Test").dict()
+                    for uid in user_ids
+                ]
+                pushes = [{"user_id": uid, "title": "Hi", "body": "Queued", "data": {"type": "test"}} for uid in user_ids]
+                await server.insert_notifications(notifications, pushes=pushes)
+                await server.send_notification_to_user(user_ids[0], "Again", "Second push")
+                await server.send_notification_to_user(no_tokens, "Hi", "Nobody home")
+                assert stand_in.requests == []  # nothing sent inline
+
+                delivered = await asyncio.gather(*(server.process_push_outbox() for _ in range(3)))
+                assert sum(delivered) == 21
+                assert len(stand_in.messages) == 21
+                assert {m["badge"] for m in stand_in.messages} == {1}
+                assert sorted(m["body"] for m in stand_in.messages).count("Queued") == 20
+
+                statuses = {e["user_id"]: e["status"] async for e in server.db.push_outbox.find({"user_id": no_tokens})}
+                assert statuses == {no_tokens: "skipped"}
+                metrics = await server.push_outbox_metrics()
+                assert metrics["due"] == 0
+            finally:
+                stand_in.close()
+                server.PUSH_OUTBOX_PAGE_SIZE = 500
+                await cleanup(user_ids + [no_tokens])
+
+        loop.run_until_complete(run())
+        print("✓ Outbox delivers queued pushes once, with badges from the counters")
+
+    def test_backoff_and_dead_letter(self, loop, db):
+        async def run():
+            server.EXPO_PUSH_URL = "http://127.0.0.1:9/--/api/v2/push/send"  # nothing listening
+            server.PUSH_OUTBOX_MAX_ATTEMPTS = 2
+            user_ids = await seed_users(1)
+            try:
+                await server.send_notification_to_user(user_ids[0], "Hi", "Will fail")
+                assert await server.process_push_outbox() == 0
+                entry = await server.db.push_outbox.find_one({"user_id": user_ids[0]})
+                assert (entry["status"], entry["attempts"], entry["last_error"]) == ("pending", 1, "RequestFailed")
+                assert entry["next_attempt_at"] > server.datetime.utcnow()
+                assert await server.process_push_outbox() == 0  # not due yet
+
+                await server.db.push_outbox.update_one({"id": entry["id"]}, {"$set": {"next_attempt_at": server.datetime.utcnow()}})
+                await server.process_push_outbox()
+                entry = await server.db.push_outbox.find_one({"id": entry["id"]})
+                assert (entry["status"], entry["attempts"]) == ("dead", 2)
+                outbox = await server.get_push_outbox(admin=ADMIN)
+                assert outbox["dead"] >= 1
+                assert entry["id"] in [e["id"] for e in outbox["recent_dead"]]
+
+                stand_in = ExpoStandIn()
+                server.EXPO_PUSH_URL = stand_in.url
+                try:
+                    assert (await server.requeue_dead_pushes(admin=ADMIN))["requeued"] >= 1
+                    await server.process_push_outbox()
+                    entry = await server.db.push_outbox.find_one({"id": entry["id"]})
+                    assert entry["status"] == "sent"
+                    assert [m["body"] for m in stand_in.messages] == ["Will fail"]
+                finally:
+                    stand_in.close()
+            finally:
+                server.PUSH_OUTBOX_MAX_ATTEMPTS = 8
+                await cleanup(user_ids)
+
+        loop.run_until_complete(run())
+        print("✓ Transient failures back off, dead-letter and can be requeued")
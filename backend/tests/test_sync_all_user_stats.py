@@ -0,0 +1,155 @@
+"""
+Test aggregation-based bulk stats sync for FRIKT App
+- counters per chunk of users come from $group aggregations over problems, comments, relates
+- stats are written back in chunks and match the per-user sync_user_stats_from_db
+- POST /admin/sync-all-user-stats runs as a background job with progress in admin_jobs
+- badges are awarded in bulk ("all" trigger)
+- a job whose lease was taken over by another sync stops and is marked failed
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+
+COMPARED_FIELDS = [
+    "total_posts", "total_comments", "total_relates_given", "total_relates_received",
+    "posts_per_category", "relates_given_per_category", "comments_per_category",
+    "total_frikts_opened", "users_followed", "current_visit_streak",
+]
+
+
+async def seed(users):
+    """Each user posts, comments and relates to the next user's posts"""
+    db = server.db
+    await db.users.insert_many([dict(u) for u in users])
+    problem_ids = []
+    for i, user in enumerate(users):
+        posts = [
+            server.Problem(user_id=user["id"], user_name=user["name"], title=f"TEST_sync {uuid.uuid4()}",
+                           category_id=["work", "tech", "work"][j % 3]).dict()
+            for j in range(i % 4 + 1)
+        ]
+        await db.problems.insert_many(posts)
+        problem_ids.append([p["id"] for p in posts])
+    for i, user in enumerate(users):
+        target = problem_ids[(i + 1) % len(users)]
+        await db.relates.insert_many([
+            {"id": str(uuid.uuid4()), "problem_id": pid, "user_id": user["id"]} for pid in target
+        ])
+        await db.comments.insert_many([
+            {"id": str(uuid.uuid4()), "problem_id": target[0], "user_id": user["id"], "content": "x"}
+            for _ in range(i % 3 + 1)
+        ])
+    # Kept counters (not derivable from source collections)
+    await db.user_stats.insert_one({**server.UserStats(user_id=users[0]["id"]).dict(),
+                                    "total_frikts_opened": 7, "current_visit_streak": 3})
+
+
+class TestBulkSync:
+    """Bulk sync matches the per-user sync"""
+
+    def test_bulk_matches_per_user_sync(self, loop, db, make_user, delete_test_data):
+        """Chunked bulk rebuild writes the same stats as sync_user_stats_from_db"""
+        async def run():
+            users = [make_user("Sync", created_at=server.datetime(2026, 5, 1)) for _ in range(12)]
+            try:
+                await seed(users)
+                await server.record_activity(users[0]["id"], "frikt_opened")
+
+                synced, awarded = await server.sync_user_stats_chunk(users)
+                assert synced == len(users)
+                assert awarded > 0
+                bulk = {s["user_id"]: s async for s in server.db.user_stats.find(
+                    {"user_id": {"$in": [u["id"] for u in users]}}, {"_id": 0})}
+
+                for user in users:
+                    expected = await server.sync_user_stats_from_db(user["id"])
+                    for field in COMPARED_FIELDS:
+                        assert bulk[user["id"]][field] == expected[field], f"{user['id']} {field}"
+
+                assert bulk[users[0]["id"]]["total_frikts_opened"] == 8
+                assert bulk[users[0]["id"]]["current_visit_streak"] == 3
+                assert bulk[users[3]["id"]]["posts_per_category"] == {"work": 3, "tech": 1}
+                # Re-running awards nothing new
+                assert (await server.sync_user_stats_chunk(users))[1] == 0
+            finally:
+                await delete_test_data([u["id"] for u in users])
+
+        loop.run_until_complete(run())
+        print("✓ Bulk sync matches per-user sync")
+
+    def test_background_job_progress(self, loop, db, make_user, delete_test_data):
+        """The endpoint returns a job id; the job completes with the legacy result keys"""
+        async def run():
+            users = [make_user("Sync", created_at=server.datetime(2026, 5, 1)) for _ in range(6)]
+            admin = {"id": "TEST_Sync_admin", "email": "admin@example.com"}
+            try:
+                await seed(users)
+                server.SYNC_ALL_USER_STATS_CHUNK_SIZE = 2
+                response = await server.admin_sync_all_user_stats(admin=admin)
+                assert response["success"] is True
+                job_id = response["job_id"]
+
+                for _ in range(200):
+                    job = await server.admin_get_job(job_id, admin=admin)
+                    if job["status"] != "running":
+                        break
+                    await asyncio.sleep(0.05)
+                assert job["status"] == "completed", job
+                assert job["result"]["success"] is True
+                assert job["result"]["users_synced"] == job["progress"]["users_total"]
+                assert job["result"]["users_synced"] >= len(users)
+                assert "badges_awarded" in job["result"]
+            finally:
+                await server.db.admin_jobs.delete_many({"created_by": admin["id"]})
+                await server.db.admin_audit_logs.delete_many({"admin_id": admin["id"]})
+                await delete_test_data([u["id"] for u in users])
+
+        loop.run_until_complete(run())
+        print("✓ Sync-all runs as a background job")
+
+    def test_lost_lease_stops_the_job(self, loop, db, make_user, delete_test_data):
+        """Another sync took the expired lease: the job stops after its current chunk"""
+        async def run():
+            users = [make_user("Sync", created_at=server.datetime(2026, 5, 1)) for _ in range(4)]
+            job_id = f"TEST_Sync_job_{uuid.uuid4().hex[:8]}"
+            sync_chunk = server.sync_user_stats_chunk
+            chunks = []
+
+            async def taken_over(chunk):
+                chunks.append(chunk)
+                await server.db.job_leases.update_one(
+                    {"_id": server.SYNC_ALL_USER_STATS_JOB},
+                    {"$set": {"owner": "other-worker", "expires_at": server.datetime.utcnow() + server.timedelta(minutes=5)}}
+                )
+                return len(chunk), 0
+
+            server.sync_user_stats_chunk = taken_over
+            server.SYNC_ALL_USER_STATS_CHUNK_SIZE = 2
+            try:
+                await seed(users)
+                await server.db.job_leases.delete_one({"_id": server.SYNC_ALL_USER_STATS_JOB})
+                assert await server.acquire_lease(server.SYNC_ALL_USER_STATS_JOB, server.SYNC_ALL_USER_STATS_LEASE_SECONDS)
+                await server.db.admin_jobs.insert_one({
+                    "id": job_id, "type": server.SYNC_ALL_USER_STATS_JOB, "status": "running",
+                    "progress": {"users_total": None, "users_synced": 0, "badges_awarded": 0},
+                })
+                await server.run_sync_all_user_stats_job(job_id)
+                assert len(chunks) == 1
+                job = await server.db.admin_jobs.find_one({"id": job_id})
+                assert job["status"] == "failed" and "lease lost" in job["error"]
+                lease = await server.db.job_leases.find_one({"_id": server.SYNC_ALL_USER_STATS_JOB})
+                assert lease["owner"] == "other-worker"
+            finally:
+                server.sync_user_stats_chunk = sync_chunk
+                await server.db.admin_jobs.delete_one({"id": job_id})
+                await server.db.job_leases.delete_one({"_id": server.SYNC_ALL_USER_STATS_JOB})
+                await delete_test_data([u["id"] for u in users])
+
+        loop.run_until_complete(run())
+        print("✓ Sync-all stops when its lease is taken over")
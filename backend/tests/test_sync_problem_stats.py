@@ -0,0 +1,83 @@
+"""
+Test streaming problem counter resync for FRIKT App
+- relates / comments / unique commenters recounted by $group, merge-joined with problems by id
+- removed and hidden comments are not counted
+- only problems whose counters differ are written (bulk_write)
+- relates/comments for deleted problems are skipped
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_ProblemSync_admin", "email": "admin@example.com"}
+
+
+def make_problem(**counts):
+    return server.Problem(
+        user_id="TEST_ProblemSync_author",
+        user_name="TestProblemSync",
+        title=f"TEST_problem_sync {uuid.uuid4()}",
+        category_id="work",
+    ).dict() | counts
+
+
+class TestSyncProblemStats:
+    """Merge-join recount"""
+
+    def test_corrects_only_drifted_problems(self, loop, db):
+        """Drifted counters are fixed, accurate ones untouched, orphans ignored"""
+        async def run():
+            drifted = make_problem(relates_count=9, comments_count=0, unique_commenters=0)
+            accurate = make_problem(relates_count=1, comments_count=2, unique_commenters=1)
+            empty = make_problem(relates_count=0, comments_count=0, unique_commenters=0)
+            problems = [drifted, accurate, empty]
+            orphan_id = str(uuid.uuid4())
+            try:
+                await db.problems.insert_many([dict(p) for p in problems])
+                await db.relates.insert_many([
+                    {"id": str(uuid.uuid4()), "problem_id": drifted["id"], "user_id": f"TEST_ProblemSync_{i}"}
+                    for i in range(3)
+                ] + [
+                    {"id": str(uuid.uuid4()), "problem_id": accurate["id"], "user_id": "TEST_ProblemSync_0"},
+                    {"id": str(uuid.uuid4()), "problem_id": orphan_id, "user_id": "TEST_ProblemSync_0"},
+                ])
+                await db.comments.insert_many([
+                    {"id": str(uuid.uuid4()), "problem_id": drifted["id"], "user_id": "TEST_ProblemSync_a", "status": "active"},
+                    {"id": str(uuid.uuid4()), "problem_id": drifted["id"], "user_id": "TEST_ProblemSync_a", "status": "active"},
+                    {"id": str(uuid.uuid4()), "problem_id": drifted["id"], "user_id": "TEST_ProblemSync_b", "status": "active"},
+                    {"id": str(uuid.uuid4()), "problem_id": drifted["id"], "user_id": "TEST_ProblemSync_c", "status": "removed"},
+                    {"id": str(uuid.uuid4()), "problem_id": accurate["id"], "user_id": "TEST_ProblemSync_a", "status": "active"},
+                    {"id": str(uuid.uuid4()), "problem_id": accurate["id"], "user_id": "TEST_ProblemSync_a", "status": "active"},
+                    {"id": str(uuid.uuid4()), "problem_id": accurate["id"], "user_id": "TEST_ProblemSync_b", "status": "hidden"},
+                    {"id": str(uuid.uuid4()), "problem_id": orphan_id, "user_id": "TEST_ProblemSync_a", "status": "active"},
+                ])
+
+                server.SYNC_PROBLEM_STATS_BATCH_SIZE = 1
+                result = await server.sync_problem_stats(admin=ADMIN)
+                assert result["success"] is True
+                assert result["total_problems"] >= 3
+
+                stored = {p["id"]: p async for p in db.problems.find({"id": {"$in": [p["id"] for p in problems]}}, {"_id": 0})}
+                assert (stored[drifted["id"]]["relates_count"], stored[drifted["id"]]["comments_count"],
+                        stored[drifted["id"]]["unique_commenters"]) == (3, 3, 2)
+                assert (stored[accurate["id"]]["relates_count"], stored[accurate["id"]]["comments_count"],
+                        stored[accurate["id"]]["unique_commenters"]) == (1, 2, 1)
+                assert stored[empty["id"]]["relates_count"] == 0
+
+                # Second pass finds nothing to fix
+                again = await server.sync_problem_stats(admin=ADMIN)
+                assert again["corrections"] == 0
+            finally:
+                ids = [p["id"] for p in problems] + [orphan_id]
+                await db.problems.delete_many({"id": {"$in": ids}})
+                await db.relates.delete_many({"problem_id": {"$in": ids}})
+                await db.comments.delete_many({"problem_id": {"$in": ids}})
+                await db.admin_audit_logs.delete_many({"admin_id": ADMIN["id"]})
+
+        loop.run_until_complete(run())
+        print("✓ Only drifted problem counters corrected")
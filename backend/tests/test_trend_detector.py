@@ -0,0 +1,161 @@
+"""
+Test streaming trend detector for FRIKT App
+- relate/comment events fold into a decaying per-problem velocity
+- a burst well above the category baseline flags the problem as trending
+- the author and followers get one "problem_trending" notification per cooldown
+- a category without enough history needs a bigger burst
+- repeat actions by one actor, and the author's own, don't add velocity
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+ADMIN = {"id": "TEST_Trend_admin"}
+
+
+async def ensure_indexes():
+    await server.db.problem_trends.create_index("problem_id", unique=True)
+    await server.db.trend_baselines.create_index("category_id", unique=True)
+
+
+async def cleanup(tag):
+    db = server.db
+    prefix = {"$regex": f"^TEST_Trend_{tag}"}
+    await db.problems.delete_many({"id": prefix})
+    await db.users.delete_many({"id": prefix})
+    await db.problem_trends.delete_many({"problem_id": prefix})
+    await db.trend_actors.delete_many({"problem_id": prefix})
+    await db.trend_baselines.delete_many({"category_id": prefix})
+    await db.notifications.delete_many({"user_id": prefix})
+    await db.notification_counters.delete_many({"user_id": prefix})
+    await db.push_outbox.delete_many({"user_id": prefix})
+    await db.fanout_jobs.delete_many({"exclude": prefix})
+
+
+class TestTrendDetector:
+    """Velocity, baseline and trending notifications"""
+
+    def test_velocity_decays(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            tag = uuid.uuid4().hex[:6]
+            t0 = server.datetime.utcnow() - server.timedelta(hours=2)
+            half_life = server.timedelta(seconds=server.TREND_HALF_LIFE_SECONDS)
+            try:
+                problem_id = f"TEST_Trend_{tag}_p"
+                assert await server.record_trend_event(problem_id, f"TEST_Trend_{tag}_cat", "relate", now=t0) == 1.0
+                velocity = await server.record_trend_event(problem_id, f"TEST_Trend_{tag}_cat", "comment", now=t0 + half_life)
+                assert velocity == pytest.approx(0.5 + server.TREND_EVENT_WEIGHTS["comment"])
+                # An event delivered late doesn't move the clock back
+                velocity = await server.record_trend_event(problem_id, f"TEST_Trend_{tag}_cat", "relate", now=t0)
+                assert velocity == pytest.approx(0.5 + server.TREND_EVENT_WEIGHTS["comment"] + 1.0)
+            finally:
+                await cleanup(tag)
+
+        loop.run_until_complete(run())
+        print("✓ Velocity decays with its half-life")
+
+    def test_burst_flags_trending_once(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            tag = uuid.uuid4().hex[:6]
+            category = f"TEST_Trend_{tag}_cat"
+            author, follower = f"TEST_Trend_{tag}_author", f"TEST_Trend_{tag}_follower"
+            hot = f"TEST_Trend_{tag}_hot"
+            start = server.datetime.utcnow() - server.timedelta(hours=2)
+            try:
+                await server.db.problems.insert_one({"id": hot, "user_id": author, "title": "A burst of relates",
+                                                     "category_id": category, "status": "active", "is_hidden": False})
+                await server.db.users.insert_many([{"id": author}, {"id": follower, "followed_problems": [hot]}])
+
+                # Steady background traffic builds the category baseline
+                for i in range(server.TREND_BASELINE_WARMUP + 10):
+                    t = start + server.timedelta(minutes=i)
+                    await server.record_trend_event(f"TEST_Trend_{tag}_bg{i % 20}", category, "relate", now=t)
+                baseline = await server.db.trend_baselines.find_one({"category_id": category})
+                assert server.trend_threshold(baseline) == server.TREND_MIN_VELOCITY
+                assert await server.db.problem_trends.count_documents({"problem_id": {"$regex": f"^TEST_Trend_{tag}_bg"}, "trending_notified_at": {"$ne": None}}) == 0
+
+                # Then one problem gets a burst
+                burst_start = start + server.timedelta(hours=2)
+                for i in range(15):
+                    await server.record_trend_event(hot, category, "relate", now=burst_start + server.timedelta(seconds=20 * i))
+                await server.process_fanout_jobs()
+
+                state = await server.db.problem_trends.find_one({"problem_id": hot})
+                assert state["trending_notified_at"] is not None
+                notified = await server.db.notifications.find({"type": "problem_trending", "problem_id": hot}).to_list(10)
+                assert sorted(n["user_id"] for n in notified) == [author, follower]
+                assert await server.db.push_outbox.count_documents({"user_id": {"$in": [author, follower]}}) == 2
+
+                # Still hot, but already notified in this cooldown
+                await server.record_trend_event(hot, category, "comment", now=burst_start + server.timedelta(minutes=6))
+                await server.process_fanout_jobs()
+                assert await server.db.notifications.count_documents({"type": "problem_trending", "problem_id": hot}) == 2
+
+                trending = await server.get_trending_problems(limit=1000, admin=ADMIN)
+                mine = [p["problem_id"] for p in trending["problems"] if p["problem_id"].startswith(f"TEST_Trend_{tag}")]
+                assert mine[0] == hot and len(mine) == 21
+                assert trending["baselines"][category]["samples"] == server.TREND_BASELINE_WARMUP + 10 + 16
+            finally:
+                await cleanup(tag)
+
+        loop.run_until_complete(run())
+        print("✓ Burst above the category baseline notifies author and followers once")
+
+    def test_cold_category_needs_bigger_burst(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            tag = uuid.uuid4().hex[:6]
+            problem_id = f"TEST_Trend_{tag}_p"
+            now = server.datetime.utcnow()
+            try:
+                await server.db.problems.insert_one({"id": problem_id, "user_id": f"TEST_Trend_{tag}_author",
+                                                     "title": "Cold category", "status": "active"})
+                for i in range(int(server.TREND_MIN_VELOCITY) + 1):
+                    await server.record_trend_event(problem_id, f"TEST_Trend_{tag}_cat", "relate", now=now)
+                state = await server.db.problem_trends.find_one({"problem_id": problem_id})
+                assert state.get("trending_notified_at") is None
+                for i in range(int(server.TREND_MIN_VELOCITY)):
+                    await server.record_trend_event(problem_id, f"TEST_Trend_{tag}_cat", "relate", now=now)
+                state = await server.db.problem_trends.find_one({"problem_id": problem_id})
+                assert state["trending_notified_at"] is not None
+            finally:
+                await cleanup(tag)
+
+        loop.run_until_complete(run())
+        print("✓ Categories without history use a higher bar")
+
+    def test_repeat_and_author_actions_ignored(self, loop, db):
+        async def run():
+            await ensure_indexes()
+            tag = uuid.uuid4().hex[:6]
+            problem_id = f"TEST_Trend_{tag}_p"
+            author = f"TEST_Trend_{tag}_author"
+            event = {"problem_id": problem_id, "problem_user_id": author, "category_id": f"TEST_Trend_{tag}_cat",
+                     "actor_id": f"TEST_Trend_{tag}_toggler", "actor_status": "active"}
+            try:
+                await server.db.problems.insert_one({"id": problem_id, "user_id": author, "title": "Toggled", "status": "active"})
+                # Relate / unrelate toggled over and over emits relate.created each time
+                for _ in range(20):
+                    await server.handle_relate_trend(event)
+                await server.handle_comment_trend(event)
+                await server.handle_comment_trend(event)
+                for _ in range(5):
+                    await server.handle_comment_trend({**event, "actor_id": author})
+
+                state = await server.db.problem_trends.find_one({"problem_id": problem_id})
+                assert state["velocity"] == pytest.approx(
+                    server.TREND_EVENT_WEIGHTS["relate"] + server.TREND_EVENT_WEIGHTS["comment"], rel=0.01
+                )
+                assert state.get("trending_notified_at") is None
+            finally:
+                await cleanup(tag)
+
+        loop.run_until_complete(run())
+        print("✓ Only the first action per actor counts; author actions ignored")
@@ -0,0 +1,88 @@
+"""
+Test unread notification counters for FRIKT App
+- inserts bump a per-user unread counter; users with older notifications are counted once
+- "mark all read" moves the last_read_at watermark without rewriting notifications
+- marking single notifications read decrements the counter once
+- the counter reconciler repairs a drifted counter
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+import uuid
+
+server = pytest.importorskip("server")
+
+
+def make_notification(user_id):
+    return server.Notification(user_id=user_id, type="new_relate", problem_id="", message="Test").dict()
+
+
+async def cleanup(user_ids):
+    await server.db.notifications.delete_many({"user_id": {"$in": user_ids}})
+    await server.db.notification_counters.delete_many({"user_id": {"$in": user_ids}})
+
+
+class TestUnreadCounters:
+    """Counter maintenance and the read watermark"""
+
+    def test_inserts_reads_and_watermark(self, loop, db):
+        async def run():
+            user = {"id": f"TEST_Unread_{uuid.uuid4().hex[:8]}"}
+            legacy = f"TEST_Unread_legacy_{uuid.uuid4().hex[:8]}"
+            try:
+                # Notifications from before counters existed
+                await server.db.notifications.insert_many([make_notification(legacy) for _ in range(2)])
+                await server.insert_notifications([make_notification(user["id"]) for _ in range(3)] + [make_notification(legacy)])
+                assert await server.get_unread_counts([user["id"], legacy]) == {user["id"]: 3, legacy: 3}
+
+                page = await server.get_notifications(user=user)
+                assert page["unread_count"] == 3
+                await server.mark_notification_read(page["notifications"][0]["id"], user=user)
+                await server.mark_notification_read(page["notifications"][0]["id"], user=user)  # no double count
+                assert await server.get_unread_count(user["id"]) == 2
+
+                await server.mark_notifications_read(user=user)
+                assert await server.get_unread_count(user["id"]) == 0
+                # Watermarked, not rewritten
+                assert await server.db.notifications.count_documents({"user_id": user["id"], "is_read": False}) == 2
+                page = await server.get_notifications(user=user)
+                assert all(n["is_read"] for n in page["notifications"])
+
+                # Marking a notification below the watermark doesn't decrement again
+                await asyncio.sleep(0.01)
+                await server.insert_notification(make_notification(user["id"]))
+                old = page["notifications"][-1]
+                assert await server.mark_notification_ids_read(user["id"], [old["id"]]) == 0
+                assert await server.get_unread_count(user["id"]) == 1
+                page = await server.get_notifications(user=user)
+                assert page["unread_count"] == 1
+                assert [n["is_read"] for n in page["notifications"]].count(False) == 1
+            finally:
+                await cleanup([user["id"], legacy])
+
+        loop.run_until_complete(run())
+        print("✓ Unread counters follow inserts, reads and the watermark")
+
+    def test_reconciler_repairs_counter(self, loop, db):
+        async def run():
+            user_id = f"TEST_Unread_{uuid.uuid4().hex[:8]}"
+            try:
+                await server.insert_notifications([make_notification(user_id) for _ in range(2)])
+                await server.mark_all_notifications_read(user_id)
+                await asyncio.sleep(0.01)
+                await server.insert_notification(make_notification(user_id))
+                await server.db.notification_counters.update_one({"user_id": user_id}, {"$set": {"unread": 7}})
+
+                drift = await server.find_unread_drift([user_id])
+                assert drift[user_id][1] == {"unread": 1, "total": 3}
+                await server.repair_unread_drift(drift)
+                assert await server.get_unread_count(user_id) == 1
+                assert await server.find_unread_drift([user_id]) == {}
+            finally:
+                await cleanup([user_id])
+
+        loop.run_until_complete(run())
+        print("✓ Reconciler repairs drifted unread counters")
@@ -0,0 +1,91 @@
+"""
+Test single-round-trip user stat updates for FRIKT App
+- bump_user_stats applies $inc / $set / $max with one find_one_and_update upsert
+- missing stats docs are created with UserStats defaults via $setOnInsert
+- create_problem-style multi-field increments (including posts_per_category.<cat>)
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import asyncio
+
+server = pytest.importorskip("server")
+
+
+class TestBumpUserStats:
+    """bump_user_stats semantics"""
+
+    def test_upsert_with_defaults_and_multi_inc(self, loop, db, make_user):
+        """First bump creates the doc with defaults; multi-field $inc in one call"""
+        async def run():
+            user_id = make_user("Stats")["id"]
+            try:
+                stats = await server.bump_user_stats(user_id, inc={"total_posts": 1, "posts_per_category.work": 1})
+                assert stats["total_posts"] == 1
+                assert stats["posts_per_category"] == {"work": 1}
+                assert stats["total_comments"] == 0
+                assert stats["current_visit_streak"] == 0
+                assert "_id" not in stats
+
+                stats = await server.bump_user_stats(user_id, inc={"total_posts": 1, "posts_per_category.tech": 1})
+                assert stats["total_posts"] == 2
+                assert stats["posts_per_category"] == {"work": 1, "tech": 1}
+            finally:
+                await server.db.user_stats.delete_many({"user_id": user_id})
+
+        loop.run_until_complete(run())
+        print("✓ Stats upserted with defaults and multi-field increments")
+
+    def test_max_and_set(self, loop, db, make_user):
+        """$max never lowers max_relates_on_single_post"""
+        async def run():
+            user_id = make_user("Stats")["id"]
+            try:
+                await server.bump_user_stats(user_id, inc={"total_relates_received": 1},
+                                             max_fields={"max_relates_on_single_post": 7})
+                stats = await server.bump_user_stats(user_id, inc={"total_relates_received": 1},
+                                                     max_fields={"max_relates_on_single_post": 3})
+                assert stats["max_relates_on_single_post"] == 7
+                assert stats["total_relates_received"] == 2
+
+                stats = await server.update_user_stats(user_id, {"last_visit_date": "2026-01-01"})
+                assert stats["last_visit_date"] == "2026-01-01"
+            finally:
+                await server.db.user_stats.delete_many({"user_id": user_id})
+
+        loop.run_until_complete(run())
+        print("✓ $max and $set stat updates")
+
+    def test_single_round_trip(self, loop, mongo_commands, make_user):
+        """Each stat update is one user_stats command"""
+        async def run():
+            user_id = make_user("Stats")["id"]
+            try:
+                mongo_commands.clear()
+                await server.bump_user_stats(user_id, inc={"total_comments": 1})
+                await server.bump_user_stats(user_id, inc={"total_posts": 1, "posts_per_category.work": 1})
+                await server.get_or_create_user_stats(user_id)
+                assert mongo_commands["user_stats"] <= 3
+            finally:
+                await server.db.user_stats.delete_many({"user_id": user_id})
+
+        loop.run_until_complete(run())
+        print("✓ One round trip per stat update")
+
+    def test_parallel_first_bumps(self, loop, db, make_user):
+        """Parallel first bumps for a new user produce one doc with the exact count"""
+        async def run():
+            await server.db.user_stats.create_index("user_id", unique=True)
+            user_id = make_user("Stats")["id"]
+            try:
+                await asyncio.gather(*(server.bump_user_stats(user_id, inc={"total_relates_given": 1}) for _ in range(50)))
+                assert await server.db.user_stats.count_documents({"user_id": user_id}) == 1
+                stats = await server.get_or_create_user_stats(user_id)
+                assert stats["total_relates_given"] == 50
+            finally:
+                await server.db.user_stats.delete_many({"user_id": user_id})
+
+        loop.run_until_complete(run())
+        print("✓ Parallel first bumps create a single stats doc")
@@ -0,0 +1,92 @@
+"""
+Test weekly digest for FRIKT App
+- top Frikts per category and per community are computed once per run
+- each user's digest comes from their community and followed categories, minus their own posts
+- digests go out as one push and one email per user; opted-out and banned users are skipped
+- the run is paged, records its throughput, and runs once per week after it is due
+
+These tests run in-process against the database configured by MONGO_URL / DB_NAME
+(skipped when MONGO_URL is not set).
+"""
+
+import pytest
+import uuid
+
+server = pytest.importorskip("server")
+
+
+def make_problem(tag, i, category_id, relates, user_id="TEST_Digest_author", community_id=None):
+    return {
+        "id": f"TEST_Digest_{tag}_p{i}", "user_id": user_id, "title": f"Digest <Frikt> {i}",
+        "category_id": category_id, "relates_count": relates, "comments_count": 0,
+        "is_local": community_id is not None, "community_id": community_id,
+        "is_hidden": False, "status": "active", "created_at": server.datetime.utcnow(),
+    }
+
+
+class TestWeeklyDigest:
+    """Digest assembly and delivery"""
+
+    def test_digest_run(self, loop, db):
+        async def run():
+            tag = uuid.uuid4().hex[:6]
+            category, community = f"TEST_Digest_{tag}_cat", f"TEST_Digest_{tag}_c"
+            a, b, c, d = (f"TEST_Digest_{tag}_{x}" for x in "abcd")
+            week, due_at = server.digest_week(server.datetime.utcnow())
+            server.RESEND_API_KEY = "re_test_key"
+            server.WEEKLY_DIGEST_PAGE_USERS = 2
+            try:
+                await server.db.digest_runs.delete_many({"id": week})
+                await server.db.problems.insert_many(
+                    [make_problem(tag, i, category, relates=10 * i) for i in range(1, 7)]
+                    + [make_problem(tag, 7, category, relates=100, user_id=a)]
+                    + [make_problem(tag, 8 + i, "local", relates=i, community_id=community) for i in range(2)]
+                )
+                await server.db.users.insert_many([
+                    {"id": a, "email": f"{a}@example.com", "name": "Ann", "followed_categories": [category]},
+                    {"id": b, "email": f"{b}@example.com", "name": "Ben", "followed_categories": [category]},
+                    {"id": c, "email": f"{c}@example.com", "name": "Cat", "followed_categories": []},
+                    {"id": d, "email": f"{d}@example.com", "name": "Dan", "followed_categories": [category], "status": "banned"},
+                ])
+                await server.db.community_members.insert_one({"community_id": community, "user_id": a})
+                await server.db.notification_settings.insert_one({"user_id": b, "weekly_digest": False})
+
+                # Not due yet: nothing happens
+                await server.run_weekly_digest(now=due_at - server.timedelta(minutes=1))
+                assert await server.db.digest_runs.find_one({"id": week}) is None
+
+                await server.run_weekly_digest(now=due_at)
+                runs = await server.get_weekly_digest_runs(admin={"id": "TEST_Digest_admin"})
+                current = next(r for r in runs["runs"] if r["id"] == week)
+                assert current["status"] == "completed"
+                assert current["users_per_second"] > 0
+                assert current["stats"]["users_processed"] >= 4
+
+                push = await server.db.push_outbox.find_one({"user_id": a})
+                expected = [f"TEST_Digest_{tag}_p{i}" for i in (9, 8, 6, 5, 4)]
+                assert push["data"]["problemIds"] == expected
+                assert push["body"] == "Top this week: Digest <Frikt> 9 and 4 more"
+                email = await server.db.email_outbox.find_one({"to": f"{a}@example.com", "kind": "weekly_digest"})
+                assert "Digest &lt;Frikt&gt; 6" in email["html"] and "Your Local" in email["html"]
+                assert f"TEST_Digest_{tag}_p7" not in str(push)
+
+                for other in (b, c, d):
+                    assert await server.db.push_outbox.count_documents({"user_id": other}) == 0
+                    assert await server.db.email_outbox.count_documents({"to": f"{other}@example.com"}) == 0
+
+                # Once per week
+                await server.run_weekly_digest(now=due_at + server.timedelta(hours=1))
+                assert await server.db.push_outbox.count_documents({"user_id": a}) == 1
+            finally:
+                server.WEEKLY_DIGEST_PAGE_USERS = 1000
+                await server.db.digest_runs.delete_many({"id": week})
+                await server.db.problems.delete_many({"id": {"$regex": f"^TEST_Digest_{tag}"}})
+                await server.db.users.delete_many({"id": {"$in": [a, b, c, d]}})
+                await server.db.community_members.delete_many({"community_id": community})
+                await server.db.notification_settings.delete_many({"user_id": b})
+                await server.db.push_outbox.delete_many({"user_id": {"$in": [a, b, c, d]}})
+                await server.db.email_outbox.delete_many({"kind": "weekly_digest"})
+                server.invalidate_notification_settings(b)
+
+        loop.run_until_complete(run())
+        print("✓ Weekly digest assembled per user and queued for push and email")